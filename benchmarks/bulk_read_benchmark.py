@@ -0,0 +1,141 @@
+"""
+Бенчмарк чтения всех листов таблицы: get_all_records по листам против
+одного values.batchGet (по колонкам, неформатированные значения)
+
+Sheets API отвечает фейковый бэкенд (GOOGLE_BACKEND=fake, см.
+fake_backend.py) с задержкой ответа; клиент gspread настоящий, поэтому
+считаются реальные запросы:
+  - legacy:   как full_sync раньше - get_worksheet_by_name + get_all_records
+              для каждого листа (в gspread 5 это два запроса: данные и
+              заголовок) и построчное преобразование в записи;
+  - per-sheet: таблица и список листов открываются один раз, но каждый лист
+              читается отдельным get_all_records;
+  - batch:    read_sheets (один values.batchGet) и преобразование колонок
+              (SyncManager.sheet_columns_to_records).
+
+Фейковый бэкенд не знает форматов ячеек, поэтому даты в листах - текст
+(как их показывает Sheets), а суммы - числа.
+
+Запуск: python benchmarks/bulk_read_benchmark.py [--sheets 30] [--rows 200] [--latency 0.1]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'bulk_read_benchmark.log'))
+os.environ['GOOGLE_BACKEND'] = 'fake'
+
+from src.google_integration.client_pool import client_pool
+from src.google_integration.rate_limiter import QuotaRateLimiter
+from src.google_integration import sheets_manager as sheets_module
+from src.google_integration.sync_manager import SyncManager
+from src.utils.date_utils import normalize_date
+
+HEADERS = ['ID', 'ամսաթիվ', 'մատակարար', 'ուղղություն', 'ծախսի բնութագիր', 'Արժեք']
+
+
+def make_sheet(index: int, rows: int):
+    """Строки листа с заголовком"""
+    values = [HEADERS]
+    for row in range(rows):
+        day = row % 28 + 1
+        values.append([f"cb-{index}-{row}", f"{day:02d}.01.25", f"Supplier {row % 7}", 'Direction',
+                       f"Expense {row}", 1000 + row * 10.5])
+    return values
+
+
+def create_spreadsheet(backend, spreadsheet_id: str, sheets: int, rows: int):
+    """Таблица фейкового бэкенда с листами Sheet 0 .. Sheet N-1"""
+    backend.create_spreadsheet(spreadsheet_id, spreadsheet_id,
+                               {f"Sheet {i}": make_sheet(i, rows) for i in range(sheets)})
+
+
+def legacy_row_to_record(row, spreadsheet_id, sheet_name):
+    """Прежнее построчное преобразование (is_valid_record + sheet_row_to_record)"""
+    if not (row.get('ID') and row.get('մատակարար') and row.get('Արժեք')):
+        return None
+    amount_str = str(row.get('Արժեք', '0')).replace(',', '.').replace(' ', '')
+    try:
+        amount = float(amount_str)
+    except ValueError:
+        amount = 0.0
+    date_str = str(row.get('ամսաթիվ', '')).strip()
+    return {
+        'id': str(row.get('ID', '')).strip(),
+        'date': normalize_date(date_str) if date_str else '',
+        'supplier': str(row.get('մատակարար', '')).strip(),
+        'direction': str(row.get('ուղղություն', '')).strip(),
+        'description': str(row.get('ծախսի բնութագիր', '')).strip(),
+        'amount': amount,
+        'spreadsheet_id': spreadsheet_id,
+        'sheet_name': sheet_name,
+        'user_id': None,
+    }
+
+
+def run_legacy(manager):
+    records = []
+    sheets_info, _ = manager.get_worksheets_info('bench')
+    for info in sheets_info:
+        worksheet = manager.get_worksheet_by_name('bench', info['title'])
+        for row in worksheet.get_all_records():
+            record = legacy_row_to_record(row, 'bench', info['title'])
+            if record:
+                records.append(record)
+    return records
+
+
+def run_per_sheet(manager):
+    records = []
+    spreadsheet = manager.open_sheet_by_id('bench')
+    for worksheet in spreadsheet.worksheets():
+        for row in worksheet.get_all_records():
+            record = legacy_row_to_record(row, 'bench', worksheet.title)
+            if record:
+                records.append(record)
+    return records
+
+
+def run_batch(manager):
+    sync = SyncManager(manager, db_manager=None)
+    spreadsheet = manager.open_sheet_by_id('bench')
+    records = []
+    for data in manager.read_sheets(spreadsheet).values():
+        records.extend(sync.sheet_columns_to_records(data, 'bench'))
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk sheet read benchmark')
+    parser.add_argument('--sheets', type=int, default=30)
+    parser.add_argument('--rows', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.1, help='Simulated API latency, seconds')
+    args = parser.parse_args()
+
+    sheets_module.rate_limiter = QuotaRateLimiter(1e9, 1e9)
+    backend = client_pool.backend
+    create_spreadsheet(backend, 'bench', args.sheets, args.rows)
+    backend.latency = args.latency
+    manager = sheets_module.GoogleSheetsManager(client_pool=client_pool)
+
+    print(f"{args.sheets} sheets x {args.rows} rows, {args.latency * 1000:.0f}ms per request")
+    print(f"{'path':10s} {'requests':>9s} {'wall time':>10s} {'records':>8s}")
+    results = {}
+    for name, func in (('legacy', run_legacy), ('per-sheet', run_per_sheet), ('batch', run_batch)):
+        backend.reset_counters()
+        started = time.perf_counter()
+        records = func(manager)
+        elapsed = time.perf_counter() - started
+        results[name] = records
+        print(f"{name:10s} {backend.stats()['requests']:9d} {elapsed:9.2f}s {len(records):8d}")
+
+    # Результаты путей должны совпадать
+    assert results['legacy'] == results['batch'], 'batch records differ from legacy records'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Бенчмарк общего пула клиентов Google API
+
+Поднимает локально фейковый OAuth token endpoint и фейковый Sheets API и
+прогоняет N задач в нескольких потоках (открыть таблицу, прочитать лист):
+  - before: как раньше для задач платежей - новый менеджер (новая
+    авторизация и новая сессия) на каждую задачу;
+  - after: общий GoogleClientPool - один токен и сессия на поток.
+
+Считаются запросы токена и новые TCP-соединения к API (в проде каждое -
+TLS handshake с googleapis.com).
+
+Запуск: python benchmarks/client_pool_benchmark.py [--tasks 100] [--threads 4]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'client_pool_benchmark.log'))
+
+import requests
+import rsa
+from google.oauth2 import service_account
+
+from src.google_integration.client_pool import GoogleClientPool
+from src.google_integration.rate_limiter import QuotaRateLimiter
+from src.google_integration import sheets_manager as sheets_module
+
+METADATA = {
+    'spreadsheetId': 'bench',
+    'properties': {'title': 'bench'},
+    'sheets': [{'properties': {'sheetId': 0, 'title': 'S', 'index': 0,
+                               'gridProperties': {'rowCount': 10, 'columnCount': 6}}}],
+}
+
+
+class CountingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler):
+        super().__init__(address, handler)
+        self.connections = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+        if '/values/' in self.path:
+            self._reply({'range': 'S!A1:F2', 'values': [['ID', 'x'], ['1', '2']]})
+        else:
+            self._reply(METADATA)
+
+    def do_POST(self):
+        with self.server.lock:
+            self.server.requests += 1
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self._reply({'access_token': f"token-{time.time()}", 'expires_in': 3600, 'token_type': 'Bearer'})
+
+
+class LocalAdapter(requests.adapters.HTTPAdapter):
+    """Отправляет запросы к googleapis.com на локальный фейковый API"""
+
+    def __init__(self, base_url: str):
+        super().__init__()
+        self.base_url = base_url
+
+    def send(self, request, **kwargs):
+        path = request.url.split('googleapis.com', 1)[-1]
+        request.url = self.base_url + path
+        return super().send(request, **kwargs)
+
+
+def start_server() -> CountingServer:
+    server = CountingServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_credentials(token_url: str, private_key: str):
+    info = {
+        'type': 'service_account',
+        'client_email': 'bench@bench.iam.gserviceaccount.com',
+        'private_key': private_key,
+        'private_key_id': 'bench',
+        'token_uri': token_url,
+    }
+    return service_account.Credentials.from_service_account_info(
+        info, scopes=['https://www.googleapis.com/auth/spreadsheets']
+    )
+
+
+def run(mode: str, tasks: int, threads: int, private_key: str) -> dict:
+    token_server, api_server = start_server(), start_server()
+    token_url = f"http://127.0.0.1:{token_server.server_port}/token"
+    api_url = f"http://127.0.0.1:{api_server.server_port}"
+
+    def make_manager():
+        pool = GoogleClientPool(credentials=make_credentials(token_url, private_key))
+        manager = sheets_module.GoogleSheetsManager(client_pool=pool)
+        # Сессия пула направляется на локальный API
+        original_get_session = pool.get_session
+
+        def get_session():
+            session = original_get_session()
+            if not getattr(session, '_bench_mounted', False):
+                session.mount('https://', LocalAdapter(api_url))
+                session._bench_mounted = True
+            return session
+
+        pool.get_session = get_session
+        return manager
+
+    shared = make_manager() if mode == 'after' else None
+
+    def task(_):
+        manager = shared or make_manager()
+        spreadsheet = manager.open_sheet_by_id('bench')
+        spreadsheet.worksheet('S').get_all_values()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        list(executor.map(task, range(tasks)))
+    elapsed = time.perf_counter() - started
+
+    result = {
+        'mode': mode,
+        'tasks': tasks,
+        'token_fetches': token_server.requests,
+        'api_connections': api_server.connections,
+        'api_requests': api_server.requests,
+        'elapsed_s': round(elapsed, 3),
+    }
+    token_server.shutdown()
+    api_server.shutdown()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Shared Google client pool benchmark')
+    parser.add_argument('--tasks', type=int, default=100)
+    parser.add_argument('--threads', type=int, default=4)
+    args = parser.parse_args()
+
+    sheets_module.rate_limiter = QuotaRateLimiter(1e9, 1e9)
+    _, private_key = rsa.newkeys(1024)
+    private_key = private_key.save_pkcs1().decode()
+
+    print(f"{'mode':8s} {'tasks':>6s} {'token fetches':>14s} {'API connections':>16s} {'API requests':>13s} {'time':>8s}")
+    for mode in ('before', 'after'):
+        r = run(mode, args.tasks, args.threads, private_key)
+        print(f"{r['mode']:8s} {r['tasks']:6d} {r['token_fetches']:14d} {r['api_connections']:16d} "
+              f"{r['api_requests']:13d} {r['elapsed_s']:7.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Проверка трехсторонней сверки полей БД и листов (DriftRepair)
+
+Drive и Sheets API отвечает фейковый бэкенд (GOOGLE_BACKEND=fake), набор
+данных - из reconcile_benchmark. В БД и листах одинаковые записи, сценарий:
+  1. первая сверка - расхождений нет, сохраняются снимки;
+  2. ничего не менялось - ни одного запроса к Sheets API;
+  3. ручные правки в листе (2 поля), правка в БД (1 поле) и конфликт
+     (одно поле изменено с обеих сторон), политика report - в лист уходит
+     одна ячейка одним values.batchUpdate, в БД - два поля, конфликт в отчете;
+  4. та же сверка с политикой db - конфликт записывается в лист;
+  5. в листе и БД одинаковые значения.
+
+Запуск: python benchmarks/drift_check.py [--records 10000] [--spreadsheets 4] [--sheets 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'drift_check.log'))
+os.environ['GOOGLE_BACKEND'] = 'fake'
+
+from reconcile_benchmark import load_dataset, make_dataset
+from src.config.settings import logger
+from src.database.database_manager import DatabaseManager
+from src.database.sheets_sync_state import SheetsSyncState
+from src.google_integration.client_pool import client_pool
+from src.google_integration.drift import DriftRepair, canonical_fields
+from src.google_integration.rate_limiter import QuotaRateLimiter
+from src.google_integration import sheets_manager as sheets_module
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Three-way drift repair check')
+    parser.add_argument('--records', type=int, default=10000)
+    parser.add_argument('--spreadsheets', type=int, default=4)
+    parser.add_argument('--sheets', type=int, default=5, help='Sheets per spreadsheet')
+    args = parser.parse_args()
+
+    logger.setLevel('WARNING')
+    sheets_module.rate_limiter = QuotaRateLimiter(1e9, 1e9)
+    records, data = make_dataset(args.records, args.spreadsheets, args.sheets)
+    # В листах - все записи БД
+    for spreadsheet in data.values():
+        for rows in spreadsheet.values():
+            del rows[1:]
+    for record in records:
+        data[record['spreadsheet_id']][record['sheet_name']].append(sheets_module.build_record_row(record))
+
+    backend = client_pool.backend
+    load_dataset(backend, data)
+    manager = sheets_module.GoogleSheetsManager(client_pool=client_pool)
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'drift.db')
+    db = DatabaseManager(db_path)
+    db.init_db()
+    db.upsert_records(records)
+    repair = DriftRepair(manager, db, SheetsSyncState(db_path), policy='report')
+
+    def run(label: str, policy: str = None, expect: dict = None):
+        backend.reset_counters()
+        report = repair.repair(policy)
+        stats = report.stats()
+        requests = backend.stats()
+        print(f"{label:40s} sheets API {requests['sheets_requests']:3d} (sent {requests['bytes_received']:5d} B)  "
+              f"to_sheet {stats['to_sheet']} to_db {stats['to_db']} conflicts {stats['conflicts']} "
+              f"(unresolved {stats['unresolved_conflicts']})  cells {stats['cells_written']}  "
+              f"db upserts {stats['db_upserts']}  skipped {stats['skipped_spreadsheets']}  errors {stats['errors']}")
+        for key, value in (expect or {}).items():
+            actual = requests['sheets_requests'] if key == 'requests' else stats[key]
+            assert actual == value, f"{label}: {key}={actual}, expected {value}"
+        return report
+
+    run('1. first check', expect={'changed_fields': 0, 'errors': 0})
+    run('2. nothing changed', expect={'requests': 0, 'skipped_spreadsheets': args.spreadsheets})
+
+    # Ручные правки в листе "Sheet 0" первой таблицы (строка записи = индекс + 1)
+    rows = backend.rows('spreadsheet-0', 'Sheet 0')
+    targets = len(data) * args.sheets
+    row_of = {row[0]: index for index, row in enumerate(rows)}
+    a, b, c, d = (records[n * targets] for n in range(4))
+    rows[row_of[a['id']]][5] = 777.5            # сумма a - в листе
+    rows[row_of[b['id']]][2] = 'Manual supplier'  # поставщик b - в листе
+    db.update_record(c['id'], 'description', 'Edited in bot')  # описание c - в БД
+    rows[row_of[d['id']]][5] = 111               # сумма d - в листе и в БД по-разному
+    db.update_record(d['id'], 'amount', 222)
+    backend.set_rows('spreadsheet-0', 'Sheet 0', rows)
+
+    report = run('3. manual edits, policy=report', expect={
+        'to_sheet': 1, 'to_db': 2, 'conflicts': 1, 'unresolved_conflicts': 1,
+        'cells_written': 1, 'db_upserts': 2, 'skipped_spreadsheets': args.spreadsheets - 1,
+        'requests': 4,  # метаданные, список листов, values.batchGet, values.batchUpdate
+    })
+    conflict = report.conflicts()[0]
+    print(f"   conflict: {conflict.record_id} {conflict.field}: db={conflict.db_value} sheet={conflict.sheet_value} "
+          f"base={conflict.base_value}")
+    assert db.get_record(a['id'])['amount'] == 777.5
+    assert db.get_record(b['id'])['supplier'] == 'Manual supplier'
+    assert backend.rows('spreadsheet-0', 'Sheet 0')[row_of[c['id']]][4] == 'Edited in bot'
+
+    run('4. same, policy=db', policy='db', expect={'conflicts': 1, 'unresolved_conflicts': 0, 'cells_written': 1})
+    rows = backend.rows('spreadsheet-0', 'Sheet 0')
+    assert rows[row_of[d['id']]][5] == 222
+
+    # Значения БД и листа совпадают
+    db_records = {record['id']: record for record in db.get_all_records()}
+    for row in rows[1:]:
+        sheet_record = dict(zip(['id', 'date', 'supplier', 'direction', 'description', 'amount'], row))
+        assert canonical_fields(sheet_record) == canonical_fields(db_records[row[0]]), row
+    run('5. after repair', expect={'changed_fields': 0})
+
+
+if __name__ == '__main__':
+    main()
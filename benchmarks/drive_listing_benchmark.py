@@ -0,0 +1,90 @@
+"""
+Бенчмарк получения списка таблиц через Drive API
+
+Drive API отвечает фейковый бэкенд (GOOGLE_BACKEND=fake, см.
+fake_backend.py) с задержкой ответа и постраничной выдачей, поэтому сервис
+строится настоящим googleapiclient.discovery.build из статического
+discovery-документа:
+  - legacy: как раньше - build() на каждый вызов и одна страница
+    (по умолчанию Drive отдает 100 файлов, остальные терялись);
+  - cold:   первый вызов нового пути - построение сервиса пула + все страницы;
+  - warm:   повторный вызов - сервис из пула, все страницы по pageSize=1000;
+  - cache:  повторное чтение через SheetsCache после синхронизации.
+
+Запуск: python benchmarks/drive_listing_benchmark.py [--files 2500] [--latency 0.05] [--repeat 5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'drive_listing_benchmark.log'))
+os.environ['GOOGLE_BACKEND'] = 'fake'
+
+from googleapiclient.discovery import build
+
+from src.google_integration.client_pool import GoogleClientPool, client_pool
+from src.google_integration.fake_backend import FakeHttp
+from src.google_integration.sheets_manager import GoogleSheetsManager
+from src.utils.sheets_cache import SheetsCache
+
+
+def legacy_list(backend):
+    """Прежняя реализация get_all_spreadsheets (транспорт - фейковый бэкенд)"""
+    service = build('drive', 'v3', http=FakeHttp(backend))
+    results = service.files().list(
+        q="mimeType='application/vnd.google-apps.spreadsheet'",
+        fields="files(id, name, modifiedTime, size)"
+    ).execute()
+    return results.get('files', [])
+
+
+def measure(func, repeat: int):
+    timings, result = [], None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return sum(timings) / len(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drive spreadsheet listing benchmark')
+    parser.add_argument('--files', type=int, default=2500)
+    parser.add_argument('--latency', type=float, default=0.05, help='Simulated API latency, seconds')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    backend = client_pool.backend
+    for i in range(args.files):
+        backend.create_spreadsheet(f"sheet-{i}", f"Spreadsheet {i}", {})
+    backend.latency = args.latency
+
+    manager = GoogleSheetsManager(client_pool=GoogleClientPool(backend=backend))
+    cache = SheetsCache()
+
+    rows = []
+
+    def run(name, func, repeat):
+        backend.reset_counters()
+        elapsed, files = measure(func, repeat)
+        rows.append((name, elapsed, len(files), backend.stats()['requests'] / repeat))
+
+    run('legacy', lambda: legacy_list(backend), args.repeat)
+    run('cold', manager.get_all_spreadsheets, 1)
+    run('warm', manager.get_all_spreadsheets, args.repeat)
+
+    cache.store_spreadsheets(manager.get_all_spreadsheets())
+    run('cache', cache.get_spreadsheets, args.repeat)
+    cache.shutdown()
+
+    print(f"{'path':8s} {'avg time':>10s} {'files':>7s} {'requests':>9s}")
+    for name, elapsed, files, requests in rows:
+        print(f"{name:8s} {elapsed * 1000:8.1f}ms {files:7d} {requests:9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Проверка фейкового бэкенда Google (GOOGLE_BACKEND=fake)
+
+Общие менеджеры GoogleSheetsManager и PaymentsSheetsManager, созданные
+по настройкам, работают без изменений поверх таблиц в памяти:
+  1. список таблиц (Drive API через googleapiclient и через gspread);
+  2. запись расходов: вставка с сортировкой по дате, обновление полей,
+     удаление строки;
+  3. платежи: создание листов ролей, одиночная и пакетная запись, чтение,
+     обновление, удаление;
+  4. асинхронный клиент (httpx) - тот же бэкенд;
+  5. ошибка квоты 429 с Retry-After и вероятностные ошибки.
+В конце - счетчики вызовов по операциям REST API.
+
+Запуск: python benchmarks/fake_backend_check.py [--latency 0]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'fake_backend_check.log'))
+os.environ['GOOGLE_BACKEND'] = 'fake'
+os.environ['PAYMENTS_SPREADSHEET_ID'] = 'payments-fake'
+
+from src.config.settings import UserRole, logger
+from src.google_integration.async_sheets_client import AsyncSheetsClient, AsyncSheetsManager
+from src.google_integration.client_pool import client_pool
+from src.google_integration.payments_sheets_manager import PaymentsSheetsManager
+from src.google_integration.rate_limiter import QuotaRateLimiter
+from src.google_integration import async_sheets_client as async_module
+from src.google_integration import sheets_manager as sheets_module
+from src.google_integration.sheets_manager import RECORD_HEADERS
+
+SPREADSHEET_ID = 'expenses-fake'
+
+
+def record(n: int, date: str) -> dict:
+    return {'id': f"cb-{n}", 'date': date, 'supplier': f"Supplier {n}", 'direction': 'Direction',
+            'description': f"Expense {n}", 'amount': 1000 + n}
+
+
+def check_sheets(backend, manager):
+    files = manager.get_all_spreadsheets()
+    assert [f['id'] for f in files] == [SPREADSHEET_ID], files
+    assert [f['id'] for f in manager.list_spreadsheets()] == [SPREADSHEET_ID]
+
+    for n, date in enumerate(['2025-03-01', '2025-01-15', '2025-02-10']):
+        assert manager.add_record_to_sheet(SPREADSHEET_ID, 'Sheet A', record(n, date))
+    rows = backend.rows(SPREADSHEET_ID, 'Sheet A')
+    assert [row[0] for row in rows] == ['ID', 'cb-1', 'cb-2', 'cb-0'], rows
+
+    assert manager.update_record_fields_in_sheet(SPREADSHEET_ID, 'Sheet A', 'cb-2', {'amount': 5, 'supplier': 'X'})
+    assert backend.rows(SPREADSHEET_ID, 'Sheet A')[2][2:6] == ['X', 'Direction', 'Expense 2', 5]
+    assert manager.delete_record_from_sheet(SPREADSHEET_ID, 'Sheet A', 'cb-1')
+    assert [row[0] for row in backend.rows(SPREADSHEET_ID, 'Sheet A')] == ['ID', 'cb-2', 'cb-0']
+    print("sheets manager: ok", json.dumps(manager.get_worksheets_info(SPREADSHEET_ID)[0], ensure_ascii=False))
+
+
+def check_payments(backend):
+    payments = PaymentsSheetsManager()
+    assert payments.initialize_payment_sheets()
+    sheet_name = payments.get_sheet_name_for_role(UserRole.WORKER)
+    assert backend.rows('payments-fake', sheet_name) == [payments.HEADERS]
+
+    assert payments.add_payment_to_sheet(1, 'Worker One', 1500.5, '2025-01-01', '2025-01-31', 'January')
+    assert payments.add_payments_batch([
+        {'payment_id': n, 'user_display_name': f"Worker {n}", 'amount': 100 * n, 'date_from': '2025-02-01',
+         'date_to': '2025-02-28', 'comment': ''}
+        for n in range(2, 6)
+    ], UserRole.WORKER)
+    stored = payments.get_payments_from_sheet(UserRole.WORKER)
+    assert [p['id'] for p in stored] == [1, 2, 3, 4, 5], stored
+    assert stored[0]['amount'] == 1500.5
+
+    assert payments.update_payment_in_sheet(3, UserRole.WORKER, {'amount': 333})
+    assert payments.get_payments_from_sheet(UserRole.WORKER)[2]['amount'] == 333
+    assert payments.delete_payment_from_sheet(4, UserRole.WORKER)
+    assert [p['id'] for p in payments.get_payments_from_sheet(UserRole.WORKER)] == [1, 2, 3, 5]
+    print(f"payments manager: ok, sheets {[ws.title for ws in payments.sheets_manager.open_sheet_by_id('payments-fake').worksheets()]}")
+
+
+async def check_async(backend):
+    client = AsyncSheetsClient()
+    manager = AsyncSheetsManager(client)
+    assert await manager.add_record(SPREADSHEET_ID, 'Sheet A', record(9, '2025-02-01'))
+    assert await manager.update_record_fields(SPREADSHEET_ID, 'Sheet A', 'cb-9', {'description': 'Async'})
+    assert [row[0] for row in backend.rows(SPREADSHEET_ID, 'Sheet A')] == ['ID', 'cb-9', 'cb-2', 'cb-0']
+    assert len(await client.list_spreadsheets()) == 2
+    await client.aclose()
+    print("async client: ok")
+
+
+def check_errors(backend, manager):
+    backend.fail_next(1, status=429, retry_after=3)
+    assert manager.open_sheet_by_id(SPREADSHEET_ID) is None
+    assert backend.errors[429] == 1
+    info = sheets_module.rate_limiter.last_error()
+    assert info.status == 429 and info.retry_after == 3, info
+
+    backend.error_rate = 0.5
+    logger.setLevel('CRITICAL')
+    opened = sum(manager.open_sheet_by_id(SPREADSHEET_ID) is not None for _ in range(200))
+    backend.error_rate = 0
+    logger.setLevel('WARNING')
+    print(f"quota errors: ok, {opened}/200 opened with error_rate=0.5, errors {dict(backend.errors)}")
+    assert 60 < opened < 140
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Google backend check')
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+
+    logger.setLevel('WARNING')
+    limiter = QuotaRateLimiter(1e9, 1e9)
+    sheets_module.rate_limiter = async_module.rate_limiter = limiter
+    backend = client_pool.backend
+    backend.latency = args.latency
+    backend.create_spreadsheet(SPREADSHEET_ID, 'Expenses', {'Sheet A': [RECORD_HEADERS]})
+
+    manager = sheets_module.sheets_manager
+    check_sheets(backend, manager)
+    check_payments(backend)
+    asyncio.run(check_async(backend))
+    check_errors(backend, manager)
+    print(json.dumps(backend.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
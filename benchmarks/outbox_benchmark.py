@@ -0,0 +1,122 @@
+"""
+Бенчмарк outbox для задач Google Sheets
+
+1. Задержка записи: add_record без outbox и с сохранением задачи в outbox
+   в той же транзакции.
+2. Восстановление: время подъема N незавершенных задач из outbox при старте
+   и время их полного выполнения воркером (Google Sheets заменен заглушкой).
+
+Запуск: python benchmarks/outbox_benchmark.py [--writes 2000] [--pending 10000]
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'outbox_benchmark.log'))
+
+from src.database.database_manager import DatabaseManager
+from src.database.sheets_outbox import SheetsOutbox, persist_task
+from src.google_integration import async_sheets_worker
+from src.google_integration.rate_limiter import QuotaRateLimiter
+
+
+def make_record(i: int) -> dict:
+    return {
+        'id': f"cb-{uuid.uuid4().hex[:8]}",
+        'date': '2025-01-15',
+        'supplier': f"supplier {i % 50}",
+        'direction': 'direction',
+        'description': 'benchmark record',
+        'amount': 1000 + i,
+        'spreadsheet_id': 'bench-spreadsheet',
+        'sheet_name': f"sheet-{i % 20}",
+    }
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def bench_write_latency(db: DatabaseManager, writes: int):
+    results = {}
+    for with_outbox in (False, True):
+        timings = []
+        for i in range(writes):
+            record = make_record(i)
+            task = async_sheets_worker.make_add_record_task(
+                record['spreadsheet_id'], record['sheet_name'], record
+            ) if with_outbox else None
+            started = time.perf_counter()
+            db.add_record(record, task)
+            timings.append((time.perf_counter() - started) * 1000)
+        results['with_outbox' if with_outbox else 'plain'] = timings
+
+    for name, timings in results.items():
+        print(f"  {name:12s} mean {statistics.mean(timings):.3f} ms, "
+              f"p95 {percentile(timings, 95):.3f} ms")
+    overhead = statistics.mean(results['with_outbox']) - statistics.mean(results['plain'])
+    print(f"  added latency per write: {overhead:.3f} ms")
+
+
+def bench_recovery(db_path: str, pending: int):
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM sheets_outbox')
+    for i in range(pending):
+        record = make_record(i)
+        persist_task(cursor, async_sheets_worker.make_add_record_task(
+            record['spreadsheet_id'], record['sheet_name'], record
+        ))
+    conn.commit()
+    conn.close()
+
+    # Google Sheets не вызывается: проверяем только накладные расходы outbox и воркера
+    async_sheets_worker.rate_limiter = QuotaRateLimiter(1e9, 1e9)
+    async_sheets_worker.sheets_manager.add_record_to_sheet = lambda *args, **kwargs: True
+
+    outbox = SheetsOutbox(db_path)
+    worker = async_sheets_worker.AsyncSheetsWorker(4, outbox=outbox)
+
+    started = time.perf_counter()
+    replayed = worker.replay_outbox()
+    replay_time = time.perf_counter() - started
+
+    worker.start()
+    while worker.get_queue_size():
+        time.sleep(0.05)
+    drain_time = time.perf_counter() - started
+    worker.stop()
+
+    print(f"  replayed {replayed} tasks in {replay_time:.3f} s")
+    print(f"  outbox drained in {drain_time:.3f} s ({replayed / drain_time:.0f} tasks/s), "
+          f"pending left: {outbox.count_pending()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sheets outbox benchmark')
+    parser.add_argument('--writes', type=int, default=2000)
+    parser.add_argument('--pending', type=int, default=10000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        db = DatabaseManager(db_path)
+        db.init_db()
+
+        print(f"Write latency ({args.writes} writes each):")
+        bench_write_latency(db, args.writes)
+
+        print(f"Recovery ({args.pending} pending tasks):")
+        bench_recovery(db_path, args.pending)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""
+Проверка параллельной полной синхронизации
+
+Drive и Sheets API отвечает фейковый бэкенд (GOOGLE_BACKEND=fake) с
+задержкой ответа. Сравниваются:
+  - последовательная синхронизация (concurrency=1) и параллельная;
+  - задержка event loop во время синхронизации (тикер каждые 10 мс) -
+    блокирующие вызовы gspread выполняются в потоках и не должны ее увеличивать;
+  - отмена через cancel_event после первого отчета о прогрессе.
+
+Запуск: python benchmarks/parallel_sync_check.py [--spreadsheets 8] [--sheets 5] [--latency 0.1] [--concurrency 4]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'parallel_sync_check.log'))
+os.environ['GOOGLE_BACKEND'] = 'fake'
+
+from bulk_read_benchmark import create_spreadsheet
+from src.database.database_manager import DatabaseManager
+from src.database.sheets_sync_state import SheetsSyncState
+from src.google_integration.client_pool import client_pool
+from src.google_integration.rate_limiter import QuotaRateLimiter
+from src.google_integration import sheets_manager as sheets_module
+from src.google_integration import sync_manager as sync_module
+
+
+async def run_sync(sync, concurrency: int, cancel_after_first: bool = False):
+    """Синхронизация с замером максимальной задержки event loop"""
+    max_lag = 0.0
+    finished = False
+
+    async def ticker():
+        nonlocal max_lag
+        while not finished:
+            started = time.perf_counter()
+            await asyncio.sleep(0.01)
+            max_lag = max(max_lag, time.perf_counter() - started - 0.01)
+
+    cancel_event = threading.Event()
+    reports = []
+
+    async def progress(done, total, stats):
+        reports.append((done, total))
+        if cancel_after_first and done > 0:
+            cancel_event.set()
+
+    tick = asyncio.ensure_future(ticker())
+    started = time.perf_counter()
+    stats = await sync.full_sync(force=True, progress=progress, cancel_event=cancel_event,
+                                 concurrency=concurrency)
+    elapsed = time.perf_counter() - started
+    finished = True
+    await tick
+    return stats, elapsed, max_lag, reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Parallel full sync check')
+    parser.add_argument('--spreadsheets', type=int, default=8)
+    parser.add_argument('--sheets', type=int, default=5)
+    parser.add_argument('--rows', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.1, help='Simulated API latency, seconds')
+    parser.add_argument('--concurrency', type=int, default=4)
+    args = parser.parse_args()
+
+    limiter = QuotaRateLimiter(1e9, 1e9)
+    sheets_module.rate_limiter = sync_module.rate_limiter = limiter
+    backend = client_pool.backend
+    for i in range(args.spreadsheets):
+        create_spreadsheet(backend, f"spreadsheet-{i}", args.sheets, args.rows)
+    backend.latency = args.latency
+    manager = sheets_module.GoogleSheetsManager(client_pool=client_pool)
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'parallel_sync.db')
+    db = DatabaseManager(db_path)
+    db.init_db()
+    sync = sync_module.SyncManager(manager, db, SheetsSyncState(db_path))
+
+    total_sheets = args.spreadsheets * args.sheets
+    print(f"{args.spreadsheets} spreadsheets x {args.sheets} sheets, {args.latency * 1000:.0f}ms per request")
+    print(f"{'run':22s} {'wall time':>10s} {'max loop lag':>13s} {'processed':>10s} {'progress':>9s}")
+    results = {}
+    for label, concurrency, cancel in (('sequential', 1, False),
+                                       (f"concurrency={args.concurrency}", args.concurrency, False),
+                                       ('cancel after first', args.concurrency, True)):
+        stats, elapsed, lag, reports = asyncio.run(run_sync(sync, concurrency, cancel))
+        results[label] = (stats, elapsed, lag)
+        print(f"{label:22s} {elapsed:9.2f}s {lag * 1000:11.1f}ms {stats['processed_sheets']:10d} "
+              f"{len(reports):9d}  cancelled={stats['cancelled']} errors={stats['errors']}")
+
+    sequential, parallel, cancelled = results.values()
+    assert sequential[0]['processed_sheets'] == parallel[0]['processed_sheets'] == total_sheets
+    assert not sequential[0]['errors'] and not parallel[0]['errors']
+    assert parallel[1] < sequential[1], 'parallel sync is not faster than sequential'
+    assert cancelled[0]['cancelled'] and cancelled[0]['processed_sheets'] < total_sheets
+    print(f"speedup: {sequential[1] / parallel[1]:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
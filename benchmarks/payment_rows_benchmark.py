@@ -0,0 +1,104 @@
+"""
+Бенчмарк адресации строк платежей (PaymentsSheetsManager) на фейковом бэкенде
+
+Лист роли заполняется --sizes платежами, затем по --ops раз выполняются
+добавление, обновление и удаление платежа. Для каждой операции печатаются
+вызовы API и средняя задержка (фейковый бэкенд отвечает с задержкой
+--latency) в двух режимах:
+  - cached: дескрипторы листов и строки платежей из кеша (как в боте);
+  - uncached: кеш строк отключен (PAYMENTS_ROW_CACHE_TTL=0), лист
+    открывается заново перед каждой операцией - поведение до кеша.
+
+Запуск: python benchmarks/payment_rows_benchmark.py [--sizes 100 1000 10000 50000]
+        [--ops 20] [--latency 0.02]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'payment_rows_benchmark.log'))
+os.environ['GOOGLE_BACKEND'] = 'fake'
+os.environ['PAYMENTS_SPREADSHEET_ID'] = 'payments-bench'
+
+from src.config.settings import UserRole, logger
+from src.google_integration import sheets_manager as sheets_module
+from src.google_integration.client_pool import client_pool
+from src.google_integration.payment_rows import PaymentRowCache
+from src.google_integration.payments_sheets_manager import PaymentsSheetsManager
+from src.google_integration.rate_limiter import QuotaRateLimiter
+
+ROLE = UserRole.WORKER
+OPERATIONS = ('add', 'update', 'delete')
+
+
+def create_sheet(backend, spreadsheet_id: str, size: int):
+    created = datetime(2025, 1, 1).strftime('%Y-%m-%d %H:%M:%S')
+    rows = [list(PaymentsSheetsManager.HEADERS)] + [
+        [str(n), f"User {n % 100}", 500 + n % 1000, '2025-01-01', '2025-01-31', '', created, '', '']
+        for n in range(1, size + 1)
+    ]
+    backend.create_spreadsheet(spreadsheet_id, sheets={PaymentsSheetsManager.SHEET_NAMES[ROLE]: rows})
+
+
+def run_operation(manager: PaymentsSheetsManager, operation: str, i: int, size: int) -> bool:
+    new_id = 10 ** 7 + i
+    if operation == 'add':
+        return manager.add_payment_to_sheet(new_id, f"User {i}", 100 + i, '2025-02-01', '2025-02-28', '', ROLE)
+    if operation == 'update':
+        return manager.update_payment_in_sheet(1 + (i * 7919) % size, ROLE, {'amount': i, 'comment': 'bench'})
+    return manager.delete_payment_from_sheet(new_id, ROLE)
+
+
+def measure(backend, size: int, ops: int, cached: bool) -> dict:
+    spreadsheet_id = f"payments-{size}-{'cached' if cached else 'uncached'}"
+    create_sheet(backend, spreadsheet_id, size)
+    manager = PaymentsSheetsManager()
+    manager.spreadsheet_id = spreadsheet_id
+    if not cached:
+        manager.row_cache = PaymentRowCache(ttl=0)
+    else:
+        # Первое обращение открывает лист и читает колонку ID - вне замеров
+        manager.update_payment_in_sheet(1, ROLE, {'comment': 'warm-up'})
+
+    result = {}
+    for operation in OPERATIONS:
+        backend.reset_counters()
+        elapsed = 0.0
+        for i in range(ops):
+            if not cached:
+                manager._local.__dict__.clear()
+            started = time.perf_counter()
+            assert run_operation(manager, operation, i, size), (operation, i)
+            elapsed += time.perf_counter() - started
+        result[operation] = (backend.stats()['requests'] / ops, elapsed / ops * 1000)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Payment row addressing benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000, 50000])
+    parser.add_argument('--ops', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.02)
+    args = parser.parse_args()
+
+    logger.setLevel('WARNING')
+    sheets_module.rate_limiter = QuotaRateLimiter(1e9, 1e9)
+    backend = client_pool.backend
+
+    backend.latency = args.latency
+    print(f"latency {args.latency * 1000:.0f}ms, {args.ops} operations of each kind")
+    print(f"{'rows':>7} {'mode':>9}" + ''.join(f" {op + ' calls':>13} {op + ' ms':>10}" for op in OPERATIONS))
+    for size in args.sizes:
+        for cached in (False, True):
+            result = measure(backend, size, args.ops, cached)
+            print(f"{size:>7} {'cached' if cached else 'uncached':>9}" + ''.join(
+                f" {result[op][0]:>13.2f} {result[op][1]:>10.1f}" for op in OPERATIONS))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""
+Бенчмарк инкрементальной синхронизации платежей на фейковом бэкенде
+
+Листы ролей заполняются --sizes платежами каждый, БД и водяные знаки
+выравниваются одной полной синхронизацией. Затем для каждого числа новых
+платежей из --new (половина добавляется в листы вручную, половина - в БД
+ботом) выполняется синхронизация в двух режимах:
+  - full: PaymentsSyncManager.full_sync_payments() (сверка всех ID);
+  - incremental: PaymentsSyncManager.sync_payments() (по водяным знакам).
+Печатаются вызовы API, байты ответов, прочитанные платежи БД и время.
+В конце проверяется откат к полной сверке: строка над хвостом листа
+удаляется вручную, после чего обе стороны снова совпадают.
+
+Запуск: python benchmarks/payments_incremental_benchmark.py [--sizes 1000 10000] [--new 0 10 100]
+        [--latency 0.02]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'payments_incremental_benchmark.log'))
+os.environ['GOOGLE_BACKEND'] = 'fake'
+os.environ['PAYMENTS_SPREADSHEET_ID'] = 'payments-incremental'
+
+from src.config.settings import UserRole, logger
+from src.database.database_manager import DatabaseManager
+from src.google_integration import sheets_manager as sheets_module
+from src.google_integration.client_pool import client_pool
+from src.google_integration.payments_sheets_manager import PaymentsSheetsManager
+from src.google_integration.payments_sync_manager import PaymentsSyncManager
+from src.google_integration.rate_limiter import QuotaRateLimiter
+
+SPREADSHEET_ID = os.environ['PAYMENTS_SPREADSHEET_ID']
+ROLES = [UserRole.ADMIN, UserRole.WORKER, UserRole.SECONDARY, UserRole.CLIENT]
+
+
+def sheet_row(payment_id: int) -> list:
+    return [str(payment_id), f"User {payment_id % 10}", 100 + payment_id % 1000, '2025-01-01', '2025-01-31',
+            '', '2025-01-02 10:00:00', '', '']
+
+
+class CountingDatabase(DatabaseManager):
+    """БД, считающая платежи, прочитанные синхронизацией"""
+
+    payments_read = 0
+
+    def get_payments(self, *args, **kwargs):
+        payments = super().get_payments(*args, **kwargs)
+        self.payments_read += len(payments)
+        return payments
+
+
+def sheet_ids(backend) -> list:
+    ids = []
+    for role in ROLES:
+        ids += [int(row[0]) for row in backend.rows(SPREADSHEET_ID, PaymentsSheetsManager.SHEET_NAMES[role])[1:]
+                if row and row[0]]
+    return ids
+
+
+def setup(backend, size: int) -> PaymentsSyncManager:
+    backend.create_spreadsheet(SPREADSHEET_ID, 'Payments', {
+        PaymentsSheetsManager.SHEET_NAMES[role]: [list(PaymentsSheetsManager.HEADERS)] + [
+            sheet_row(r * size + n + 1) for n in range(size)
+        ]
+        for r, role in enumerate(ROLES)
+    })
+    sync = PaymentsSyncManager()
+    sync.db = CountingDatabase(os.path.join(tempfile.mkdtemp(), 'payments.db'))
+    assert sync.db.init_db()
+    assert sync.full_sync_payments()['total_errors'] == 0
+    return sync
+
+
+def add_new_payments(backend, sync: PaymentsSyncManager, count: int):
+    """Половина новых платежей - платежи бота в БД, половина - строки листов (ввод вручную со следующими ID)"""
+    for i in range(count - count // 2):
+        assert sync.db.add_payment(f"Bot user {i}", amount=10 + i)
+    next_id = sync.db.get_max_payment_id() + 1
+    for i in range(count // 2):
+        sheet_name = PaymentsSheetsManager.SHEET_NAMES[ROLES[i % len(ROLES)]]
+        with backend._lock:
+            sheet = backend._sheet(SPREADSHEET_ID, sheet_name)
+            sheet.rows.append(sheet_row(next_id + i))
+            sheet.row_count = max(sheet.row_count, len(sheet.rows))
+
+
+def measure(backend, sync: PaymentsSyncManager, mode: str) -> tuple:
+    backend.reset_counters()
+    sync.db.payments_read = 0
+    started = time.perf_counter()
+    stats = sync.sync_payments() if mode == 'incremental' else sync.full_sync_payments()
+    elapsed = time.perf_counter() - started
+    backend_stats, db_read = backend.stats(), sync.db.payments_read
+    assert stats['total_errors'] == 0, stats
+    db_ids = sorted(payment['id'] for payment in sync.db.get_payments())
+    ids = sheet_ids(backend)
+    assert db_ids == sorted(ids), f"DB and sheets differ: {sorted(set(db_ids) - set(ids))[:10]} {sorted(set(ids) - set(db_ids))[:10]}"
+    return stats['total_added'], backend_stats['requests'], backend_stats['bytes_sent'], db_read, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Incremental payments sync benchmark')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--new', type=int, nargs='+', default=[0, 10, 100])
+    parser.add_argument('--latency', type=float, default=0.02)
+    args = parser.parse_args()
+
+    logger.setLevel('WARNING')
+    sheets_module.rate_limiter = QuotaRateLimiter(1e9, 1e9)
+    backend = client_pool.backend
+
+    print(f"latency {args.latency * 1000:.0f}ms, {len(ROLES)} role sheets")
+    print(f"{'rows/sheet':>10} {'new':>5} {'mode':>12} {'added':>6} {'calls':>6} {'bytes read':>11} "
+          f"{'DB rows read':>13} {'ms':>8}")
+    for size in args.sizes:
+        backend.latency = 0
+        sync = setup(backend, size)
+        backend.latency = args.latency
+        for new in args.new:
+            for mode in ('full', 'incremental'):
+                add_new_payments(backend, sync, new)
+                added, calls, size_read, db_read, elapsed = measure(backend, sync, mode)
+                assert added == new, (mode, added, new)
+                print(f"{size:>10} {new:>5} {mode:>12} {added:>6} {calls:>6} {size_read:>11} "
+                      f"{db_read:>13} {elapsed * 1000:>8.0f}")
+
+        # Строка над хвостом удалена вручную: инкрементальная синхронизация откатывается к полной
+        with backend._lock:
+            rows = backend._sheet(SPREADSHEET_ID, PaymentsSheetsManager.SHEET_NAMES[ROLES[0]]).rows
+            del rows[2]
+        add_new_payments(backend, sync, 4)
+        added, calls, _, db_read, _ = measure(backend, sync, 'incremental')
+        assert added == 5, added  # 4 новых платежа и удаленный из листа платеж БД
+        print(f"{size:>10} tail moved: fallback to full sync, {calls} calls, {db_read} DB rows read, DB and sheets match")
+
+    print("ok")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Бенчмарк маршрутизации платежей по листам ролей на фейковом бэкенде
+
+В БД --payments платежей для --users пользователей разных ролей (и
+нескольких имен без пользователя), листы ролей пусты. Печатается:
+  - время определения ролей всех платежей: поиск по файлу пользователей
+    для каждого платежа (как раньше) и одна кешированная карта
+    {display_name: роль};
+  - дозапись (backfill) всех платежей в листы: вызовы API, в т.ч. append
+    (по одному на лист роли), и время; затем проверяется, что каждый
+    платеж попал на лист своей роли, а повторная синхронизация ничего не
+    добавляет.
+
+Запуск: python benchmarks/payments_routing_benchmark.py [--payments 1000] [--users 40] [--latency 0.02]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'payments_routing_benchmark.log'))
+os.environ['GOOGLE_BACKEND'] = 'fake'
+os.environ['PAYMENTS_SPREADSHEET_ID'] = 'payments-routing'
+
+from src.config.settings import UserRole, logger
+from src.database.database_manager import DatabaseManager
+from src.google_integration import sheets_manager as sheets_module
+from src.google_integration.client_pool import client_pool
+from src.google_integration.payments_sheets_manager import PaymentsSheetsManager
+from src.google_integration.payments_sync_manager import PaymentsSyncManager
+from src.google_integration.rate_limiter import QuotaRateLimiter
+from src.utils import config_utils
+
+SPREADSHEET_ID = os.environ['PAYMENTS_SPREADSHEET_ID']
+ROLES = [UserRole.ADMIN, UserRole.WORKER, UserRole.SECONDARY, UserRole.CLIENT]
+
+
+def role_by_scan(display_name: str) -> str:
+    """Определение роли до кеша: файл пользователей читается для каждого платежа"""
+    for user_data in config_utils.load_users().values():
+        if user_data.get('display_name') == display_name:
+            return user_data.get('role', UserRole.WORKER)
+    return UserRole.WORKER
+
+
+def expected_sheet(roles: dict, display_name: str) -> str:
+    role = roles.get(display_name, UserRole.WORKER)
+    return PaymentsSheetsManager.SHEET_NAMES.get(role, PaymentsSheetsManager.SHEET_NAMES[UserRole.WORKER])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Role-aware payment routing benchmark')
+    parser.add_argument('--payments', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=40)
+    parser.add_argument('--latency', type=float, default=0.02)
+    args = parser.parse_args()
+
+    logger.setLevel('WARNING')
+    sheets_module.rate_limiter = QuotaRateLimiter(1e9, 1e9)
+    backend = client_pool.backend
+    data_dir = tempfile.mkdtemp()
+
+    # Пользователи: роли по кругу, один супер-админ (своего листа нет) и один без роли
+    users = {
+        str(1000 + i): {'display_name': f"User {i}", 'role': ROLES[i % len(ROLES)]}
+        for i in range(args.users)
+    }
+    users['1'] = {'display_name': 'Owner', 'role': UserRole.SUPER_ADMIN}
+    users['2'] = {'display_name': 'No role'}
+    config_utils.USERS_FILE = os.path.join(data_dir, 'users.json')
+    with open(config_utils.USERS_FILE, 'w', encoding='utf-8') as f:
+        json.dump(users, f, ensure_ascii=False, indent=2)
+
+    names = [f"User {i}" for i in range(args.users)] + ['Owner', 'No role', 'Former user']
+    db = DatabaseManager(os.path.join(data_dir, 'payments.db'))
+    assert db.init_db()
+    assert db.add_missing_payments([
+        {'id': i + 1, 'user_display_name': names[i % len(names)], 'amount': 100 + i,
+         'date_from': '2025-01-01', 'date_to': '2025-01-31', 'created_at': '2025-01-02 10:00:00'}
+        for i in range(args.payments)
+    ]) == args.payments
+    payments = db.get_payments()
+
+    started = time.perf_counter()
+    scanned = {payment['id']: role_by_scan(payment['user_display_name']) for payment in payments}
+    scan_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    roles = config_utils.get_display_name_roles()
+    mapped = {payment['id']: roles.get(payment['user_display_name'], UserRole.WORKER) for payment in payments}
+    map_ms = (time.perf_counter() - started) * 1000
+    assert scanned == mapped
+    print(f"{len(payments)} payments, {len(users)} users")
+    print(f"role lookup: per-payment file scan {scan_ms:.1f}ms, cached map {map_ms:.2f}ms")
+
+    backend.create_spreadsheet(SPREADSHEET_ID, 'Payments', {
+        sheet_name: [list(PaymentsSheetsManager.HEADERS)] for sheet_name in PaymentsSheetsManager.SHEET_NAMES.values()
+    })
+    backend.latency = args.latency
+    sync = PaymentsSyncManager()
+    sync.db = db
+
+    backend.reset_counters()
+    started = time.perf_counter()
+    stats = sync.full_sync_payments()
+    elapsed = time.perf_counter() - started
+    calls = backend.stats()['calls']
+    assert stats['total_errors'] == 0 and stats['db_to_sheets']['added'] == args.payments, stats
+    print(f"backfill: {stats['db_to_sheets']['added']} payments, {sum(calls.values())} API calls "
+          f"({calls.get('spreadsheets.values.append', 0)} appends), {elapsed * 1000:.0f}ms")
+
+    by_sheet = {}
+    for sheet_name in PaymentsSheetsManager.SHEET_NAMES.values():
+        rows = backend.rows(SPREADSHEET_ID, sheet_name)[1:]
+        by_sheet[sheet_name] = len(rows)
+        for row in rows:
+            assert expected_sheet(roles, row[1]) == sheet_name, (row, sheet_name)
+    assert sum(by_sheet.values()) == args.payments
+    print('rows per sheet: ' + ', '.join(f"{sheet_name}: {count}" for sheet_name, count in by_sheet.items()))
+
+    stats = sync.full_sync_payments()
+    assert stats['total_added'] == 0 and stats['total_errors'] == 0, stats
+    print("ok: every payment is on its role sheet, repeated sync adds nothing")
+
+
+if __name__ == '__main__':
+    main()
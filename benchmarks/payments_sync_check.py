@@ -0,0 +1,102 @@
+"""
+Проверка сходимости синхронизации платежей на фейковом бэкенде
+
+Исходное состояние: часть платежей только в листах ролей, часть только
+в БД, часть - с обеих сторон. Затем --runs раз подряд выполняется
+PaymentsSyncManager.full_sync_payments(). После первой синхронизации
+обе стороны содержат одинаковый набор ID, а каждая следующая ничего не
+добавляет: размер БД и листов не растет.
+
+Запуск: python benchmarks/payments_sync_check.py [--runs 10] [--payments 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'payments_sync_check.log'))
+os.environ['GOOGLE_BACKEND'] = 'fake'
+os.environ['PAYMENTS_SPREADSHEET_ID'] = 'payments-sync-check'
+
+from src.config.settings import UserRole, logger
+from src.database.database_manager import DatabaseManager
+from src.google_integration import sheets_manager as sheets_module
+from src.google_integration.client_pool import client_pool
+from src.google_integration.payments_sheets_manager import PaymentsSheetsManager
+from src.google_integration.payments_sync_manager import PaymentsSyncManager
+from src.google_integration.rate_limiter import QuotaRateLimiter
+
+ROLES = [UserRole.ADMIN, UserRole.WORKER, UserRole.SECONDARY, UserRole.CLIENT]
+
+
+def sheet_row(payment_id: int) -> list:
+    return [str(payment_id), f"User {payment_id % 10}", 100 + payment_id, '2025-01-01', '2025-01-31',
+            f"sheet {payment_id}", '2025-01-02 10:00:00', '', '']
+
+
+def sheet_ids(backend) -> list:
+    ids = []
+    for role in ROLES:
+        ids += [row[0] for row in backend.rows(os.environ['PAYMENTS_SPREADSHEET_ID'],
+                                               PaymentsSheetsManager.SHEET_NAMES[role])[1:]]
+    return ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Payments sync convergence check')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--payments', type=int, default=200)
+    args = parser.parse_args()
+
+    logger.setLevel('WARNING')
+    sheets_module.rate_limiter = QuotaRateLimiter(1e9, 1e9)
+    backend = client_pool.backend
+
+    # Листы: ID 1..N по ролям; БД: ID N/2+1..N (общие) и новые платежи бота
+    n = args.payments
+    backend.create_spreadsheet(os.environ['PAYMENTS_SPREADSHEET_ID'], 'Payments', {
+        PaymentsSheetsManager.SHEET_NAMES[role]: [list(PaymentsSheetsManager.HEADERS)] + [
+            sheet_row(payment_id) for payment_id in range(1, n + 1) if payment_id % len(ROLES) == r
+        ]
+        for r, role in enumerate(ROLES)
+    })
+    db = DatabaseManager(os.path.join(tempfile.mkdtemp(), 'payments.db'))
+    assert db.init_db()
+    assert db.add_missing_payments([
+        {'id': payment_id, 'user_display_name': f"User {payment_id % 10}", 'amount': 100 + payment_id,
+         'comment': f"sheet {payment_id}"}
+        for payment_id in range(n // 2 + 1, n + 1)
+    ]) == n - n // 2
+    bot_payments = [db.add_payment(f"Bot user {i}", amount=10 + i) for i in range(n // 4)]
+    assert all(bot_payments) and min(bot_payments) > n
+
+    sync = PaymentsSyncManager()
+    sync.db = db
+    sizes = []
+    for run in range(1, args.runs + 1):
+        backend.reset_counters()
+        started = time.perf_counter()
+        stats = sync.full_sync_payments()
+        elapsed = time.perf_counter() - started
+        db_ids = [payment['id'] for payment in db.get_payments()]
+        ids = sheet_ids(backend)
+        sizes.append((len(db_ids), len(ids)))
+        print(f"run {run:>2}: added {stats['total_added']:>4}, errors {stats['total_errors']}, "
+              f"DB {len(db_ids)}, sheets {len(ids)}, API calls {backend.stats()['requests']}, {elapsed * 1000:.0f}ms")
+        assert stats['total_errors'] == 0, stats
+        assert len(ids) == len(set(ids)), "duplicate IDs in sheets"
+        assert sorted(db_ids) == sorted(int(i) for i in ids), "DB and sheets differ"
+        if run > 1:
+            assert stats['total_added'] == 0, stats
+
+    expected = n + len(bot_payments)
+    assert set(sizes) == {(expected, expected)}, sizes
+    assert sync.validate_sync()
+    print(f"ok: {args.runs} syncs, DB and sheets stay at {expected} payments")
+
+
+if __name__ == '__main__':
+    main()
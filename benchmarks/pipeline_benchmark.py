@@ -0,0 +1,385 @@
+"""
+Сквозной бенчмарк конвейера Google Sheets на фейковом бэкенде (GOOGLE_BACKEND=fake)
+
+Настоящие компоненты бота работают поверх FakeGoogleBackend (таблицы в
+памяти, задержка ответа --latency), размер листов - 100, 10 000 и
+100 000 строк (--sizes). Сценарии:
+  - worker-threads / worker-asyncio: AsyncSheetsWorker / AsyncioSheetsWorker,
+    смесь задач ADD_RECORD, UPDATE_RECORD и ADD_PAYMENT по 4 таблицам;
+  - sheets-manager: GoogleSheetsManager напрямую (добавление, обновление
+    полей, удаление записи);
+  - payments-manager: PaymentsSheetsManager напрямую (добавление,
+    обновление, удаление платежа);
+  - sync: SyncManager.full_sync(force=True) - импорт 4 таблиц в БД,
+    задача - строка листа, фиксация - запись таблицы в БД;
+  - payments-sync: PaymentsSyncManager.full_sync_payments - листы всех
+    ролей в БД и обратно, задача - строка листа.
+
+Для каждого сценария и размера печатаются задачи/с, вызовы API на задачу,
+p95 задержки от постановки задачи до фиксации и пиковый RSS. Каждый запуск
+идет в отдельном процессе (RSS не смешивается). Квоты ограничителя по
+умолчанию сняты (--quota), измеряется сам конвейер.
+
+Результаты сохраняются в JSON (по умолчанию benchmarks/results/pipeline-<commit>.json);
+--compare BASELINE.json печатает изменение относительно другого коммита.
+
+Запуск: python benchmarks/pipeline_benchmark.py [--sizes 100 10000 100000] [--tasks 40]
+        [--latency 0.02] [--scenarios worker-threads sync ...] [--output FILE] [--compare FILE]
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, ROOT)
+
+SCENARIOS = ('worker-threads', 'worker-asyncio', 'sheets-manager', 'payments-manager', 'sync', 'payments-sync')
+SPREADSHEETS = 4
+SHEET_NAME = 'Ծախսեր'
+PAYMENTS_SPREADSHEET = 'payments-bench'
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def percentile(values, q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def expense_record(n: int, size: int, spreadsheet_id: str) -> dict:
+    """Запись с датой, растущей вместе с номером (лист отсортирован по дате)"""
+    day = date(2024, 1, 1) + timedelta(days=n * 365 // max(size, 1))
+    return {'id': f"cb-{spreadsheet_id}-{n}", 'date': day.isoformat(), 'supplier': f"Supplier {n % 50}",
+            'direction': f"Direction {n % 5}", 'description': f"Expense {n}", 'amount': 1000 + n % 9000,
+            'spreadsheet_id': spreadsheet_id, 'sheet_name': SHEET_NAME}
+
+
+class Pipeline:
+    """Фейковый бэкенд с данными, временная БД и счетчики одного запуска"""
+
+    def __init__(self, size: int, latency: float, payments: bool):
+        from src.config.settings import UserRole
+        from src.database.database_manager import DatabaseManager
+        from src.google_integration.client_pool import client_pool
+        from src.google_integration.payments_sheets_manager import PaymentsSheetsManager
+        from src.google_integration.sheets_manager import build_record_row, RECORD_HEADERS
+
+        self.size = size
+        self.backend = client_pool.backend
+        self.spreadsheet_ids = [f"expenses-{i}" for i in range(SPREADSHEETS)]
+        for spreadsheet_id in self.spreadsheet_ids:
+            rows = [list(RECORD_HEADERS)] + [build_record_row(expense_record(n, size, spreadsheet_id))
+                                             for n in range(size)]
+            self.backend.create_spreadsheet(spreadsheet_id, sheets={SHEET_NAME: rows})
+
+        self.roles = [UserRole.ADMIN, UserRole.WORKER, UserRole.SECONDARY, UserRole.CLIENT]
+        if payments:
+            created = datetime(2025, 1, 1).strftime('%Y-%m-%d %H:%M:%S')
+            sheets = {}
+            for r, role in enumerate(self.roles):
+                sheets[PaymentsSheetsManager.SHEET_NAMES[role]] = [list(PaymentsSheetsManager.HEADERS)] + [
+                    [str(r * size + n + 1), f"User {n % 100}", 500 + n % 1000, '2025-01-01', '2025-01-31',
+                     '', created, '', '']
+                    for n in range(size)
+                ]
+            self.backend.create_spreadsheet(PAYMENTS_SPREADSHEET, sheets=sheets)
+
+        self.db_path = os.path.join(tempfile.mkdtemp(), 'pipeline.db')
+        self.db = DatabaseManager(self.db_path)
+        self.db.init_db()
+        self.backend.latency = latency
+        self.backend.reset_counters()
+        self.latencies = []
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def commit(self, latency: float, success: bool = True):
+        with self._lock:
+            self.latencies.append(latency)
+            self.failed += not success
+
+    def result(self, scenario: str, tasks: int, elapsed: float, baseline_rss: float, **extra) -> dict:
+        stats = self.backend.stats()
+        return {
+            'scenario': scenario,
+            'size': self.size,
+            'latency_s': self.backend.latency,
+            'tasks': tasks,
+            'failed': self.failed,
+            'elapsed_s': round(elapsed, 3),
+            'tasks_per_s': round(tasks / elapsed, 2) if elapsed else 0.0,
+            'api_calls': stats['requests'],
+            'api_calls_per_task': round(stats['requests'] / tasks, 2) if tasks else 0.0,
+            'p50_commit_latency_s': round(percentile(self.latencies, 0.5), 4),
+            'p95_commit_latency_s': round(percentile(self.latencies, 0.95), 4),
+            'bytes_sent_mb': round(stats['bytes_sent'] / 1e6, 2),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+            'rss_growth_mb': round(peak_rss_mb() - baseline_rss, 1),
+            'calls': stats['calls'],
+            **extra,
+        }
+
+
+def worker_tasks(pipeline: Pipeline, count: int, callback_for):
+    """Смесь задач воркера: половина - новые записи, четверть - обновления, четверть - платежи"""
+    from src.config.settings import UserRole
+    from src.google_integration import async_sheets_worker as worker_module
+
+    tasks = []
+    for i in range(count):
+        spreadsheet_id = pipeline.spreadsheet_ids[i % SPREADSHEETS]
+        kind = i % 4
+        if kind in (0, 1):
+            record = expense_record(i * 7919 % max(pipeline.size, 1), pipeline.size, spreadsheet_id)
+            record['id'] = f"new-{i}"
+            task = worker_module.make_add_record_task(spreadsheet_id, SHEET_NAME, record)
+        elif kind == 2:
+            record_id = f"cb-{spreadsheet_id}-{i * 104729 % max(pipeline.size, 1)}"
+            task = worker_module.make_update_record_task(spreadsheet_id, SHEET_NAME, record_id, 'amount', i)
+        else:
+            task = worker_module.make_add_payment_task(10 ** 7 + i, f"User {i}", 100 + i, UserRole.WORKER,
+                                                       '2025-02-01', '2025-02-28')
+        task.callback = callback_for(task)
+        tasks.append(task)
+    return tasks
+
+
+def run_worker(pipeline: Pipeline, scenario: str, count: int, concurrency: int) -> float:
+    from src.database.sheets_outbox import SheetsOutbox
+    from src.google_integration import async_sheets_worker as worker_module
+
+    done = threading.Event()
+    finished = [0]
+
+    def callback_for(task):
+        def callback(success, error):
+            pipeline.commit(time.time() - task.enqueued_at, success)
+            with pipeline._lock:
+                finished[0] += 1
+                if finished[0] == count:
+                    done.set()
+        return callback
+
+    outbox = SheetsOutbox(pipeline.db_path)
+    if scenario == 'worker-threads':
+        worker = worker_module.AsyncSheetsWorker(concurrency, outbox=outbox)
+        started = time.perf_counter()
+        for task in worker_tasks(pipeline, count, callback_for):
+            worker.add_task(task)
+        done.wait()
+        elapsed = time.perf_counter() - started
+        worker.stop()
+        return elapsed
+
+    async def main():
+        worker = worker_module.AsyncioSheetsWorker(concurrency, outbox=outbox)
+        worker.start()
+        started = time.perf_counter()
+        for task in worker_tasks(pipeline, count, callback_for):
+            worker.add_task(task)
+        while not done.is_set():
+            await asyncio.sleep(0.005)
+        elapsed = time.perf_counter() - started
+        worker.stop()
+        await worker.client.aclose()
+        return elapsed
+
+    return asyncio.run(main())
+
+
+def run_sheets_manager(pipeline: Pipeline, count: int) -> float:
+    from src.google_integration.sheets_manager import sheets_manager
+
+    started = time.perf_counter()
+    for i in range(count):
+        spreadsheet_id = pipeline.spreadsheet_ids[i % SPREADSHEETS]
+        call_started = time.perf_counter()
+        kind = i % 3
+        if kind == 0:
+            record = expense_record(i * 7919 % max(pipeline.size, 1), pipeline.size, spreadsheet_id)
+            record['id'] = f"new-{i}"
+            success = sheets_manager.add_record_to_sheet(spreadsheet_id, SHEET_NAME, record)
+        elif kind == 1:
+            record_id = f"cb-{spreadsheet_id}-{i * 104729 % max(pipeline.size, 1)}"
+            success = sheets_manager.update_record_fields_in_sheet(
+                spreadsheet_id, SHEET_NAME, record_id, {'amount': i, 'description': f"Updated {i}"})
+        else:
+            success = sheets_manager.delete_record_from_sheet(
+                pipeline.spreadsheet_ids[(i - 2) % SPREADSHEETS], SHEET_NAME, f"new-{i - 2}")
+        pipeline.commit(time.perf_counter() - call_started, success)
+    return time.perf_counter() - started
+
+
+def run_payments_manager(pipeline: Pipeline, count: int) -> float:
+    from src.google_integration.payments_sheets_manager import PaymentsSheetsManager
+
+    payments = PaymentsSheetsManager()
+    started = time.perf_counter()
+    for i in range(count):
+        role = pipeline.roles[i % len(pipeline.roles)]
+        call_started = time.perf_counter()
+        kind = i % 3
+        if kind == 0:
+            success = payments.add_payment_to_sheet(10 ** 7 + i, f"User {i}", 100 + i, '2025-02-01',
+                                                    '2025-02-28', 'bench', role)
+        elif kind == 1:
+            payment_id = pipeline.roles.index(role) * pipeline.size + i % max(pipeline.size, 1) + 1
+            success = payments.update_payment_in_sheet(payment_id, role, {'amount': i})
+        else:
+            success = payments.delete_payment_from_sheet(10 ** 7 + i - 2, pipeline.roles[(i - 2) % len(pipeline.roles)])
+        pipeline.commit(time.perf_counter() - call_started, success)
+    return time.perf_counter() - started
+
+
+def run_sync(pipeline: Pipeline) -> float:
+    from src.database.sheets_sync_state import SheetsSyncState
+    from src.google_integration.sheets_manager import sheets_manager
+    from src.google_integration.sync_manager import SyncManager
+
+    sync = SyncManager(sheets_manager, pipeline.db, SheetsSyncState(pipeline.db_path))
+    started = time.perf_counter()
+    committed = [0]
+
+    async def progress(done, total, stats):
+        # Таблица записана в БД: все ее строки зафиксированы в этот момент
+        rows = stats['synced_records'] - committed[0]
+        committed[0] = stats['synced_records']
+        for _ in range(rows):
+            pipeline.commit(time.perf_counter() - started)
+
+    stats = asyncio.run(sync.full_sync(force=True, progress=progress))
+    elapsed = time.perf_counter() - started
+    assert stats['errors'] == 0 and stats['new_records'] == SPREADSHEETS * pipeline.size, stats
+    return elapsed
+
+
+def run_payments_sync(pipeline: Pipeline) -> float:
+    from src.google_integration.payments_sync_manager import PaymentsSyncManager
+
+    sync = PaymentsSyncManager()
+    sync.db = pipeline.db
+    started = time.perf_counter()
+    stats = sync.full_sync_payments()
+    elapsed = time.perf_counter() - started
+    for _ in range(len(pipeline.roles) * pipeline.size):
+        pipeline.commit(elapsed)
+    assert stats['total_errors'] == 0, stats
+    return elapsed
+
+
+def run_scenario(scenario: str, size: int, tasks: int, latency: float, concurrency: int) -> dict:
+    """Один запуск в отдельном процессе"""
+    from src.config.settings import logger
+    logger.setLevel('ERROR')
+
+    baseline_rss = peak_rss_mb()
+    pipeline = Pipeline(size, latency, payments=scenario != 'sync')
+    if scenario in ('worker-threads', 'worker-asyncio'):
+        elapsed = run_worker(pipeline, scenario, tasks, concurrency)
+    elif scenario == 'sheets-manager':
+        elapsed = run_sheets_manager(pipeline, tasks)
+    elif scenario == 'payments-manager':
+        elapsed = run_payments_manager(pipeline, tasks)
+    elif scenario == 'sync':
+        elapsed = run_sync(pipeline)
+        tasks = SPREADSHEETS * size
+    else:
+        elapsed = run_payments_sync(pipeline)
+        tasks = len(pipeline.roles) * size
+    return pipeline.result(scenario, tasks, elapsed, baseline_rss, concurrency=concurrency)
+
+
+def git_commit() -> dict:
+    def git(*args):
+        return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    return {'commit': git('rev-parse', '--short', 'HEAD') or 'unknown',
+            'dirty': bool(git('status', '--porcelain', '--untracked-files=no'))}
+
+
+def print_result(result: dict, baseline: dict = None):
+    line = (f"{result['scenario']:17s} {result['size']:>7d} {result['tasks']:>7d} {result['tasks_per_s']:>10.1f} "
+            f"{result['api_calls_per_task']:>10.2f} {result['p95_commit_latency_s'] * 1000:>10.1f} "
+            f"{result['peak_rss_mb']:>8.1f}")
+    if baseline:
+        change = lambda key: (result[key] / baseline[key] - 1) * 100 if baseline.get(key) else 0.0
+        line += (f"   vs base: tasks/s {change('tasks_per_s'):+.0f}%  calls/task {change('api_calls_per_task'):+.0f}%"
+                 f"  p95 {change('p95_commit_latency_s'):+.0f}%  RSS {change('peak_rss_mb'):+.0f}%")
+    if result['failed']:
+        line += f"   FAILED {result['failed']}"
+    print(line, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end Sheets pipeline benchmark on the fake backend')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 10000, 100000], help='Rows per sheet')
+    parser.add_argument('--tasks', type=int, default=40, help='Tasks per worker/manager scenario')
+    parser.add_argument('--latency', type=float, default=0.0, help='Injected API latency, seconds')
+    parser.add_argument('--concurrency', type=int, default=4, help='Worker threads / asyncio tasks')
+    parser.add_argument('--quota', type=int, default=10 ** 9, help='Rate limiter quota, requests per minute')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--output', help='JSON results file (default benchmarks/results/pipeline-<commit>.json)')
+    parser.add_argument('--compare', help='Baseline JSON results to compare with')
+    parser.add_argument('--run', nargs=2, metavar=('SCENARIO', 'SIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_scenario(args.run[0], int(args.run[1]), args.tasks, args.latency, args.concurrency)))
+        return
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = {(r['scenario'], r['size']): r for r in json.load(f)['results']}
+
+    env = dict(os.environ, GOOGLE_BACKEND='fake', PAYMENTS_SPREADSHEET_ID=PAYMENTS_SPREADSHEET,
+               GOOGLE_READ_REQUESTS_PER_MINUTE=str(args.quota), GOOGLE_WRITE_REQUESTS_PER_MINUTE=str(args.quota),
+               FAKE_GOOGLE_LATENCY='0', FAKE_GOOGLE_ERROR_RATE='0', FAKE_GOOGLE_DATA='',
+               LOG_FILE=os.path.join(tempfile.gettempdir(), 'pipeline_benchmark.log'))
+    print(f"latency {args.latency * 1000:.0f}ms, concurrency {args.concurrency}, {args.tasks} tasks per scenario")
+    print(f"{'scenario':17s} {'rows':>7s} {'tasks':>7s} {'tasks/s':>10s} {'calls/task':>10s} "
+          f"{'p95 ms':>10s} {'RSS MB':>8s}")
+    results = []
+    for size in args.sizes:
+        for scenario in args.scenarios:
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--tasks', str(args.tasks), '--latency',
+                 str(args.latency), '--concurrency', str(args.concurrency), '--run', scenario, str(size)],
+                capture_output=True, text=True, env=env
+            )
+            if completed.returncode != 0:
+                print(f"{scenario:17s} {size:>7d} failed:\n{completed.stderr[-2000:]}", flush=True)
+                continue
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print_result(result, baseline.get((scenario, size)))
+
+    output = args.output or os.path.join(ROOT, 'benchmarks', 'results', f"pipeline-{git_commit()['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            **git_commit(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'args': {key: value for key, value in vars(args).items() if key not in ('run', 'output', 'compare')},
+            'results': results,
+        }, f, ensure_ascii=False, indent=2)
+    print(f"results saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
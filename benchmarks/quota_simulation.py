@@ -0,0 +1,135 @@
+"""
+Симуляция квот Google Sheets API для AsyncSheetsWorker
+
+Поднимает в процессе фейковый сервер, который считает запросы в скользящем
+окне и отвечает 429 с Retry-After при превышении квоты. Воркер гоняет через
+него пачку задач; в конце печатается, сколько задач выполнено, сколько раз
+сервер вернул 429 и были ли потеряны задачи.
+
+Запуск: python benchmarks/quota_simulation.py [--tasks 200] [--quota 30] [--window 2]
+"""
+import argparse
+import sys
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'quota_simulation.log'))
+
+import gspread
+
+from src.database.database_manager import DatabaseManager
+from src.database.sheets_outbox import SheetsOutbox
+from src.google_integration import async_sheets_worker, sheets_manager as sheets_module
+from src.google_integration.rate_limiter import QuotaRateLimiter, READ, WRITE
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, headers: dict = None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = ''
+
+    def json(self):
+        return {'error': {'code': self.status_code, 'message': 'Quota exceeded', 'status': 'RESOURCE_EXHAUSTED'}}
+
+
+class FakeQuotaServer:
+    """Считает запросы на чтение/запись в скользящем окне, как квоты Google"""
+
+    def __init__(self, quota: int, window: float):
+        self.quota = quota
+        self.window = window
+        self.lock = threading.Lock()
+        self.calls = {READ: deque(), WRITE: deque()}
+        self.served = 0
+        self.rejected = 0
+
+    def handle(self, method: str):
+        kind = READ if method.upper() == 'GET' else WRITE
+        now = time.monotonic()
+        with self.lock:
+            calls = self.calls[kind]
+            while calls and calls[0] <= now - self.window:
+                calls.popleft()
+            if len(calls) >= self.quota:
+                self.rejected += 1
+                retry_after = max(0.1, calls[0] + self.window - now)
+                raise gspread.exceptions.APIError(FakeResponse(429, {'Retry-After': f"{retry_after:.2f}"}))
+            calls.append(now)
+            self.served += 1
+        return FakeResponse(200)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quota simulation for the Sheets worker')
+    parser.add_argument('--tasks', type=int, default=200)
+    parser.add_argument('--quota', type=int, default=30, help='Requests per window for each of read/write')
+    parser.add_argument('--window', type=float, default=2.0, help='Quota window in seconds')
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    server = FakeQuotaServer(args.quota, args.window)
+    per_minute = args.quota * 60.0 / args.window
+    limiter = QuotaRateLimiter(per_minute, per_minute)
+    async_sheets_worker.rate_limiter = limiter
+    sheets_module.rate_limiter = limiter
+
+    # Запросы клиента уходят в фейковый сервер, а не в Google
+    gspread.Client.request = lambda self, method, endpoint, *a, **kw: server.handle(method)
+    client = sheets_module.RateLimitedClient(auth=None)
+
+    def fake_add_record(spreadsheet_id, sheet_name, record):
+        # Как и настоящий менеджер: ошибки перехватываются, наружу уходит False
+        try:
+            for _ in range(3):
+                client.request('get', 'values')
+            client.request('post', 'values:append')
+            return True
+        except Exception:
+            return False
+
+    sheets_module.sheets_manager.add_record_to_sheet = fake_add_record
+    async_sheets_worker.sheets_manager.add_record_to_sheet = fake_add_record
+
+    done = threading.Semaphore(0)
+    results = {'ok': 0, 'failed': 0}
+
+    def callback(success, error):
+        results['ok' if success else 'failed'] += 1
+        done.release()
+
+    # Outbox воркера - во временной БД, а не в data/expenses.db
+    db = DatabaseManager(os.path.join(tempfile.mkdtemp(), 'quota.db'))
+    assert db.init_db()
+    worker = async_sheets_worker.AsyncSheetsWorker(args.workers, outbox=SheetsOutbox(db.db_path))
+    started = time.perf_counter()
+    for i in range(args.tasks):
+        worker.add_task(async_sheets_worker.SheetsTask(
+            task_type=async_sheets_worker.TaskType.ADD_RECORD,
+            spreadsheet_id='sim',
+            sheet_name=f"sheet-{i % 8}",
+            record_id=f"cb-{i}",
+            data={'id': f"cb-{i}"},
+            callback=callback,
+        ))
+    for _ in range(args.tasks):
+        done.acquire()
+    elapsed = time.perf_counter() - started
+    worker.stop()
+
+    print(f"tasks:            {args.tasks}")
+    print(f"completed:        {results['ok']}")
+    print(f"failed:           {results['failed']}")
+    print(f"server served:    {server.served}")
+    print(f"server 429s:      {server.rejected}")
+    print(f"elapsed:          {elapsed:.2f}s")
+    print(f"theoretical min:  {max(0, args.tasks * 3 - args.quota) / args.quota * args.window:.2f}s (read-bound)")
+
+
+if __name__ == '__main__':
+    main()
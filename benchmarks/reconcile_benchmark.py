@@ -0,0 +1,139 @@
+"""
+Бенчмарк сверки БД -> Google Sheets: построчная проверка против сверки множеств
+
+Sheets API отвечает фейковый бэкенд (GOOGLE_BACKEND=fake, несколько таблиц,
+чтение и запись, задержка ответа), клиент gspread настоящий. Записи БД (по умолчанию 10 000)
+распределены по 20 листам 4 таблиц, в листах нет каждой десятой записи и
+есть по одной лишней строке.
+  - legacy: прежний sync_db_to_sheets - для каждой записи get_worksheet_by_name
+            и get_all_records всего листа, недостающие - add_record_to_sheet.
+            Прогоняется на выборке записей (--legacy-sample) и линейно
+            экстраполируется на все записи;
+  - reconcile: SheetsReconciler - колонка ID всех листов таблицы одним
+            values.batchGet и одна дозапись values.append на лист.
+После сверки проверяется, что все записи есть в листах и повторная
+сверка ничего не дописывает.
+
+Запуск: python benchmarks/reconcile_benchmark.py [--records 10000] [--spreadsheets 4] [--sheets 5] [--latency 0.02]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'reconcile_benchmark.log'))
+os.environ['GOOGLE_BACKEND'] = 'fake'
+
+from src.config.settings import logger
+from src.google_integration.client_pool import client_pool
+from src.google_integration.rate_limiter import QuotaRateLimiter
+from src.google_integration import sheets_manager as sheets_module
+from src.google_integration.reconciliation import SheetsReconciler
+from src.google_integration.sheets_manager import RECORD_HEADERS, build_record_row
+
+
+def make_dataset(records: int, spreadsheets: int, sheets: int):
+    """Записи БД и листы, в которых нет каждой десятой записи и есть одна лишняя строка"""
+    targets = [(f"spreadsheet-{s}", f"Sheet {i}") for s in range(spreadsheets) for i in range(sheets)]
+    db_records = []
+    data = {spreadsheet_id: {} for spreadsheet_id, _ in targets}
+    for spreadsheet_id, title in targets:
+        data[spreadsheet_id][title] = [list(RECORD_HEADERS)]
+    for n in range(records):
+        spreadsheet_id, title = targets[n % len(targets)]
+        record = {
+            'id': f"cb-{n}", 'date': f"2025-{n % 12 + 1:02d}-{n % 28 + 1:02d}",
+            'supplier': f"Supplier {n % 7}", 'direction': 'Direction',
+            'description': f"Expense {n}", 'amount': 1000 + n,
+            'spreadsheet_id': spreadsheet_id, 'sheet_name': title,
+        }
+        db_records.append(record)
+        if (n // len(targets)) % 10:
+            data[spreadsheet_id][title].append(build_record_row(record))
+    for spreadsheet_id, title in targets:
+        data[spreadsheet_id][title].append(['manual-only', '01.01.25', 'Manual', '', '', 1])
+    return db_records, data
+
+
+def load_dataset(backend, data):
+    """Создает (или пересоздает) таблицы {spreadsheet_id: {название листа: строки}} в фейковом бэкенде"""
+    for spreadsheet_id, sheets in data.items():
+        backend.create_spreadsheet(spreadsheet_id, spreadsheet_id, sheets)
+
+
+def run_legacy(manager, records):
+    """Прежний sync_db_to_sheets: полный лист на каждую запись"""
+    synced = 0
+    for record in records:
+        worksheet = manager.get_worksheet_by_name(record['spreadsheet_id'], record['sheet_name'])
+        exists = any(str(row.get('ID', '')).strip() == record['id'] for row in worksheet.get_all_records())
+        if not exists and manager.add_record_to_sheet(record['spreadsheet_id'], record['sheet_name'], record):
+            synced += 1
+    return synced
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DB to Sheets reconciliation benchmark')
+    parser.add_argument('--records', type=int, default=10000)
+    parser.add_argument('--spreadsheets', type=int, default=4)
+    parser.add_argument('--sheets', type=int, default=5, help='Sheets per spreadsheet')
+    parser.add_argument('--latency', type=float, default=0.02, help='Simulated API latency, seconds')
+    parser.add_argument('--legacy-sample', type=int, default=100)
+    args = parser.parse_args()
+
+    logger.setLevel('WARNING')
+    sheets_module.rate_limiter = QuotaRateLimiter(1e9, 1e9)
+    records, data = make_dataset(args.records, args.spreadsheets, args.sheets)
+    backend = client_pool.backend
+    load_dataset(backend, data)
+    backend.latency = args.latency
+    manager = sheets_module.GoogleSheetsManager(client_pool=client_pool)
+
+    total_sheets = args.spreadsheets * args.sheets
+    print(f"{args.records} records, {total_sheets} sheets, {args.latency * 1000:.0f}ms per request")
+    print(f"{'path':22s} {'requests':>9s} {'received MB':>12s} {'wall time':>10s} {'appended':>9s}")
+
+    sample = records[:args.legacy_sample]
+    backend.reset_counters()
+    started = time.perf_counter()
+    synced = run_legacy(manager, sample)
+    elapsed = time.perf_counter() - started
+    scale = args.records / len(sample)
+    stats = backend.stats()
+    print(f"{'legacy (sample)':22s} {stats['requests']:9d} {stats['bytes_sent'] / 1e6:12.1f} {elapsed:9.2f}s {synced:9d}")
+    print(f"{'legacy (extrapolated)':22s} {stats['requests'] * scale:9.0f} {stats['bytes_sent'] * scale / 1e6:12.1f} "
+          f"{elapsed * scale:9.0f}s {'':>9s}")
+
+    load_dataset(backend, data)
+    backend.reset_counters()
+    reconciler = SheetsReconciler(manager)
+    started = time.perf_counter()
+    report = reconciler.reconcile(records)
+    elapsed = time.perf_counter() - started
+    stats = backend.stats()
+    print(f"{'reconcile':22s} {stats['requests']:9d} {stats['bytes_sent'] / 1e6:12.1f} {elapsed:9.2f}s {report.appended:9d}")
+    print(f"report: {json.dumps({key: value for key, value in report.to_dict().items() if key != 'details'})}")
+    print(f"first sheet: {json.dumps({**report.to_dict()['details'][0], 'missing_ids': '...'}, ensure_ascii=False)}")
+
+    # Все записи в листах, повторная сверка ничего не дописывает
+    expected = sum(1 for n in range(args.records) if not (n // total_sheets) % 10)
+    assert report.missing == report.appended == expected
+    assert report.extra == total_sheets and not report.errors
+    sheet_ids = {}
+    for record in records:
+        key = (record['spreadsheet_id'], record['sheet_name'])
+        if key not in sheet_ids:
+            sheet_ids[key] = {row[0] for row in backend.rows(*key) if row}
+        assert record['id'] in sheet_ids[key], f"{record['id']} is missing after reconciliation"
+    backend.reset_counters()
+    again = reconciler.reconcile(records)
+    assert again.missing == again.appended == 0
+    print(f"second run: {backend.stats()['requests']} requests, missing {again.missing}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Проверка позиций записей в листах (records.sheet_row) на фейковом бэкенде
+
+Потоковый воркер выполняет задачи записей над временной БД:
+  1. вставки сохраняют строки и сдвигают строки ниже точки вставки;
+  2. обновление и удаление с верной позицией читают одну ячейку ID
+     вместо всего листа (счетчики values.get по диапазонам);
+  3. устаревшая позиция (лист изменен вручную) проверяется, и запись
+     находится по колонке ID;
+  4. изменение даты с пересортировкой сохраняет новые строки всех записей.
+
+Запуск: python benchmarks/sheet_rows_check.py [--records 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'sheet_rows_check.log'))
+os.environ['GOOGLE_BACKEND'] = 'fake'
+
+from src.config.settings import logger
+from src.database.database_manager import DatabaseManager
+from src.database.sheets_outbox import SheetsOutbox
+from src.google_integration import async_sheets_worker as worker_module
+from src.google_integration import sheets_manager as sheets_module
+from src.google_integration.client_pool import client_pool
+from src.google_integration.rate_limiter import QuotaRateLimiter
+from src.google_integration.sheets_manager import RECORD_HEADERS
+
+SPREADSHEET_ID = 'rows-fake'
+SHEET = 'Sheet A'
+
+
+def record(n: int) -> dict:
+    return {'id': f"cb-{n}", 'date': f"2025-{1 + n % 12:02d}-{1 + n % 28:02d}", 'supplier': f"Supplier {n}",
+            'direction': 'Direction', 'description': f"Expense {n}", 'amount': 100 + n,
+            'spreadsheet_id': SPREADSHEET_ID, 'sheet_name': SHEET}
+
+
+def run(worker, task):
+    """Выполняет задачу синхронно в текущем потоке (как поток воркера)"""
+    worker._process_task(task)
+
+
+def check_positions(backend, worker):
+    """Строки в БД совпадают с фактическими строками листа"""
+    actual = {row[0]: i for i, row in enumerate(backend.rows(SPREADSHEET_ID, SHEET)[1:], start=2)}
+    stored = worker.sheet_rows.get_rows(SPREADSHEET_ID, SHEET)
+    wrong = {rid: (row, actual.get(rid)) for rid, row in stored.items() if actual.get(rid) != row}
+    assert not wrong, list(wrong.items())[:5]
+    return len(stored), len(actual)
+
+
+def reads(backend) -> int:
+    calls = backend.stats()['calls']
+    return calls.get('spreadsheets.values.get', 0) + calls.get('spreadsheets.values.batchGet', 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sheet row positions check')
+    parser.add_argument('--records', type=int, default=200)
+    args = parser.parse_args()
+
+    logger.setLevel('WARNING')
+    sheets_module.rate_limiter = worker_module.rate_limiter = QuotaRateLimiter(1e9, 1e9)
+    backend = client_pool.backend
+    backend.create_spreadsheet(SPREADSHEET_ID, 'Rows', {SHEET: [RECORD_HEADERS]})
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'rows.db')
+    db = DatabaseManager(db_path)
+    assert db.init_db()
+    worker = worker_module.AsyncSheetsWorker(1, outbox=SheetsOutbox(db_path))
+
+    started = time.perf_counter()
+    for n in range(args.records):
+        rec = record(n)
+        task = worker_module.make_add_record_task(SPREADSHEET_ID, SHEET, rec)
+        assert db.add_record(rec, task)
+        run(worker, task)
+    stored, actual = check_positions(backend, worker)
+    assert stored == actual == args.records, (stored, actual)
+    print(f"insert: {args.records} records, all positions match ({time.perf_counter() - started:.1f}s)")
+
+    # Обновление и удаление с верной позицией
+    backend.reset_counters()
+    for n in range(0, args.records, 10):
+        task = worker_module.make_update_record_task(SPREADSHEET_ID, SHEET, f"cb-{n}", 'amount', 7)
+        assert db.update_record(f"cb-{n}", 'amount', 7, task)
+        run(worker, task)
+    updates = len(range(0, args.records, 10))
+    print(f"update with hint: {updates} updates, {reads(backend)} reads, "
+          f"calls {backend.stats()['calls']}")
+    assert reads(backend) == updates
+
+    backend.reset_counters()
+    for n in range(5, args.records, 20):
+        task = worker_module.make_delete_record_task(SPREADSHEET_ID, SHEET, f"cb-{n}")
+        assert db.delete_record(f"cb-{n}", task)
+        assert 'sheet_row' in task.data
+        run(worker, task)
+    deletes = len(range(5, args.records, 20))
+    print(f"delete with hint: {deletes} deletes, {reads(backend)} reads")
+    assert reads(backend) == deletes
+    stored, actual = check_positions(backend, worker)
+    assert stored == actual == args.records - deletes, (stored, actual)
+
+    # Лист изменен вручную: строка вставлена сверху, позиции в БД устарели
+    with backend._lock:
+        backend._sheet(SPREADSHEET_ID, SHEET).rows.insert(1, ['manual-1', '2024-12-31', 'Manual', '', '', 1])
+    task = worker_module.make_update_record_task(SPREADSHEET_ID, SHEET, 'cb-0', 'supplier', 'Stale hint')
+    assert db.update_record('cb-0', 'supplier', 'Stale hint', task)
+    run(worker, task)
+    row = worker.sheet_rows.lookup('cb-0', SPREADSHEET_ID, SHEET)
+    assert backend.rows(SPREADSHEET_ID, SHEET)[row - 1][2] == 'Stale hint'
+    print(f"stale hint: record found by ID column, stored row corrected to {row}")
+
+    # Изменение даты с пересортировкой
+    with backend._lock:
+        del backend._sheet(SPREADSHEET_ID, SHEET).rows[1]
+    worker.sheet_rows.invalidate(SPREADSHEET_ID, SHEET)
+    task = worker_module.make_update_record_task(SPREADSHEET_ID, SHEET, 'cb-1', 'date', '2026-12-31')
+    assert db.update_record('cb-1', 'date', '2026-12-31', task)
+    run(worker, task)
+    stored, actual = check_positions(backend, worker)
+    assert stored == actual, (stored, actual)
+    assert backend.rows(SPREADSHEET_ID, SHEET)[-1][0] == 'cb-1'
+    print(f"resort: {stored} positions saved after date change")
+
+
+if __name__ == '__main__':
+    main()
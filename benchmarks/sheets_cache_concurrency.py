@@ -0,0 +1,124 @@
+"""
+Проверка SheetsCache под одновременными открытиями меню (фейковый бэкенд)
+
+--threads потоков одновременно (через барьер) запрашивают листы таблиц, как
+обработчик меню выбора листа. Фейковый бэкенд отвечает с задержкой
+--latency, а загрузка таблицы 'slow' дополнительно ждет --slow секунд.
+Сценарии:
+  - cold: все потоки промахиваются по --spreadsheets таблицам - на каждую
+    таблицу одна загрузка, остальные ждут ее;
+  - cached + slow: пока идет медленная загрузка 'slow', запросы к
+    закешированным таблицам отвечают сразу (блокировка не держится во время I/O);
+  - stale: все записи устарели - ответ сразу из кеша, по одному фоновому
+    обновлению на таблицу.
+Для каждого сценария печатаются максимальное и медианное время ответа,
+вызовы API и число загрузок кеша.
+
+Запуск: python benchmarks/sheets_cache_concurrency.py [--threads 50] [--spreadsheets 5]
+        [--latency 0.2] [--slow 3]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'sheets_cache_concurrency.log'))
+os.environ['GOOGLE_BACKEND'] = 'fake'
+
+from src.config.settings import logger
+from src.google_integration import sheets_manager as sheets_module
+from src.google_integration.client_pool import client_pool
+from src.google_integration.rate_limiter import QuotaRateLimiter
+from src.utils.sheets_cache import SheetsCache
+
+
+def open_menus(cache: SheetsCache, spreadsheet_ids: list, threads: int) -> list:
+    """Одновременные запросы листов; возвращает время ответа каждого потока"""
+    barrier = threading.Barrier(threads)
+    durations = [0.0] * threads
+    results = [None] * threads
+
+    def open_menu(i: int):
+        barrier.wait()
+        started = time.perf_counter()
+        results[i] = cache.get_sheets_info(spreadsheet_ids[i % len(spreadsheet_ids)])
+        durations[i] = time.perf_counter() - started
+
+    workers = [threading.Thread(target=open_menu, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert all(sheets_info for sheets_info, _ in results), "empty sheets info"
+    return durations
+
+
+def report(name: str, backend, cache: SheetsCache, durations: list):
+    stats = cache.get_cache_stats()
+    print(f"{name:>14}: max {max(durations) * 1000:>7.0f}ms, median {statistics.median(durations) * 1000:>7.1f}ms, "
+          f"API calls {backend.stats()['requests']:>3}, cache loads {stats['loads']:>3}, "
+          f"shared {stats['shared_loads']:>3}, stale hits {stats['stale_hits']:>3}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SheetsCache concurrency check')
+    parser.add_argument('--threads', type=int, default=50)
+    parser.add_argument('--spreadsheets', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--slow', type=float, default=3.0)
+    args = parser.parse_args()
+
+    logger.setLevel('WARNING')
+    sheets_module.rate_limiter = QuotaRateLimiter(1e9, 1e9)
+    backend = client_pool.backend
+    spreadsheet_ids = [f"menu-{i}" for i in range(args.spreadsheets)]
+    for spreadsheet_id in spreadsheet_ids + ['slow']:
+        backend.create_spreadsheet(spreadsheet_id, spreadsheet_id, {'Sheet 1': [['ID']], 'Sheet 2': [['ID']]})
+    backend.latency = args.latency
+
+    cache = SheetsCache()
+    load = cache._load_sheets_info_sync
+
+    def load_with_slow_spreadsheet(spreadsheet_id):
+        if spreadsheet_id == 'slow':
+            time.sleep(args.slow)
+        return load(spreadsheet_id)
+
+    cache._load_sheets_info_sync = load_with_slow_spreadsheet
+
+    # 1. Холодный кеш: одна загрузка на таблицу
+    backend.reset_counters()
+    durations = open_menus(cache, spreadsheet_ids, args.threads)
+    report('cold', backend, cache, durations)
+    assert cache.get_cache_stats()['loads'] == args.spreadsheets
+    assert max(durations) < args.latency * 10
+
+    # 2. Медленная загрузка одной таблицы не задерживает закешированные
+    backend.reset_counters()
+    slow = threading.Thread(target=cache.get_sheets_info, args=('slow',))
+    slow.start()
+    time.sleep(0.05)
+    durations = open_menus(cache, spreadsheet_ids, args.threads)
+    report('cached + slow', backend, cache, durations)
+    assert max(durations) < args.latency, "cached keys waited for a slow load"
+    slow.join()
+
+    # 3. Устаревшие записи: ответ сразу, одно фоновое обновление на таблицу
+    cache.cache_duration = cache.cache_duration * 0
+    loads_before = cache.get_cache_stats()['loads']
+    backend.reset_counters()
+    durations = open_menus(cache, spreadsheet_ids, args.threads)
+    cache._executor.shutdown(wait=True)
+    report('stale', backend, cache, durations)
+    assert max(durations) < args.latency, "stale entries waited for refresh"
+    assert cache.get_cache_stats()['loads'] - loads_before == args.spreadsheets
+    print("ok")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Прогрев и обновление по расписанию кеша листов на фейковом бэкенде
+
+Открытие меню (список таблиц + листы основной таблицы, как
+select_spreadsheet_menu и show_sheet_selection_for_add_record) сразу после
+запуска измеряется в двух режимах:
+  - cold: кеш пуст, пользователь ждет Drive и Sheets API;
+  - warm: перед этим выполнен прогрев (основная таблица, таблица платежей и
+    таблицы с записями за последние дни из БД).
+Затем записи "состариваются" почти до истечения срока, и обновление по
+расписанию перезагружает прогретые и открывавшиеся таблицы (но не
+неиспользуемую): следующее открытие меню - попадание, а не устаревшие данные.
+Печатаются время открытия меню, вызовы API и метрика sheets_cache_requests_total.
+
+Запуск: python benchmarks/sheets_cache_warmup.py [--latency 0.2] [--recent 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'sheets_cache_warmup.log'))
+os.environ['GOOGLE_BACKEND'] = 'fake'
+
+from src.config.settings import logger
+from src.database.database_manager import DatabaseManager
+from src.google_integration import sheets_manager as sheets_module
+from src.google_integration.client_pool import client_pool
+from src.google_integration.rate_limiter import QuotaRateLimiter
+from src.google_integration.sheets_metrics import format_metrics_report, metrics
+from src.utils.sheets_cache import SheetsCache
+
+ACTIVE_ID = 'warmup-active'
+PAYMENTS_ID = 'warmup-payments'
+UNUSED_ID = 'warmup-unused'
+REFRESH_INTERVAL = timedelta(minutes=10)
+
+
+def open_menu(cache: SheetsCache) -> float:
+    """Меню выбора таблицы и листа; возвращает время ответа"""
+    started = time.perf_counter()
+    assert cache.get_spreadsheets(), "empty spreadsheets list"
+    sheets_info, _ = cache.get_sheets_info(ACTIVE_ID)
+    assert sheets_info, "empty sheets info"
+    return time.perf_counter() - started
+
+
+def wait_for_loads(cache: SheetsCache):
+    while cache.get_cache_stats()['loads_in_progress']:
+        time.sleep(0.01)
+
+
+def age_entries(cache: SheetsCache, age: timedelta):
+    """Сдвигает время загрузки и обращений ко всем записям в прошлое"""
+    with cache.lock:
+        for spreadsheet_id in cache._last_used:
+            cache._last_used[spreadsheet_id] -= age
+        for spreadsheet_id, (sheets_info, title, timestamp) in list(cache._sheets_cache.items()):
+            cache._sheets_cache[spreadsheet_id] = (sheets_info, title, timestamp - age)
+        spreadsheets, timestamp = cache._spreadsheets_cache
+        cache._spreadsheets_cache = (spreadsheets, timestamp - age)
+
+
+def menu_requests() -> dict:
+    return {f"{item['labels']['kind']} {item['labels']['result']}": int(item['value'])
+            for item in metrics.snapshot()['counters'].get('sheets_cache_requests_total', [])}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sheets cache warm-up and scheduled refresh check')
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--recent', type=int, default=3)
+    args = parser.parse_args()
+
+    logger.setLevel('WARNING')
+    sheets_module.rate_limiter = QuotaRateLimiter(1e9, 1e9)
+    backend = client_pool.backend
+    recent_ids = [f"warmup-recent-{i}" for i in range(args.recent)]
+    for spreadsheet_id in [ACTIVE_ID, PAYMENTS_ID, UNUSED_ID] + recent_ids:
+        backend.create_spreadsheet(spreadsheet_id, spreadsheet_id, {'Sheet 1': [['ID']], 'Sheet 2': [['ID']]})
+    backend.latency = args.latency
+
+    # Недавние таблицы - по записям в БД
+    db = DatabaseManager(os.path.join(tempfile.mkdtemp(), 'expenses.db'))
+    assert db.init_db()
+    for spreadsheet_id in recent_ids:
+        assert db.add_record({'id': uuid.uuid4().hex[:8], 'date': '2025-01-01', 'supplier': 'Supplier',
+                              'direction': 'Direction', 'description': '', 'amount': 1,
+                              'spreadsheet_id': spreadsheet_id, 'sheet_name': 'Sheet 1'})
+    spreadsheet_ids = [ACTIVE_ID, PAYMENTS_ID] + db.get_recent_spreadsheet_ids(7)
+    assert set(spreadsheet_ids) == {ACTIVE_ID, PAYMENTS_ID, *recent_ids}, spreadsheet_ids
+
+    # 1. Без прогрева: первое открытие меню - промахи
+    metrics.reset()
+    cache = SheetsCache()
+    backend.reset_counters()
+    cold = open_menu(cache)
+    print(f"{'cold':>10}: first menu {cold * 1000:>6.0f}ms, API calls {backend.stats()['requests']}, {menu_requests()}")
+    assert menu_requests().get('sheets miss') == 1
+
+    # 2. С прогревом: загрузки идут в фоне до прихода пользователя
+    metrics.reset()
+    cache = SheetsCache()
+    backend.reset_counters()
+    started = cache.warm_up(spreadsheet_ids)
+    wait_for_loads(cache)
+    warm_up_calls = backend.stats()['requests']
+    warm = open_menu(cache)
+    print(f"{'warm':>10}: first menu {warm * 1000:>6.0f}ms, warm-up {started} loads / {warm_up_calls} API calls, "
+          f"{menu_requests()}")
+    assert started == len(spreadsheet_ids) + 1
+    assert 'sheets miss' not in menu_requests() and 'spreadsheets miss' not in menu_requests()
+    assert warm < args.latency
+
+    # 3. Обновление по расписанию: записи истекут до следующего запуска
+    cache.get_sheets_info(UNUSED_ID)
+    age_entries(cache, cache.cache_duration - REFRESH_INTERVAL / 2)
+    backend.reset_counters()
+    refreshed = cache.refresh_expiring(REFRESH_INTERVAL)
+    wait_for_loads(cache)
+    print(f"{'refresh':>10}: {refreshed} loads, {backend.stats()['requests']} API calls")
+    # Неиспользуемая после загрузки таблица не обновляется
+    assert refreshed == len(spreadsheet_ids) + 1, refreshed
+    age_entries(cache, REFRESH_INTERVAL)
+    metrics.reset()
+    after = open_menu(cache)
+    print(f"{'next run':>10}: menu {after * 1000:>6.0f}ms, {menu_requests()}")
+    assert menu_requests() == {'spreadsheets hit': 1, 'sheets hit': 1}, menu_requests()
+    assert cache.refresh_expiring(timedelta(0)) == 0
+
+    print("")
+    print(format_metrics_report(metrics.snapshot()).split("\n🌐")[0].strip())
+    cache.shutdown()
+    print("ok")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Время до первого ответа бота после холодного старта (фейковый бэкенд)
+
+Повторяет шаги main() до начала опроса Telegram над временной БД и
+фейковым Google API с задержкой --latency: --spreadsheets таблиц расходов
+и таблица платежей с --payments платежами на лист роли. Режимы:
+  - blocking: проверка заголовков и синхронизация платежей до опроса
+    (поведение до фоновой синхронизации);
+  - background: синхронизация в фоновом потоке (StartupSync).
+Для каждого режима печатаются время до начала опроса (первый ответ на
+команду, не связанную с платежами) и время до готовности платежей
+(первый ответ обработчика платежей, ожидающего синхронизацию).
+Каждый режим запускается в отдельном процессе.
+
+Запуск: python benchmarks/startup_benchmark.py [--latency 0.15] [--spreadsheets 10] [--payments 500]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, ROOT)
+
+PAYMENTS_SPREADSHEET = 'payments-startup'
+
+
+def prepare_backend(backend, spreadsheets: int, payments: int):
+    from src.config.settings import UserRole
+    from src.google_integration.payments_sheets_manager import PaymentsSheetsManager
+    from src.google_integration.sheets_manager import RECORD_HEADERS
+
+    for i in range(spreadsheets):
+        backend.create_spreadsheet(f"expenses-{i}", f"Expenses {i}", {
+            f"Sheet {n}": [list(RECORD_HEADERS), [f"cb-{i}-{n}", '01.01.2025', 'Supplier', '', '', 100]]
+            for n in range(3)
+        })
+    sheets = {}
+    for r, role in enumerate([UserRole.ADMIN, UserRole.WORKER, UserRole.SECONDARY, UserRole.CLIENT]):
+        sheets[PaymentsSheetsManager.SHEET_NAMES[role]] = [list(PaymentsSheetsManager.HEADERS)] + [
+            [str(r * payments + n + 1), f"User {n % 20}", 100 + n, '2025-01-01', '2025-01-31', '',
+             '2025-01-01 00:00:00', '', '']
+            for n in range(payments)
+        ]
+    backend.create_spreadsheet(PAYMENTS_SPREADSHEET, 'Payments', sheets)
+
+
+def run_mode(mode: str, latency: float, spreadsheets: int, payments: int, db_path: str) -> dict:
+    """Один холодный старт в текущем процессе"""
+    from src.config import settings
+    # Временная БД: путь подменяется до импорта модулей базы данных (они копируют DATABASE_PATH)
+    settings.DATABASE_PATH = db_path
+    from src.config.settings import logger
+    from src.database.database_manager import init_db
+    from src.google_integration.async_sheets_worker import start_worker, stop_worker
+    from src.google_integration.client_pool import client_pool
+    from src.google_integration.startup_sync import startup_sync, wait_for_payments_sync
+
+    logger.setLevel('WARNING')
+    backend = client_pool.backend
+    prepare_backend(backend, spreadsheets, payments)
+    backend.latency = latency
+    backend.reset_counters()
+
+    started = time.perf_counter()
+    assert init_db()
+    start_worker()
+    if mode == 'blocking':
+        startup_sync.run()
+    else:
+        startup_sync.start()
+    polling_at = time.perf_counter() - started
+
+    assert asyncio.run(wait_for_payments_sync(timeout=600))
+    ready_at = time.perf_counter() - started
+    stop_worker()
+    return {'mode': mode, 'first_response_s': round(polling_at, 3),
+            'payments_ready_s': round(ready_at, 3), 'api_calls': backend.stats()['requests']}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold start time-to-first-response benchmark')
+    parser.add_argument('--latency', type=float, default=0.15)
+    parser.add_argument('--spreadsheets', type=int, default=10)
+    parser.add_argument('--payments', type=int, default=500)
+    parser.add_argument('--mode', choices=('blocking', 'background'))
+    parser.add_argument('--db')
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_mode(args.mode, args.latency, args.spreadsheets, args.payments, args.db)))
+        return
+
+    print(f"latency {args.latency * 1000:.0f}ms, {args.spreadsheets} spreadsheets, "
+          f"{args.payments} payments per role sheet")
+    print(f"{'mode':>11} {'first response s':>17} {'payments ready s':>17} {'API calls':>10}")
+    for mode in ('blocking', 'background'):
+        data_dir = tempfile.mkdtemp()
+        env = dict(os.environ, GOOGLE_BACKEND='fake', PAYMENTS_SPREADSHEET_ID=PAYMENTS_SPREADSHEET,
+                   LOG_FILE=os.environ.get('LOG_FILE', os.path.join(data_dir, 'startup.log')))
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--mode', mode, '--db', os.path.join(data_dir, 'startup.db'),
+             '--latency', str(args.latency),
+             '--spreadsheets', str(args.spreadsheets), '--payments', str(args.payments)],
+            env=env, capture_output=True, text=True, check=True, cwd=ROOT,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:>11} {result['first_response_s']:>17.2f} {result['payments_ready_s']:>17.2f} "
+              f"{result['api_calls']:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Проверка пропуска неизменившихся таблиц и листов в полной синхронизации
+
+Drive и Sheets API отвечает фейковый бэкенд (GOOGLE_BACKEND=fake):
+files.list отдает modifiedTime, который меняется при правке листа. Сценарий:
+  1. первая синхронизация - обрабатываются все таблицы и листы;
+  2. повторная без изменений - все таблицы пропускаются (только files.list);
+  3. изменен один лист одной таблицы - читается только она, обрабатывается
+     только измененный лист;
+  4. force - обрабатывается все.
+
+Запуск: python benchmarks/sync_skip_check.py [--spreadsheets 3] [--sheets 10] [--rows 50]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'sync_skip_check.log'))
+os.environ['GOOGLE_BACKEND'] = 'fake'
+
+from bulk_read_benchmark import create_spreadsheet
+from src.database.database_manager import DatabaseManager
+from src.database.sheets_sync_state import SheetsSyncState
+from src.google_integration.client_pool import client_pool
+from src.google_integration.rate_limiter import QuotaRateLimiter
+from src.google_integration import sheets_manager as sheets_module
+from src.google_integration.sheets_metrics import metrics
+from src.google_integration.sync_manager import SyncManager
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Full sync skip check')
+    parser.add_argument('--spreadsheets', type=int, default=3)
+    parser.add_argument('--sheets', type=int, default=10)
+    parser.add_argument('--rows', type=int, default=50)
+    args = parser.parse_args()
+
+    sheets_module.rate_limiter = QuotaRateLimiter(1e9, 1e9)
+    backend = client_pool.backend
+    for i in range(args.spreadsheets):
+        create_spreadsheet(backend, f"spreadsheet-{i}", args.sheets, args.rows)
+    manager = sheets_module.GoogleSheetsManager(client_pool=client_pool)
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'sync_skip.db')
+    db = DatabaseManager(db_path)
+    db.init_db()
+    sync = SyncManager(manager, db, SheetsSyncState(db_path))
+
+    def run(label: str, force: bool = False, expect: dict = None):
+        backend.reset_counters()
+        stats = asyncio.run(sync.full_sync(force=force))
+        requests = backend.stats()
+        print(f"{label:34s} sheets API {requests['sheets_requests']:3d}  "
+              f"drive {requests['calls'].get('drive.files.list', 0)}  "
+              f"processed {stats['processed_sheets']:3d}  skipped spreadsheets {stats['skipped_spreadsheets']}  "
+              f"skipped sheets {stats['skipped_sheets']:3d}  new records {stats['new_records']:4d}  "
+              f"errors {stats['errors']}")
+        for key, value in (expect or {}).items():
+            assert stats[key] == value, f"{label}: {key}={stats[key]}, expected {value}"
+
+    total_sheets = args.spreadsheets * args.sheets
+    run('1. first sync', expect={'processed_sheets': total_sheets, 'skipped_spreadsheets': 0})
+    run('2. nothing changed', expect={'processed_sheets': 0, 'skipped_spreadsheets': args.spreadsheets})
+
+    # Добавляем строку в один лист одной таблицы (меняется ее modifiedTime)
+    rows = backend.rows('spreadsheet-1', 'Sheet 0')
+    rows.append(['cb-new-1', '11.02.25', 'New supplier', 'Direction', 'New expense', 500])
+    backend.set_rows('spreadsheet-1', 'Sheet 0', rows)
+    run('3. one sheet of one spreadsheet', expect={
+        'processed_sheets': 1, 'skipped_sheets': args.sheets - 1,
+        'skipped_spreadsheets': args.spreadsheets - 1, 'new_records': 1,
+    })
+    run('4. force', force=True, expect={'processed_sheets': total_sheets, 'skipped_spreadsheets': 0})
+
+    skipped = {(item['labels']['level']): item['value']
+               for item in metrics.snapshot()['counters'].get('sheets_sync_skipped_total', [])}
+    print(f"sheets_sync_skipped_total: {skipped}")
+
+
+if __name__ == '__main__':
+    main()
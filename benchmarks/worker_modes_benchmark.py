@@ -0,0 +1,158 @@
+"""
+Сравнение режимов воркера Google Sheets: потоки против asyncio
+
+Оба режима гоняют задачи ADD_RECORD через фейковый бэкенд Google
+(GOOGLE_BACKEND=fake) с задержкой ответа --latency:
+  - threads: AsyncSheetsWorker, каждая задача - синхронные запросы gspread
+    из потока воркера (GoogleSheetsManager);
+  - asyncio: AsyncioSheetsWorker + AsyncSheetsManager на httpx.AsyncClient.
+Менеджеры делают разное число запросов на задачу, поэтому кроме задач/с
+печатается и число запросов на задачу.
+
+Каждая конфигурация запускается в отдельном процессе, чтобы пиковый RSS
+не смешивался. Печатается пропускная способность (задач/с и запросов/с),
+пиковый RSS и количество потоков.
+
+Запуск: python benchmarks/worker_modes_benchmark.py [--tasks 2000] [--latency 0.05]
+        [--concurrency 4 16 64]
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Добавляем корневую директорию проекта в путь
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SHEETS = 64
+HEADERS = ['ID', 'ամսաթիվ', 'մատակարար', 'ուղղություն', 'ծախսի բնութագիր', 'Արժեք']
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def make_tasks(worker_module, count: int, callback):
+    return [
+        worker_module.SheetsTask(
+            task_type=worker_module.TaskType.ADD_RECORD,
+            spreadsheet_id='bench',
+            sheet_name=f"sheet-{i % SHEETS}",
+            record_id=f"cb-{i}",
+            data={'id': f"cb-{i}", 'date': '2025-01-15', 'amount': i},
+            callback=callback,
+        )
+        for i in range(count)
+    ]
+
+
+def run_mode(mode: str, tasks: int, latency: float, concurrency: int) -> dict:
+    os.environ.setdefault('LOG_FILE', os.path.join(tempfile.gettempdir(), 'worker_modes_benchmark.log'))
+    os.environ['GOOGLE_BACKEND'] = 'fake'
+    import logging
+    from src.database.database_manager import DatabaseManager
+    from src.database.sheets_outbox import SheetsOutbox
+    from src.google_integration import async_sheets_worker as worker_module
+    from src.google_integration import sheets_manager as sheets_module
+    from src.google_integration.async_sheets_client import AsyncSheetsClient
+    from src.google_integration.client_pool import client_pool
+    from src.google_integration.rate_limiter import QuotaRateLimiter
+    logging.getLogger().setLevel(logging.WARNING)
+
+    # Квоты не ограничивают: измеряем только модель конкурентности
+    worker_module.rate_limiter = sheets_module.rate_limiter = QuotaRateLimiter(1e9, 1e9)
+
+    # Полная схема: менеджер Google Sheets сохраняет позиции записей в records
+    db_path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    DatabaseManager(db_path).init_db()
+
+    backend = client_pool.backend
+    backend.create_spreadsheet('bench', 'bench', {f"sheet-{i}": [HEADERS] for i in range(SHEETS)})
+    backend.latency = latency
+    done = threading.Event()
+    finished = {'count': 0}
+    lock = threading.Lock()
+
+    def callback(success, error):
+        with lock:
+            finished['count'] += 1
+            if finished['count'] == tasks:
+                done.set()
+
+    baseline_rss = peak_rss_mb()
+    started = time.perf_counter()
+
+    if mode == 'threads':
+        worker = worker_module.AsyncSheetsWorker(concurrency, outbox=SheetsOutbox(db_path))
+        for task in make_tasks(worker_module, tasks, callback):
+            worker.add_task(task)
+        done.wait()
+        elapsed = time.perf_counter() - started
+        threads = threading.active_count()
+        worker.stop()
+    else:
+        async def main():
+            client = AsyncSheetsClient(max_connections=concurrency)
+            worker = worker_module.AsyncioSheetsWorker(concurrency, outbox=SheetsOutbox(db_path), client=client)
+            worker.start()
+            for task in make_tasks(worker_module, tasks, callback):
+                worker.add_task(task)
+            while not done.is_set():
+                await asyncio.sleep(0.01)
+            result = time.perf_counter() - started, threading.active_count()
+            worker.stop()
+            await client.aclose()
+            return result
+
+        elapsed, threads = asyncio.run(main())
+
+    requests = backend.stats()['requests']
+    return {
+        'mode': mode,
+        'concurrency': concurrency,
+        'tasks': tasks,
+        'elapsed_s': round(elapsed, 3),
+        'tasks_per_s': round(tasks / elapsed, 1),
+        'requests_per_s': round(requests / elapsed, 1),
+        'requests_per_task': round(requests / tasks, 2),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'rss_growth_mb': round(peak_rss_mb() - baseline_rss, 1),
+        'threads': threads,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Threads vs asyncio Sheets worker benchmark')
+    parser.add_argument('--tasks', type=int, default=2000)
+    parser.add_argument('--latency', type=float, default=0.05, help='Simulated API latency, seconds')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[4, 16, 64])
+    parser.add_argument('--run', nargs=2, metavar=('MODE', 'CONCURRENCY'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_mode(args.run[0], args.tasks, args.latency, int(args.run[1]))))
+        return
+
+    print(f"{'mode':8s} {'conc':>5s} {'tasks/s':>9s} {'req/s':>9s} {'req/task':>9s} {'peak RSS':>10s} "
+          f"{'RSS +':>8s} {'threads':>8s}")
+    for concurrency in args.concurrency:
+        for mode in ('threads', 'asyncio'):
+            output = subprocess.run(
+                [sys.executable, __file__, '--tasks', str(args.tasks), '--latency', str(args.latency),
+                 '--run', mode, str(concurrency)],
+                capture_output=True, text=True, check=True
+            ).stdout.strip().splitlines()[-1]
+            result = json.loads(output)
+            print(f"{result['mode']:8s} {result['concurrency']:5d} {result['tasks_per_s']:9.1f} "
+                  f"{result['requests_per_s']:9.1f} {result['requests_per_task']:9.2f} {result['peak_rss_mb']:8.1f}MB "
+                  f"{result['rss_growth_mb']:6.1f}MB {result['threads']:8d}")
+
+
+if __name__ == '__main__':
+    main()
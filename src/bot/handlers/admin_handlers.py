@@ -1,8 +1,14 @@
 """
 Обработчики команд администратора
 """
+import asyncio
 import json
 import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
 
 from datetime import datetime
 from telegram import Update
@@ -11,14 +17,18 @@ from telegram.ext import CallbackContext
 from ...config.settings import ADMIN_IDS, logger
 from telegram.constants import ChatAction
 from ...utils.date_utils import safe_parse_date_or_none
+from ...utils.sheets_cache import store_cached_spreadsheets
 from ...utils.config_utils import (
     is_user_allowed, load_users, save_users, 
     load_allowed_users, add_allowed_user, remove_allowed_user,
     set_log_chat, set_report_settings, send_to_log_chat
 )
-from ...database.database_manager import backup_db_to_dict, get_record_from_db, add_record_to_db
-from ...google_integration.sheets_manager import get_all_spreadsheets, get_worksheets_info, open_sheet_by_id
-from ...google_integration.sync_manager import full_sync
+from ...database.database_manager import backup_db_to_dict, add_missing_records_to_db
+from ...google_integration.sheets_manager import get_all_spreadsheets, get_worksheets_info, open_sheet_by_id, sheets_manager
+from ...google_integration.sheet_columns import SheetColumns, blank_mask, cell_text, clean_amounts
+from ...google_integration.drift import CONFLICT_POLICIES
+from ...google_integration.sync_manager import full_sync, repair_drift
+from ...google_integration.sheets_metrics import metrics, format_metrics_report
 from ..keyboards.inline_keyboards import create_main_menu
 from .edit_handlers import get_user_id_by_name
 
@@ -335,37 +345,227 @@ async def export_command(update: Update, context: CallbackContext):
     except Exception as e:
         await update.message.reply_text(f"❌ Արտահանման սխալ: {e}")
 
+# Текущая полная синхронизация (одна на бота): задача и флаг отмены
+_full_sync_state = {'task': None, 'cancel_event': None}
+
+# Минимальный интервал между обновлениями сообщения о прогрессе (секунды)
+SYNC_PROGRESS_INTERVAL = 2.0
+
+
+def format_sync_stats(stats: dict) -> str:
+    """Текст статистики полной синхронизации"""
+    text = (
+        f"📊 Մշակված աղյուսակներ: {stats['processed_sheets']}\n"
+        f"📋 Համաժամեցված գրառումներ: {stats['synced_records']}\n"
+        f"🆕 Նոր գրառումներ: {stats['new_records']}\n"
+    )
+
+    if stats['skipped_spreadsheets'] or stats['skipped_sheets']:
+        text += (
+            f"⏭ Անփոփոխ աղյուսակներ: {stats['skipped_spreadsheets']}, "
+            f"անփոփոխ թերթիկներ: {stats['skipped_sheets']}\n"
+        )
+
+    if stats['errors'] > 0:
+        text += f"❌ Սխալներ: {stats['errors']}\n"
+
+    return text
+
+
 async def sync_sheets_command(update: Update, context: CallbackContext):
-    """Выполняет полную синхронизацию всех Google Sheets с БД"""
+    """
+    Выполняет полную синхронизацию всех Google Sheets с БД
+    (/sync_sheets force - без пропуска неизменившихся таблиц,
+    /sync_sheets cancel - остановить текущую синхронизацию)
+    
+    Синхронизация выполняется фоновой задачей: прогресс показывается
+    редактированием сообщения, итоговый отчет приходит отдельным сообщением.
+    """
     user_id = update.effective_user.id
     if user_id not in ADMIN_IDS:
         await update.message.reply_text("❌ Դուք չունեք այս հրամանը կատարելու թույլտվություն:")
         return
 
+    argument = context.args[0].lower() if context.args else ''
+    running = _full_sync_state['task'] is not None and not _full_sync_state['task'].done()
+
+    if argument == 'cancel':
+        if running:
+            _full_sync_state['cancel_event'].set()
+            await update.message.reply_text("⏹ Համաժամեցումը չեղարկվում է...")
+        else:
+            await update.message.reply_text("ℹ️ Ընթացիկ համաժամեցում չկա:")
+        return
+
+    if running:
+        await update.message.reply_text(
+            "⏳ Լրիվ համաժամեցումն արդեն ընթացքում է: Չեղարկելու համար՝ /sync_sheets cancel"
+        )
+        return
+
     try:
-        await update.message.reply_text("🔄 Սկսվել է լրիվ համաժամեցում բոլոր աղյուսակների հետ...")
+        progress_message = await update.message.reply_text("🔄 Սկսվել է լրիվ համաժամեցում բոլոր աղյուսակների հետ...")
+    except Exception as e:
+        logger.error(f"Error starting full synchronization: {e}")
+        return
+
+    force = argument == 'force'
+    cancel_event = threading.Event()
+    last_update = {'at': 0.0, 'text': ''}
+
+    async def report_progress(done: int, total: int, stats: dict):
+        # Telegram ограничивает частоту редактирования - обновляем не чаще интервала
+        now = time.monotonic()
+        if done < total and now - last_update['at'] < SYNC_PROGRESS_INTERVAL:
+            return
+        text = (
+            f"🔄 Լրիվ համաժամեցում: {done}/{total} աղյուսակ\n\n"
+            + format_sync_stats(stats)
+            + "\nՉեղարկելու համար՝ /sync_sheets cancel"
+        )
+        if text == last_update['text']:
+            return
+        last_update.update(at=now, text=text)
+        try:
+            await progress_message.edit_text(text)
+        except Exception as e:
+            # "Message is not modified" и ограничения частоты не мешают синхронизации
+            logger.debug(f"Could not update sync progress message: {e}")
+
+    async def run_sync():
+        try:
+            stats = await full_sync(force=force, progress=report_progress, cancel_event=cancel_event)
+
+            # Формируем отчет
+            if stats.get('cancelled'):
+                result_text = "⏹ Լրիվ համաժամեցումը չեղարկվել է:\n\n"
+            else:
+                result_text = "✅ Լրիվ համաժամեցումն ավարտված է:\n\n"
+            result_text += format_sync_stats(stats)
+
+            await update.message.reply_text(result_text, parse_mode="HTML")
 
-        # Выполняем полную синхронизацию
-        stats = await full_sync()
+            await send_to_log_chat(context, f"Լրիվ համաժամեցում: {stats['processed_sheets']} աղյուսակ, {stats['new_records']} նոր գրառում")
+
+        except Exception as e:
+            logger.error(f"Error during full synchronization: {e}")
+            await update.message.reply_text(f"❌ Սխալ լրիվ համաժամեցման ժամանակ: {e}")
+
+    _full_sync_state['cancel_event'] = cancel_event
+    _full_sync_state['task'] = context.application.create_task(run_sync())
+
+
+async def sync_payments_command(update: Update, context: CallbackContext):
+    """
+    Синхронизирует платежи БД и таблицы платежей
+    (/sync_payments - инкрементально, по водяным знакам;
+    /sync_payments full - полная сверка всех ID и сброс водяных знаков)
+    """
+    user_id = update.effective_user.id
+    if user_id not in ADMIN_IDS:
+        await update.message.reply_text("❌ Դուք չունեք այս հրամանը կատարելու թույլտվություն:")
+        return
+
+    full = bool(context.args) and context.args[0].lower() == 'full'
+    try:
+        from ...google_integration.payments_sync_manager import PaymentsSyncManager
+
+        await update.message.reply_text(
+            "🔄 Սկսվել է վճարումների լրիվ համաժամեցում..." if full else "🔄 Վճարումների համաժամեցում..."
+        )
+        sync_manager = PaymentsSyncManager()
+        stats = await asyncio.to_thread(sync_manager.full_sync_payments if full else sync_manager.sync_payments)
 
-        # Формируем отчет
         result_text = (
-            f"✅ Լրիվ համաժամեցումն ավարտված է:\n\n"
-            f"📊 Մշակված աղյուսակներ: {stats['processed_sheets']}\n"
-            f"📋 Համաժամեցված գրառումներ: {stats['synced_records']}\n"
-            f"🆕 Նոր գրառումներ: {stats['new_records']}\n"
+            "✅ Վճարումների համաժամեցումն ավարտված է:\n\n"
+            f"📥 Աղյուսակից բազա: {stats['sheets_to_db']['added']}\n"
+            f"📤 Բազայից աղյուսակ: {stats['db_to_sheets']['added']}\n"
         )
+        if stats['total_errors'] > 0:
+            result_text += f"❌ Սխալներ: {stats['total_errors']}\n"
+        await update.message.reply_text(result_text)
+
+    except Exception as e:
+        logger.error(f"Error during payments synchronization: {e}")
+        await update.message.reply_text(f"❌ Սխալ վճարումների համաժամեցման ժամանակ: {e}")
+
 
-        if stats['errors'] > 0:
+async def sheets_drift_command(update: Update, context: CallbackContext):
+    """
+    Сверка полей записей БД и листов с исправлением расхождений
+    (/sheets_drift [dry] [force] [db|sheet|report]: dry - только отчет,
+    force - читать и неизменившиеся таблицы, db/sheet/report - политика конфликтов)
+    """
+    user_id = update.effective_user.id
+    if user_id not in ADMIN_IDS:
+        await update.message.reply_text("❌ Դուք չունեք այս հրամանը կատարելու թույլտվություն:")
+        return
+
+    args = [arg.lower() for arg in (context.args or [])]
+    policy = next((arg for arg in args if arg in CONFLICT_POLICIES), None)
+
+    try:
+        await update.message.reply_text("🔍 Ստուգվում են տարբերությունները բազայի և աղյուսակների միջև...")
+
+        report = await repair_drift(policy=policy, dry_run='dry' in args, force='force' in args)
+        stats = report.stats()
+
+        result_text = (
+            f"{'🔍 Ստուգում (առանց փոփոխությունների)' if report.dry_run else '✅ Տարբերությունները շտկված են'}"
+            f" [{report.policy}]:\n\n"
+            f"✏️ Փոփոխված դաշտեր: {stats['changed_fields']}\n"
+            f"📤 Աղյուսակ: {stats['to_sheet']} դաշտ ({stats['cells_written']} բջիջ)\n"
+            f"📥 Բազա: {stats['to_db']} դաշտ, նոր գրառումներ: {stats['new_in_sheet']}\n"
+            f"⚠️ Կոնֆլիկտներ: {stats['conflicts']} (չլուծված՝ {stats['unresolved_conflicts']})\n"
+        )
+        if stats['missing_in_sheet'] or stats['deleted_in_sheet'] or stats['deleted_in_db']:
+            result_text += (
+                f"❔ Բացակայում են աղյուսակում: {stats['missing_in_sheet'] + stats['deleted_in_sheet']}, "
+                f"ջնջված բազայից: {stats['deleted_in_db']}\n"
+            )
+        if stats['skipped_spreadsheets']:
+            result_text += f"⏭ Անփոփոխ աղյուսակներ: {stats['skipped_spreadsheets']}\n"
+        if stats['errors']:
             result_text += f"❌ Սխալներ: {stats['errors']}\n"
 
-        await update.message.reply_text(result_text, parse_mode="HTML")
+        unresolved = [change for change in report.conflicts() if not change.applied]
+        if unresolved:
+            result_text += "\n⚠️ Չլուծված կոնֆլիկտներ:\n"
+            for change in unresolved[:10]:
+                result_text += (f"• {change.record_id} {change.field}: "
+                                f"բազա «{change.db_value}» / աղյուսակ «{change.sheet_value}»\n")
+            if len(unresolved) > 10:
+                result_text += f"... և ևս {len(unresolved) - 10}\n"
 
-        await send_to_log_chat(context, f"Լրիվ համաժամեցում: {stats['processed_sheets']} աղյուսակ, {stats['new_records']} նոր գրառում")
+        await update.message.reply_text(result_text)
 
     except Exception as e:
-        logger.error(f"Error during full synchronization: {e}")
-        await update.message.reply_text(f"❌ Սխալ լրիվ համաժամեցման ժամանակ: {e}")
+        logger.error(f"Error repairing drift: {e}")
+        await update.message.reply_text(f"❌ Սխալ տարբերությունների ստուգման ժամանակ: {e}")
+
+
+async def sheets_metrics_command(update: Update, context: CallbackContext):
+    """Показывает метрики очереди Google Sheets (/sheets_metrics json - полный JSON-дамп)"""
+    user_id = update.effective_user.id
+    if user_id not in ADMIN_IDS:
+        await update.message.reply_text("❌ Դուք չունեք այս հրամանը կատարելու թույլտվություն:")
+        return
+
+    try:
+        if context.args and context.args[0].lower() == 'json':
+            filename = f"sheets_metrics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+            await update.message.reply_document(
+                document=metrics.dump_json().encode('utf-8'),
+                filename=filename,
+                caption="📈 Google Sheets metrics"
+            )
+            return
+
+        await update.message.reply_text(format_metrics_report(metrics.snapshot()))
+
+    except Exception as e:
+        logger.error(f"Error building sheets metrics: {e}")
+        await update.message.reply_text(f"❌ Մետրիկաների ստացման սխալ: {e}")
 
 
 def initialize_and_sync_sheets():
@@ -373,6 +573,8 @@ def initialize_and_sync_sheets():
 
     headers = ['ID', 'ամսաթիվ', 'մատակարար', 'ուղղություն', 'ծախսի բնութագիր', 'Արժեք']
     spreadsheets = get_all_spreadsheets()
+    if spreadsheets:
+        store_cached_spreadsheets(spreadsheets)
 
     for spreadsheet in spreadsheets:
         spreadsheet_id = spreadsheet['id']
@@ -384,73 +586,75 @@ def initialize_and_sync_sheets():
             logger.error(f"Failed to open spreadsheet: {spreadsheet_name}")
             continue
 
-        for worksheet in sheet.worksheets():
+        worksheets = sheet.worksheets()
+        try:
+            # Все листы таблицы читаются одним запросом values.batchGet; даты - текстом,
+            # как в листе: лист и БД перезаписываются ими без смены формата
+            sheets_data = sheets_manager.read_sheets(sheet, [worksheet.title for worksheet in worksheets],
+                                                     dates_as_text=True)
+        except Exception as e:
+            logger.error(f"Failed to read spreadsheet {spreadsheet_name}: {e}")
+            continue
+
+        for worksheet in worksheets:
             sheet_name = worksheet.title
             logger.info(f"  Sheet: {sheet_name}")
 
             try:
-                rows = worksheet.get_all_records()
-                new_rows = []
-                last_valid_date = None
-                for row in rows:
-                    if all(not str(value).strip() for value in row.values()):
-                        continue
-
-                    row_id = str(row.get('ID', '')).strip()
-                    if not row_id:
-                        row_id = "cb-" + str(uuid.uuid4())[:8]
-
-                    # 🗓 Обработка даты
-                    raw_date = str(row.get('ամսաթիվ', '')).strip()
-                    if raw_date:
-                        normalized_date = raw_date.replace("․", ".").strip()
-                        last_valid_date = normalized_date
-                    elif last_valid_date:
-                        normalized_date = last_valid_date
-                    else:
-                        normalized_date = ""
-
-                    # 💰 Обработка суммы
-                    raw_amount = str(row.get('Արժեք', '0'))
-                    cleaned_amount = (
-                        raw_amount.replace('\xa0', '')
-                                  .replace('\u202f', '')
-                                  .replace(' ', '')
-                                  .replace(',', '.')
-                                  .strip()
-                    )
-
-                    # Если cleaned_amount пуст, то присваиваем 0.0
-                    if not cleaned_amount:
-                        amount = 0.0
-                        logger.warning(f"Empty value in amount column for row {row}")
-                    else:
-                        try:
-                            amount = float(cleaned_amount)
-                        except ValueError:
-                            amount = 0.0
-                            logger.warning(f"Cannot convert amount '{raw_amount}' → 0.0")
+                data = sheets_data.get(sheet_name) or SheetColumns(sheet_name)
+                frame = data.to_frame()
+
+                # Пропускаем полностью пустые строки
+                if data.headers:
+                    empty_rows = np.logical_and.reduce([blank_mask(frame[header]) for header in data.headers])
+                    frame = frame[~empty_rows].reset_index(drop=True)
+
+                def column(header: str) -> pd.Series:
+                    return frame[header] if header in frame else pd.Series([''] * len(frame), dtype=object)
+
+                ids = cell_text(column('ID'))
+                missing_ids = ids == ''
+                ids[missing_ids] = ["cb-" + str(uuid.uuid4())[:8] for _ in range(int(missing_ids.sum()))]
+
+                # 🗓 Обработка даты: пустые даты берутся из предыдущей строки
+                dates = cell_text(column('ամսաթիվ')).str.replace("․", ".", regex=False)
+                dates = dates.mask(dates == '').ffill().fillna('')
+
+                # 💰 Обработка суммы
+                raw_amounts = column('Արժեք')
+                amounts = clean_amounts(raw_amounts)
+                empty_amounts = blank_mask(raw_amounts)
+                for index in np.flatnonzero(empty_amounts):
+                    logger.warning(f"Empty value in amount column for row {frame.iloc[index].to_dict()}")
+                for index in np.flatnonzero(amounts.isna().to_numpy() & ~empty_amounts):
+                    logger.warning(f"Cannot convert amount '{raw_amounts.iat[index]}' → 0.0")
+                amounts = amounts.fillna(0.0)
+
+                suppliers = cell_text(column('մատակարար'))
+                directions = cell_text(column('ուղղություն'))
+                descriptions = cell_text(column('ծախսի բնութագիր'))
+
+                records, new_rows = [], []
+                for index in range(len(frame)):
+                    row_id = ids.iat[index]
+                    normalized_date = dates.iat[index]
+                    amount = float(amounts.iat[index])
 
                     # 📦 Подготовка записи
-                    user_id = get_user_id_by_name(row.get('մատակարար', ''))
+                    user_id = get_user_id_by_name(suppliers.iat[index])
                     record = {
                         'id': row_id,
                         'date': normalized_date,
-                        'supplier': str(row.get('մատակարար', '')).strip(),
-                        'direction': str(row.get('ուղղություն', '')).strip(),
-                        'description': str(row.get('ծախսի բնութագիր', '')).strip(),
+                        'supplier': suppliers.iat[index],
+                        'direction': directions.iat[index],
+                        'description': descriptions.iat[index],
                         'amount': amount,
                         'spreadsheet_id': spreadsheet_id,
                         'sheet_name': sheet_name,
                         'user_id': user_id if user_id != 0 else None
                     }
 
-                    if not get_record_from_db(row_id):
-                        success = add_record_to_db(record)
-                        if success:
-                            logger.info(f"    Added record to DB: {row_id}")
-                        else:
-                            logger.warning(f"    Failed to add record to DB: {row_id}")
+                    records.append(record)
                     new_rows.append([
                         row_id,
                         normalized_date,
@@ -460,6 +664,13 @@ def initialize_and_sync_sheets():
                         amount
                     ])
 
+                # Новые записи добавляются в БД одной транзакцией (существующие ID пропускаются)
+                added = add_missing_records_to_db(records)
+                if added is None:
+                    logger.warning(f"    Failed to add records of sheet {sheet_name} to DB")
+                else:
+                    logger.info(f"    Added {added} records to DB")
+
                 # Обновление листа одним вызовом
                 all_data = [headers] + new_rows
                 worksheet.clear()
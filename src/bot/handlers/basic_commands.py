@@ -157,6 +157,8 @@ async def help_command(update: Update, context: CallbackContext):
             "• /set_user_name [user_id] [name] - Օգտագործողի անվան սահմանում\n"
             "• /export - Տվյալների արտահանում\n"
             "• /sync_sheets - Google Sheets-ի համաժամեցում\n"
+            "• /sync_payments [full] - Վճարումների համաժամեցում\n"
+            "• /sheets_drift [dry] - Բազայի և աղյուսակների տարբերությունների շտկում\n"
             "• /initialize_sheets - Բոլոր աղյուսակների նախապատրաստում\n\n"
             "• /send_data_files - Տվյալների ֆայլերի ուղարկում ադմինիստրատորին\n"
         )
@@ -2,13 +2,22 @@
 Обработчики для управления кешем листов
 """
 
+import asyncio
+from datetime import timedelta
+
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import CallbackContext
 
-from ...utils.sheets_cache import get_cache_statistics, clear_all_cache, invalidate_spreadsheets_cache
+from ...utils.sheets_cache import (
+    get_cache_statistics, clear_all_cache, invalidate_spreadsheets_cache,
+    warm_up_sheets_cache, refresh_expiring_sheets_cache
+)
 from ...utils.localization import _
 from ..keyboards.inline_keyboards import create_back_to_menu_keyboard
-from ...config.settings import ADMIN_IDS, logger
+from ...config.settings import (
+    ADMIN_IDS, ACTIVE_SPREADSHEET_ID, PAYMENTS_SPREADSHEET_ID,
+    SHEETS_CACHE_REFRESH_MINUTES, SHEETS_CACHE_RECENT_DAYS, logger
+)
 
 
 async def cache_management_menu(update: Update, context: CallbackContext):
@@ -34,7 +43,7 @@ async def cache_management_menu(update: Update, context: CallbackContext):
     await query.edit_message_text(
         "🗂 Управление кешем листов\n\n"
         "Кеш позволяет быстро загружать списки листов без обращения к API Google Sheets.\n"
-        "Обновляется автоматически каждые 30 минут.",
+        "Записи устаревают через 30 минут и обновляются в фоне заранее.",
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
 
@@ -57,7 +66,11 @@ async def show_cache_stats(update: Update, context: CallbackContext):
         text = "📊 Статистика кеша листов\n\n"
         text += f"🔄 Период кеширования: {stats['cache_duration_minutes']} минут\n"
         text += f"📊 Кешированных таблиц: {stats['spreadsheets_cached']}\n"
-        text += f"📋 Кешированных листов: {stats['sheets_cached']}\n\n"
+        text += f"📋 Кешированных листов: {stats['sheets_cached']}\n"
+        text += (f"⚡ Попаданий: {stats['hits']}, устаревших: {stats['stale_hits']}, "
+                 f"промахов: {stats['misses']}, загрузок: {stats['loads']}\n")
+        text += (f"🔥 Прогретых таблиц: {stats['warm_spreadsheets']}, "
+                 f"фоновых обновлений: {stats['refreshes']}\n\n")
         
         if stats.get('spreadsheets_last_updated'):
             text += f"📅 Таблицы обновлены: {stats['spreadsheets_last_updated']}\n\n"
@@ -162,3 +175,30 @@ async def clear_cache(update: Update, context: CallbackContext):
             f"❌ Error in cash cleaning: {e}",
             reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ Назад", callback_data="cache_management")]])
         )
+
+
+def _warm_up_spreadsheet_ids() -> list:
+    """Основная таблица, таблица платежей и таблицы с недавними записями"""
+    from ...database.database_manager import get_recent_spreadsheet_ids
+
+    return [ACTIVE_SPREADSHEET_ID, PAYMENTS_SPREADSHEET_ID] + get_recent_spreadsheet_ids(SHEETS_CACHE_RECENT_DAYS)
+
+
+async def sheets_cache_warmup_job(context: CallbackContext):
+    """
+    Прогрев кеша листов после запуска (однократная задача job_queue),
+    чтобы первый пользователь не ждал Drive и Sheets API
+    """
+    try:
+        spreadsheet_ids = await asyncio.to_thread(_warm_up_spreadsheet_ids)
+        await asyncio.to_thread(warm_up_sheets_cache, spreadsheet_ids)
+    except Exception as e:
+        logger.error(f"Error warming up sheets cache: {e}", exc_info=True)
+
+
+async def sheets_cache_refresh_job(context: CallbackContext):
+    """Периодическое обновление записей кеша листов до истечения их срока"""
+    try:
+        await asyncio.to_thread(refresh_expiring_sheets_cache, timedelta(minutes=SHEETS_CACHE_REFRESH_MINUTES))
+    except Exception as e:
+        logger.error(f"Error refreshing sheets cache: {e}", exc_info=True)
@@ -11,7 +11,9 @@ from ...utils.config_utils import is_user_allowed, get_user_settings, load_users
 from ...config.settings import ADMIN_IDS, logger
 from ...utils.formatting import format_record_info
 from ...database.database_manager import get_record_from_db, update_record_in_db, delete_record_from_db
-from ...google_integration.async_sheets_worker import update_record_async, delete_record_async
+from ...google_integration.async_sheets_worker import (
+    make_update_record_task, make_delete_record_task, submit_task
+)
 from ...utils.report_manager import send_report
 
 
@@ -198,14 +200,16 @@ async def get_edit_value(update: Update, context: CallbackContext):
         except Exception:
             pass
     
-    # Асинхронно обновляем в Google Sheets
+    # Обновляем в базе данных вместе с задачей для Google Sheets (outbox)
     spreadsheet_id = record.get('spreadsheet_id')
     sheet_name = record.get('sheet_name')
-    update_record_async(spreadsheet_id, sheet_name, record_id, field, new_value)
-    sheet_success = True  # Считаем успешным, так как задача добавлена в очередь
+    sheets_task = make_update_record_task(spreadsheet_id, sheet_name, record_id, field, new_value)
+    db_success = update_record_in_db(record_id, field, new_value, sheets_task)
 
-    # Обновляем в базе данных
-    db_success = update_record_in_db(record_id, field, new_value)
+    # Асинхронно обновляем в Google Sheets (только если запись обновлена в БД)
+    if db_success:
+        submit_task(sheets_task)
+    sheet_success = True  # Считаем успешным, так как задача добавлена в очередь
     data_field = \
     {
         'date': 'Ամսաթիվ',
@@ -306,11 +310,12 @@ async def confirm_delete(update: Update, context: CallbackContext):
     spreadsheet_id = record.get('spreadsheet_id')
     sheet_name = record.get('sheet_name')
     
-    # Удаляем из базы данных
-    db_success = delete_record_from_db(record_id)
+    # Удаляем из базы данных вместе с задачей для Google Sheets (outbox)
+    sheets_task = make_delete_record_task(spreadsheet_id, sheet_name, record_id)
+    db_success = delete_record_from_db(record_id, sheets_task)
     
     # Асинхронно удаляем из Google Sheets
-    delete_record_async(spreadsheet_id, sheet_name, record_id)
+    submit_task(sheets_task)
     sheet_success = True  # Считаем успешным, так как задача добавлена в очередь
     
     # Результат
@@ -11,6 +11,7 @@ import pandas as pd
 from ...config.settings import ADMIN_IDS, logger
 from ...utils.config_utils import load_users
 from ...database.database_manager import get_all_records, get_payments
+from ...google_integration.startup_sync import wait_for_payments_sync
 
 
 async def export_menu(update: Update, context: CallbackContext):
@@ -85,6 +86,8 @@ async def export_all_payments(update: Update, context: CallbackContext):
         await query.answer("❌ Մուտքն արգելված է")
         return
     
+    await wait_for_payments_sync()  # Платежи в БД - после синхронизации при запуске
+
     try:
         users = load_users()
         all_payments = []
@@ -198,6 +201,8 @@ async def export_full_backup(update: Update, context: CallbackContext):
         await query.answer("❌ Մուտքն արգելված է")
         return
     
+    await wait_for_payments_sync()
+
     try:
         # Собираем все данные
         records = get_all_records()
@@ -11,6 +11,7 @@ from ...config.settings import ADMIN_IDS, ACTIVE_SPREADSHEET_ID, logger
 import os
 from ...utils.config_utils import load_users, get_user_settings, send_to_log_chat
 from ...database.database_manager import add_payment, get_payments, get_all_records
+from ...google_integration.startup_sync import wait_for_payments_sync
 from ...utils.payment_utils import (
     normalize_date, merge_payment_intervals, get_user_id_by_display_name, send_message_to_user
 )
@@ -108,7 +109,7 @@ async def start_add_payment(update: Update, context: CallbackContext):
     """Начинает процесс добавления платежа"""
     from ...database.database_manager import get_role_by_display_name
     from ...config.settings import UserRole
-    from ...google_integration.sheets_manager import GoogleSheetsManager
+    from ...google_integration.sheets_manager import sheets_manager
 
     query = update.callback_query
     user_id = update.effective_user.id
@@ -137,7 +138,6 @@ async def start_add_payment(update: Update, context: CallbackContext):
             return ConversationHandler.END
 
         # Получаем список листов из таблицы
-        sheets_manager = GoogleSheetsManager()
         try:
             sheets_info, title = sheets_manager.get_worksheets_info(user_spreadsheet_id)
 
@@ -409,7 +409,7 @@ async def get_payment_comment(update: Update, context: CallbackContext):
 
         if spreadsheet_id and sheet_name != " ":
             from ...database.database_manager import add_record_to_db
-            from ...google_integration.async_sheets_worker import add_record_async
+            from ...google_integration.async_sheets_worker import make_add_record_task, submit_task
             import uuid
 
             # Формируем описание расхода
@@ -432,16 +432,17 @@ async def get_payment_comment(update: Update, context: CallbackContext):
                 'user_id': sender_id
             }
 
-            # Добавляем запись в БД
-            record_added = add_record_to_db(expense_record)
+            # Добавляем запись в БД вместе с задачей для Google Sheets (outbox)
+            sheets_task = make_add_record_task(
+                spreadsheet_id=spreadsheet_id,  # Используем spreadsheet_id платежа
+                sheet_name=sheet_name,  # Используем sheet_name платежа
+                record=expense_record
+            )
+            record_added = add_record_to_db(expense_record, sheets_task)
 
             if record_added:
                 # Добавляем в async worker для синхронизации с Google Sheets
-                add_record_async(
-                    spreadsheet_id=spreadsheet_id,  # Используем spreadsheet_id платежа
-                    sheet_name=sheet_name,  # Используем sheet_name платежа
-                    record=expense_record
-                )
+                submit_task(sheets_task)
                 logger.info(f"Created expense record #{record_id} for payment {display_name}")
                 expense_record_created = True
             else:
@@ -485,6 +486,7 @@ async def send_payment_report(update: Update, context: CallbackContext, display_
     """
     Формирует и отправляет Excel-отчет с разбивкой по промежуткам выплат для заданного работника
     """
+    await wait_for_payments_sync()  # Платежи в БД - после синхронизации при запуске
     try:
         # Получаем все записи из БД и фильтруем по пользователю
         db_records = get_all_records()
@@ -9,9 +9,10 @@ from telegram.ext import ContextTypes, ConversationHandler
 from ...config.settings import UserRole, logger
 from ...utils.config_utils import (
     is_admin, is_super_admin, get_user_role, get_users_by_role,
-    get_user_display_name, load_users
+    get_user_display_name
 )
 from ...database.database_manager import get_payments, delete_payment, update_payment, get_role_by_display_name
+from ...google_integration.startup_sync import wait_for_payments_sync
 
 
 # Conversation states
@@ -31,11 +32,7 @@ def get_user_role_by_display_name(display_name: str) -> str:
     Returns:
         Роль пользователя или UserRole.WORKER по умолчанию
     """
-    users = load_users()
-    for user_id_str, user_data in users.items():
-        if user_data.get('display_name') == display_name:
-            return user_data.get('role', UserRole.WORKER)
-    return UserRole.WORKER
+    return get_role_by_display_name(display_name)
 
 
 async def payments_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -51,6 +48,7 @@ async def payments_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
 
     await query.answer()
+    await wait_for_payments_sync()  # Платежи в БД - после синхронизации при запуске
 
     # Получаем текущую страницу из callback_data или устанавливаем 0
     page = 0
@@ -135,6 +133,7 @@ async def payments_secondary_list(update: Update, context: ContextTypes.DEFAULT_
         return
 
     await query.answer()
+    await wait_for_payments_sync()
 
     # Получаем страницу
     page = 0
@@ -217,6 +216,7 @@ async def payments_clients_list(update: Update, context: ContextTypes.DEFAULT_TY
         return
 
     await query.answer()
+    await wait_for_payments_sync()
 
     # Получаем страницу
     page = 0
@@ -302,6 +302,7 @@ async def user_payments_list(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
 
     await query.answer()
+    await wait_for_payments_sync()
 
     # Определяем тип пользователя и имя
     data = query.data
@@ -416,6 +417,7 @@ async def payment_detail(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     await query.answer()
+    await wait_for_payments_sync()
 
     try:
         payment_id = int(query.data.replace("payment_detail_", ""))
@@ -808,6 +810,7 @@ async def send_payments_only_report(update: Update, context: ContextTypes.DEFAUL
     Отправляет Excel-отчет только по платежам (без records)
     Используется когда у пользователя нет расходов, но есть платежи
     """
+    await wait_for_payments_sync()
     import pandas as pd
     from io import BytesIO
     from datetime import datetime
@@ -906,6 +909,7 @@ async def get_summary_report(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
 
     await query.answer()
+    await wait_for_payments_sync()
 
     # Извлекаем display_name из callback
     display_name = query.data.replace("get_summary_report_", "")
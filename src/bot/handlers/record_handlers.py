@@ -11,7 +11,7 @@ from ..keyboards.inline_keyboards import create_main_menu
 from ...utils.config_utils import is_user_allowed, get_user_settings, update_user_settings, load_users, save_users
 from ...utils.formatting import format_record_info
 from ...database.database_manager import add_record_to_db
-from ...google_integration.async_sheets_worker import add_record_async
+from ...google_integration.async_sheets_worker import make_add_record_task, submit_task
 from ...config.settings import ACTIVE_SPREADSHEET_ID, logger
 from ...utils.report_manager import send_report
 from ..handlers.translation_handlers import _
@@ -462,11 +462,12 @@ async def get_amount(update: Update, context: CallbackContext):
 
         record = context.user_data['record']
 
-        # Сохраняем в БД 
-        db_success = add_record_to_db(record)
+        # Сохраняем в БД вместе с задачей для Google Sheets (outbox)
+        sheets_task = make_add_record_task(spreadsheet_id, sheet_name, record)
+        db_success = add_record_to_db(record, sheets_task)
         
         # Асинхронно добавляем в Google Sheets (не блокируем бота)
-        add_record_async(spreadsheet_id, sheet_name, record)
+        submit_task(sheets_task)
         sheet_success = True  # Считаем успешным, так как задача добавлена в очередь
 
         if record.get('skip_mode'):
@@ -59,8 +59,34 @@ GOOGLE_SCOPE = [
 GOOGLE_SCOPES = ['https://www.googleapis.com/auth/drive.metadata.readonly']
 GOOGLE_SHEET_WORKERS = 4  # Количество воркеров для работы с Google Sheets
 
+# Квоты Google Sheets API на сервисный аккаунт (запросов в минуту)
+GOOGLE_READ_REQUESTS_PER_MINUTE = int(os.getenv('GOOGLE_READ_REQUESTS_PER_MINUTE', '60'))
+GOOGLE_WRITE_REQUESTS_PER_MINUTE = int(os.getenv('GOOGLE_WRITE_REQUESTS_PER_MINUTE', '60'))
+
+# Режим воркера Google Sheets: 'threads' (gspread в пуле потоков) или 'asyncio' (httpx в цикле событий бота)
+SHEETS_WORKER_MODE = os.getenv('SHEETS_WORKER_MODE', 'threads').lower()
+SHEETS_ASYNC_WORKERS = int(os.getenv('SHEETS_ASYNC_WORKERS', '16'))  # Количество asyncio-задач воркера
+# HTTP/2 для asyncio-клиента: нужен пакет h2 (pip install httpx[http2]), его нет в requirements.txt
+GOOGLE_HTTP2 = os.getenv('GOOGLE_HTTP2', 'false').lower() in ('1', 'true', 'yes')
+DRIVE_PAGE_SIZE = 1000  # Максимальный размер страницы files().list в Drive API
+FULL_SYNC_CONCURRENCY = int(os.getenv('FULL_SYNC_CONCURRENCY', '4'))  # Таблиц, синхронизируемых одновременно
+# Конфликт при сверке полей (поле изменено и в БД, и в листе): db, sheet или report (только отчет)
+DRIFT_CONFLICT_POLICY = os.getenv('DRIFT_CONFLICT_POLICY', 'report').lower()
+# Сколько секунд обработчики платежей ждут фоновую синхронизацию при запуске
+STARTUP_SYNC_WAIT_TIMEOUT = float(os.getenv('STARTUP_SYNC_WAIT_TIMEOUT', '30'))
+
+# Бэкенд Google API: google (настоящий API) или fake (таблицы в памяти процесса - для тестов и бенчмарков)
+GOOGLE_BACKEND = os.getenv('GOOGLE_BACKEND', 'google').lower()
+FAKE_GOOGLE_LATENCY = float(os.getenv('FAKE_GOOGLE_LATENCY', '0'))  # Задержка ответа фейкового API, секунды
+FAKE_GOOGLE_ERROR_RATE = float(os.getenv('FAKE_GOOGLE_ERROR_RATE', '0'))  # Доля запросов с ошибкой квоты 429
+FAKE_GOOGLE_DATA = os.getenv('FAKE_GOOGLE_DATA')  # JSON {spreadsheet_id: {лист: строки}} - начальные данные
+
 # ID таблицы для хранения платежей (отдельная от основной)
 PAYMENTS_SPREADSHEET_ID = os.getenv('PAYMENTS_SPREADSHEET_ID')
+# Сколько секунд кешируются строки платежей листа ({ID платежа: строка}); 0 - без кеша
+PAYMENTS_ROW_CACHE_TTL = float(os.getenv('PAYMENTS_ROW_CACHE_TTL', '600'))
+# Сколько последних строк листа платежей перечитывается для проверки водяного знака
+PAYMENTS_SYNC_TAIL_ROWS = int(os.getenv('PAYMENTS_SYNC_TAIL_ROWS', '5'))
 
 # ID основной таблицы Google Sheets
 ACTIVE_SPREADSHEET_ID = os.getenv('ACTIVE_SPREADSHEET_ID')
@@ -78,6 +104,12 @@ else:
 # Интервал автоматического бэкапа (в часах)
 BACKUP_INTERVAL_HOURS = float(os.getenv('BACKUP_INTERVAL_HOURS', '2'))
 
+# Период фонового обновления кеша листов (в минутах): записи, срок которых
+# истечет до следующего запуска, перезагружаются заранее; 0 - без обновления
+SHEETS_CACHE_REFRESH_MINUTES = float(os.getenv('SHEETS_CACHE_REFRESH_MINUTES', '10'))
+# За сколько дней таблицы с новыми записями прогреваются в кеше при старте
+SHEETS_CACHE_RECENT_DAYS = int(os.getenv('SHEETS_CACHE_RECENT_DAYS', '7'))
+
 LOCALIZATION_FILE = os.path.join(BASE_DIR, 'src/config/localization.json')
 
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
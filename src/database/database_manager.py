@@ -3,8 +3,12 @@
 """
 import sqlite3
 from datetime import datetime
-from typing import Dict, Optional, List, Tuple
+from typing import Any, Callable, Dict, Optional, List, Tuple
 from ..config.settings import DATABASE_PATH, logger
+from .sheets_outbox import ensure_outbox_table, persist_task
+from .sheets_sync_state import ensure_sync_state_tables
+from .sheet_rows import ensure_sheet_rows_schema
+from .payments_sync_state import ensure_payments_sync_state_tables
 
 
 class DatabaseManager:
@@ -57,6 +61,18 @@ class DatabaseManager:
                 cursor.execute("ALTER TABLE records ADD COLUMN user_id INTEGER")
                 logger.info("Migration: added user_id column to records table")
 
+            # Outbox задач для Google Sheets
+            ensure_outbox_table(cursor)
+
+            # Состояние полной синхронизации (modifiedTime таблиц, хеши листов)
+            ensure_sync_state_tables(cursor)
+
+            # Последние известные строки записей в листах
+            ensure_sheet_rows_schema(cursor)
+
+            # Водяные знаки инкрементальной синхронизации платежей
+            ensure_payments_sync_state_tables(cursor)
+
             conn.commit()
             conn.close()
             logger.info("Database initialized and migration completed successfully")
@@ -66,8 +82,8 @@ class DatabaseManager:
             logger.error(f"Error initializing/migrating database: {e}")
             return False
 
-    def add_record(self, record: Dict) -> bool:
-        """Добавляет запись в базу данных"""
+    def add_record(self, record: Dict, sheets_task=None) -> bool:
+        """Добавляет запись в базу данных (и задачу для Google Sheets в outbox)"""
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
@@ -88,6 +104,8 @@ class DatabaseManager:
                 record.get('sheet_name'),
                 record.get('user_id')
             ))
+            if sheets_task is not None:
+                persist_task(cursor, sheets_task)
 
             conn.commit()
             conn.close()
@@ -98,8 +116,112 @@ class DatabaseManager:
             logger.error(f"Error adding record to DB: {e}")
             return False
 
-    def update_record(self, record_id: str, field: str, new_value) -> bool:
-        """Обновляет запись в базе данных"""
+    def add_missing_records(self, records: List[Dict]) -> Optional[int]:
+        """
+        Добавляет записи, которых еще нет в БД (по id), одной транзакцией.
+
+        Returns:
+            Количество добавленных записей (None - ошибка).
+        """
+        if not records:
+            return 0
+
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+
+            added = 0
+            for record in records:
+                cursor.execute('''
+                    INSERT INTO records (
+                        id, date, supplier, direction, description, amount,
+                        spreadsheet_id, sheet_name, user_id
+                    )
+                    SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?
+                    WHERE NOT EXISTS (SELECT 1 FROM records WHERE id = ?)
+                ''', (
+                    record.get('id'),
+                    record.get('date'),
+                    record.get('supplier'),
+                    record.get('direction'),
+                    record.get('description'),
+                    record.get('amount', 0),
+                    record.get('spreadsheet_id'),
+                    record.get('sheet_name'),
+                    record.get('user_id'),
+                    record.get('id')
+                ))
+                added += cursor.rowcount
+
+            conn.commit()
+            conn.close()
+            return added
+
+        except Exception as e:
+            logger.error(f"Error adding records to DB: {e}")
+            return None
+
+    def upsert_records(self, records: List[Dict]) -> int:
+        """
+        Добавляет или обновляет записи одной транзакцией (по id).
+        user_id и created_at существующих записей не меняются.
+
+        Returns:
+            Количество добавленных и обновленных записей.
+        """
+        if not records:
+            return 0
+
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+
+            # UPDATE, а для новых id - INSERT (в старых БД id может не быть уникальным ключом)
+            for record in records:
+                cursor.execute('''
+                    UPDATE records
+                    SET date = ?, supplier = ?, direction = ?, description = ?, amount = ?,
+                        spreadsheet_id = ?, sheet_name = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (
+                    record.get('date'),
+                    record.get('supplier'),
+                    record.get('direction'),
+                    record.get('description'),
+                    record.get('amount', 0),
+                    record.get('spreadsheet_id'),
+                    record.get('sheet_name'),
+                    record.get('id')
+                ))
+                if cursor.rowcount == 0:
+                    cursor.execute('''
+                        INSERT INTO records (
+                            id, date, supplier, direction, description, amount,
+                            spreadsheet_id, sheet_name, user_id
+                        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ''', (
+                        record.get('id'),
+                        record.get('date'),
+                        record.get('supplier'),
+                        record.get('direction'),
+                        record.get('description'),
+                        record.get('amount', 0),
+                        record.get('spreadsheet_id'),
+                        record.get('sheet_name'),
+                        record.get('user_id')
+                    ))
+
+            conn.commit()
+            conn.close()
+            logger.info(f"Upserted {len(records)} records to DB")
+            return len(records)
+
+        except Exception as e:
+            logger.error(f"Error upserting records to DB: {e}")
+            return 0
+
+    def update_record(self, record_id: str, field: str, new_value, sheets_task=None) -> bool:
+        """Обновляет запись в базе данных (и задачу для Google Sheets в outbox)"""
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
@@ -114,6 +236,13 @@ class DatabaseManager:
                 SET {field} = ?, updated_at = CURRENT_TIMESTAMP 
                 WHERE id = ?
             ''', (new_value, record_id))
+            if cursor.rowcount == 0:
+                # Записи нет: задача для Google Sheets не сохраняется
+                conn.close()
+                logger.warning(f"Record {record_id} not found for update")
+                return False
+            if sheets_task is not None:
+                persist_task(cursor, sheets_task)
             
             conn.commit()
             conn.close()
@@ -124,13 +253,21 @@ class DatabaseManager:
             logger.error(f"Error updating record in DB: {e}")
             return False
 
-    def delete_record(self, record_id: str) -> bool:
-        """Удаляет запись из базы данных"""
+    def delete_record(self, record_id: str, sheets_task=None) -> bool:
+        """Удаляет запись из базы данных (и задачу для Google Sheets в outbox)"""
         try:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
             
+            if sheets_task is not None:
+                # Позиция строки нужна задаче удаления, а сама запись сейчас исчезнет
+                cursor.execute('SELECT sheet_row, layout_version FROM records WHERE id = ?', (record_id,))
+                row = cursor.fetchone()
+                if row and row[0] is not None:
+                    sheets_task.data = dict(sheets_task.data or {}, sheet_row=row[0], layout_version=row[1])
             cursor.execute('DELETE FROM records WHERE id = ?', (record_id,))
+            if sheets_task is not None:
+                persist_task(cursor, sheets_task)
             
             conn.commit()
             conn.close()
@@ -216,6 +353,27 @@ class DatabaseManager:
             logger.error(f"Error searching records in DB: {e}")
             return []
 
+    def get_recent_spreadsheet_ids(self, days: int, limit: int = 20) -> List[str]:
+        """ID таблиц с записями за последние days дней (сначала недавние)"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT spreadsheet_id FROM records
+                WHERE spreadsheet_id IS NOT NULL AND spreadsheet_id != ''
+                  AND created_at >= datetime('now', ?)
+                GROUP BY spreadsheet_id
+                ORDER BY MAX(created_at) DESC
+                LIMIT ?
+            ''', (f'-{days} days', limit))
+            spreadsheet_ids = [row[0] for row in cursor.fetchall()]
+            conn.close()
+            return spreadsheet_ids
+
+        except Exception as e:
+            logger.error(f"Error getting recent spreadsheets: {e}")
+            return []
+
     def get_db_stats(self) -> Optional[Dict]:
         """Получает статистику базы данных"""
         try:
@@ -273,10 +431,15 @@ class DatabaseManager:
     def add_payment(self, user_display_name: str, spreadsheet_id: str = None,
                    sheet_name: str = None, amount: float = 0,
                    date_from: str = None, date_to: str = None,
-                   comment: str = None) -> int:
+                   comment: str = None,
+                   sheets_task_factory: Optional[Callable[[int], Any]] = None) -> int:
         """
         Добавляет платеж
 
+        Args:
+            sheets_task_factory: функция payment_id -> SheetsTask; задача
+                сохраняется в outbox в той же транзакции
+
         Returns:
             ID добавленного платежа или 0 в случае ошибки
         """
@@ -293,6 +456,10 @@ class DatabaseManager:
                   date_from, date_to, comment))
 
             payment_id = cursor.lastrowid
+            if sheets_task_factory is not None:
+                sheets_task = sheets_task_factory(payment_id)
+                if sheets_task is not None:
+                    persist_task(cursor, sheets_task)
             conn.commit()
             conn.close()
             logger.info(f"Payment #{payment_id} added: {amount} for {user_display_name}")
@@ -350,11 +517,62 @@ class DatabaseManager:
             logger.error(f"Error in batch payment insertion: {e}")
             return 0
 
+    def add_missing_payments(self, payments: List[Dict]) -> Optional[int]:
+        """
+        Добавляет платежи с их ID из Google Sheets, которых еще нет в БД,
+        одной транзакцией. Платежи с уже существующим ID не меняются, поэтому
+        повторная синхронизация ничего не добавляет.
+
+        Args:
+            payments: список словарей с ключами id, user_display_name, spreadsheet_id,
+                      sheet_name, amount, date_from, date_to, comment, created_at
+
+        Returns:
+            Количество добавленных платежей (None - ошибка).
+        """
+        if not payments:
+            return 0
+
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+
+            added = 0
+            for p in payments:
+                # Явный id продвигает счетчик AUTOINCREMENT - новые платежи бота не пересекутся с ним
+                cursor.execute('''
+                    INSERT OR IGNORE INTO payments (
+                        id, user_display_name, spreadsheet_id, sheet_name, amount,
+                        date_from, date_to, comment, created_at
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, COALESCE(NULLIF(?, ''), CURRENT_TIMESTAMP))
+                ''', (
+                    p.get('id'),
+                    p.get('user_display_name'),
+                    p.get('spreadsheet_id'),
+                    p.get('sheet_name'),
+                    p.get('amount', 0),
+                    p.get('date_from'),
+                    p.get('date_to'),
+                    p.get('comment'),
+                    p.get('created_at')
+                ))
+                added += cursor.rowcount
+
+            conn.commit()
+            conn.close()
+            logger.info(f"Added {added} payments with sheet IDs to DB")
+            return added
+
+        except Exception as e:
+            logger.error(f"Error adding payments to DB: {e}")
+            return None
+
     def get_payments(self, user_display_name: str = None, spreadsheet_id: str = None,
-                    sheet_name: str = None) -> List[Dict]:
+                    sheet_name: str = None, after_id: int = None) -> List[Dict]:
         """
         Получает платежи пользователя или все платежи
         Если параметры не указаны, возвращает все платежи
+        (after_id - только платежи с ID больше указанного)
         """
         try:
             conn = sqlite3.connect(self.db_path)
@@ -377,6 +595,10 @@ class DatabaseManager:
                 conditions.append("sheet_name = ?")
                 params.append(sheet_name)
 
+            if after_id is not None:
+                conditions.append("id > ?")
+                params.append(after_id)
+
             query = '''
                 SELECT id, user_display_name, spreadsheet_id, sheet_name,
                        amount, date_from, date_to, comment, created_at
@@ -399,12 +621,27 @@ class DatabaseManager:
             logger.error(f"Error getting payments: {e}")
             return []
 
-    def delete_payment(self, payment_id: int) -> bool:
+    def get_max_payment_id(self) -> Optional[int]:
+        """Наибольший ID платежа (0 - платежей нет, None - ошибка)"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            cursor.execute('SELECT COALESCE(MAX(id), 0) FROM payments')
+            result = cursor.fetchone()[0]
+            conn.close()
+            return result
+
+        except Exception as e:
+            logger.error(f"Error getting max payment ID: {e}")
+            return None
+
+    def delete_payment(self, payment_id: int, sheets_task=None) -> bool:
         """
         Удаляет платеж из БД
 
         Args:
             payment_id: ID платежа для удаления
+            sheets_task: задача для Google Sheets (сохраняется в outbox)
 
         Returns:
             True если успешно, False если ошибка
@@ -415,6 +652,8 @@ class DatabaseManager:
 
             cursor.execute('DELETE FROM payments WHERE id = ?', (payment_id,))
             deleted = cursor.rowcount > 0
+            if deleted and sheets_task is not None:
+                persist_task(cursor, sheets_task)
 
             conn.commit()
             conn.close()
@@ -432,7 +671,7 @@ class DatabaseManager:
 
     def update_payment(self, payment_id: int, amount: float = None,
                       date_from: str = None, date_to: str = None,
-                      comment: str = None) -> bool:
+                      comment: str = None, sheets_task=None) -> bool:
         """
         Обновляет платеж в БД
 
@@ -442,6 +681,7 @@ class DatabaseManager:
             date_from: Новая дата начала (опционально)
             date_to: Новая дата окончания (опционально)
             comment: Новый комментарий (опционально)
+            sheets_task: задача для Google Sheets (сохраняется в outbox)
 
         Returns:
             True если успешно, False если ошибка
@@ -477,6 +717,8 @@ class DatabaseManager:
 
             cursor.execute(query, params)
             updated = cursor.rowcount > 0
+            if updated and sheets_task is not None:
+                persist_task(cursor, sheets_task)
 
             conn.commit()
             conn.close()
@@ -575,14 +817,17 @@ db_manager = DatabaseManager()
 def init_db():
     return db_manager.init_db()
 
-def add_record_to_db(record: Dict) -> bool:
-    return db_manager.add_record(record)
+def add_record_to_db(record: Dict, sheets_task=None) -> bool:
+    return db_manager.add_record(record, sheets_task)
+
+def add_missing_records_to_db(records: List[Dict]) -> Optional[int]:
+    return db_manager.add_missing_records(records)
 
-def update_record_in_db(record_id: str, field: str, new_value) -> bool:
-    return db_manager.update_record(record_id, field, new_value)
+def update_record_in_db(record_id: str, field: str, new_value, sheets_task=None) -> bool:
+    return db_manager.update_record(record_id, field, new_value, sheets_task)
 
-def delete_record_from_db(record_id: str) -> bool:
-    return db_manager.delete_record(record_id)
+def delete_record_from_db(record_id: str, sheets_task=None) -> bool:
+    return db_manager.delete_record(record_id, sheets_task)
 
 def get_record_from_db(record_id: str) -> Optional[Dict]:
     return db_manager.get_record(record_id)
@@ -596,6 +841,9 @@ def search_records(query: str) -> List[Dict]:
 def get_db_stats() -> Optional[Dict]:
     return db_manager.get_db_stats()
 
+def get_recent_spreadsheet_ids(days: int, limit: int = 20) -> List[str]:
+    return db_manager.get_recent_spreadsheet_ids(days, limit)
+
 def backup_db_to_dict() -> Optional[Dict]:
     return db_manager.backup_to_dict()
 
@@ -612,32 +860,40 @@ def add_payment(user_display_name: str, spreadsheet_id: str = None,
     Returns:
         ID добавленного платежа или 0 в случае ошибки
     """
-    # Добавляем в БД
+    from ..google_integration.async_sheets_worker import make_add_payment_task, submit_task
+
+    # Определяем роль пользователя по display_name
+    role = get_role_by_display_name(user_display_name)
+    tasks = []
+
+    def sheets_task_factory(payment_id: int):
+        # Задача создается внутри транзакции, когда ID платежа уже известен
+        task = make_add_payment_task(
+            payment_id=payment_id,
+            user_display_name=user_display_name,
+            amount=amount,
+            role=role,
+            date_from=date_from,
+            date_to=date_to,
+            comment=comment,
+            target_spreadsheet_id=spreadsheet_id,
+            target_sheet_name=sheet_name
+        )
+        if task:
+            tasks.append(task)
+        return task
+
+    # Добавляем в БД вместе с задачей для Google Sheets (outbox)
     payment_id = db_manager.add_payment(
         user_display_name, spreadsheet_id, sheet_name,
-        amount, date_from, date_to, comment
+        amount, date_from, date_to, comment,
+        sheets_task_factory=sheets_task_factory
     )
 
-    if payment_id > 0:
+    if payment_id > 0 and tasks:
         # Синхронизируем с Google Sheets через async worker
         try:
-            from ..google_integration.async_sheets_worker import add_payment_async
-
-            # Определяем роль пользователя по display_name
-            role = get_role_by_display_name(user_display_name)
-
-            # Добавляем задачу в очередь async worker
-            add_payment_async(
-                payment_id=payment_id,
-                user_display_name=user_display_name,
-                amount=amount,
-                role=role,
-                date_from=date_from,
-                date_to=date_to,
-                comment=comment,
-                target_spreadsheet_id=spreadsheet_id,
-                target_sheet_name=sheet_name
-            )
+            submit_task(tasks[0])
             logger.info(f"Payment #{payment_id} added to queue for synchronization with Google Sheets (role: {role})")
         except Exception as e:
             logger.error(f"Error queuing payment synchronization task #{payment_id}: {e}")
@@ -659,14 +915,10 @@ def get_role_by_display_name(display_name: str) -> str:
     Returns:
         Роль пользователя или UserRole.WORKER по умолчанию
     """
-    from ..utils.config_utils import load_users
+    from ..utils.config_utils import get_display_name_roles
     from ..config.settings import UserRole
 
-    users = load_users()
-    for user_id_str, user_data in users.items():
-        if user_data.get('display_name') == display_name:
-            return user_data.get('role', UserRole.WORKER)
-    return UserRole.WORKER
+    return get_display_name_roles().get(display_name, UserRole.WORKER)
 
 
 def delete_payment(payment_id: int) -> bool:
@@ -681,7 +933,7 @@ def delete_payment(payment_id: int) -> bool:
     """
     # Сначала получаем информацию о платеже для удаления из Sheets
     try:
-        from ..google_integration.async_sheets_worker import delete_payment_async
+        from ..google_integration.async_sheets_worker import make_delete_payment_task, submit_task
 
         # Получаем информацию о платеже перед удалением
         all_payments = db_manager.get_payments()
@@ -689,13 +941,14 @@ def delete_payment(payment_id: int) -> bool:
 
         # Определяем роль по display_name
         role = get_role_by_display_name(payment['user_display_name']) if payment else None
+        task = make_delete_payment_task(payment_id=payment_id, role=role) if role else None
 
-        # Удаляем из БД
-        success = db_manager.delete_payment(payment_id)
+        # Удаляем из БД вместе с задачей для Google Sheets (outbox)
+        success = db_manager.delete_payment(payment_id, sheets_task=task)
 
-        if success and role:
+        if success and task:
             # Добавляем задачу на удаление из Google Sheets
-            delete_payment_async(payment_id=payment_id, role=role)
+            submit_task(task)
             logger.info(f"Payment #{payment_id} added to queue for deletion from Google Sheets (role: {role})")
 
         return success
@@ -720,7 +973,7 @@ def update_payment(payment_id: int, amount: float = None,
     Returns:
         True если успешно
     """
-    from ..google_integration.async_sheets_worker import update_payment_async
+    from ..google_integration.async_sheets_worker import make_update_payment_task, submit_task
 
     try:
         # Получаем информацию о платеже для определения роли
@@ -734,23 +987,24 @@ def update_payment(payment_id: int, amount: float = None,
         # Определяем роль по display_name
         role = get_role_by_display_name(payment['user_display_name'])
 
-        # Обновляем в БД
-        success = db_manager.update_payment(payment_id, amount, date_from, date_to, comment)
-
-        if success and role:
-            # Формируем словарь с обновленными данными
-            updated_data = {}
-            if amount is not None:
-                updated_data['amount'] = amount
-            if date_from is not None:
-                updated_data['date_from'] = date_from
-            if date_to is not None:
-                updated_data['date_to'] = date_to
-            if comment is not None:
-                updated_data['comment'] = comment
-
+        # Формируем словарь с обновленными данными
+        updated_data = {}
+        if amount is not None:
+            updated_data['amount'] = amount
+        if date_from is not None:
+            updated_data['date_from'] = date_from
+        if date_to is not None:
+            updated_data['date_to'] = date_to
+        if comment is not None:
+            updated_data['comment'] = comment
+        task = make_update_payment_task(payment_id=payment_id, role=role, updated_data=updated_data) if role else None
+
+        # Обновляем в БД вместе с задачей для Google Sheets (outbox)
+        success = db_manager.update_payment(payment_id, amount, date_from, date_to, comment, sheets_task=task)
+
+        if success and task:
             # Добавляем задачу на обновление в Google Sheets
-            update_payment_async(payment_id=payment_id, role=role, updated_data=updated_data)
+            submit_task(task)
             logger.info(f"Payment #{payment_id} updated and added to queue for synchronization with Google Sheets (role: {role})")
 
         return success
@@ -0,0 +1,158 @@
+"""
+Водяные знаки инкрементальной синхронизации платежей
+
+Для каждого листа роли в таблице платежей хранится последняя строка с
+платежом на момент последней синхронизации, наибольший ID платежа листа и
+"хвост" - пары (строка, ID) последних PAYMENTS_SYNC_TAIL_ROWS платежей.
+Для БД хранится наибольший ID платежа, который уже есть в обоих местах.
+
+Инкрементальная синхронизация читает лист только с первой строки хвоста:
+если хвост на месте, все строки ниже - новые платежи. Если хвост сдвинулся
+(строки удалены, вставлены или отсортированы вручную) или водяных знаков
+нет, выполняется полная сверка.
+"""
+import json
+import sqlite3
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from ..config.settings import DATABASE_PATH, logger
+
+
+def ensure_payments_sync_state_tables(cursor: sqlite3.Cursor):
+    """Создает таблицы водяных знаков синхронизации платежей (вызывается из init_db)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS payments_sync_sheets (
+            spreadsheet_id TEXT NOT NULL,
+            sheet_name TEXT NOT NULL,
+            last_row INTEGER NOT NULL,
+            max_payment_id INTEGER NOT NULL DEFAULT 0,
+            tail TEXT NOT NULL,
+            synced_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (spreadsheet_id, sheet_name)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS payments_sync_db (
+            spreadsheet_id TEXT PRIMARY KEY,
+            max_payment_id INTEGER NOT NULL,
+            synced_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+@dataclass
+class SheetWatermark:
+    """Водяной знак листа: последняя строка с платежом и хвост [(строка, ID)]"""
+    last_row: int = 1
+    max_payment_id: int = 0
+    tail: List[Tuple[int, int]] = field(default_factory=list)
+
+    @classmethod
+    def from_rows(cls, rows: List[Tuple[int, int]], tail_size: int,
+                  previous: Optional['SheetWatermark'] = None) -> 'SheetWatermark':
+        """
+        Водяной знак по прочитанным парам (строка, ID). Если прочитан только
+        хвост листа, previous дает последнюю строку и наибольший ID при пустом чтении.
+        """
+        previous = previous or cls()
+        rows = sorted(rows)
+        last_row = max(rows[-1][0] if rows else 1, previous.last_row)
+        return cls(
+            last_row=last_row,
+            max_payment_id=max([payment_id for _, payment_id in rows] + [previous.max_payment_id]),
+            tail=[(row, payment_id) for row, payment_id in rows if row > last_row - tail_size]
+        )
+
+    def first_tail_row(self, tail_size: int) -> int:
+        """Первая строка чтения: начало хвоста (строка 1 - заголовки)"""
+        return max(2, self.last_row - tail_size + 1)
+
+
+@dataclass
+class PaymentsWatermark:
+    """Водяные знаки таблицы платежей: листы ролей и БД"""
+    db_max_payment_id: int
+    sheets: Dict[str, SheetWatermark]
+
+
+class PaymentsSyncState:
+    """Доступ к водяным знакам синхронизации платежей"""
+
+    def __init__(self, db_path: str = DATABASE_PATH):
+        self.db_path = db_path
+        self._ensured = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        if not self._ensured:
+            # Таблицы могут отсутствовать, если init_db еще не вызывался (скрипты, бенчмарки)
+            ensure_payments_sync_state_tables(conn.cursor())
+            conn.commit()
+            self._ensured = True
+        return conn
+
+    def get(self, spreadsheet_id: str) -> Optional[PaymentsWatermark]:
+        """Водяные знаки таблицы (None - синхронизация еще не выполнялась)"""
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute('SELECT max_payment_id FROM payments_sync_db WHERE spreadsheet_id = ?',
+                           (spreadsheet_id,))
+            row = cursor.fetchone()
+            if row is None:
+                conn.close()
+                return None
+            cursor.execute('''
+                SELECT sheet_name, last_row, max_payment_id, tail
+                FROM payments_sync_sheets WHERE spreadsheet_id = ?
+            ''', (spreadsheet_id,))
+            sheets = {
+                sheet_name: SheetWatermark(last_row, max_payment_id, [tuple(pair) for pair in json.loads(tail)])
+                for sheet_name, last_row, max_payment_id, tail in cursor.fetchall()
+            }
+            conn.close()
+            return PaymentsWatermark(row[0], sheets)
+        except Exception as e:
+            logger.error(f"Error loading payments sync watermark: {e}")
+            return None
+
+    def save(self, spreadsheet_id: str, watermark: PaymentsWatermark) -> bool:
+        """Заменяет водяные знаки таблицы одной транзакцией"""
+        try:
+            conn = self._connect()
+            conn.execute('DELETE FROM payments_sync_sheets WHERE spreadsheet_id = ?', (spreadsheet_id,))
+            conn.executemany('''
+                INSERT INTO payments_sync_sheets (spreadsheet_id, sheet_name, last_row, max_payment_id, tail)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [
+                (spreadsheet_id, sheet_name, sheet.last_row, sheet.max_payment_id, json.dumps(sheet.tail))
+                for sheet_name, sheet in watermark.sheets.items()
+            ])
+            conn.execute('''
+                INSERT INTO payments_sync_db (spreadsheet_id, max_payment_id, synced_at)
+                VALUES (?, ?, CURRENT_TIMESTAMP)
+                ON CONFLICT (spreadsheet_id)
+                DO UPDATE SET max_payment_id = excluded.max_payment_id, synced_at = CURRENT_TIMESTAMP
+            ''', (spreadsheet_id, watermark.db_max_payment_id))
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            logger.error(f"Error saving payments sync watermark: {e}")
+            return False
+
+    def clear(self, spreadsheet_id: Optional[str] = None):
+        """Сбрасывает водяные знаки (следующая синхронизация будет полной)"""
+        try:
+            conn = self._connect()
+            if spreadsheet_id is None:
+                conn.execute('DELETE FROM payments_sync_sheets')
+                conn.execute('DELETE FROM payments_sync_db')
+            else:
+                conn.execute('DELETE FROM payments_sync_sheets WHERE spreadsheet_id = ?', (spreadsheet_id,))
+                conn.execute('DELETE FROM payments_sync_db WHERE spreadsheet_id = ?', (spreadsheet_id,))
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Error clearing payments sync watermark: {e}")
@@ -0,0 +1,188 @@
+"""
+Последние известные позиции записей в листах Google Sheets
+
+Для каждой записи в таблице records хранится номер строки листа
+(sheet_row) и версия раскладки листа (layout_version), при которой этот
+номер был верен. Версия раскладки листа (sheet_layouts) увеличивается при
+каждой вставке, удалении или сортировке строк, выполненной воркером; в той
+же транзакции строки остальных записей листа сдвигаются, а их версия
+обновляется. Запись, версия которой отстала от версии листа (например,
+после вставки в режиме asyncio), считается без позиции.
+
+Позиция - только подсказка: менеджер проверяет ID в ячейке A{строка}
+перед записью и при несовпадении ищет запись по колонке ID.
+"""
+import sqlite3
+from typing import Dict, Optional
+
+from ..config.settings import DATABASE_PATH, logger
+
+
+def ensure_sheet_rows_schema(cursor: sqlite3.Cursor):
+    """Колонки позиции в records и таблица версий раскладки (вызывается из init_db)"""
+    cursor.execute("PRAGMA table_info(records)")
+    columns = [row[1] for row in cursor.fetchall()]
+    if columns and "sheet_row" not in columns:
+        cursor.execute("ALTER TABLE records ADD COLUMN sheet_row INTEGER")
+        logger.info("Migration: added sheet_row column to records table")
+    if columns and "layout_version" not in columns:
+        cursor.execute("ALTER TABLE records ADD COLUMN layout_version INTEGER")
+        logger.info("Migration: added layout_version column to records table")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sheet_layouts (
+            spreadsheet_id TEXT NOT NULL,
+            sheet_name TEXT NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (spreadsheet_id, sheet_name)
+        )
+    ''')
+    if columns:
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_records_sheet_row
+            ON records (spreadsheet_id, sheet_name, sheet_row)
+        ''')
+
+
+def _layout_version(cursor: sqlite3.Cursor, spreadsheet_id: str, sheet_name: str) -> int:
+    cursor.execute('SELECT version FROM sheet_layouts WHERE spreadsheet_id = ? AND sheet_name = ?',
+                   (spreadsheet_id, sheet_name))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def _bump_layout(cursor: sqlite3.Cursor, spreadsheet_id: str, sheet_name: str) -> int:
+    """Увеличивает версию раскладки листа, возвращает новую"""
+    version = _layout_version(cursor, spreadsheet_id, sheet_name) + 1
+    cursor.execute('''
+        INSERT INTO sheet_layouts (spreadsheet_id, sheet_name, version) VALUES (?, ?, ?)
+        ON CONFLICT (spreadsheet_id, sheet_name) DO UPDATE SET version = excluded.version
+    ''', (spreadsheet_id, sheet_name, version))
+    return version
+
+
+class SheetRowIndex:
+    """Чтение и обновление позиций записей в листах"""
+
+    def __init__(self, db_path: str = DATABASE_PATH):
+        self.db_path = db_path
+        self._ensured = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        if not self._ensured:
+            # Схема может отсутствовать, если init_db еще не вызывался (скрипты, бенчмарки)
+            ensure_sheet_rows_schema(conn.cursor())
+            conn.commit()
+            self._ensured = True
+        return conn
+
+    def lookup(self, record_id: str, spreadsheet_id: str, sheet_name: str) -> Optional[int]:
+        """Строка записи в листе, если она известна для текущей раскладки листа"""
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT r.sheet_row FROM records r
+                LEFT JOIN sheet_layouts l
+                    ON l.spreadsheet_id = r.spreadsheet_id AND l.sheet_name = r.sheet_name
+                WHERE r.id = ? AND r.spreadsheet_id = ? AND r.sheet_name = ?
+                    AND r.sheet_row IS NOT NULL AND r.layout_version = COALESCE(l.version, 0)
+            ''', (record_id, spreadsheet_id, sheet_name))
+            row = cursor.fetchone()
+            conn.close()
+            return row[0] if row else None
+        except Exception as e:
+            logger.error(f"Error reading sheet row of record {record_id}: {e}")
+            return None
+
+    def valid_row(self, spreadsheet_id: str, sheet_name: str, sheet_row: Optional[int],
+                  layout_version: Optional[int]) -> Optional[int]:
+        """Запомненная позиция (например, в задаче удаления), если раскладка листа с тех пор не менялась"""
+        if sheet_row is None or layout_version is None:
+            return None
+        try:
+            conn = self._connect()
+            current = _layout_version(conn.cursor(), spreadsheet_id, sheet_name)
+            conn.close()
+            return sheet_row if current == layout_version else None
+        except Exception as e:
+            logger.error(f"Error reading layout version of {sheet_name}: {e}")
+            return None
+
+    def apply(self, spreadsheet_id: str, sheet_name: str, record_id: str, change) -> bool:
+        """
+        Применяет изменение строк листа (RowChange менеджера Google Sheets)
+        одной транзакцией:
+          - locate: запись найдена в строке row;
+          - insert: запись вставлена в строку row, строки ниже сдвинуты вниз;
+          - delete: строка row удалена, строки ниже сдвинуты вверх;
+          - sort: лист пересортирован, rows - {ID записи: строка}.
+        """
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            if change.kind == 'locate':
+                cursor.execute('''
+                    UPDATE records SET sheet_row = ?, layout_version = ?
+                    WHERE id = ? AND spreadsheet_id = ? AND sheet_name = ?
+                ''', (change.row, _layout_version(cursor, spreadsheet_id, sheet_name),
+                      record_id, spreadsheet_id, sheet_name))
+            elif change.kind in ('insert', 'delete'):
+                previous = _layout_version(cursor, spreadsheet_id, sheet_name)
+                version = _bump_layout(cursor, spreadsheet_id, sheet_name)
+                if change.kind == 'insert':
+                    shift = 'CASE WHEN sheet_row >= ? THEN sheet_row + 1 ELSE sheet_row END'
+                else:
+                    shift = 'CASE WHEN sheet_row > ? THEN sheet_row - 1 ELSE sheet_row END'
+                # Сдвигаются только позиции, верные для прежней раскладки
+                cursor.execute(f'''
+                    UPDATE records SET sheet_row = {shift}, layout_version = ?
+                    WHERE spreadsheet_id = ? AND sheet_name = ? AND sheet_row IS NOT NULL
+                        AND layout_version = ? AND id != ?
+                ''', (change.row, version, spreadsheet_id, sheet_name, previous, record_id))
+                cursor.execute('''
+                    UPDATE records SET sheet_row = ?, layout_version = ?
+                    WHERE id = ? AND spreadsheet_id = ? AND sheet_name = ?
+                ''', (change.row if change.kind == 'insert' else None, version,
+                      record_id, spreadsheet_id, sheet_name))
+            elif change.kind == 'sort':
+                version = _bump_layout(cursor, spreadsheet_id, sheet_name)
+                cursor.executemany('''
+                    UPDATE records SET sheet_row = ?, layout_version = ?
+                    WHERE id = ? AND spreadsheet_id = ? AND sheet_name = ?
+                ''', [(row, version, rid, spreadsheet_id, sheet_name) for rid, row in change.rows.items()])
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            logger.error(f"Error saving sheet rows of {sheet_name}: {e}")
+            return False
+
+    def invalidate(self, spreadsheet_id: str, sheet_name: str) -> bool:
+        """Раскладка листа изменилась без учета позиций: все позиции листа устаревают"""
+        try:
+            conn = self._connect()
+            _bump_layout(conn.cursor(), spreadsheet_id, sheet_name)
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            logger.error(f"Error invalidating sheet rows of {sheet_name}: {e}")
+            return False
+
+    def get_rows(self, spreadsheet_id: str, sheet_name: str) -> Dict[str, int]:
+        """{ID записи: строка} для текущей раскладки листа"""
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, sheet_row FROM records
+                WHERE spreadsheet_id = ? AND sheet_name = ? AND sheet_row IS NOT NULL
+                    AND layout_version = ?
+            ''', (spreadsheet_id, sheet_name, _layout_version(cursor, spreadsheet_id, sheet_name)))
+            result = dict(cursor.fetchall())
+            conn.close()
+            return result
+        except Exception as e:
+            logger.error(f"Error reading sheet rows of {sheet_name}: {e}")
+            return {}
@@ -0,0 +1,203 @@
+"""
+Outbox для задач синхронизации с Google Sheets
+
+Каждая задача SheetsTask сохраняется в таблицу sheets_outbox в той же
+транзакции, что и изменение в БД. Воркер берет задачу в аренду (lease),
+а после успешной записи в Google Sheets удаляет строку. Если процесс
+упал, незавершенные задачи поднимаются из outbox при следующем старте.
+"""
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from ..config.settings import DATABASE_PATH, logger
+
+STATUS_PENDING = 'pending'
+STATUS_FAILED = 'failed'
+
+# Идентификатор текущего процесса для аренды задач
+LEASE_OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Через сколько секунд повторить захват аренды, если БД недоступна (заблокирована)
+CLAIM_RETRY_SECONDS = 5.0
+
+
+def ensure_outbox_table(cursor: sqlite3.Cursor):
+    """Создает таблицу outbox (вызывается из init_db)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sheets_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_type TEXT NOT NULL,
+            spreadsheet_id TEXT NOT NULL,
+            sheet_name TEXT NOT NULL,
+            record_id TEXT NOT NULL,
+            data TEXT NOT NULL,
+            max_retries INTEGER NOT NULL DEFAULT 3,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            lease_owner TEXT,
+            lease_expires REAL,
+            last_error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_sheets_outbox_status ON sheets_outbox (status, id)'
+    )
+
+
+def persist_task(cursor: sqlite3.Cursor, task) -> int:
+    """
+    Сохраняет задачу в outbox внутри транзакции вызывающего кода
+
+    Args:
+        cursor: курсор открытой транзакции
+        task: SheetsTask (или любой объект с to_outbox_row())
+
+    Returns:
+        ID строки outbox (также записывается в task.outbox_id)
+    """
+    row = task.to_outbox_row()
+    cursor.execute('''
+        INSERT INTO sheets_outbox (
+            task_type, spreadsheet_id, sheet_name, record_id, data, max_retries
+        ) VALUES (?, ?, ?, ?, ?, ?)
+    ''', (
+        row['task_type'],
+        row['spreadsheet_id'],
+        row['sheet_name'],
+        row['record_id'],
+        json.dumps(row['data'], ensure_ascii=False, default=str),
+        row['max_retries']
+    ))
+    task.outbox_id = cursor.lastrowid
+    return task.outbox_id
+
+
+class SheetsOutbox:
+    """Доступ воркера к таблице outbox"""
+
+    def __init__(self, db_path: str = DATABASE_PATH, lease_seconds: float = 300):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.owner = LEASE_OWNER
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def claim(self, outbox_id: int) -> Optional[float]:
+        """
+        Берет задачу в аренду
+
+        Returns:
+            None если задача взята (или уже удалена из outbox),
+            иначе через сколько секунд повторить попытку: остаток чужой
+            аренды или CLAIM_RETRY_SECONDS, если аренду не удалось проверить
+        """
+        now = time.time()
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE sheets_outbox
+                SET lease_owner = ?, lease_expires = ?, attempts = attempts + 1
+                WHERE id = ? AND status = ?
+                  AND (lease_owner IS NULL OR lease_owner = ? OR lease_expires < ?)
+            ''', (self.owner, now + self.lease_seconds, outbox_id, STATUS_PENDING, self.owner, now))
+            claimed = cursor.rowcount > 0
+
+            remaining = None
+            if not claimed:
+                cursor.execute('SELECT lease_expires FROM sheets_outbox WHERE id = ? AND status = ?',
+                               (outbox_id, STATUS_PENDING))
+                row = cursor.fetchone()
+                if row and row[0]:
+                    remaining = max(0.0, row[0] - now)
+
+            conn.commit()
+            conn.close()
+            return remaining
+
+        except Exception as e:
+            # Без аренды задачу выполнять нельзя: ее может выполнять другой процесс
+            logger.error(f"Error claiming outbox task #{outbox_id}: {e}")
+            return CLAIM_RETRY_SECONDS
+
+    def release(self, outbox_ids: List[int], error: str = None):
+        """Снимает аренды этого процесса (задачи поднимет следующий запуск без ожидания)"""
+        ids = [i for i in outbox_ids if i]
+        if ids:
+            self._execute(
+                f"UPDATE sheets_outbox SET lease_owner = NULL, lease_expires = NULL, last_error = COALESCE(?, last_error) "
+                f"WHERE lease_owner = ? AND id IN ({','.join('?' * len(ids))})",
+                [error, self.owner] + ids
+            )
+
+    def complete(self, outbox_ids: List[int]):
+        """Удаляет выполненные задачи из outbox"""
+        ids = [i for i in outbox_ids if i]
+        if ids:
+            self._execute(
+                f"DELETE FROM sheets_outbox WHERE id IN ({','.join('?' * len(ids))})", ids
+            )
+
+    def fail(self, outbox_ids: List[int], error: str = None):
+        """Помечает задачи как окончательно неудачные (не будут подняты при старте)"""
+        ids = [i for i in outbox_ids if i]
+        if ids:
+            self._execute(
+                f"UPDATE sheets_outbox SET status = ?, lease_owner = NULL, lease_expires = NULL, "
+                f"last_error = ? WHERE id IN ({','.join('?' * len(ids))})",
+                [STATUS_FAILED, error] + ids
+            )
+
+    def load_pending(self) -> List[Dict]:
+        """Возвращает незавершенные задачи в порядке их создания"""
+        try:
+            conn = self._connect()
+            conn.row_factory = sqlite3.Row
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, task_type, spreadsheet_id, sheet_name, record_id, data, max_retries, attempts,
+                       CAST(strftime('%s', created_at) AS INTEGER) AS created_ts
+                FROM sheets_outbox
+                WHERE status = ?
+                ORDER BY id
+            ''', (STATUS_PENDING,))
+            rows = []
+            for row in cursor.fetchall():
+                row = dict(row)
+                row['data'] = json.loads(row['data'])
+                rows.append(row)
+            conn.close()
+            return rows
+
+        except Exception as e:
+            logger.error(f"Error loading pending outbox tasks: {e}")
+            return []
+
+    def count_pending(self) -> int:
+        """Количество незавершенных задач"""
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute('SELECT COUNT(*) FROM sheets_outbox WHERE status = ?', (STATUS_PENDING,))
+            count = cursor.fetchone()[0]
+            conn.close()
+            return count
+        except Exception as e:
+            logger.error(f"Error counting outbox tasks: {e}")
+            return 0
+
+    def _execute(self, query: str, params):
+        try:
+            conn = self._connect()
+            conn.execute(query, params)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Error updating sheets outbox: {e}")
@@ -0,0 +1,171 @@
+"""
+Состояние полной синхронизации с Google Sheets
+
+Для каждой таблицы хранится Drive modifiedTime на момент последней
+успешной обработки (отдельно для каждой операции: full_sync,
+инициализация заголовков), для каждого листа - хеш содержимого,
+с которым он последний раз синхронизировался. Неизменившиеся таблицы
+пропускаются по одному списку файлов Drive, листы - по хешу.
+
+Для сверки полей хранится снимок каждой записи листа на момент последней
+сверки (значения полей и номер строки) - общий предок для трехсторонней
+сверки БД и листа.
+"""
+import json
+import sqlite3
+from typing import Dict, Optional
+
+from ..config.settings import DATABASE_PATH, logger
+
+
+def ensure_sync_state_tables(cursor: sqlite3.Cursor):
+    """Создает таблицы состояния синхронизации (вызывается из init_db)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sheets_sync_state (
+            scope TEXT NOT NULL,
+            spreadsheet_id TEXT NOT NULL,
+            modified_time TEXT NOT NULL,
+            synced_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (scope, spreadsheet_id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sheets_sync_hashes (
+            spreadsheet_id TEXT NOT NULL,
+            sheet_name TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            synced_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (spreadsheet_id, sheet_name)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sheets_sync_snapshots (
+            spreadsheet_id TEXT NOT NULL,
+            sheet_name TEXT NOT NULL,
+            record_id TEXT NOT NULL,
+            row_number INTEGER,
+            fields TEXT NOT NULL,
+            synced_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (spreadsheet_id, sheet_name, record_id)
+        )
+    ''')
+
+
+class SheetsSyncState:
+    """Доступ к состоянию синхронизации таблиц и листов"""
+
+    def __init__(self, db_path: str = DATABASE_PATH):
+        self.db_path = db_path
+        self._ensured = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        if not self._ensured:
+            # Таблицы могут отсутствовать, если init_db еще не вызывался (скрипты, бенчмарки)
+            ensure_sync_state_tables(conn.cursor())
+            conn.commit()
+            self._ensured = True
+        return conn
+
+    def get_modified_times(self, scope: str) -> Dict[str, str]:
+        """{spreadsheet_id: modifiedTime} последней успешной обработки"""
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute('SELECT spreadsheet_id, modified_time FROM sheets_sync_state WHERE scope = ?',
+                           (scope,))
+            result = dict(cursor.fetchall())
+            conn.close()
+            return result
+        except Exception as e:
+            logger.error(f"Error loading sheets sync state: {e}")
+            return {}
+
+    def set_modified_time(self, scope: str, spreadsheet_id: str, modified_time: Optional[str]):
+        if not modified_time:
+            return
+        self._execute('''
+            INSERT INTO sheets_sync_state (scope, spreadsheet_id, modified_time, synced_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (scope, spreadsheet_id)
+            DO UPDATE SET modified_time = excluded.modified_time, synced_at = CURRENT_TIMESTAMP
+        ''', (scope, spreadsheet_id, modified_time))
+
+    def get_sheet_hashes(self, spreadsheet_id: str) -> Dict[str, str]:
+        """{sheet_name: content_hash} листов таблицы"""
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute('SELECT sheet_name, content_hash FROM sheets_sync_hashes WHERE spreadsheet_id = ?',
+                           (spreadsheet_id,))
+            result = dict(cursor.fetchall())
+            conn.close()
+            return result
+        except Exception as e:
+            logger.error(f"Error loading sheet hashes: {e}")
+            return {}
+
+    def set_sheet_hash(self, spreadsheet_id: str, sheet_name: str, value: str):
+        self._execute('''
+            INSERT INTO sheets_sync_hashes (spreadsheet_id, sheet_name, content_hash, synced_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (spreadsheet_id, sheet_name)
+            DO UPDATE SET content_hash = excluded.content_hash, synced_at = CURRENT_TIMESTAMP
+        ''', (spreadsheet_id, sheet_name, value))
+
+    def get_snapshots(self, spreadsheet_id: str) -> Dict[str, Dict[str, Dict]]:
+        """{sheet_name: {record_id: {'row': номер строки, 'fields': {поле: значение}}}} таблицы"""
+        try:
+            conn = self._connect()
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT sheet_name, record_id, row_number, fields
+                FROM sheets_sync_snapshots WHERE spreadsheet_id = ?
+            ''', (spreadsheet_id,))
+            result: Dict[str, Dict[str, Dict]] = {}
+            for sheet_name, record_id, row_number, fields in cursor.fetchall():
+                result.setdefault(sheet_name, {})[record_id] = {'row': row_number, 'fields': json.loads(fields)}
+            conn.close()
+            return result
+        except Exception as e:
+            logger.error(f"Error loading sheet snapshots: {e}")
+            return {}
+
+    def set_snapshots(self, spreadsheet_id: str, sheet_name: str, snapshots: Dict[str, Dict]) -> bool:
+        """Заменяет снимок листа ({record_id: {'row': ..., 'fields': {...}}}) одной транзакцией"""
+        try:
+            conn = self._connect()
+            conn.execute('DELETE FROM sheets_sync_snapshots WHERE spreadsheet_id = ? AND sheet_name = ?',
+                         (spreadsheet_id, sheet_name))
+            conn.executemany('''
+                INSERT INTO sheets_sync_snapshots (spreadsheet_id, sheet_name, record_id, row_number, fields)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [
+                (spreadsheet_id, sheet_name, record_id, snapshot.get('row'),
+                 json.dumps(snapshot['fields'], ensure_ascii=False))
+                for record_id, snapshot in snapshots.items()
+            ])
+            conn.commit()
+            conn.close()
+            return True
+        except Exception as e:
+            logger.error(f"Error saving sheet snapshots: {e}")
+            return False
+
+    def clear(self, scope: Optional[str] = None):
+        """Сбрасывает состояние (следующая синхронизация обработает все таблицы)"""
+        if scope is None:
+            self._execute('DELETE FROM sheets_sync_state', ())
+            self._execute('DELETE FROM sheets_sync_hashes', ())
+            self._execute('DELETE FROM sheets_sync_snapshots', ())
+        else:
+            self._execute('DELETE FROM sheets_sync_state WHERE scope = ?', (scope,))
+
+    def _execute(self, query: str, params):
+        try:
+            conn = self._connect()
+            conn.execute(query, params)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Error updating sheets sync state: {e}")
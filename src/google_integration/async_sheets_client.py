@@ -0,0 +1,418 @@
+"""
+Асинхронный клиент Google Sheets / Drive API на httpx
+
+Используется воркером в режиме SHEETS_WORKER_MODE=asyncio: все запросы
+выполняются в цикле событий бота через один httpx.AsyncClient с keep-alive
+(HTTP/2 - только при GOOGLE_HTTP2=true и установленном пакете h2), без пула
+потоков gspread. Каждый запрос учитывается в ограничителе квот и в метриках
+так же, как запросы RateLimitedClient.
+
+AsyncSheetsManager использует общий с GoogleSheetsManager кеш заголовков и
+известные строки записей (проверяются чтением одной ячейки ID) и сообщает
+сдвиги строк через last_row_changes(). Задачи платежей воркер по-прежнему
+выполняет через PaymentsSheetsManager (gspread) в пуле потоков.
+"""
+import asyncio
+import importlib.util
+import json
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+import httpx
+from google.auth.transport.requests import Request
+
+from ..config.settings import GOOGLE_HTTP2, logger
+from .client_pool import GoogleClientPool, client_pool as default_client_pool
+from .header_cache import HeaderLayout, HeaderLayoutCache, header_cache, is_layout_error
+from .rate_limiter import rate_limiter, READ, WRITE
+from .sheets_manager import (
+    RECORD_HEADERS, RECORD_FIELD_MAPPING, DRIVE_FILES_URL, RowChange, build_record_row, find_insert_row,
+    format_sheet_value, is_sorted_by_date, sorted_record_rows, record_api_call
+)
+from .sheets_metrics import metrics
+from ..config.settings import DRIVE_PAGE_SIZE
+
+SHEETS_API_URL = 'https://sheets.googleapis.com/v4/spreadsheets'
+
+# Изменения строк последней операции с записью (своя копия у каждой asyncio-задачи воркера)
+_row_changes: ContextVar[Optional[List[RowChange]]] = ContextVar('async_sheets_row_changes', default=None)
+
+
+class AsyncSheetsApiError(Exception):
+    """Ошибка HTTP от Google API (совместима с classify_error через .response)"""
+
+    def __init__(self, response: httpx.Response):
+        self.response = response
+        super().__init__(f"Google API error {response.status_code}: {response.text[:200]}")
+
+
+def a1_range(sheet_name: str, cells: str = '') -> str:
+    """Диапазон в нотации A1 с экранированным названием листа"""
+    title = "'" + sheet_name.replace("'", "''") + "'"
+    return f"{title}!{cells}" if cells else title
+
+
+def _numericise(value):
+    """Как gspread.get_all_records: числовые строки превращаются в числа"""
+    if isinstance(value, str) and value:
+        try:
+            return int(value)
+        except ValueError:
+            try:
+                return float(value)
+            except ValueError:
+                return value
+    return value
+
+
+def rows_to_records(rows: List[List]) -> List[Dict]:
+    """Строки листа (первая - заголовки) в словари, как get_all_records"""
+    if not rows:
+        return []
+    headers = rows[0]
+    return [
+        dict(zip(headers, [_numericise(v) for v in row] + [''] * (len(headers) - len(row))))
+        for row in rows[1:]
+    ]
+
+
+class AsyncSheetsClient:
+    """Транспорт: авторизация сервисного аккаунта, лимиты, метрики"""
+
+    def __init__(self, client_pool: Optional[GoogleClientPool] = None, http2: bool = GOOGLE_HTTP2,
+                 max_connections: int = 20, timeout: float = 30.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None, credentials=None):
+        self.client_pool = client_pool or default_client_pool
+        # HTTP/2 требует пакет h2 (pip install httpx[http2]), без него работаем по HTTP/1.1 с keep-alive
+        self.http2 = http2 and importlib.util.find_spec('h2') is not None
+        if http2 and not self.http2:
+            logger.warning("GOOGLE_HTTP2 is enabled but the h2 package is not installed, using HTTP/1.1")
+        self.max_connections = max_connections
+        self.timeout = timeout
+        if transport is None and self.client_pool.backend is not None:
+            from .fake_backend import FakeAsyncTransport
+            transport = FakeAsyncTransport(self.client_pool.backend)
+        self._transport = transport
+        self._credentials = credentials
+        self._http: Optional[httpx.AsyncClient] = None
+        self._token_lock: Optional[asyncio.Lock] = None
+        self._sheet_ids: Dict[Tuple[str, str], int] = {}
+
+    def _get_http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                http2=self.http2,
+                timeout=self.timeout,
+                transport=self._transport,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            )
+            logger.info(f"Async Google API client created (HTTP/{'2' if self.http2 else '1.1'})")
+        return self._http
+
+    async def _get_token(self) -> str:
+        """Возвращает действующий access token (обновление - в пуле потоков)"""
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        async with self._token_lock:
+            if self._credentials is None:
+                # Токен общий с потоковыми клиентами gspread
+                self._credentials = self.client_pool.credentials
+            if not self._credentials.valid:
+                await asyncio.to_thread(self._credentials.refresh, Request())
+            return self._credentials.token
+
+    async def request(self, method: str, url: str, params: Dict = None,
+                      body: Dict = None) -> Dict[str, Any]:
+        """Выполняет запрос к Google API; ошибки HTTP выбрасываются как AsyncSheetsApiError"""
+        kind = READ if method.upper() == 'GET' else WRITE
+        rate_limiter.acquire(kind)
+        content = json.dumps(body, ensure_ascii=False, default=str).encode('utf-8') if body is not None else None
+        sent = len(content) if content else 0
+        started = time.monotonic()
+        try:
+            headers = {'Authorization': f"Bearer {await self._get_token()}"}
+            if content is not None:
+                headers['Content-Type'] = 'application/json'
+            response = await self._get_http().request(method, url, params=params,
+                                                      content=content, headers=headers)
+            if response.status_code >= 400:
+                raise AsyncSheetsApiError(response)
+        except Exception as e:
+            info = rate_limiter.report_error(e, kind)
+            record_api_call(method, url, started, info.status or info.kind.value, sent)
+            raise
+        rate_limiter.report_success(kind)
+        record_api_call(method, url, started, 'ok', sent, len(response.content))
+        return response.json() if response.content else {}
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    # --- Sheets API ---
+
+    async def get_values(self, spreadsheet_id: str, range_name: str, **params) -> List[List]:
+        data = await self.request('GET', f"{SHEETS_API_URL}/{spreadsheet_id}/values/{quote(range_name, safe='')}",
+                                  params=params or None)
+        return data.get('values', [])
+
+    async def update_values(self, spreadsheet_id: str, range_name: str, values: List[List],
+                            value_input_option: str = 'USER_ENTERED') -> Dict:
+        return await self.request(
+            'PUT', f"{SHEETS_API_URL}/{spreadsheet_id}/values/{quote(range_name, safe='')}",
+            params={'valueInputOption': value_input_option},
+            body={'range': range_name, 'majorDimension': 'ROWS', 'values': values}
+        )
+
+    async def append_values(self, spreadsheet_id: str, range_name: str, values: List[List],
+                            value_input_option: str = 'RAW') -> Dict:
+        return await self.request(
+            'POST', f"{SHEETS_API_URL}/{spreadsheet_id}/values/{quote(range_name, safe='')}:append",
+            params={'valueInputOption': value_input_option},
+            body={'majorDimension': 'ROWS', 'values': values}
+        )
+
+    async def batch_update_values(self, spreadsheet_id: str, data: List[Dict],
+                                  value_input_option: str = 'USER_ENTERED') -> Dict:
+        return await self.request(
+            'POST', f"{SHEETS_API_URL}/{spreadsheet_id}/values:batchUpdate",
+            body={'valueInputOption': value_input_option, 'data': data}
+        )
+
+    async def batch_update(self, spreadsheet_id: str, requests: List[Dict]) -> Dict:
+        return await self.request('POST', f"{SHEETS_API_URL}/{spreadsheet_id}:batchUpdate",
+                                  body={'requests': requests})
+
+    async def get_sheet_id(self, spreadsheet_id: str, sheet_name: str) -> Optional[int]:
+        """sheetId листа по названию (кешируется до ошибки раскладки, см. invalidate_sheet_ids)"""
+        key = (spreadsheet_id, sheet_name)
+        if key not in self._sheet_ids:
+            data = await self.request('GET', f"{SHEETS_API_URL}/{spreadsheet_id}",
+                                      params={'fields': 'sheets.properties(sheetId,title)'})
+            for sheet in data.get('sheets', []):
+                properties = sheet.get('properties', {})
+                self._sheet_ids[(spreadsheet_id, properties.get('title'))] = properties.get('sheetId')
+        return self._sheet_ids.get(key)
+
+    def invalidate_sheet_ids(self, spreadsheet_id: str):
+        """Сбрасывает sheetId листов таблицы (лист удален, пересоздан или переименован)"""
+        for key in [key for key in self._sheet_ids if key[0] == spreadsheet_id]:
+            del self._sheet_ids[key]
+
+    # --- Drive API ---
+
+    async def list_spreadsheets(self) -> List[Dict]:
+        """Все таблицы, доступные сервисному аккаунту (постранично)"""
+        files, page_token = [], None
+        while True:
+            params = {
+                'q': "mimeType='application/vnd.google-apps.spreadsheet'",
+                'fields': 'nextPageToken, files(id, name, modifiedTime, size)',
+                'pageSize': DRIVE_PAGE_SIZE,
+            }
+            if page_token:
+                params['pageToken'] = page_token
+            data = await self.request('GET', DRIVE_FILES_URL, params=params)
+            files.extend(data.get('files', []))
+            page_token = data.get('nextPageToken')
+            if not page_token:
+                return files
+
+
+class AsyncSheetsManager:
+    """
+    Операции с записями на листах поверх AsyncSheetsClient.
+
+    Повторяет логику GoogleSheetsManager (вставка с сортировкой по дате,
+    пакетное обновление полей, удаление строки, кеш заголовков и известные
+    строки записей), но ошибки API не перехватывает: их классифицирует воркер.
+    """
+
+    def __init__(self, client: AsyncSheetsClient, layouts: HeaderLayoutCache = header_cache):
+        self.client = client
+        self.header_cache = layouts
+
+    def last_row_changes(self) -> List[RowChange]:
+        """Изменения строк последней операции с записью в текущей asyncio-задаче"""
+        return list(_row_changes.get() or [])
+
+    def _reset_row_changes(self):
+        _row_changes.set([])
+
+    def _row_changed(self, kind: str, row: Optional[int] = None, rows: Optional[Dict[str, int]] = None):
+        changes = _row_changes.get()
+        if changes is None:
+            changes = []
+            _row_changes.set(changes)
+        changes.append(RowChange(kind, row, rows))
+
+    def _layout_failed(self, spreadsheet_id: str, sheet_name: str, error: BaseException):
+        """Ошибка раскладки: кешированные заголовки и sheetId листа могли устареть"""
+        if is_layout_error(error):
+            self.header_cache.invalidate(spreadsheet_id, sheet_name)
+            self.client.invalidate_sheet_ids(spreadsheet_id)
+
+    async def _get_records(self, spreadsheet_id: str, sheet_name: str) -> Tuple[List, List[Dict]]:
+        rows = await self.client.get_values(spreadsheet_id, a1_range(sheet_name))
+        return (rows[0] if rows else []), rows_to_records(rows)
+
+    async def _header_layout(self, spreadsheet_id: str, sheet_name: str, refresh: bool = False) -> HeaderLayout:
+        """Раскладка заголовков листа (из кеша или по первой строке)"""
+        layout = None if refresh else self.header_cache.get(spreadsheet_id, sheet_name)
+        if layout is None:
+            rows = await self.client.get_values(spreadsheet_id, a1_range(sheet_name, '1:1'))
+            layout = self.header_cache.observe(spreadsheet_id, sheet_name, rows[0] if rows else [])
+        return layout
+
+    async def _locate_record(self, spreadsheet_id: str, sheet_name: str, record_id: str,
+                             sheet_row: Optional[int] = None) -> Optional[int]:
+        """
+        Строка записи в листе: известная позиция проверяется чтением одной
+        ячейки ID, при несовпадении запись ищется по колонке ID
+        """
+        if sheet_row and sheet_row >= 2:
+            rows = await self.client.get_values(spreadsheet_id, a1_range(sheet_name, f"A{sheet_row}"))
+            if rows and rows[0] and str(rows[0][0]).strip() == record_id:
+                metrics.inc('sheets_row_hint_total', result='hit')
+                return sheet_row
+            metrics.inc('sheets_row_hint_total', result='stale')
+            logger.info(f"Stored row {sheet_row} of record {record_id} is stale, searching ID column")
+        else:
+            metrics.inc('sheets_row_hint_total', result='none')
+
+        ids = await self.client.get_values(spreadsheet_id, a1_range(sheet_name, 'A:A'))
+        for i, row in enumerate(ids[1:], start=2):
+            if row and str(row[0]).strip() == record_id:
+                return i
+        logger.debug(f"Record {record_id} not found among {max(len(ids) - 1, 0)} IDs")
+        return None
+
+    async def add_record(self, spreadsheet_id: str, sheet_name: str, record: Dict) -> bool:
+        self._reset_row_changes()
+        try:
+            sheet_id = await self.client.get_sheet_id(spreadsheet_id, sheet_name)
+            if sheet_id is None:
+                logger.error(f"Sheet {sheet_name} not found")
+                return False
+
+            # Позиция вставки требует всех строк - заголовки проверяются по ним же
+            rows = await self.client.get_values(spreadsheet_id, a1_range(sheet_name))
+            if not rows or rows[0] != RECORD_HEADERS:
+                logger.info("Updating headers on the sheet")
+                await self.client.update_values(spreadsheet_id, a1_range(sheet_name, 'A1:F1'), [RECORD_HEADERS])
+                rows = [RECORD_HEADERS] + rows[1:]
+            self.header_cache.store(spreadsheet_id, sheet_name, RECORD_HEADERS)
+
+            new_row = build_record_row(record)
+            insert_row = find_insert_row(rows_to_records(rows), new_row[1])
+
+            # Как worksheet.insert_row: вставляем пустую строку и записываем в нее значения
+            await self.client.batch_update(spreadsheet_id, [{
+                'insertDimension': {
+                    'range': {'sheetId': sheet_id, 'dimension': 'ROWS',
+                              'startIndex': insert_row - 1, 'endIndex': insert_row},
+                    'inheritFromBefore': False,
+                }
+            }])
+            await self.client.append_values(spreadsheet_id, a1_range(sheet_name, f"A{insert_row}"), [new_row])
+        except Exception as e:
+            self._layout_failed(spreadsheet_id, sheet_name, e)
+            raise
+        self._row_changed('insert', insert_row)
+        logger.info(f"Record {record.get('id')} inserted at position {insert_row} with date sorting")
+        return True
+
+    async def update_record_fields(self, spreadsheet_id: str, sheet_name: str,
+                                   record_id: str, fields: Dict, sheet_row: Optional[int] = None) -> bool:
+        """sheet_row - последняя известная строка записи (проверяется перед записью)"""
+        self._reset_row_changes()
+        try:
+            record_row = await self._locate_record(spreadsheet_id, sheet_name, record_id, sheet_row)
+            if record_row is None:
+                logger.error(f"Record {record_id} not found for update")
+                return False
+            self._row_changed('locate', record_row)
+
+            data = self._field_updates(sheet_name, await self._header_layout(spreadsheet_id, sheet_name),
+                                       record_row, fields)
+            if data is None:
+                # Кешированная раскладка могла устареть - перечитываем заголовки
+                layout = await self._header_layout(spreadsheet_id, sheet_name, refresh=True)
+                data = self._field_updates(sheet_name, layout, record_row, fields, log_missing=True)
+                if data is None:
+                    return False
+
+            await self.client.batch_update_values(spreadsheet_id, data)
+            logger.info(f"Record {record_id} updated: fields {list(fields.keys())}")
+
+            if 'date' in fields:
+                _, updated_records = await self._get_records(spreadsheet_id, sheet_name)
+                if not is_sorted_by_date(updated_records):
+                    logger.info(f"Performing sheet resorting after date update for record {record_id}")
+                    sorted_rows = sorted_record_rows(updated_records)
+                    await self.client.update_values(
+                        spreadsheet_id, a1_range(sheet_name, f"A2:F{len(sorted_rows) + 1}"), sorted_rows
+                    )
+                    self._row_changed('sort', rows={
+                        str(row[0]).strip(): i for i, row in enumerate(sorted_rows, start=2)
+                    })
+        except Exception as e:
+            self._layout_failed(spreadsheet_id, sheet_name, e)
+            raise
+        return True
+
+    @staticmethod
+    def _field_updates(sheet_name: str, layout: HeaderLayout, record_row: int, fields: Dict,
+                       log_missing: bool = False) -> Optional[List[Dict]]:
+        """Диапазоны ячеек для обновления полей записи (None - колонка не найдена)"""
+        data = []
+        for field, new_value in fields.items():
+            sheet_field = RECORD_FIELD_MAPPING.get(field, field)
+            column = layout.column(sheet_field)
+            if column is None:
+                if log_missing:
+                    logger.error(f"Field {sheet_field} not found in headers: {layout.headers}")
+                return None
+            data.append({
+                'range': a1_range(sheet_name, f"{_column_letter(column)}{record_row}"),
+                'values': [[format_sheet_value(field, new_value)]],
+            })
+        return data
+
+    async def delete_record(self, spreadsheet_id: str, sheet_name: str, record_id: str,
+                            sheet_row: Optional[int] = None) -> bool:
+        """sheet_row - последняя известная строка записи (проверяется перед удалением)"""
+        self._reset_row_changes()
+        try:
+            record_row = await self._locate_record(spreadsheet_id, sheet_name, record_id, sheet_row)
+            if record_row is None:
+                return False
+            sheet_id = await self.client.get_sheet_id(spreadsheet_id, sheet_name)
+            if sheet_id is None:
+                logger.error(f"Sheet {sheet_name} not found")
+                return False
+            await self.client.batch_update(spreadsheet_id, [{
+                'deleteDimension': {
+                    'range': {'sheetId': sheet_id, 'dimension': 'ROWS',
+                              'startIndex': record_row - 1, 'endIndex': record_row}
+                }
+            }])
+        except Exception as e:
+            self._layout_failed(spreadsheet_id, sheet_name, e)
+            raise
+        self._row_changed('delete', record_row)
+        logger.info(f"Record {record_id} deleted from Google Sheets")
+        return True
+
+
+def _column_letter(column: int) -> str:
+    """Номер колонки (с 1) в буквенное обозначение A1"""
+    letters = ''
+    while column:
+        column, remainder = divmod(column - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
@@ -1,16 +1,42 @@
 """
 Асинхронный воркер для работы с Google Sheets
+
+Задачи шардируются по листу: все задачи одного (spreadsheet_id, sheet_name)
+попадают в одну полосу (lane) и выполняются строго по очереди (FIFO),
+а разные листы обрабатываются параллельно.
+
+Задачи, сохраненные в outbox вместе с изменением в БД, удаляются из него
+только после успешной записи в Google Sheets и поднимаются при старте.
+
+Ожидающие задачи одной записи схлопываются при постановке в очередь:
+несколько UPDATE сливаются в одну запись нескольких полей, ADD + UPDATE
+превращается в ADD с итоговыми значениями, ADD + DELETE - в пустую операцию.
+
+По умолчанию задачи выполняют потоки (gspread). В режиме
+SHEETS_WORKER_MODE=asyncio те же полосы обслуживают asyncio-задачи в цикле
+событий бота через httpx-клиент (AsyncioSheetsWorker).
+
+Последние известные строки записей хранятся в БД (SheetRowIndex): потоковый
+воркер передает их менеджеру при обновлении и удалении и сохраняет сдвиги
+строк после каждой вставки, удаления и сортировки.
 """
 import asyncio
 
-from queue import Queue
-from threading import Thread, current_thread
-from typing import Dict, Any, Optional
-from dataclasses import dataclass
+from collections import OrderedDict, deque
+from threading import Condition, Thread, current_thread
+from typing import Deque, Dict, Any, List, Optional, Tuple
+from dataclasses import dataclass, field
 from enum import Enum
+import heapq
+import itertools
 import time
+import zlib
 
-from .sheets_manager import sheets_manager
+from .sheets_manager import RowChange, sheets_manager
+from .rate_limiter import rate_limiter, classify_error, ApiErrorInfo, ErrorKind, Reservation
+from .sheets_metrics import MetricsRegistry, metrics
+from ..database.sheets_outbox import SheetsOutbox
+from ..database.sheet_rows import SheetRowIndex
 from ..config.settings import logger
 
 
@@ -34,16 +60,159 @@ class SheetsTask:
     callback: Optional[callable] = None
     retry_count: int = 0
     max_retries: int = 3
+    throttle_count: int = 0  # Повторы из-за квот (не расходуют max_retries)
+    outbox_id: Optional[int] = None  # Строка в sheets_outbox, если задача сохранена в БД
+    merged: List['SheetsTask'] = field(default_factory=list)  # Поглощенные задачи (для callback/outbox)
+    enqueued_at: float = field(default_factory=time.time)  # Время создания (для задержки и отставания)
+
+    def all_tasks(self) -> List['SheetsTask']:
+        """Сама задача и все поглощенные ею задачи"""
+        return [self] + self.merged
+
+    @property
+    def lane_key(self) -> Tuple[str, str]:
+        """Ключ полосы: задачи платежей без листа шардируются по роли"""
+        return self.spreadsheet_id, self.sheet_name or self.data.get('role', '')
+
+    def to_outbox_row(self) -> Dict[str, Any]:
+        """Сериализует задачу для таблицы sheets_outbox"""
+        return {
+            'task_type': self.task_type.value,
+            'spreadsheet_id': self.spreadsheet_id,
+            'sheet_name': self.sheet_name,
+            'record_id': self.record_id,
+            'data': self.data,
+            'max_retries': self.max_retries,
+        }
+
+    @classmethod
+    def from_outbox_row(cls, row: Dict[str, Any]) -> 'SheetsTask':
+        """
+        Восстанавливает задачу из строки outbox (без callback).
+        Каждая аренда - начатое выполнение, поэтому незавершенные аренды
+        прошлых запусков засчитываются в повторы.
+        """
+        return cls(
+            task_type=TaskType(row['task_type']),
+            spreadsheet_id=row['spreadsheet_id'],
+            sheet_name=row['sheet_name'],
+            record_id=row['record_id'],
+            data=row['data'],
+            retry_count=row.get('attempts') or 0,
+            max_retries=row['max_retries'],
+            outbox_id=row['id'],
+            enqueued_at=float(row.get('created_ts') or time.time()),
+        )
+
+
+RECORD_TASKS = (TaskType.ADD_RECORD, TaskType.UPDATE_RECORD, TaskType.DELETE_RECORD)
+PAYMENT_TASKS = (TaskType.ADD_PAYMENT, TaskType.UPDATE_PAYMENT, TaskType.DELETE_PAYMENT)
+
+
+def _record_update_fields(task: SheetsTask) -> Dict[str, Any]:
+    """Поля UPDATE_RECORD в виде словаря (одно поле или уже слитые)"""
+    if 'fields' in task.data:
+        return dict(task.data['fields'])
+    return {task.data['field']: task.data['value']}
+
+
+def collapse_tasks(prev: SheetsTask, new: SheetsTask) -> Optional[str]:
+    """
+    Пытается слить новую задачу с ожидающей задачей той же записи.
+
+    Returns:
+        'merged' - новая задача поглощена prev (prev изменена),
+        'noop' - обе задачи взаимно уничтожаются (ADD + DELETE),
+        'replace' - prev поглощена new (UPDATE + DELETE),
+        None - задачи нельзя слить
+    """
+    pair = (prev.task_type, new.task_type)
+
+    if pair in ((TaskType.ADD_RECORD, TaskType.DELETE_RECORD),
+                (TaskType.ADD_PAYMENT, TaskType.DELETE_PAYMENT)):
+        return 'noop'
+
+    if pair in ((TaskType.UPDATE_RECORD, TaskType.DELETE_RECORD),
+                (TaskType.UPDATE_PAYMENT, TaskType.DELETE_PAYMENT)):
+        return 'replace'
+
+    if pair == (TaskType.ADD_RECORD, TaskType.UPDATE_RECORD):
+        # Копируем запись, чтобы не менять словарь вызывающего кода
+        prev.data = {**prev.data, **_record_update_fields(new)}
+        return 'merged'
+
+    if pair == (TaskType.UPDATE_RECORD, TaskType.UPDATE_RECORD):
+        fields = _record_update_fields(prev)
+        fields.update(_record_update_fields(new))
+        prev.data = {'fields': fields}
+        return 'merged'
+
+    if pair == (TaskType.ADD_PAYMENT, TaskType.UPDATE_PAYMENT):
+        prev.data = {**prev.data, **new.data.get('updated_data', {})}
+        return 'merged'
+
+    if pair == (TaskType.UPDATE_PAYMENT, TaskType.UPDATE_PAYMENT):
+        prev.data = {
+            **prev.data,
+            'updated_data': {**prev.data.get('updated_data', {}), **new.data.get('updated_data', {})}
+        }
+        return 'merged'
+
+    return None
+
+
+# Примерная стоимость задачи в запросах к API (чтения, записи)
+TASK_COSTS: Dict[TaskType, Tuple[int, int]] = {
+    TaskType.ADD_RECORD: (4, 1),
+    TaskType.UPDATE_RECORD: (4, 1),
+    TaskType.DELETE_RECORD: (3, 1),
+    TaskType.ADD_PAYMENT: (3, 1),
+    TaskType.UPDATE_PAYMENT: (3, 1),
+    TaskType.DELETE_PAYMENT: (3, 1),
+}
+
+
+class _Lane:
+    """Очередь задач одного листа"""
+
+    __slots__ = ('key', 'owner', 'tasks', 'busy', 'parked', 'current')
+
+    def __init__(self, key: Tuple[str, str], owner: int):
+        self.key = key
+        self.owner = owner  # Индекс "домашнего" воркера
+        self.tasks: Deque[SheetsTask] = deque()
+        self.busy = False  # Задача полосы сейчас выполняется
+        self.parked = 0  # Задачи полосы, ожидающие в очереди отложенных
+        self.current: Optional[SheetsTask] = None  # Выполняемая задача
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.tasks) and not self.busy and not self.parked
+
+    @property
+    def depth(self) -> int:
+        return len(self.tasks) + (1 if self.busy else 0) + self.parked
 
 
 class AsyncSheetsWorker:
     """Асинхронный воркер для обработки операций с Google Sheets"""
     
-    def __init__(self, max_workers: int = 4):
-        self.task_queue = Queue()
+    def __init__(self, max_workers: int = 4, outbox: Optional[SheetsOutbox] = None,
+                 collapse: bool = True):
         self.max_workers = max_workers
+        self.collapse = collapse
         self.workers = []
         self.running = False
+        self.outbox = outbox or SheetsOutbox()
+        self.sheet_rows = SheetRowIndex(self.outbox.db_path)
+        self._outbox_replayed = False
+        self._outbox_tasks: Dict[int, SheetsTask] = {}  # Задачи outbox, уже находящиеся в памяти
+        self._lanes: "OrderedDict[Tuple[str, str], _Lane]" = OrderedDict()
+        self._cond = Condition()
+        # Отложенные задачи (повторы и ожидание квоты): куча (due, seq, task)
+        self._delayed: List[Tuple[float, int, SheetsTask]] = []
+        self._delayed_seq = itertools.count()
+        self._payments_manager = None
         
     def start(self):
         """Запускает воркеры"""
@@ -51,55 +220,276 @@ class AsyncSheetsWorker:
             return
             
         self.running = True
+        if not self._outbox_replayed:
+            self.replay_outbox()
         logger.info(f"Starting {self.max_workers} workers for Google Sheets")
         
         for i in range(self.max_workers):
-            worker = Thread(target=self._worker_loop, name=f"SheetsWorker-{i}", daemon=True)
+            worker = Thread(target=self._worker_loop, args=(i,), name=f"SheetsWorker-{i}", daemon=True)
             worker.start()
             self.workers.append(worker)
     
     def stop(self):
         """Останавливает воркеры"""
         self.running = False
+        with self._cond:
+            self._notify()
+            # Аренды невыполняющихся задач снимаем, иначе после перезапуска
+            # они ждали бы истечения аренды (владелец аренды - процесс)
+            executing = {t.outbox_id for lane in self._lanes.values() if lane.current is not None
+                         for t in lane.current.all_tasks()}
+            idle_ids = [outbox_id for outbox_id in self._outbox_tasks if outbox_id not in executing]
+        self.outbox.release(idle_ids)
         logger.info("Stopping Google Sheets workers")
     
     def add_task(self, task: SheetsTask):
-        """Добавляет задачу в очередь"""
-        # Check if the task queue is running, if not start it
-        # Check if the thread is running, if not start it
+        """Добавляет задачу в полосу её листа"""
         if not self.running:
             self.start()
-        # Add the task to the queue
-        # Add the task to the queue
-        # Log the task that was added
-        # Log the task that was added
-        
-        self.task_queue.put(task)
-        logger.debug(f"Task {task.task_type.value} added for {task.record_id}")
+        self._enqueue(task)
+
+    def replay_outbox(self) -> int:
+        """Поднимает незавершенные задачи из outbox в исходном порядке"""
+        self._outbox_replayed = True
+        rows = self.outbox.load_pending()
+        for row in rows:
+            try:
+                task = SheetsTask.from_outbox_row(row)
+                if task.retry_count > task.max_retries:
+                    # Задача прерывала процесс при каждой попытке - больше не повторяем
+                    logger.error(f"Outbox task #{task.outbox_id} {task.task_type.value} for {task.record_id} "
+                                 f"dropped after {task.retry_count} interrupted attempts")
+                    self.outbox.fail([task.outbox_id], "Maximum attempts exceeded before restart")
+                    continue
+                self._enqueue(task)
+            except Exception as e:
+                logger.error(f"Invalid outbox task #{row.get('id')}: {e}")
+        if rows:
+            logger.info(f"Replayed {len(rows)} pending Google Sheets tasks from outbox")
+        return len(rows)
+
+    def _enqueue(self, task: SheetsTask):
+        cancelled = None
+        with self._cond:
+            if task.outbox_id is not None:
+                known = self._outbox_tasks.get(task.outbox_id)
+                if known is not None:
+                    # Задача уже поднята из outbox - сохраняем только callback
+                    known.callback = known.callback or task.callback
+                    return
+                self._outbox_tasks[task.outbox_id] = task
+            lane = self._lanes.get(task.lane_key)
+            if lane is None:
+                lane = _Lane(task.lane_key, self._home_worker(task.lane_key))
+                self._lanes[task.lane_key] = lane
+            outcome = self._collapse_into_lane(lane, task) if self.collapse else None
+            metrics.inc('sheets_tasks_enqueued_total', task_type=task.task_type.value)
+            if outcome is not None:
+                metrics.inc('sheets_tasks_collapsed_total', task_type=task.task_type.value, outcome=outcome)
+            if outcome == 'noop':
+                cancelled = task
+            elif outcome != 'merged':
+                lane.tasks.append(task)
+            self._notify()
+
+        if cancelled is not None:
+            # ADD + DELETE еще не дошли до Google Sheets - записывать нечего
+            logger.info(f"Tasks for {task.record_id} cancelled each other out, nothing to write")
+            self._finish_task(cancelled, True)
+            return
+
+        logger.debug(f"Task {task.task_type.value} {outcome or 'added'} for {task.record_id} "
+                     f"(lane {self._format_lane_key(task.lane_key)}, depth {lane.depth})")
+
+    def _collapse_into_lane(self, lane: _Lane, task: SheetsTask) -> Optional[str]:
+        """
+        Сливает задачу с последней ожидающей задачей той же записи в полосе
+        (вызывается под self._cond). Выполняемые и отложенные задачи не трогаются.
+        """
+        family = RECORD_TASKS if task.task_type in RECORD_TASKS else PAYMENT_TASKS
+        for index in range(len(lane.tasks) - 1, -1, -1):
+            prev = lane.tasks[index]
+            if prev.record_id != task.record_id or prev.task_type not in family:
+                continue
+
+            outcome = collapse_tasks(prev, task)
+            if outcome == 'merged':
+                prev.merged.extend(task.all_tasks())
+            elif outcome == 'noop':
+                del lane.tasks[index]
+                task.merged.extend(prev.all_tasks())
+            elif outcome == 'replace':
+                del lane.tasks[index]
+                task.merged.extend(prev.all_tasks())
+                lane.tasks.append(task)
+                outcome = 'merged'  # Задача уже поставлена в полосу
+            return outcome
+        return None
+
+    def get_lane_depths(self) -> Dict[str, int]:
+        """Возвращает глубину очереди каждой полосы (включая выполняемую задачу)"""
+        with self._cond:
+            return {self._format_lane_key(key): lane.depth for key, lane in self._lanes.items()}
+
+    def get_queue_size(self) -> int:
+        """Возвращает общее количество необработанных задач"""
+        with self._cond:
+            return sum(lane.depth for lane in self._lanes.values())
+
+    def get_replication_lag(self) -> float:
+        """Возраст самой старой незаписанной в Google Sheets задачи (секунды)"""
+        with self._cond:
+            pending = [task for lane in self._lanes.values() for task in lane.tasks]
+            pending.extend(lane.current for lane in self._lanes.values() if lane.current is not None)
+            pending.extend(task for _, _, task in self._delayed)
+        oldest = min((t.enqueued_at for task in pending for t in task.all_tasks()), default=None)
+        return max(0.0, time.time() - oldest) if oldest is not None else 0.0
+
+    def register_metrics(self, registry: MetricsRegistry = metrics):
+        """Регистрирует показатели очереди в реестре метрик"""
+        registry.register_gauge('sheets_queue_size', self.get_queue_size)
+        registry.register_gauge('sheets_lane_depth', self.get_lane_depths)
+        registry.register_gauge('sheets_replication_lag_seconds', self.get_replication_lag)
+        registry.register_gauge('sheets_delayed_tasks', lambda: len(self._delayed))
+        registry.register_gauge('sheets_outbox_pending', self.outbox.count_pending)
+        registry.register_gauge('google_api_throttled_total', lambda: rate_limiter.throttled_count)
+
+    def _notify(self):
+        """Будит воркеры после изменения полос (вызывается под self._cond)"""
+        self._cond.notify_all()
+
+    def _home_worker(self, key: Tuple[str, str]) -> int:
+        """Стабильно закрепляет полосу за воркером"""
+        return zlib.crc32(self._format_lane_key(key).encode('utf-8')) % self.max_workers
+
+    @staticmethod
+    def _format_lane_key(key: Tuple[str, str]) -> str:
+        return f"{key[0]}/{key[1]}"
+
+    def _acquire_lane(self, worker_index: int) -> Optional[_Lane]:
+        """
+        Выбирает полосу для воркера (вызывается под self._cond).
+
+        Сначала берутся свои полосы, затем воркер "крадёт" самую длинную
+        готовую полосу другого воркера, чтобы не простаивать.
+        """
+        stolen = None
+        for lane in self._lanes.values():
+            if not lane.ready:
+                continue
+            if lane.owner == worker_index:
+                return lane
+            if stolen is None or len(lane.tasks) > len(stolen.tasks):
+                stolen = lane
+        return stolen
+
+    def _release_lane(self, lane: _Lane):
+        """Освобождает полосу после выполнения задачи (вызывается под self._cond)"""
+        lane.busy = False
+        lane.current = None
+        if lane.tasks:
+            # Отправляем полосу в конец, чтобы остальные листы не голодали
+            self._lanes.move_to_end(lane.key)
+        elif not lane.parked and self._lanes.get(lane.key) is lane:
+            del self._lanes[lane.key]
+        self._notify()
+
+    def _schedule(self, task: SheetsTask, delay: float):
+        """
+        Откладывает задачу, не усыпляя воркер.
+
+        Полоса задачи блокируется до срока, чтобы последующие задачи листа
+        не обогнали повтор.
+        """
+        with self._cond:
+            lane = self._lanes.get(task.lane_key)
+            if lane is None:
+                lane = _Lane(task.lane_key, self._home_worker(task.lane_key))
+                self._lanes[task.lane_key] = lane
+            lane.parked += 1
+            heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._delayed_seq), task))
+            self._notify()
+
+    def _promote_due_tasks(self) -> Optional[float]:
+        """
+        Возвращает наступившие отложенные задачи в начало их полос
+        (вызывается под self._cond). Возвращает время до следующего срока.
+        """
+        now = time.monotonic()
+        while self._delayed and self._delayed[0][0] <= now:
+            _, _, task = heapq.heappop(self._delayed)
+            lane = self._lanes.get(task.lane_key)
+            if lane is None:
+                lane = _Lane(task.lane_key, self._home_worker(task.lane_key))
+                self._lanes[task.lane_key] = lane
+            lane.parked -= 1
+            lane.tasks.appendleft(task)
+        if self._delayed:
+            return self._delayed[0][0] - now
+        return None
     
-    def _worker_loop(self):
+    def _worker_loop(self, worker_index: int = 0):
         """Основной цикл воркера"""
         worker_name = current_thread().name
         logger.info(f"Worker {worker_name} started")
         
         while self.running:
+            with self._cond:
+                next_due = self._promote_due_tasks()
+                lane = self._acquire_lane(worker_index)
+                if lane is None:
+                    self._cond.wait(timeout=min(1.0, next_due) if next_due is not None else 1.0)
+                    continue
+                task = lane.tasks.popleft()
+                lane.busy = True
+                lane.current = task
+
             try:
-                # Получаем задачу с таймаутом
-                task = self.task_queue.get(timeout=1.0)
+                reservation = self._admit_task(task)
+                if reservation is None:
+                    continue
+
                 logger.debug(f"Worker {worker_name} received task {task.task_type.value}")
-                self._process_task(task)
-                self.task_queue.task_done()
+                rate_limiter.clear_last_error()
+                # Вызовы API в этом потоке учитываются по типу задачи
+                metrics.set_context(task_type=task.task_type.value)
+                metrics.inc('sheets_task_executions_total', task_type=task.task_type.value)
+                with rate_limiter.reserved(reservation):
+                    self._process_task(task)
             except Exception as e:
-                # Проверяем тип исключения
-                import queue
-                if isinstance(e, queue.Empty):
-                    # Таймаут ожидания задачи - это нормально
-                    continue
-                elif self.running:  # Игнорируем ошибки при остановке
+                if self.running:  # Игнорируем ошибки при остановке
                     logger.error(f"Error in worker {worker_name}: {e}", exc_info=True)
-                time.sleep(0.1)
+            finally:
+                metrics.clear_context()
+                with self._cond:
+                    self._release_lane(lane)
         
         logger.info(f"Worker {worker_name} stopped")
+
+    def _admit_task(self, task: SheetsTask) -> Optional[Reservation]:
+        """
+        Резервирует квоту на задачу и проверяет аренду outbox перед ее выполнением.
+        Возвращает резерв (его остаток возвращается после выполнения) или None,
+        если задача отложена.
+        """
+        reads, writes = TASK_COSTS.get(task.task_type, (1, 1))
+        delay, reservation = rate_limiter.reserve(reads, writes)
+        if reservation is None:
+            logger.debug(f"Quota exhausted, task {task.task_type.value} for {task.record_id} "
+                         f"postponed by {delay:.1f}s")
+            metrics.inc('sheets_tasks_postponed_total', task_type=task.task_type.value, reason='quota')
+            self._schedule(task, delay)
+            return None
+
+        if task.outbox_id is not None:
+            lease_remaining = self.outbox.claim(task.outbox_id)
+            if lease_remaining is not None:
+                # Задача арендована другим процессом (или аренду не удалось проверить) - откладываем
+                rate_limiter.release(reservation)
+                metrics.inc('sheets_tasks_postponed_total', task_type=task.task_type.value, reason='lease')
+                self._schedule(task, lease_remaining + 1)
+                return None
+        return reservation
     
     def _process_task(self, task: SheetsTask):
         """Обрабатывает одну задачу"""
@@ -112,19 +502,18 @@ class AsyncSheetsWorker:
                     task.spreadsheet_id, task.sheet_name, task.data
                 )
             elif task.task_type == TaskType.UPDATE_RECORD:
-                success = sheets_manager.update_record_in_sheet(
+                # Одно поле или несколько слитых обновлений - одной пакетной записью
+                success = sheets_manager.update_record_fields_in_sheet(
                     task.spreadsheet_id, task.sheet_name,
-                    task.record_id, task.data['field'], task.data['value']
+                    task.record_id, _record_update_fields(task), self._sheet_row(task)
                 )
             elif task.task_type == TaskType.DELETE_RECORD:
                 success = sheets_manager.delete_record_from_sheet(
-                    task.spreadsheet_id, task.sheet_name, task.record_id
+                    task.spreadsheet_id, task.sheet_name, task.record_id, self._sheet_row(task)
                 )
             elif task.task_type == TaskType.ADD_PAYMENT:
                 # Обработка добавления платежа
-                from .payments_sheets_manager import PaymentsSheetsManager
-                payments_manager = PaymentsSheetsManager()
-                success = payments_manager.add_payment_to_sheet(
+                success = self._get_payments_manager().add_payment_to_sheet(
                     payment_id=task.data['payment_id'],
                     user_display_name=task.data['user_display_name'],
                     amount=task.data['amount'],
@@ -137,18 +526,14 @@ class AsyncSheetsWorker:
                 )
             elif task.task_type == TaskType.UPDATE_PAYMENT:
                 # Обработка обновления платежа
-                from .payments_sheets_manager import PaymentsSheetsManager
-                payments_manager = PaymentsSheetsManager()
-                success = payments_manager.update_payment_in_sheet(
+                success = self._get_payments_manager().update_payment_in_sheet(
                     payment_id=int(task.record_id),
                     role=task.data['role'],
                     updated_data=task.data.get('updated_data', {})
                 )
             elif task.task_type == TaskType.DELETE_PAYMENT:
                 # Обработка удаления платежа
-                from .payments_sheets_manager import PaymentsSheetsManager
-                payments_manager = PaymentsSheetsManager()
-                success = payments_manager.delete_payment_from_sheet(
+                success = self._get_payments_manager().delete_payment_from_sheet(
                     payment_id=int(task.record_id),
                     role=task.data['role']
                 )
@@ -158,59 +543,296 @@ class AsyncSheetsWorker:
             
             if success:
                 logger.info(f"Task {task.task_type.value} completed successfully for {task.record_id}")
-                if task.callback:
-                    try:
-                        task.callback(True, None)
-                    except Exception as e:
-                        logger.error(f"Error in callback: {e}", exc_info=True)
+                if task.task_type in RECORD_TASKS:
+                    self._save_row_changes(task)
+                self._finish_task(task, True)
             else:
                 logger.warning(f"Failed to execute task {task.task_type.value} for {task.record_id}")
-                self._handle_task_failure(task)
+                # Менеджеры перехватывают исключения сами, ошибку API берем из ограничителя
+                self._handle_task_failure(task, info=rate_limiter.last_error())
                 
         except Exception as e:
             logger.error(f"Error processing task {task.task_type.value} for {task.record_id}: {e}", exc_info=True)
-            self._handle_task_failure(task, str(e))
+            self._handle_task_failure(task, str(e), classify_error(e))
     
-    def _handle_task_failure(self, task: SheetsTask, error: str = None):
+    def _sheet_row(self, task: SheetsTask) -> Optional[int]:
+        """Последняя известная строка записи (запись удаления уже нет в БД - позиция в задаче)"""
+        if task.task_type == TaskType.DELETE_RECORD:
+            return self.sheet_rows.valid_row(task.spreadsheet_id, task.sheet_name,
+                                             task.data.get('sheet_row'), task.data.get('layout_version'))
+        return self.sheet_rows.lookup(task.record_id, task.spreadsheet_id, task.sheet_name)
+
+    def _save_row_changes(self, task: SheetsTask, changes: Optional[List[RowChange]] = None):
+        """Сохраняет в БД сдвиги строк, выполненные менеджером для задачи"""
+        for change in sheets_manager.last_row_changes() if changes is None else changes:
+            self.sheet_rows.apply(task.spreadsheet_id, task.sheet_name, task.record_id, change)
+
+    def _get_payments_manager(self):
+        """Менеджер платежей, общий для всех задач (использует общий sheets_manager)"""
+        if self._payments_manager is None:
+            from .payments_sheets_manager import PaymentsSheetsManager
+            self._payments_manager = PaymentsSheetsManager(sheets_manager)
+        return self._payments_manager
+
+    def _handle_task_failure(self, task: SheetsTask, error: str = None,
+                             info: Optional[ApiErrorInfo] = None):
         """Обрабатывает неудачное выполнение задачи"""
+        if info is not None and info.kind == ErrorKind.RATE_LIMITED:
+            # Превышение квоты - не ошибка задачи, повторяем без расхода попыток
+            task.throttle_count += 1
+            metrics.inc('sheets_task_retries_total', task_type=task.task_type.value, reason='throttled')
+            delay = rate_limiter.retry_delay(task.throttle_count, info)
+            logger.warning(f"Task {task.task_type.value} for {task.record_id} throttled, "
+                           f"retrying in {delay:.1f}s")
+            self._schedule(task, delay)
+            return
+
         task.retry_count += 1
+        retryable = info is None or info.retryable
         
-        if task.retry_count <= task.max_retries:
+        if retryable and task.retry_count <= task.max_retries:
+            delay = rate_limiter.retry_delay(task.retry_count, info)
+            reason = info.kind.value if info is not None else 'error'
+            metrics.inc('sheets_task_retries_total', task_type=task.task_type.value, reason=reason)
             logger.warning(f"Retrying task {task.task_type.value} for {task.record_id} "
-                           f"(attempt {task.retry_count}/{task.max_retries})")
-            # Добавляем задержку перед повтором
-            time.sleep(min(2 ** task.retry_count, 10))  # Экспоненциальная задержка
-            self.task_queue.put(task)
+                           f"in {delay:.1f}s (attempt {task.retry_count}/{task.max_retries})")
+            self._schedule(task, delay)
         else:
+            if not retryable:
+                error = error or f"Google API error {info.status}"
             logger.error(f"Task {task.task_type.value} for {task.record_id} not completed "
-                         f"after {task.max_retries} attempts")
-            if task.callback:
+                         f"after {task.retry_count} attempts: {error}")
+            self._finish_task(task, False, error or "Maximum attempts exceeded")
+
+    def _finish_task(self, task: SheetsTask, success: bool, error: str = None):
+        """
+        Фиксирует результат задачи и всех поглощенных ею задач в outbox
+        и вызывает callback каждой исходной задачи
+        """
+        tasks = task.all_tasks()
+        outbox_ids = [t.outbox_id for t in tasks if t.outbox_id is not None]
+        if outbox_ids:
+            if success:
+                self.outbox.complete(outbox_ids)
+            else:
+                self.outbox.fail(outbox_ids, error)
+            with self._cond:
+                for outbox_id in outbox_ids:
+                    self._outbox_tasks.pop(outbox_id, None)
+
+        now = time.time()
+        for original in tasks:
+            task_type = original.task_type.value
+            metrics.inc('sheets_tasks_total', task_type=task_type, outcome='success' if success else 'failed')
+            if success:
+                metrics.observe('sheets_task_commit_latency_seconds', now - original.enqueued_at,
+                                task_type=task_type)
+
+        for original in tasks:
+            if original.callback:
                 try:
-                    task.callback(False, error or "Maximum attempts exceeded")
+                    original.callback(success, error)
                 except Exception as e:
-                    logger.error(f"Error in failure callback: {e}")
+                    logger.error(f"Error in callback: {e}", exc_info=True)
+
+
+class AsyncioSheetsWorker(AsyncSheetsWorker):
+    """
+    Воркер на asyncio-задачах в цикле событий бота.
+
+    Полосы, очередь отложенных задач, outbox и схлопывание общие с
+    AsyncSheetsWorker; записи выполняются через AsyncSheetsManager (httpx)
+    с теми же известными строками записей, задачи платежей пока идут через
+    синхронный менеджер в пуле потоков.
+    """
+
+    def __init__(self, max_workers: int = 16, outbox: Optional[SheetsOutbox] = None,
+                 collapse: bool = True, client=None):
+        super().__init__(max_workers, outbox, collapse)
+        self.client = client
+        self.manager = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeups: List[asyncio.Event] = []
+        self._idle: set = set()  # События простаивающих воркеров (под self._cond)
+
+    def start(self):
+        """Запускает asyncio-задачи воркера (нужен работающий цикл событий)"""
+        if self.running:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Цикл бота еще не запущен: задачи копятся в полосах до запуска из post_init
+            if not self._outbox_replayed:
+                self.replay_outbox()
+            return
+
+        from .async_sheets_client import AsyncSheetsClient, AsyncSheetsManager
+        if self.client is None:
+            self.client = AsyncSheetsClient()
+        self.manager = AsyncSheetsManager(self.client)
+        self._loop = loop
+        self._wakeups = [asyncio.Event() for _ in range(self.max_workers)]
+        self.running = True
+        if not self._outbox_replayed:
+            self.replay_outbox()
+        logger.info(f"Starting {self.max_workers} asyncio workers for Google Sheets")
+        self.workers = [
+            loop.create_task(self._async_worker_loop(i), name=f"SheetsWorker-{i}")
+            for i in range(self.max_workers)
+        ]
+
+    def stop(self):
+        super().stop()
+        loop, self._loop = self._loop, None
+        if self.client is not None and loop is not None and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self.client.aclose(), loop)
+
+    def _notify(self):
+        super()._notify()
+        loop = self._loop
+        if loop is None or not self._idle:
+            return
+        try:
+            in_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            in_loop = False
+        try:
+            # Будим только простаивающие воркеры
+            for wakeup in self._idle:
+                if in_loop:
+                    wakeup.set()
+                else:
+                    loop.call_soon_threadsafe(wakeup.set)
+        except RuntimeError:
+            pass  # Цикл событий уже закрыт
+        self._idle.clear()
+
+    async def _async_worker_loop(self, worker_index: int):
+        """Цикл asyncio-воркера: тот же выбор полос, ожидание без потоков"""
+        wakeup = self._wakeups[worker_index]
+        while self.running:
+            wakeup.clear()
+            with self._cond:
+                next_due = self._promote_due_tasks()
+                lane = self._acquire_lane(worker_index)
+                if lane is not None:
+                    task = lane.tasks.popleft()
+                    lane.busy = True
+                    lane.current = task
+                else:
+                    self._idle.add(wakeup)
+
+            if lane is None:
+                try:
+                    await asyncio.wait_for(wakeup.wait(),
+                                           timeout=min(1.0, next_due) if next_due is not None else 1.0)
+                except asyncio.TimeoutError:
+                    pass
+                with self._cond:
+                    self._idle.discard(wakeup)
+                continue
+
+            try:
+                reservation = (await asyncio.to_thread(self._admit_task, task)
+                               if task.outbox_id is not None else self._admit_task(task))
+                if reservation is not None:
+                    metrics.set_context(task_type=task.task_type.value)
+                    metrics.inc('sheets_task_executions_total', task_type=task.task_type.value)
+                    # Резерв виден и запросам httpx в этой задаче, и задачам платежей в to_thread
+                    with rate_limiter.reserved(reservation):
+                        await self._process_task_async(task)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.running:
+                    logger.error(f"Error in asyncio worker {worker_index}: {e}", exc_info=True)
+            finally:
+                metrics.clear_context()
+                with self._cond:
+                    self._release_lane(lane)
+
+        logger.info(f"Asyncio worker {worker_index} stopped")
+
+    async def _process_task_async(self, task: SheetsTask):
+        """Выполняет задачу записи через httpx, задачи платежей - в пуле потоков"""
+        if task.task_type not in RECORD_TASKS:
+            await asyncio.to_thread(self._process_task_in_thread, task)
+            return
+
+        try:
+            logger.debug(f"Processing task {task.task_type.value} for {task.record_id}")
+            if task.task_type == TaskType.ADD_RECORD:
+                success = await self.manager.add_record(task.spreadsheet_id, task.sheet_name, task.data)
+            elif task.task_type == TaskType.UPDATE_RECORD:
+                success = await self.manager.update_record_fields(
+                    task.spreadsheet_id, task.sheet_name, task.record_id, _record_update_fields(task),
+                    await asyncio.to_thread(self._sheet_row, task)
+                )
+            else:
+                success = await self.manager.delete_record(
+                    task.spreadsheet_id, task.sheet_name, task.record_id,
+                    await asyncio.to_thread(self._sheet_row, task)
+                )
+        except Exception as e:
+            logger.error(f"Error processing task {task.task_type.value} for {task.record_id}: {e}")
+            await self._run_blocking(task, self._handle_task_failure, task, str(e), classify_error(e))
+            return
+
+        if success:
+            logger.info(f"Task {task.task_type.value} completed successfully for {task.record_id}")
+            await asyncio.to_thread(self._save_row_changes, task, self.manager.last_row_changes())
+            await self._run_blocking(task, self._finish_task, task, True)
+        else:
+            logger.warning(f"Failed to execute task {task.task_type.value} for {task.record_id}")
+            await self._run_blocking(task, self._handle_task_failure, task)
+
+    @staticmethod
+    async def _run_blocking(task: SheetsTask, func, *args):
+        """
+        Завершение задачи пишет в outbox (SQLite) - тогда оно уходит в пул потоков,
+        иначе выполняется сразу (callback не должны блокировать цикл событий)
+        """
+        if any(t.outbox_id is not None for t in task.all_tasks()):
+            await asyncio.to_thread(func, *args)
+        else:
+            func(*args)
+
+    def _process_task_in_thread(self, task: SheetsTask):
+        rate_limiter.clear_last_error()
+        self._process_task(task)
 
 
 # Глобальный экземпляр воркера
-from ..config.settings import GOOGLE_SHEET_WORKERS
-sheets_worker = AsyncSheetsWorker(GOOGLE_SHEET_WORKERS)
+from ..config.settings import GOOGLE_SHEET_WORKERS, SHEETS_WORKER_MODE, SHEETS_ASYNC_WORKERS
+if SHEETS_WORKER_MODE == 'asyncio':
+    sheets_worker = AsyncioSheetsWorker(SHEETS_ASYNC_WORKERS)
+else:
+    sheets_worker = AsyncSheetsWorker(GOOGLE_SHEET_WORKERS)
+sheets_worker.register_metrics()
 
 
-def add_record_async(spreadsheet_id: str, sheet_name: str, record: Dict, 
-                    callback: Optional[callable] = None):
-    """Асинхронно добавляет запись в Google Sheets"""
+def submit_task(task: Optional[SheetsTask]):
+    """Ставит подготовленную задачу в очередь воркера"""
+    if task is not None:
+        sheets_worker.add_task(task)
+
+
+def make_add_record_task(spreadsheet_id: str, sheet_name: str, record: Dict,
+                         callback: Optional[callable] = None) -> Optional[SheetsTask]:
+    """Создает задачу добавления записи (None при некорректных параметрах)"""
     # Валидация входных данных
     if not spreadsheet_id or not sheet_name or not record:
         logger.error(f"Invalid parameters for add_record_async: "
                      f"spreadsheet_id={spreadsheet_id}, sheet_name={sheet_name}, "
                      f"record={record}")
-        return
+        return None
     
     if not record.get('id'):
         logger.error(f"Record without ID: {record}")
-        return
+        return None
     
-    task = SheetsTask(
+    return SheetsTask(
         task_type=TaskType.ADD_RECORD,
         spreadsheet_id=spreadsheet_id,
         sheet_name=sheet_name,
@@ -218,20 +840,20 @@ def add_record_async(spreadsheet_id: str, sheet_name: str, record: Dict,
         data=record,
         callback=callback
     )
-    sheets_worker.add_task(task)
 
 
-def update_record_async(spreadsheet_id: str, sheet_name: str, record_id: str, 
-                       field: str, value: Any, callback: Optional[callable] = None):
-    """Асинхронно обновляет запись в Google Sheets"""
+def make_update_record_task(spreadsheet_id: str, sheet_name: str, record_id: str,
+                            field: str, value: Any,
+                            callback: Optional[callable] = None) -> Optional[SheetsTask]:
+    """Создает задачу обновления записи (None при некорректных параметрах)"""
     # Валидация входных данных
     if not spreadsheet_id or not sheet_name or not record_id or not field:
         logger.error(f"Invalid parameters for update_record_async: "
                      f"spreadsheet_id={spreadsheet_id}, sheet_name={sheet_name}, "
                      f"record_id={record_id}, field={field}")
-        return
+        return None
     
-    task = SheetsTask(
+    return SheetsTask(
         task_type=TaskType.UPDATE_RECORD,
         spreadsheet_id=spreadsheet_id,
         sheet_name=sheet_name,
@@ -239,20 +861,19 @@ def update_record_async(spreadsheet_id: str, sheet_name: str, record_id: str,
         data={'field': field, 'value': value},
         callback=callback
     )
-    sheets_worker.add_task(task)
 
 
-def delete_record_async(spreadsheet_id: str, sheet_name: str, record_id: str,
-                       callback: Optional[callable] = None):
-    """Асинхронно удаляет запись из Google Sheets"""
+def make_delete_record_task(spreadsheet_id: str, sheet_name: str, record_id: str,
+                            callback: Optional[callable] = None) -> Optional[SheetsTask]:
+    """Создает задачу удаления записи (None при некорректных параметрах)"""
     # Валидация входных данных
     if not spreadsheet_id or not sheet_name or not record_id:
         logger.error(f"Invalid parameters for delete_record_async: "
                      f"spreadsheet_id={spreadsheet_id}, sheet_name={sheet_name}, "
                      f"record_id={record_id}")
-        return
+        return None
     
-    task = SheetsTask(
+    return SheetsTask(
         task_type=TaskType.DELETE_RECORD,
         spreadsheet_id=spreadsheet_id,
         sheet_name=sheet_name,
@@ -260,11 +881,36 @@ def delete_record_async(spreadsheet_id: str, sheet_name: str, record_id: str,
         data={},
         callback=callback
     )
-    sheets_worker.add_task(task)
+
+
+def add_record_async(spreadsheet_id: str, sheet_name: str, record: Dict, 
+                    callback: Optional[callable] = None):
+    """Асинхронно добавляет запись в Google Sheets"""
+    submit_task(make_add_record_task(spreadsheet_id, sheet_name, record, callback))
+
+
+def update_record_async(spreadsheet_id: str, sheet_name: str, record_id: str, 
+                       field: str, value: Any, callback: Optional[callable] = None):
+    """Асинхронно обновляет запись в Google Sheets"""
+    submit_task(make_update_record_task(spreadsheet_id, sheet_name, record_id, field, value, callback))
+
+
+def delete_record_async(spreadsheet_id: str, sheet_name: str, record_id: str,
+                       callback: Optional[callable] = None):
+    """Асинхронно удаляет запись из Google Sheets"""
+    submit_task(make_delete_record_task(spreadsheet_id, sheet_name, record_id, callback))
 
 
 def start_worker():
-    """Запускает воркер (вызывается при старте бота)"""
+    """Запускает воркер и поднимает незавершенные задачи из outbox (вызывается при старте бота)"""
+    sheets_worker.start()
+
+
+async def start_worker_in_loop(application=None):
+    """
+    Запускает воркер внутри цикла событий бота (post_init приложения).
+    Для потокового режима повторный запуск ничего не делает.
+    """
     sheets_worker.start()
 
 
@@ -273,36 +919,31 @@ def stop_worker():
     sheets_worker.stop()
 
 
-def add_payment_async(payment_id: int, user_display_name: str, amount: float,
-                     role: str, date_from: str = None, date_to: str = None,
-                     comment: str = None, target_spreadsheet_id: str = None,
-                     target_sheet_name: str = None, callback: Optional[callable] = None):
-    """
-    Асинхронно добавляет платеж в Google Sheets
-
-    Args:
-        payment_id: ID платежа в БД
-        user_display_name: Имя получателя
-        amount: Сумма
-        role: Роль пользователя (определяет лист)
-        date_from: Начало периода
-        date_to: Конец периода
-        comment: Комментарий
-        target_spreadsheet_id: ID таблицы для двойной записи
-        target_sheet_name: Имя листа для двойной записи
-        callback: Callback функция
-    """
+def _payments_spreadsheet_id(callback: Optional[callable] = None) -> Optional[str]:
+    """Возвращает ID таблицы платежей или сообщает об ошибке"""
     from ..config.settings import PAYMENTS_SPREADSHEET_ID
 
     if not PAYMENTS_SPREADSHEET_ID:
         logger.error("PAYMENTS_SPREADSHEET_ID not set")
         if callback:
             callback(False, "PAYMENTS_SPREADSHEET_ID not set")
-        return
+        return None
+    return PAYMENTS_SPREADSHEET_ID
+
 
-    task = SheetsTask(
+def make_add_payment_task(payment_id: int, user_display_name: str, amount: float,
+                          role: str, date_from: str = None, date_to: str = None,
+                          comment: str = None, target_spreadsheet_id: str = None,
+                          target_sheet_name: str = None,
+                          callback: Optional[callable] = None) -> Optional[SheetsTask]:
+    """Создает задачу добавления платежа (None, если таблица платежей не настроена)"""
+    spreadsheet_id = _payments_spreadsheet_id(callback)
+    if not spreadsheet_id:
+        return None
+
+    return SheetsTask(
         task_type=TaskType.ADD_PAYMENT,
-        spreadsheet_id=PAYMENTS_SPREADSHEET_ID,
+        spreadsheet_id=spreadsheet_id,
         sheet_name='',  # Название листа определится по роли
         record_id=str(payment_id),
         data={
@@ -318,8 +959,71 @@ def add_payment_async(payment_id: int, user_display_name: str, amount: float,
         },
         callback=callback
     )
-    sheets_worker.add_task(task)
-    logger.info(f"Task to add payment #{payment_id} added to queue")
+
+
+def make_delete_payment_task(payment_id: int, role: str,
+                             callback: Optional[callable] = None) -> Optional[SheetsTask]:
+    """Создает задачу удаления платежа (None, если таблица платежей не настроена)"""
+    spreadsheet_id = _payments_spreadsheet_id(callback)
+    if not spreadsheet_id:
+        return None
+
+    return SheetsTask(
+        task_type=TaskType.DELETE_PAYMENT,
+        spreadsheet_id=spreadsheet_id,
+        sheet_name='',
+        record_id=str(payment_id),
+        data={'role': role},
+        callback=callback
+    )
+
+
+def make_update_payment_task(payment_id: int, role: str, updated_data: Dict,
+                             callback: Optional[callable] = None) -> Optional[SheetsTask]:
+    """Создает задачу обновления платежа (None, если таблица платежей не настроена)"""
+    spreadsheet_id = _payments_spreadsheet_id(callback)
+    if not spreadsheet_id:
+        return None
+
+    return SheetsTask(
+        task_type=TaskType.UPDATE_PAYMENT,
+        spreadsheet_id=spreadsheet_id,
+        sheet_name='',
+        record_id=str(payment_id),
+        data={
+            'role': role,
+            'updated_data': updated_data
+        },
+        callback=callback
+    )
+
+
+def add_payment_async(payment_id: int, user_display_name: str, amount: float,
+                     role: str, date_from: str = None, date_to: str = None,
+                     comment: str = None, target_spreadsheet_id: str = None,
+                     target_sheet_name: str = None, callback: Optional[callable] = None):
+    """
+    Асинхронно добавляет платеж в Google Sheets
+
+    Args:
+        payment_id: ID платежа в БД
+        user_display_name: Имя получателя
+        amount: Сумма
+        role: Роль пользователя (определяет лист)
+        date_from: Начало периода
+        date_to: Конец периода
+        comment: Комментарий
+        target_spreadsheet_id: ID таблицы для двойной записи
+        target_sheet_name: Имя листа для двойной записи
+        callback: Callback функция
+    """
+    task = make_add_payment_task(
+        payment_id, user_display_name, amount, role, date_from, date_to,
+        comment, target_spreadsheet_id, target_sheet_name, callback
+    )
+    if task:
+        submit_task(task)
+        logger.info(f"Task to add payment #{payment_id} added to queue")
 
 
 def delete_payment_async(payment_id: int, role: str, callback: Optional[callable] = None):
@@ -331,24 +1035,10 @@ def delete_payment_async(payment_id: int, role: str, callback: Optional[callable
         role: Роль пользователя (определяет лист)
         callback: Callback функция
     """
-    from ..config.settings import PAYMENTS_SPREADSHEET_ID
-
-    if not PAYMENTS_SPREADSHEET_ID:
-        logger.error("PAYMENTS_SPREADSHEET_ID not set")
-        if callback:
-            callback(False, "PAYMENTS_SPREADSHEET_ID not set")
-        return
-
-    task = SheetsTask(
-        task_type=TaskType.DELETE_PAYMENT,
-        spreadsheet_id=PAYMENTS_SPREADSHEET_ID,
-        sheet_name='',
-        record_id=str(payment_id),
-        data={'role': role},
-        callback=callback
-    )
-    sheets_worker.add_task(task)
-    logger.info(f"Task to delete payment #{payment_id} added to queue")
+    task = make_delete_payment_task(payment_id, role, callback)
+    if task:
+        submit_task(task)
+        logger.info(f"Task to delete payment #{payment_id} added to queue")
 
 
 def update_payment_async(payment_id: int, role: str, updated_data: Dict,
@@ -362,24 +1052,7 @@ def update_payment_async(payment_id: int, role: str, updated_data: Dict,
         updated_data: Словарь с обновленными данными (amount, date_from, date_to, comment)
         callback: Callback функция
     """
-    from ..config.settings import PAYMENTS_SPREADSHEET_ID
-
-    if not PAYMENTS_SPREADSHEET_ID:
-        logger.error("PAYMENTS_SPREADSHEET_ID not set")
-        if callback:
-            callback(False, "PAYMENTS_SPREADSHEET_ID not set")
-        return
-
-    task = SheetsTask(
-        task_type=TaskType.UPDATE_PAYMENT,
-        spreadsheet_id=PAYMENTS_SPREADSHEET_ID,
-        sheet_name='',
-        record_id=str(payment_id),
-        data={
-            'role': role,
-            'updated_data': updated_data
-        },
-        callback=callback
-    )
-    sheets_worker.add_task(task)
-    logger.info(f"Task to update payment #{payment_id} added to queue")
+    task = make_update_payment_task(payment_id, role, updated_data, callback)
+    if task:
+        submit_task(task)
+        logger.info(f"Task to update payment #{payment_id} added to queue")
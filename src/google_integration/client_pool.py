@@ -0,0 +1,131 @@
+"""
+Общие учетные данные и пул HTTP-сессий для Google API
+
+Учетные данные сервисного аккаунта загружаются один раз на процесс,
+а access token обновляется под блокировкой: параллельные потоки не
+запрашивают токен повторно. Каждый поток получает свою AuthorizedSession
+(requests.Session с keep-alive) и свой клиент gspread - сессии requests
+не рассчитаны на одновременное использование из нескольких потоков.
+
+Все менеджеры (GoogleSheetsManager, PaymentsSheetsManager, асинхронный
+клиент) получают пул через конструктор, по умолчанию - общий client_pool.
+
+Сервис Drive API строится один раз на поток из статического discovery-
+документа, поставляемого с googleapiclient (httplib2 не потокобезопасен).
+
+С фейковым бэкендом (GOOGLE_BACKEND=fake, см. fake_backend.py) пул выдает
+те же сессии и сервисы, но их транспорт обращается к таблицам в памяти,
+а учетные данные анонимные - файл сервисного аккаунта не нужен.
+"""
+import threading
+from typing import Optional
+
+from google.auth.transport.requests import AuthorizedSession
+from google.oauth2 import service_account
+
+from ..config.settings import GOOGLE_BACKEND, GOOGLE_CREDS_FILE, GOOGLE_SCOPE, GOOGLE_SCOPES, logger
+from .sheets_metrics import metrics
+
+
+class GoogleClientPool:
+    """Кеш учетных данных и пул сессий/клиентов gspread по потокам"""
+
+    def __init__(self, creds_file: str = GOOGLE_CREDS_FILE, scopes: Optional[list] = None,
+                 credentials=None, backend=None):
+        self.creds_file = creds_file
+        # FakeGoogleBackend вместо googleapis.com (None - настоящий API)
+        self.backend = backend
+        self.scopes = scopes or list(dict.fromkeys(GOOGLE_SCOPE + GOOGLE_SCOPES))
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._local = threading.local()
+        self.token_fetches = 0
+        self.sessions_created = 0
+        self._credentials = self._wrap_refresh(credentials) if credentials is not None else None
+
+    @property
+    def credentials(self):
+        """Учетные данные сервисного аккаунта (загружаются один раз)"""
+        if self._credentials is None:
+            with self._lock:
+                if self._credentials is None and self.backend is not None:
+                    from google.auth.credentials import AnonymousCredentials
+                    self._credentials = AnonymousCredentials()
+                elif self._credentials is None:
+                    self._credentials = self._wrap_refresh(
+                        service_account.Credentials.from_service_account_file(
+                            self.creds_file, scopes=self.scopes
+                        )
+                    )
+        return self._credentials
+
+    def _wrap_refresh(self, credentials):
+        """
+        Сериализует обновление токена: поток, дождавшийся блокировки,
+        не запрашивает токен, если его уже обновил другой поток.
+        """
+        refresh = credentials.refresh
+
+        def locked_refresh(request):
+            stale_token = credentials.token
+            with self._refresh_lock:
+                if credentials.valid and credentials.token != stale_token:
+                    return
+                refresh(request)
+                self.token_fetches += 1
+                metrics.inc('google_token_fetches_total')
+                logger.debug("Google access token refreshed")
+
+        credentials.refresh = locked_refresh
+        return credentials
+
+    def get_session(self) -> AuthorizedSession:
+        """HTTP-сессия текущего потока (keep-alive соединения переиспользуются)"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = AuthorizedSession(self.credentials)
+            if self.backend is not None:
+                from .fake_backend import FakeRequestsAdapter
+                session.mount('https://', FakeRequestsAdapter(self.backend))
+            self._local.session = session
+            with self._lock:
+                self.sessions_created += 1
+            metrics.inc('google_http_sessions_created_total')
+        return session
+
+    def get_drive_service(self):
+        """Сервис Drive API v3 текущего потока (без загрузки discovery по сети)"""
+        service = getattr(self._local, 'drive', None)
+        if service is None:
+            from googleapiclient.discovery import build
+            if self.backend is not None:
+                from .fake_backend import FakeHttp
+                service = build('drive', 'v3', http=FakeHttp(self.backend),
+                                static_discovery=True, cache_discovery=False)
+            else:
+                service = build('drive', 'v3', credentials=self.credentials,
+                                static_discovery=True, cache_discovery=False)
+            self._local.drive = service
+            metrics.inc('google_drive_services_built_total')
+        return service
+
+    def get_client(self):
+        """Клиент gspread текущего потока поверх его сессии"""
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            from .sheets_manager import RateLimitedClient
+            client = RateLimitedClient(auth=self.credentials, session=self.get_session())
+            self._local.client = client
+        return client
+
+
+def _default_backend():
+    """Фейковый бэкенд, если он выбран настройкой GOOGLE_BACKEND=fake"""
+    if GOOGLE_BACKEND == 'fake':
+        from .fake_backend import create_fake_backend
+        return create_fake_backend()
+    return None
+
+
+# Общий пул для всех менеджеров Google Sheets / Drive
+client_pool = GoogleClientPool(backend=_default_backend())
@@ -0,0 +1,360 @@
+"""
+Трехсторонняя сверка полей записей между БД и листами Google Sheets
+
+Листы правят и вручную, поэтому для каждой записи сравниваются три
+версии каждого поля: в БД, в листе и в снимке последней сверки (общий
+предок). Поле, изменившееся только в БД, записывается в ячейку листа,
+изменившееся только в листе - в БД; изменившееся с обеих сторон (или
+без снимка) - конфликт, который решается политикой DRIFT_CONFLICT_POLICY:
+  - db:     значение из БД записывается в лист;
+  - sheet:  значение из листа записывается в БД;
+  - report: ничего не меняется, конфликт только попадает в отчет.
+
+Изменения листа уходят одним values.batchUpdate на таблицу (только
+измененные ячейки), изменения БД - одной транзакцией. Таблица, которая
+не менялась в Drive с прошлой сверки и записи которой в БД совпадают
+со снимком, не читается вовсе.
+"""
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+from gspread.utils import absolute_range_name, rowcol_to_a1
+
+from ..config.settings import DRIFT_CONFLICT_POLICY, logger
+from ..database.database_manager import DatabaseManager
+from ..database.sheets_sync_state import SheetsSyncState
+from ..utils.date_utils import safe_parse_date_or_none
+from .reconciliation import group_records_by_sheet
+from .sheet_columns import record_rows
+from .sheets_manager import RECORD_FIELD_MAPPING, GoogleSheetsManager, format_sheet_value
+from .sheets_metrics import metrics
+
+# Сверяемые поля записи
+SYNC_FIELDS = ('date', 'supplier', 'direction', 'description', 'amount')
+
+CONFLICT_POLICIES = ('db', 'sheet', 'report')
+
+# Операция в состоянии синхронизации (modifiedTime таблиц на момент сверки)
+DRIFT_SCOPE = 'drift'
+
+# Направления изменения поля
+TO_SHEET = 'to_sheet'
+TO_DB = 'to_db'
+CONFLICT = 'conflict'
+
+
+def canonical_value(field_name: str, value):
+    """Значение поля в виде для сравнения (даты - ISO, суммы - с точностью до копеек)"""
+    if field_name == 'amount':
+        try:
+            return round(float(value), 2)
+        except (TypeError, ValueError):
+            return str(value if value is not None else '').strip()
+    text = str(value if value is not None else '').strip()
+    if field_name == 'date' and text:
+        parsed = safe_parse_date_or_none(text)
+        return parsed.isoformat() if parsed else text
+    return text
+
+
+def canonical_fields(record: Dict) -> Dict:
+    return {field_name: canonical_value(field_name, record.get(field_name)) for field_name in SYNC_FIELDS}
+
+
+def resolve_field(db_value, sheet_value, base_value) -> Optional[str]:
+    """Направление изменения поля: None (совпадает), TO_SHEET, TO_DB или CONFLICT"""
+    if db_value == sheet_value:
+        return None
+    if base_value is not None:
+        if sheet_value == base_value:
+            return TO_SHEET
+        if db_value == base_value:
+            return TO_DB
+    return CONFLICT
+
+
+@dataclass
+class FieldChange:
+    """Расхождение одного поля записи"""
+    record_id: str
+    field: str
+    db_value: object
+    sheet_value: object
+    base_value: object
+    action: str
+    applied: Optional[str] = None
+
+
+@dataclass
+class SheetDrift:
+    """Расхождения одного листа"""
+    spreadsheet_id: str
+    sheet_name: str
+    changes: List[FieldChange] = field(default_factory=list)
+    new_in_sheet: List[str] = field(default_factory=list)
+    missing_in_sheet: List[str] = field(default_factory=list)
+    deleted_in_sheet: List[str] = field(default_factory=list)
+    deleted_in_db: List[str] = field(default_factory=list)
+    cells_written: int = 0
+    db_upserts: int = 0
+    error: Optional[str] = None
+
+    @property
+    def conflicts(self) -> List[FieldChange]:
+        return [change for change in self.changes if change.action == CONFLICT]
+
+
+@dataclass
+class DriftReport:
+    """Отчет трехсторонней сверки"""
+    policy: str
+    dry_run: bool = False
+    sheets: List[SheetDrift] = field(default_factory=list)
+    skipped_spreadsheets: int = 0
+    duration: float = 0.0
+
+    def _count(self, predicate) -> int:
+        return sum(1 for drift in self.sheets for change in drift.changes if predicate(change))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'changed_fields': sum(len(drift.changes) for drift in self.sheets),
+            'to_sheet': self._count(lambda change: change.action == TO_SHEET),
+            'to_db': self._count(lambda change: change.action == TO_DB),
+            'conflicts': self._count(lambda change: change.action == CONFLICT),
+            'unresolved_conflicts': self._count(lambda change: change.action == CONFLICT and not change.applied),
+            'new_in_sheet': sum(len(drift.new_in_sheet) for drift in self.sheets),
+            'missing_in_sheet': sum(len(drift.missing_in_sheet) for drift in self.sheets),
+            'deleted_in_sheet': sum(len(drift.deleted_in_sheet) for drift in self.sheets),
+            'deleted_in_db': sum(len(drift.deleted_in_db) for drift in self.sheets),
+            'cells_written': sum(drift.cells_written for drift in self.sheets),
+            'db_upserts': sum(drift.db_upserts for drift in self.sheets),
+            'skipped_spreadsheets': self.skipped_spreadsheets,
+            'errors': sum(1 for drift in self.sheets if drift.error),
+        }
+
+    def conflicts(self) -> List[FieldChange]:
+        return [change for drift in self.sheets for change in drift.conflicts]
+
+    def to_dict(self) -> Dict:
+        return {
+            **self.stats(),
+            'policy': self.policy,
+            'dry_run': self.dry_run,
+            'duration': round(self.duration, 3),
+            'details': [asdict(drift) for drift in self.sheets
+                        if drift.changes or drift.new_in_sheet or drift.missing_in_sheet
+                        or drift.deleted_in_sheet or drift.deleted_in_db or drift.error],
+        }
+
+
+class DriftRepair:
+    """Трехсторонняя сверка БД и листов с минимальной записью изменений"""
+
+    def __init__(self, sheets_manager: GoogleSheetsManager, db_manager: DatabaseManager,
+                 sync_state: SheetsSyncState, policy: str = DRIFT_CONFLICT_POLICY):
+        self.sheets = sheets_manager
+        self.db = db_manager
+        self.sync_state = sync_state
+        self.policy = policy
+
+    def repair(self, policy: Optional[str] = None, dry_run: bool = False, force: bool = False) -> DriftReport:
+        """
+        Сверяет поля записей БД и листов и применяет изменения
+        (dry_run=True - только отчет; force=True - читать и неизменившиеся таблицы)
+        """
+        started = time.monotonic()
+        policy = policy or self.policy
+        if policy not in CONFLICT_POLICIES:
+            logger.error(f"Unknown drift conflict policy {policy!r}, using 'report'")
+            policy = 'report'
+        report = DriftReport(policy, dry_run)
+
+        grouped, _ = group_records_by_sheet(self.db.get_all_records())
+        known_ids = {record_id for records in grouped.values() for record_id in records}
+        by_spreadsheet: Dict[str, Dict[str, Dict[str, Dict]]] = {}
+        for (spreadsheet_id, sheet_name), records in grouped.items():
+            by_spreadsheet.setdefault(spreadsheet_id, {})[sheet_name] = records
+
+        modified_times = {spreadsheet['id']: spreadsheet.get('modifiedTime')
+                          for spreadsheet in self.sheets.get_all_spreadsheets()}
+        synced_times = {} if force else self.sync_state.get_modified_times(DRIFT_SCOPE)
+
+        for spreadsheet_id, sheet_records in by_spreadsheet.items():
+            snapshots = self.sync_state.get_snapshots(spreadsheet_id)
+            modified_time = modified_times.get(spreadsheet_id)
+            if (modified_time and synced_times.get(spreadsheet_id) == modified_time
+                    and self._matches_snapshots(sheet_records, snapshots)):
+                report.skipped_spreadsheets += 1
+                metrics.inc('sheets_sync_skipped_total', operation=DRIFT_SCOPE, level='spreadsheet')
+                continue
+
+            drifts = []
+            try:
+                wrote = self._repair_spreadsheet(spreadsheet_id, sheet_records, snapshots, known_ids,
+                                                 policy, dry_run, drifts)
+            except Exception as e:
+                logger.error(f"Error checking drift in spreadsheet {spreadsheet_id}: {e}")
+                drifts = drifts or [SheetDrift(spreadsheet_id, '')]
+                for drift in drifts:
+                    drift.error = drift.error or str(e)
+                wrote = True
+            report.sheets.extend(drifts)
+
+            # Наши записи меняют modifiedTime - такую таблицу следующая сверка перечитает
+            if not dry_run and not wrote and modified_time and not any(drift.error for drift in drifts):
+                self.sync_state.set_modified_time(DRIFT_SCOPE, spreadsheet_id, modified_time)
+
+        report.duration = time.monotonic() - started
+        stats = report.stats()
+        for action in (TO_SHEET, TO_DB, CONFLICT):
+            metrics.inc('sheets_drift_fields_total', stats['conflicts' if action == CONFLICT else action],
+                        action=action)
+        logger.info(f"Drift check ({policy}{', dry run' if dry_run else ''}): {stats} in {report.duration:.2f}s")
+        return report
+
+    def _matches_snapshots(self, sheet_records: Dict[str, Dict[str, Dict]],
+                           snapshots: Dict[str, Dict[str, Dict]]) -> bool:
+        """Записи БД таблицы совпадают со снимками (в БД с прошлой сверки ничего не менялось)"""
+        for sheet_name, records in sheet_records.items():
+            snapshot = snapshots.get(sheet_name, {})
+            if not records.keys() <= snapshot.keys():
+                return False
+            for record_id, record in records.items():
+                if canonical_fields(record) != snapshot[record_id]['fields']:
+                    return False
+        return True
+
+    def _repair_spreadsheet(self, spreadsheet_id: str, sheet_records: Dict[str, Dict[str, Dict]],
+                            snapshots: Dict[str, Dict[str, Dict]], known_ids: Set[str],
+                            policy: str, dry_run: bool, drifts: List[SheetDrift]) -> bool:
+        """Сверка листов одной таблицы. Возвращает True, если в лист что-то записано."""
+        spreadsheet = self.sheets.open_sheet_by_id(spreadsheet_id)
+        if not spreadsheet:
+            raise RuntimeError('spreadsheet is not available')
+
+        existing = {worksheet.title for worksheet in spreadsheet.worksheets()}
+        targets = []
+        for sheet_name in sheet_records:
+            drift = SheetDrift(spreadsheet_id, sheet_name)
+            drifts.append(drift)
+            if sheet_name in existing:
+                targets.append(drift)
+            else:
+                drift.error = 'sheet not found'
+        if not targets:
+            return False
+
+        # Все листы таблицы - одним values.batchGet
+        data_by_sheet = self.sheets.read_sheets(spreadsheet, [drift.sheet_name for drift in targets])
+        cell_updates: List[Tuple[SheetDrift, Dict]] = []
+        db_upserts: List[Tuple[SheetDrift, Dict]] = []
+        new_snapshots: Dict[str, Dict[str, Dict]] = {}
+
+        for drift in targets:
+            data = data_by_sheet.get(drift.sheet_name)
+            if data is None or (data.row_count and 'ID' not in data.headers):
+                drift.error = 'ID column not found'
+                continue
+            new_snapshots[drift.sheet_name] = self._diff_sheet(
+                drift, data, sheet_records[drift.sheet_name], snapshots.get(drift.sheet_name, {}),
+                known_ids, policy, cell_updates, db_upserts
+            )
+
+        if dry_run:
+            return False
+
+        if cell_updates:
+            try:
+                spreadsheet.values_batch_update(body={
+                    'valueInputOption': 'USER_ENTERED',
+                    'data': [update for _, update in cell_updates]
+                })
+                for drift, _ in cell_updates:
+                    drift.cells_written += 1
+            except Exception as e:
+                logger.error(f"Error writing drift repairs to {spreadsheet_id}: {e}")
+                for drift in {id(drift): drift for drift, _ in cell_updates}.values():
+                    drift.error = str(e)
+
+        if db_upserts:
+            if self.db.upsert_records([record for _, record in db_upserts]):
+                for drift, _ in db_upserts:
+                    drift.db_upserts += 1
+            else:
+                for drift, _ in db_upserts:
+                    drift.error = drift.error or 'DB upsert failed'
+
+        # Снимок сохраняется только для листов без ошибок - иначе расхождения найдутся снова
+        for drift in targets:
+            if not drift.error:
+                self.sync_state.set_snapshots(spreadsheet_id, drift.sheet_name, new_snapshots[drift.sheet_name])
+
+        return bool(cell_updates)
+
+    def _diff_sheet(self, drift: SheetDrift, data, db_records: Dict[str, Dict], snapshot: Dict[str, Dict],
+                    known_ids: Set[str], policy: str, cell_updates: List[Tuple[SheetDrift, Dict]],
+                    db_upserts: List[Tuple[SheetDrift, Dict]]) -> Dict[str, Dict]:
+        """Трехсторонняя сверка листа; возвращает новый снимок листа"""
+        sheet_rows: Dict[str, Tuple[int, Dict]] = {}
+        for row_number, record in record_rows(data, drift.spreadsheet_id):
+            sheet_rows.setdefault(record['id'], (row_number, record))
+        columns = {header: index for index, header in enumerate(data.headers, start=1)}
+        new_snapshot: Dict[str, Dict] = {}
+
+        for record_id, db_record in db_records.items():
+            if record_id not in sheet_rows:
+                # Недостающие строки дописывает сверка множеств (SheetsReconciler)
+                (drift.deleted_in_sheet if record_id in snapshot else drift.missing_in_sheet).append(record_id)
+                continue
+
+            row_number, sheet_record = sheet_rows[record_id]
+            base = snapshot.get(record_id, {}).get('fields', {})
+            fields, db_changes = {}, {}
+            for field_name in SYNC_FIELDS:
+                db_value = canonical_value(field_name, db_record.get(field_name))
+                sheet_value = canonical_value(field_name, sheet_record.get(field_name))
+                base_value = base.get(field_name)
+                action = resolve_field(db_value, sheet_value, base_value)
+                if action is None:
+                    fields[field_name] = db_value
+                    continue
+
+                applied = action if action != CONFLICT else {'db': TO_SHEET, 'sheet': TO_DB}.get(policy)
+                column = columns.get(RECORD_FIELD_MAPPING[field_name])
+                if applied == TO_SHEET and column is None:
+                    applied = None
+                drift.changes.append(FieldChange(record_id, field_name, db_value, sheet_value,
+                                                 base_value, action, applied))
+
+                if applied == TO_SHEET:
+                    cell_updates.append((drift, {
+                        'range': absolute_range_name(drift.sheet_name, rowcol_to_a1(row_number, column)),
+                        'values': [[format_sheet_value(field_name, db_record.get(field_name))]]
+                    }))
+                    fields[field_name] = db_value
+                elif applied == TO_DB:
+                    db_changes[field_name] = sheet_record[field_name]
+                    fields[field_name] = sheet_value
+                elif base_value is not None:
+                    # Нерешенный конфликт - предок остается прежним
+                    fields[field_name] = base_value
+
+            if db_changes:
+                db_upserts.append((drift, {**db_record, **db_changes}))
+            new_snapshot[record_id] = {'row': row_number, 'fields': fields}
+
+        for record_id, (row_number, sheet_record) in sheet_rows.items():
+            if record_id in db_records:
+                continue
+            if record_id in snapshot:
+                # Запись удалена из БД после прошлой сверки - не восстанавливаем
+                drift.deleted_in_db.append(record_id)
+                new_snapshot[record_id] = snapshot[record_id]
+            elif record_id not in known_ids:
+                drift.new_in_sheet.append(record_id)
+                db_upserts.append((drift, sheet_record))
+                new_snapshot[record_id] = {'row': row_number, 'fields': canonical_fields(sheet_record)}
+
+        return new_snapshot
@@ -0,0 +1,647 @@
+"""
+Фейковый бэкенд Google Sheets / Drive API в памяти процесса
+
+Включается настройкой GOOGLE_BACKEND=fake. Подменяется только транспорт:
+сессии пула (requests), сервис Drive (httplib2) и асинхронный клиент (httpx)
+отправляют запросы не в googleapis.com, а в FakeGoogleBackend. Поэтому
+gspread, GoogleSheetsManager, PaymentsSheetsManager и воркеры работают
+без изменений - с теми же URL, параметрами и телами запросов.
+
+Поддерживается подмножество REST API, которое используют gspread и
+AsyncSheetsClient:
+  - spreadsheets.get (метаданные и листы);
+  - spreadsheets.batchUpdate: addSheet, deleteSheet, insertDimension,
+    deleteDimension, appendDimension, updateSheetProperties (форматирование
+    принимается и игнорируется);
+  - spreadsheets.values: get, batchGet (ROWS/COLUMNS), update, append,
+    batchUpdate, clear, batchClear;
+  - drive.files.list (постранично).
+
+Таблицы хранятся списками строк, значения - как их записал клиент
+(USER_ENTERED превращает числовые строки в числа). Бэкенд считает вызовы
+по операциям, умеет задерживать ответы (latency) и отвечать ошибкой квоты
+429 - с заданной вероятностью (error_rate) или на несколько следующих
+запросов (fail_next).
+"""
+import asyncio
+import copy
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import httplib2
+import httpx
+import requests
+from requests.structures import CaseInsensitiveDict
+from gspread.utils import a1_range_to_grid_range
+
+from ..config.settings import (
+    FAKE_GOOGLE_DATA, FAKE_GOOGLE_ERROR_RATE, FAKE_GOOGLE_LATENCY, logger
+)
+
+DEFAULT_ROWS = 1000
+DEFAULT_COLUMNS = 26
+
+_SPREADSHEET_PATH = re.compile(r'^/v4/spreadsheets/([^/:]+)(.*)$')
+_NUMBER = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$')
+_STATUS_NAMES = {400: 'INVALID_ARGUMENT', 404: 'NOT_FOUND', 429: 'RESOURCE_EXHAUSTED', 500: 'INTERNAL',
+                 503: 'UNAVAILABLE'}
+
+
+class FakeApiError(Exception):
+    """Ошибка запроса к фейковому API (превращается в HTTP-ответ с кодом)"""
+
+    def __init__(self, status: int, message: str):
+        self.status = status
+        super().__init__(message)
+
+
+class FakeSheet:
+    """Лист: строки значений и размер сетки"""
+
+    def __init__(self, sheet_id: int, title: str, rows: Optional[List[List]] = None,
+                 row_count: int = DEFAULT_ROWS, col_count: int = DEFAULT_COLUMNS):
+        self.sheet_id = sheet_id
+        self.title = title
+        self.rows = [list(row) for row in rows or []]
+        self.row_count = max(row_count, len(self.rows))
+        self.col_count = max([col_count] + [len(row) for row in self.rows])
+        self.frozen_rows = 0
+
+    def properties(self, index: int) -> Dict:
+        grid = {'rowCount': self.row_count, 'columnCount': self.col_count}
+        if self.frozen_rows:
+            grid['frozenRowCount'] = self.frozen_rows
+        return {'sheetId': self.sheet_id, 'title': self.title, 'index': index,
+                'sheetType': 'GRID', 'gridProperties': grid}
+
+
+class FakeSpreadsheet:
+    """Таблица: листы по названию и время последнего изменения для Drive"""
+
+    def __init__(self, spreadsheet_id: str, title: str):
+        self.id = spreadsheet_id
+        self.title = title
+        self.sheets: Dict[str, FakeSheet] = {}
+        self.next_sheet_id = 0
+        self.modified = datetime.now(timezone.utc)
+
+    def add_sheet(self, title: str, rows: Optional[List[List]] = None, row_count: int = DEFAULT_ROWS,
+                  col_count: int = DEFAULT_COLUMNS, sheet_id: Optional[int] = None) -> FakeSheet:
+        if title in self.sheets:
+            raise FakeApiError(400, f"A sheet with the name \"{title}\" already exists.")
+        sheet_id = self.next_sheet_id if sheet_id is None else sheet_id
+        self.next_sheet_id = max(self.next_sheet_id, sheet_id) + 1
+        sheet = FakeSheet(sheet_id, title, rows, row_count, col_count)
+        self.sheets[title] = sheet
+        return sheet
+
+    def sheet_by_id(self, sheet_id: int) -> FakeSheet:
+        for sheet in self.sheets.values():
+            if sheet.sheet_id == sheet_id:
+                return sheet
+        raise FakeApiError(400, f"No grid with id: {sheet_id}")
+
+    def touch(self):
+        # modifiedTime строго растет, даже если изменения пришли в одну миллисекунду
+        self.modified = max(datetime.now(timezone.utc), self.modified + timedelta(milliseconds=1))
+
+    @property
+    def modified_time(self) -> str:
+        return self.modified.strftime('%Y-%m-%dT%H:%M:%S.') + f"{self.modified.microsecond // 1000:03d}Z"
+
+
+def parse_range(range_name: str) -> Tuple[str, Dict]:
+    """'Лист'!A1:B2 -> (название листа, границы сетки)"""
+    title, _, cells = range_name.partition('!')
+    if title.startswith("'") and title.endswith("'") and len(title) > 1:
+        title = title[1:-1].replace("''", "'")
+    return title, a1_range_to_grid_range(cells) if cells else {}
+
+
+def user_entered(value):
+    """Значение, как его сохранит Sheets при valueInputOption=USER_ENTERED"""
+    if not isinstance(value, str):
+        return value
+    if value.startswith("'"):
+        return value[1:]
+    stripped = value.strip()
+    if _NUMBER.match(stripped):
+        try:
+            return int(stripped)
+        except ValueError:
+            return float(stripped)
+    if stripped.upper() in ('TRUE', 'FALSE'):
+        return stripped.upper() == 'TRUE'
+    return value
+
+
+def formatted(value) -> Any:
+    """Значение ячейки при valueRenderOption=FORMATTED_VALUE"""
+    if isinstance(value, bool):
+        return 'TRUE' if value else 'FALSE'
+    if isinstance(value, float):
+        return str(int(value)) if value.is_integer() else repr(value)
+    if isinstance(value, int):
+        return str(value)
+    return '' if value is None else value
+
+
+def _trim(rows: List[List]) -> List[List]:
+    """Как Sheets API: без пустых ячеек в конце строк и пустых строк в конце"""
+    trimmed = []
+    for row in rows:
+        end = len(row)
+        while end and row[end - 1] in ('', None):
+            end -= 1
+        trimmed.append(row[:end])
+    while trimmed and not trimmed[-1]:
+        trimmed.pop()
+    return trimmed
+
+
+class FakeGoogleBackend:
+    """Таблицы в памяти, счетчики вызовов, задержка и ошибки квоты"""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, auto_create: bool = False,
+                 seed: Optional[int] = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        # Неизвестная таблица создается с пустым листом (иначе - 404, как в Google)
+        self.auto_create = auto_create
+        self.spreadsheets: Dict[str, FakeSpreadsheet] = {}
+        self.calls: Counter = Counter()
+        self.batch_requests: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self._failures: List[Tuple[int, Optional[float]]] = []
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+
+    # --- Данные ---
+
+    def create_spreadsheet(self, spreadsheet_id: Optional[str] = None, title: Optional[str] = None,
+                           sheets: Optional[Dict[str, List[List]]] = None) -> str:
+        """Создает таблицу; sheets - {название листа: строки}, по умолчанию один пустой Sheet1"""
+        with self._lock:
+            spreadsheet_id = spreadsheet_id or uuid.uuid4().hex
+            spreadsheet = FakeSpreadsheet(spreadsheet_id, title or spreadsheet_id)
+            for sheet_title, rows in (sheets if sheets is not None else {'Sheet1': []}).items():
+                spreadsheet.add_sheet(sheet_title, rows)
+            self.spreadsheets[spreadsheet_id] = spreadsheet
+            return spreadsheet_id
+
+    def add_sheet(self, spreadsheet_id: str, title: str, rows: Optional[List[List]] = None,
+                  row_count: int = DEFAULT_ROWS, col_count: int = DEFAULT_COLUMNS) -> FakeSheet:
+        with self._lock:
+            spreadsheet = self._spreadsheet(spreadsheet_id)
+            sheet = spreadsheet.add_sheet(title, rows, row_count, col_count)
+            spreadsheet.touch()
+            return sheet
+
+    def rows(self, spreadsheet_id: str, title: str) -> List[List]:
+        """Копия строк листа"""
+        with self._lock:
+            return copy.deepcopy(self._sheet(spreadsheet_id, title).rows)
+
+    def set_rows(self, spreadsheet_id: str, title: str, rows: List[List]):
+        """Заменяет строки листа (ручная правка в интерфейсе Sheets): меняет modifiedTime таблицы"""
+        with self._lock:
+            spreadsheet = self._spreadsheet(spreadsheet_id)
+            sheet = self._resolve(spreadsheet, title)
+            sheet.rows = [list(row) for row in rows]
+            sheet.row_count = max(sheet.row_count, len(sheet.rows))
+            sheet.col_count = max([sheet.col_count] + [len(row) for row in sheet.rows])
+            spreadsheet.touch()
+
+    def load(self, path: str):
+        """Загружает таблицы из JSON {spreadsheet_id: {название листа: строки}}"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for spreadsheet_id, sheets in data.items():
+            self.create_spreadsheet(spreadsheet_id, sheets=sheets)
+        logger.info(f"Fake Google backend: loaded {len(data)} spreadsheets from {path}")
+
+    def dump(self, path: str):
+        """Сохраняет таблицы в JSON того же формата, что load"""
+        with self._lock:
+            data = {spreadsheet.id: {sheet.title: sheet.rows for sheet in spreadsheet.sheets.values()}
+                    for spreadsheet in self.spreadsheets.values()}
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+
+    # --- Ошибки и статистика ---
+
+    def fail_next(self, count: int = 1, status: int = 429, retry_after: Optional[float] = None):
+        """Следующие count запросов завершатся ошибкой status (по умолчанию - квота 429)"""
+        with self._lock:
+            self._failures.extend([(status, retry_after)] * count)
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls.clear()
+            self.batch_requests.clear()
+            self.errors.clear()
+            self.bytes_received = self.bytes_sent = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'requests': sum(self.calls.values()),
+                'sheets_requests': sum(count for operation, count in self.calls.items()
+                                       if operation.startswith('spreadsheets.')),
+                'calls': dict(self.calls),
+                'batch_requests': dict(self.batch_requests),
+                'errors': dict(self.errors),
+                'bytes_received': self.bytes_received,
+                'bytes_sent': self.bytes_sent,
+            }
+
+    # --- Обработка HTTP-запросов ---
+
+    def handle(self, method: str, url: str, body=None) -> Tuple[int, Dict[str, str], bytes]:
+        """Выполняет запрос; возвращает (статус, заголовки, тело ответа). Задержку делает транспорт"""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        body = body or b''
+        parts = urlsplit(url)
+        query = parse_qs(parts.query)
+        operation = self._operation(method.upper(), parts.netloc, parts.path)
+        headers = {'Content-Type': 'application/json; charset=UTF-8'}
+
+        with self._lock:
+            self.calls[operation] += 1
+            self.bytes_received += len(body)
+            failure = self._failures.pop(0) if self._failures else None
+            if failure is None and self.error_rate and self._random.random() < self.error_rate:
+                failure = (429, None)
+            try:
+                if failure is not None:
+                    status, retry_after = failure
+                    if retry_after is not None:
+                        headers['Retry-After'] = str(retry_after)
+                    raise FakeApiError(status, "Quota exceeded for quota metric 'Requests' and limit "
+                                               "'Requests per minute per user' of service 'sheets.googleapis.com'"
+                                       if status == 429 else 'Injected error')
+                payload = self._dispatch(operation, method.upper(), parts.path, query,
+                                         json.loads(body) if body else {})
+                status = 200
+            except FakeApiError as e:
+                status, payload = e.status, self._error(e.status, str(e))
+            except (KeyError, ValueError, TypeError) as e:
+                status, payload = 400, self._error(400, f"Invalid request: {e}")
+            if status >= 400:
+                self.errors[status] += 1
+            content = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.bytes_sent += len(content)
+        return status, headers, content
+
+    @staticmethod
+    def _error(status: int, message: str) -> Dict:
+        return {'error': {'code': status, 'message': message, 'status': _STATUS_NAMES.get(status, 'UNKNOWN')}}
+
+    @staticmethod
+    def _operation(method: str, host: str, path: str) -> str:
+        """Имя метода REST API для счетчиков: spreadsheets.values.get, drive.files.list, ..."""
+        if path.startswith('/drive/v3/files'):
+            return 'drive.files.list' if method == 'GET' else f"drive.files.{method.lower()}"
+        match = _SPREADSHEET_PATH.match(path)
+        if not match:
+            return f"unknown {method} {host}{path}"
+        rest = match.group(2)
+        if not rest:
+            return 'spreadsheets.get'
+        if rest == ':batchUpdate':
+            return 'spreadsheets.batchUpdate'
+        if rest.startswith('/values:'):
+            return f"spreadsheets.values.{rest[len('/values:'):]}"
+        if rest.startswith('/values/'):
+            for action in ('append', 'clear'):
+                if rest.endswith(f":{action}"):
+                    return f"spreadsheets.values.{action}"
+            return 'spreadsheets.values.update' if method == 'PUT' else 'spreadsheets.values.get'
+        return f"unknown {method} {path}"
+
+    def _dispatch(self, operation: str, method: str, path: str, query: Dict, body: Dict) -> Dict:
+        if operation == 'drive.files.list':
+            return self._files_list(query)
+        if operation.startswith('unknown'):
+            raise FakeApiError(404, f"Not found: {method} {path}")
+
+        spreadsheet_id, rest = _SPREADSHEET_PATH.match(path).groups()
+        spreadsheet = self._spreadsheet(spreadsheet_id)
+
+        def param(name: str, default: str = None) -> str:
+            return query.get(name, [default])[0]
+
+        if operation == 'spreadsheets.get':
+            return self._metadata(spreadsheet)
+        if operation == 'spreadsheets.batchUpdate':
+            return self._batch_update(spreadsheet, body.get('requests', []))
+        if operation == 'spreadsheets.values.batchGet':
+            return {'spreadsheetId': spreadsheet.id, 'valueRanges': [
+                self._get_values(spreadsheet, range_name, param('majorDimension', 'ROWS'),
+                                 param('valueRenderOption', 'FORMATTED_VALUE'))
+                for range_name in query.get('ranges', [])
+            ]}
+        if operation == 'spreadsheets.values.batchUpdate':
+            responses = [self._update_values(spreadsheet, item['range'], item.get('values', []),
+                                             body.get('valueInputOption', 'RAW'), item.get('majorDimension'))
+                         for item in body.get('data', [])]
+            spreadsheet.touch()
+            return {'spreadsheetId': spreadsheet.id,
+                    'totalUpdatedRows': sum(r['updatedRows'] for r in responses),
+                    'totalUpdatedCells': sum(r['updatedCells'] for r in responses),
+                    'totalUpdatedSheets': len({r['updatedRange'].partition('!')[0] for r in responses}),
+                    'responses': responses}
+        if operation == 'spreadsheets.values.batchClear':
+            for range_name in body.get('ranges', []):
+                self._clear(spreadsheet, range_name)
+            spreadsheet.touch()
+            return {'spreadsheetId': spreadsheet.id, 'clearedRanges': body.get('ranges', [])}
+
+        range_path = rest[len('/values/'):]
+        if operation in ('spreadsheets.values.append', 'spreadsheets.values.clear'):
+            range_path = range_path.rsplit(':', 1)[0]
+        range_name = unquote(range_path)
+        if operation == 'spreadsheets.values.get':
+            return self._get_values(spreadsheet, range_name, param('majorDimension', 'ROWS'),
+                                    param('valueRenderOption', 'FORMATTED_VALUE'))
+        if operation == 'spreadsheets.values.update':
+            result = self._update_values(spreadsheet, range_name, body.get('values', []),
+                                         param('valueInputOption', 'RAW'), body.get('majorDimension'))
+            spreadsheet.touch()
+            return {'spreadsheetId': spreadsheet.id, **result}
+        if operation == 'spreadsheets.values.append':
+            result = self._append(spreadsheet, range_name, body.get('values', []),
+                                  param('valueInputOption', 'RAW'), param('insertDataOption', 'OVERWRITE'))
+            spreadsheet.touch()
+            return {'spreadsheetId': spreadsheet.id, 'tableRange': range_name, 'updates': result}
+        if operation == 'spreadsheets.values.clear':
+            cleared = self._clear(spreadsheet, range_name)
+            spreadsheet.touch()
+            return {'spreadsheetId': spreadsheet.id, 'clearedRange': cleared}
+        raise FakeApiError(404, f"Unsupported operation: {operation}")
+
+    # --- Таблицы и листы ---
+
+    def _spreadsheet(self, spreadsheet_id: str) -> FakeSpreadsheet:
+        spreadsheet = self.spreadsheets.get(spreadsheet_id)
+        if spreadsheet is None:
+            if not self.auto_create:
+                raise FakeApiError(404, 'Requested entity was not found.')
+            self.create_spreadsheet(spreadsheet_id)
+            spreadsheet = self.spreadsheets[spreadsheet_id]
+            logger.info(f"Fake Google backend: created spreadsheet {spreadsheet_id}")
+        return spreadsheet
+
+    def _sheet(self, spreadsheet_id: str, title: str) -> FakeSheet:
+        return self._resolve(self._spreadsheet(spreadsheet_id), title)
+
+    @staticmethod
+    def _resolve(spreadsheet: FakeSpreadsheet, range_name: str) -> FakeSheet:
+        title, _ = parse_range(range_name)
+        sheet = spreadsheet.sheets.get(title)
+        if sheet is None:
+            raise FakeApiError(400, f"Unable to parse range: {range_name}")
+        return sheet
+
+    def _metadata(self, spreadsheet: FakeSpreadsheet) -> Dict:
+        return {
+            'spreadsheetId': spreadsheet.id,
+            'properties': {'title': spreadsheet.title, 'locale': 'en_US', 'timeZone': 'Etc/GMT'},
+            'sheets': [{'properties': sheet.properties(index)}
+                       for index, sheet in enumerate(spreadsheet.sheets.values())],
+            'spreadsheetUrl': f"https://docs.google.com/spreadsheets/d/{spreadsheet.id}/edit",
+        }
+
+    def _batch_update(self, spreadsheet: FakeSpreadsheet, requests_list: List[Dict]) -> Dict:
+        replies = []
+        for request in requests_list:
+            (kind, params), = request.items()
+            self.batch_requests[kind] += 1
+            reply = {}
+            if kind == 'addSheet':
+                properties = params.get('properties', {})
+                grid = properties.get('gridProperties', {})
+                sheet = spreadsheet.add_sheet(
+                    properties.get('title') or f"Sheet{len(spreadsheet.sheets) + 1}", None,
+                    grid.get('rowCount', DEFAULT_ROWS), grid.get('columnCount', DEFAULT_COLUMNS),
+                    properties.get('sheetId'),
+                )
+                reply = {'addSheet': {'properties': sheet.properties(len(spreadsheet.sheets) - 1)}}
+            elif kind == 'deleteSheet':
+                del spreadsheet.sheets[spreadsheet.sheet_by_id(params['sheetId']).title]
+            elif kind in ('insertDimension', 'deleteDimension'):
+                self._change_dimension(spreadsheet, kind, params['range'])
+            elif kind == 'appendDimension':
+                sheet = spreadsheet.sheet_by_id(params['sheetId'])
+                if params.get('dimension', 'ROWS') == 'ROWS':
+                    sheet.row_count += params['length']
+                else:
+                    sheet.col_count += params['length']
+            elif kind == 'updateSheetProperties':
+                properties = params.get('properties', {})
+                sheet = spreadsheet.sheet_by_id(properties.get('sheetId', 0))
+                grid = properties.get('gridProperties', {})
+                sheet.row_count = grid.get('rowCount', sheet.row_count)
+                sheet.col_count = grid.get('columnCount', sheet.col_count)
+                sheet.frozen_rows = grid.get('frozenRowCount', sheet.frozen_rows)
+                if properties.get('title') and properties['title'] != sheet.title:
+                    spreadsheet.sheets = {(properties['title'] if title == sheet.title else title): value
+                                          for title, value in spreadsheet.sheets.items()}
+                    sheet.title = properties['title']
+            # Форматирование (repeatCell, updateBorders, ...) на значения не влияет
+            replies.append(reply)
+        spreadsheet.touch()
+        return {'spreadsheetId': spreadsheet.id, 'replies': replies}
+
+    @staticmethod
+    def _change_dimension(spreadsheet: FakeSpreadsheet, kind: str, grid_range: Dict):
+        sheet = spreadsheet.sheet_by_id(grid_range.get('sheetId', 0))
+        start, end = grid_range['startIndex'], grid_range['endIndex']
+        if grid_range.get('dimension', 'ROWS') == 'ROWS':
+            if kind == 'insertDimension':
+                if start > sheet.row_count:
+                    raise FakeApiError(400, f"Invalid requests[0].insertDimension: range start index ({start}) "
+                                            f"is after the end of the grid ({sheet.row_count})")
+                sheet.rows[start:start] = [[] for _ in range(end - start)] if start <= len(sheet.rows) else []
+                sheet.row_count += end - start
+            else:
+                del sheet.rows[start:end]
+                sheet.row_count -= min(end, sheet.row_count) - start
+        else:
+            for row in sheet.rows:
+                if kind == 'insertDimension':
+                    if start < len(row):
+                        row[start:start] = [''] * (end - start)
+                else:
+                    del row[start:end]
+            sheet.col_count += (end - start) if kind == 'insertDimension' else -(end - start)
+
+    # --- Значения ---
+
+    def _get_values(self, spreadsheet: FakeSpreadsheet, range_name: str, major: str, render: str) -> Dict:
+        sheet = self._resolve(spreadsheet, range_name)
+        _, grid = parse_range(range_name)
+        row_start, row_end = grid.get('startRowIndex', 0), grid.get('endRowIndex', sheet.row_count)
+        col_start, col_end = grid.get('startColumnIndex', 0), grid.get('endColumnIndex', sheet.col_count)
+        render_value = formatted if render == 'FORMATTED_VALUE' else (lambda value: value)
+        rows = [[render_value(value) for value in row[col_start:col_end]] for row in sheet.rows[row_start:row_end]]
+        if major == 'COLUMNS':
+            width = max((len(row) for row in rows), default=0)
+            rows = [[row[i] if i < len(row) else '' for row in rows] for i in range(width)]
+        value_range = {'range': range_name, 'majorDimension': major}
+        values = _trim(rows)
+        if values:
+            value_range['values'] = values
+        return value_range
+
+    def _write(self, sheet: FakeSheet, row_start: int, col_start: int, values: List[List], option: str):
+        convert = user_entered if option == 'USER_ENTERED' else (lambda value: value)
+        for r, row_values in enumerate(values, start=row_start):
+            while len(sheet.rows) <= r:
+                sheet.rows.append([])
+            row = sheet.rows[r]
+            for c, value in enumerate(row_values, start=col_start):
+                if c >= len(row):
+                    row.extend([''] * (c + 1 - len(row)))
+                row[c] = '' if value is None else convert(value)
+
+    def _update_values(self, spreadsheet: FakeSpreadsheet, range_name: str, values: List[List],
+                       option: str, major: Optional[str] = None) -> Dict:
+        sheet = self._resolve(spreadsheet, range_name)
+        _, grid = parse_range(range_name)
+        if major == 'COLUMNS':
+            width = max((len(column) for column in values), default=0)
+            values = [[column[i] if i < len(column) else None for column in values] for i in range(width)]
+        row_start, col_start = grid.get('startRowIndex', 0), grid.get('startColumnIndex', 0)
+        width = max((len(row) for row in values), default=0)
+        if row_start + len(values) > sheet.row_count or col_start + width > sheet.col_count:
+            raise FakeApiError(400, f"Range ({range_name}) exceeds grid limits. "
+                                    f"Max rows: {sheet.row_count}, max columns: {sheet.col_count}")
+        self._write(sheet, row_start, col_start, values, option)
+        return {'updatedRange': range_name, 'updatedRows': len(values), 'updatedColumns': width,
+                'updatedCells': sum(len(row) for row in values)}
+
+    def _append(self, spreadsheet: FakeSpreadsheet, range_name: str, values: List[List],
+                option: str, insert_option: str) -> Dict:
+        """
+        Как values.append: "таблица" - непрерывный блок непустых строк, начиная
+        с первой непустой строки диапазона; значения пишутся сразу под ним.
+        Пустая ячейка A{n} (worksheet.insert_row) заполняется на месте.
+        """
+        sheet = self._resolve(spreadsheet, range_name)
+        _, grid = parse_range(range_name)
+        start = grid.get('startRowIndex', 0)
+        end = min(grid.get('endRowIndex', len(sheet.rows)), len(sheet.rows))
+        position = start
+        first = next((r for r in range(start, end) if any(v not in ('', None) for v in sheet.rows[r])), None)
+        if first is not None:
+            position = first
+            while position < len(sheet.rows) and any(v not in ('', None) for v in sheet.rows[position]):
+                position += 1
+        if insert_option == 'INSERT_ROWS':
+            sheet.rows[position:position] = [[] for _ in values] if position <= len(sheet.rows) else []
+            sheet.row_count += len(values)
+        sheet.row_count = max(sheet.row_count, position + len(values))
+        col_start = grid.get('startColumnIndex', 0)
+        sheet.col_count = max([sheet.col_count] + [col_start + len(row) for row in values])
+        self._write(sheet, position, col_start, values, option)
+        return {'spreadsheetId': spreadsheet.id, 'updatedRows': len(values),
+                'updatedRange': f"{range_name.partition('!')[0]}!A{position + 1}",
+                'updatedCells': sum(len(row) for row in values)}
+
+    def _clear(self, spreadsheet: FakeSpreadsheet, range_name: str) -> str:
+        sheet = self._resolve(spreadsheet, range_name)
+        _, grid = parse_range(range_name)
+        col_start, col_end = grid.get('startColumnIndex', 0), grid.get('endColumnIndex')
+        for row in sheet.rows[grid.get('startRowIndex', 0):grid.get('endRowIndex')]:
+            for c in range(col_start, min(col_end or len(row), len(row))):
+                row[c] = ''
+        return range_name
+
+    # --- Drive ---
+
+    def _files_list(self, query: Dict) -> Dict:
+        page_size = min(int(query.get('pageSize', ['100'])[0]), 1000)  # Как в Drive: не больше 1000
+        offset = int(query.get('pageToken', ['0'])[0])
+        spreadsheets = list(self.spreadsheets.values())
+        page = spreadsheets[offset:offset + page_size]
+        result = {'files': [{'id': s.id, 'name': s.title, 'modifiedTime': s.modified_time,
+                             'mimeType': 'application/vnd.google-apps.spreadsheet'} for s in page]}
+        if offset + page_size < len(spreadsheets):
+            result['nextPageToken'] = str(offset + page_size)
+        return result
+
+
+class FakeRequestsAdapter(requests.adapters.BaseAdapter):
+    """Транспорт requests (AuthorizedSession, gspread) поверх фейкового бэкенда"""
+
+    def __init__(self, backend: FakeGoogleBackend):
+        super().__init__()
+        self.backend = backend
+
+    def send(self, request, **kwargs):
+        if self.backend.latency:
+            time.sleep(self.backend.latency)
+        status, headers, content = self.backend.handle(request.method, request.url, request.body)
+        response = requests.Response()
+        response.status_code = status
+        response.reason = 'OK' if status < 400 else _STATUS_NAMES.get(status, 'Error')
+        response.headers = CaseInsensitiveDict(headers)
+        response.encoding = 'utf-8'
+        response._content = content
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class FakeHttp:
+    """Замена httplib2.Http для сервиса Drive (googleapiclient)"""
+
+    def __init__(self, backend: FakeGoogleBackend):
+        self.backend = backend
+
+    def request(self, uri, method='GET', body=None, headers=None, redirections=None, connection_type=None):
+        if self.backend.latency:
+            time.sleep(self.backend.latency)
+        status, response_headers, content = self.backend.handle(method, uri, body)
+        return httplib2.Response({'status': str(status), **response_headers}), content
+
+    def close(self):
+        pass
+
+
+class FakeAsyncTransport(httpx.AsyncBaseTransport):
+    """Транспорт httpx для AsyncSheetsClient (задержка не блокирует цикл событий)"""
+
+    def __init__(self, backend: FakeGoogleBackend):
+        self.backend = backend
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if self.backend.latency:
+            await asyncio.sleep(self.backend.latency)
+        body = await request.aread()
+        status, headers, content = self.backend.handle(request.method, str(request.url), body)
+        return httpx.Response(status, headers=headers, content=content, request=request)
+
+
+def create_fake_backend() -> FakeGoogleBackend:
+    """Бэкенд по настройкам FAKE_GOOGLE_*: неизвестные таблицы создаются при первом обращении"""
+    backend = FakeGoogleBackend(latency=FAKE_GOOGLE_LATENCY, error_rate=FAKE_GOOGLE_ERROR_RATE, auto_create=True)
+    if FAKE_GOOGLE_DATA:
+        backend.load(FAKE_GOOGLE_DATA)
+    logger.warning("Using in-process fake Google Sheets/Drive backend (GOOGLE_BACKEND=fake)")
+    return backend
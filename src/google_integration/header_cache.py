@@ -0,0 +1,138 @@
+"""
+Кеш проверенных заголовков листов Google Sheets
+
+Заголовки листа меняются крайне редко, поэтому проверенная раскладка
+(заголовки и карта "название колонки -> номер колонки") запоминается для
+каждого листа. Вместе с ней хранится версия метаданных листа (ID листа и
+количество колонок) - она приходит вместе с метаданными таблицы, которые
+открываются при каждой операции, так что ее проверка не стоит запросов.
+
+Версия метаданных не замечает перестановку или переименование колонок,
+поэтому раскладка хранит и отпечаток строки заголовков: каждое чтение
+первой строки (пакетная проверка verify_headers) сверяется с ним, и при
+расхождении запись заменяется раскладкой фактических заголовков.
+
+Запись сбрасывается, если версия метаданных изменилась, отпечаток не совпал
+с прочитанной строкой заголовков или запись в лист завершилась ошибкой
+раскладки (колонка не найдена, диапазон вне сетки).
+"""
+import hashlib
+import json
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from ..config.settings import logger
+from .rate_limiter import ErrorKind, classify_error
+from .sheets_metrics import metrics
+
+LayoutKey = Tuple[str, str]
+
+
+@dataclass
+class HeaderLayout:
+    """Проверенная раскладка заголовков листа"""
+    headers: List[str]
+    version: Optional[Tuple] = None
+    columns: Dict[str, int] = field(default_factory=dict)
+
+    def __post_init__(self):
+        if not self.columns:
+            # Номера колонок с 1, как в gspread (первое вхождение названия)
+            for index, header in enumerate(self.headers, start=1):
+                self.columns.setdefault(header, index)
+
+    @property
+    def fingerprint(self) -> str:
+        return headers_fingerprint(self.headers)
+
+    def column(self, header: str) -> Optional[int]:
+        return self.columns.get(header)
+
+
+def headers_fingerprint(headers: List) -> str:
+    """Отпечаток строки заголовков (порядок и названия колонок)"""
+    payload = json.dumps([str(header) for header in headers], ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def worksheet_version(worksheet) -> Optional[Tuple]:
+    """Версия метаданных листа gspread: ID листа и количество колонок"""
+    try:
+        return (worksheet.id, worksheet.col_count)
+    except Exception:
+        return None
+
+
+class HeaderLayoutCache:
+    """Потокобезопасный кеш раскладок заголовков по (spreadsheet_id, sheet_name)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._layouts: Dict[LayoutKey, HeaderLayout] = {}
+
+    def get(self, spreadsheet_id: str, sheet_name: str,
+            version: Optional[Tuple] = None) -> Optional[HeaderLayout]:
+        """Возвращает раскладку, если она проверена для этой версии метаданных"""
+        key = (spreadsheet_id, sheet_name)
+        with self._lock:
+            layout = self._layouts.get(key)
+            if layout is not None and version is not None and layout.version != version:
+                logger.info(f"Sheet metadata changed for {sheet_name}, header layout invalidated")
+                del self._layouts[key]
+                layout = None
+        metrics.inc('sheets_header_cache_total', result='hit' if layout else 'miss')
+        return layout
+
+    def store(self, spreadsheet_id: str, sheet_name: str, headers: List[str],
+              version: Optional[Tuple] = None) -> HeaderLayout:
+        layout = HeaderLayout(list(headers), version)
+        with self._lock:
+            self._layouts[(spreadsheet_id, sheet_name)] = layout
+        return layout
+
+    def observe(self, spreadsheet_id: str, sheet_name: str, headers: List[str],
+                version: Optional[Tuple] = None) -> HeaderLayout:
+        """
+        Запоминает фактическую строку заголовков, прочитанную из листа.
+        Если отпечаток кешированной раскладки с ней не совпадает (колонки
+        переставлены или переименованы), раскладка заменяется.
+        """
+        layout = HeaderLayout(list(headers), version)
+        key = (spreadsheet_id, sheet_name)
+        with self._lock:
+            cached = self._layouts.get(key)
+            changed = cached is not None and cached.fingerprint != layout.fingerprint
+            self._layouts[key] = layout
+        if changed:
+            logger.info(f"Header row changed on {sheet_name}, header layout invalidated")
+            metrics.inc('sheets_header_cache_invalidations_total')
+        return layout
+
+    def invalidate(self, spreadsheet_id: str, sheet_name: Optional[str] = None):
+        """Сбрасывает раскладку листа (или всех листов таблицы)"""
+        with self._lock:
+            if sheet_name is not None:
+                self._layouts.pop((spreadsheet_id, sheet_name), None)
+            else:
+                for key in [key for key in self._layouts if key[0] == spreadsheet_id]:
+                    del self._layouts[key]
+        metrics.inc('sheets_header_cache_invalidations_total')
+
+    def clear(self):
+        with self._lock:
+            self._layouts.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._layouts)
+
+
+def is_layout_error(error: BaseException) -> bool:
+    """Ошибка записи, вызванная устаревшей раскладкой листа (400: диапазон вне сетки и т.п.)"""
+    info = classify_error(error)
+    return info.kind == ErrorKind.CLIENT and info.status == 400
+
+
+# Общий кеш раскладок заголовков
+header_cache = HeaderLayoutCache()
@@ -0,0 +1,113 @@
+"""
+Кеш строк платежей в листах ролей
+
+Для каждого листа хранится {ID платежа: строка}, построенный по колонке ID
+и поддерживаемый после добавлений и удалений, выполненных менеджером
+платежей. Позиция перед записью проверяется по ячейке ID, поэтому устаревший
+кеш (лист изменен вручную) приводит к перечитыванию колонки, а не к записи
+не в ту строку. Полное чтение листа (синхронизация) строит строки заново,
+в остальном кеш листа живет не дольше PAYMENTS_ROW_CACHE_TTL секунд.
+"""
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .sheets_metrics import metrics
+from ..config.settings import PAYMENTS_ROW_CACHE_TTL
+
+SheetKey = Tuple[str, str]
+
+# Первая строка диапазона ответа API: 'Лист'!A12:I14 -> 12
+_RANGE_FIRST_ROW = re.compile(r'!\$?[A-Za-z]*\$?(\d+)')
+
+
+def first_row_of_range(range_name: str) -> Optional[int]:
+    match = _RANGE_FIRST_ROW.search(range_name or '')
+    return int(match.group(1)) if match else None
+
+
+def payment_id_text(value) -> str:
+    """ID платежа из ячейки (неформатированные значения приходят числами)"""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+class PaymentSheetRows:
+    """Строки платежей одного листа"""
+
+    def __init__(self, id_column: List, loaded_at: float):
+        self.rows: Dict[str, int] = {}
+        for row, value in enumerate(id_column[1:], start=2):
+            payment_id = payment_id_text(value)
+            if payment_id:
+                self.rows.setdefault(payment_id, row)
+        self.loaded_at = loaded_at
+
+    def get(self, payment_id) -> Optional[int]:
+        return self.rows.get(str(payment_id))
+
+    def __contains__(self, payment_id) -> bool:
+        return str(payment_id) in self.rows
+
+
+class PaymentRowCache:
+    """Потокобезопасный кеш {ID платежа: строка} по (spreadsheet_id, лист)"""
+
+    def __init__(self, ttl: float = PAYMENTS_ROW_CACHE_TTL):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._sheets: Dict[SheetKey, PaymentSheetRows] = {}
+        self.generation = 0  # Растет при сбросе всей таблицы (сбрасывает и дескрипторы листов)
+
+    def get(self, spreadsheet_id: str, sheet_name: str) -> Optional[PaymentSheetRows]:
+        key = (spreadsheet_id, sheet_name)
+        with self._lock:
+            rows = self._sheets.get(key)
+            if rows is not None and time.monotonic() - rows.loaded_at > self.ttl:
+                del self._sheets[key]
+                rows = None
+        metrics.inc('sheets_payment_rows_total', result='hit' if rows else 'miss')
+        return rows
+
+    def store(self, spreadsheet_id: str, sheet_name: str, id_column: List) -> PaymentSheetRows:
+        """Строит строки листа по колонке ID (включая заголовок)"""
+        rows = PaymentSheetRows(id_column, time.monotonic())
+        if self.ttl > 0:
+            with self._lock:
+                self._sheets[(spreadsheet_id, sheet_name)] = rows
+        return rows
+
+    def appended(self, spreadsheet_id: str, sheet_name: str, payment_ids: Iterable, first_row: int):
+        """Платежи записаны подряд начиная со строки first_row"""
+        with self._lock:
+            rows = self._sheets.get((spreadsheet_id, sheet_name))
+            if rows is not None:
+                for row, payment_id in enumerate(payment_ids, start=first_row):
+                    rows.rows[str(payment_id)] = row
+
+    def deleted(self, spreadsheet_id: str, sheet_name: str, payment_id, row: int):
+        """Строка row удалена, строки ниже сдвинулись вверх"""
+        with self._lock:
+            rows = self._sheets.get((spreadsheet_id, sheet_name))
+            if rows is not None:
+                rows.rows.pop(str(payment_id), None)
+                for key, value in rows.rows.items():
+                    if value > row:
+                        rows.rows[key] = value - 1
+
+    def invalidate(self, spreadsheet_id: str, sheet_name: Optional[str] = None):
+        """Сбрасывает строки листа (или всех листов таблицы вместе с дескрипторами)"""
+        with self._lock:
+            if sheet_name is not None:
+                self._sheets.pop((spreadsheet_id, sheet_name), None)
+            else:
+                for key in [key for key in self._sheets if key[0] == spreadsheet_id]:
+                    del self._sheets[key]
+                self.generation += 1
+        metrics.inc('sheets_payment_rows_invalidations_total')
+
+
+# Общий кеш: менеджеры платежей (воркер, синхронизация, main) видят одни и те же строки
+payment_row_cache = PaymentRowCache()
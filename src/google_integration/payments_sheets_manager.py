@@ -1,11 +1,25 @@
 """
 Менеджер для работы с Google Sheets таблицами платежей
 Создает и управляет отдельными листами для каждой роли
+
+Дескрипторы листов ролей кешируются (для каждого потока), а строки
+платежей - в общем кеше payment_row_cache: добавление платежа - один
+запрос append, обновление и удаление - проверка ячейки ID и запись.
 """
 
+import threading
 from datetime import datetime
 from typing import Optional, List, Dict
-from .sheets_manager import GoogleSheetsManager
+
+import numpy as np
+import pandas as pd
+from gspread.utils import absolute_range_name, rowcol_to_a1
+
+from .sheets_manager import GoogleSheetsManager, sheets_manager as default_sheets_manager
+from .header_cache import worksheet_version
+from .payment_rows import PaymentRowCache, PaymentSheetRows, first_row_of_range, payment_row_cache
+from .sheet_columns import BATCH_GET_PARAMS, SheetColumns, cell_text, clean_amounts, serial_dates_to_text
+from .sheets_metrics import metrics
 from ..config.settings import PAYMENTS_SPREADSHEET_ID, UserRole, logger
 from ..utils.config_utils import get_role_display_name
 
@@ -35,9 +49,12 @@ class PaymentsSheetsManager:
         'Թերթիկի անուն'  # Sheet Name (для двойной записи)
     ]
 
-    def __init__(self):
-        self.sheets_manager = GoogleSheetsManager()
+    def __init__(self, sheets_manager: Optional[GoogleSheetsManager] = None):
+        # Общий менеджер: один кеш токена и пул сессий на процесс
+        self.sheets_manager = sheets_manager or default_sheets_manager
         self.spreadsheet_id = PAYMENTS_SPREADSHEET_ID
+        self.row_cache: PaymentRowCache = payment_row_cache
+        self._local = threading.local()
 
         if not self.spreadsheet_id:
             logger.warning("PAYMENTS_SPREADSHEET_ID not set in environment variables")
@@ -77,6 +94,17 @@ class PaymentsSheetsManager:
             else:
                 logger.info("All necessary sheets already exist")
 
+            # Заголовки всех листов ролей проверяются одним пакетным запросом
+            verified = self.sheets_manager.verify_headers(
+                spreadsheet, self.HEADERS, sheet_names=list(self.SHEET_NAMES.values())
+            )
+            for sheet_name, matches in verified.items():
+                if not matches:
+                    self._ensure_headers(spreadsheet, sheet_name)
+
+            # Листы могли быть созданы или заголовки вставлены - строки перечитываются
+            self.row_cache.invalidate(self.spreadsheet_id)
+
             logger.info("Payments table initialization completed")
             return True
 
@@ -109,9 +137,15 @@ class PaymentsSheetsManager:
             raise
 
     def _ensure_headers(self, spreadsheet, sheet_name: str):
-        """Проверяет наличие заголовков в листе, добавляет если нет"""
+        """Проверяет наличие заголовков в листе, добавляет если нет (проверка кешируется)"""
         try:
             worksheet = spreadsheet.worksheet(sheet_name)
+            header_cache = self.sheets_manager.header_cache
+            version = worksheet_version(worksheet)
+
+            layout = header_cache.get(spreadsheet.id, sheet_name, version)
+            if layout and layout.headers == self.HEADERS:
+                return
 
             # Проверяем первую строку
             first_row = worksheet.row_values(1)
@@ -126,6 +160,8 @@ class PaymentsSheetsManager:
                     'backgroundColor': {'red': 0.9, 'green': 0.9, 'blue': 0.9}
                 })
 
+            header_cache.store(spreadsheet.id, sheet_name, self.HEADERS, version)
+
         except Exception as e:
             logger.error(f"Error checking headers in {sheet_name}: {e}")
 
@@ -133,6 +169,59 @@ class PaymentsSheetsManager:
         """Возвращает название листа для указанной роли"""
         return self.SHEET_NAMES.get(role)
 
+    def _worksheet(self, sheet_name: str):
+        """Лист роли: дескрипторы всех листов таблицы открываются одним запросом, один раз на поток"""
+        handles = getattr(self._local, 'worksheets', None)
+        if handles is None or self._local.generation != self.row_cache.generation:
+            handles = self._local.worksheets = {}
+            self._local.generation = self.row_cache.generation
+
+        worksheet = handles.get(sheet_name)
+        if worksheet is None:
+            spreadsheet = self.sheets_manager.open_sheet_by_id(self.spreadsheet_id)
+            if not spreadsheet:
+                logger.error(f"Failed to open table: {self.spreadsheet_id}")
+                return None
+            for handle in spreadsheet.worksheets():
+                handles.setdefault(handle.title, handle)
+            worksheet = handles.get(sheet_name)
+            if worksheet is None:
+                worksheet = handles[sheet_name] = spreadsheet.worksheet(sheet_name)
+        return worksheet
+
+    def _forget_sheet(self, sheet_name: str):
+        """Сбрасывает дескриптор и строки листа после ошибки API"""
+        getattr(self._local, 'worksheets', {}).pop(sheet_name, None)
+        self.row_cache.invalidate(self.spreadsheet_id, sheet_name)
+
+    def _payment_rows(self, worksheet, sheet_name: str) -> PaymentSheetRows:
+        """Строки платежей листа (из кеша или по колонке ID)"""
+        rows = self.row_cache.get(self.spreadsheet_id, sheet_name)
+        if rows is None:
+            rows = self.row_cache.store(self.spreadsheet_id, sheet_name, worksheet.col_values(1))
+        return rows
+
+    def _find_payment_row(self, worksheet, sheet_name: str, payment_id: int) -> Optional[int]:
+        """Строка платежа: позиция из кеша проверяется по ячейке ID, при несовпадении колонка перечитывается"""
+        rows = self.row_cache.get(self.spreadsheet_id, sheet_name)
+        if rows is not None:
+            row_index = rows.get(payment_id)
+            if row_index is not None and str(worksheet.acell(f'A{row_index}').value or '').strip() == str(payment_id):
+                return row_index
+            logger.info(f"Cached rows of sheet '{sheet_name}' are stale, reloading ID column")
+            metrics.inc('sheets_payment_rows_total', result='stale')
+        rows = self.row_cache.store(self.spreadsheet_id, sheet_name, worksheet.col_values(1))
+        return rows.get(payment_id)
+
+    def _appended(self, sheet_name: str, payment_ids: List, response) -> None:
+        """Запоминает строки, в которые API записал добавленные платежи"""
+        updated_range = ((response or {}).get('updates') or {}).get('updatedRange')
+        first_row = first_row_of_range(updated_range)
+        if first_row is None:
+            self.row_cache.invalidate(self.spreadsheet_id, sheet_name)
+        else:
+            self.row_cache.appended(self.spreadsheet_id, sheet_name, payment_ids, first_row)
+
     def add_payment_to_sheet(
         self,
         payment_id: int,
@@ -173,17 +262,13 @@ class PaymentsSheetsManager:
                 logger.error(f"Sheet not found for role: {role}")
                 return False
 
-            # Открываем таблицу и лист
-            spreadsheet = self.sheets_manager.open_sheet_by_id(self.spreadsheet_id)
-            if not spreadsheet:
-                logger.error(f"Failed to open table: {self.spreadsheet_id}")
+            # Открываем лист (дескриптор кешируется)
+            worksheet = self._worksheet(sheet_name)
+            if worksheet is None:
                 return False
 
-            worksheet = spreadsheet.worksheet(sheet_name)
-
             # Проверяем, существует ли уже платеж с таким ID
-            id_column = worksheet.col_values(1)  # Первая колонка - ID
-            if str(payment_id) in id_column:
+            if payment_id in self._payment_rows(worksheet, sheet_name):
                 logger.info(f"Payment #{payment_id} already exists in sheet '{sheet_name}', skipping")
                 return True  # Возвращаем True, т.к. это не ошибка
 
@@ -203,7 +288,8 @@ class PaymentsSheetsManager:
             ]
 
             # Добавляем строку
-            worksheet.append_row(row_data)
+            response = worksheet.append_row(row_data)
+            self._appended(sheet_name, [payment_id], response)
 
             logger.info(
                 f"Payment #{payment_id} added to sheet '{sheet_name}' "
@@ -212,6 +298,8 @@ class PaymentsSheetsManager:
             return True
 
         except Exception as e:
+            if sheet_name:
+                self._forget_sheet(sheet_name)
             logger.error(f"Error adding payment to table: {e}", exc_info=True)
             return False
 
@@ -228,6 +316,7 @@ class PaymentsSheetsManager:
                 - date_from: Optional[str]
                 - date_to: Optional[str]
                 - comment: Optional[str]
+                - created_at: Optional[str] (по умолчанию - текущее время)
                 - target_spreadsheet_id: Optional[str]
                 - target_sheet_name: Optional[str]
             role: Роль пользователя (определяет лист)
@@ -250,16 +339,13 @@ class PaymentsSheetsManager:
                 logger.error(f"Sheet not found for role: {role}")
                 return False
 
-            # Открываем таблицу и лист
-            spreadsheet = self.sheets_manager.open_sheet_by_id(self.spreadsheet_id)
-            if not spreadsheet:
-                logger.error(f"Failed to open table: {self.spreadsheet_id}")
+            # Открываем лист (дескриптор кешируется)
+            worksheet = self._worksheet(sheet_name)
+            if worksheet is None:
                 return False
 
-            worksheet = spreadsheet.worksheet(sheet_name)
-
-            # Получаем существующие ID для проверки дубликатов
-            existing_ids = set(worksheet.col_values(1))  # Первая колонка - ID
+            # Существующие ID для проверки дубликатов
+            existing_ids = self._payment_rows(worksheet, sheet_name)
 
             # Подготавливаем данные для пакетной вставки (только новые платежи)
             rows_data = []
@@ -270,7 +356,7 @@ class PaymentsSheetsManager:
                 if payment_id in existing_ids:
                     skipped_count += 1
                     continue
-                created_at = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                created_at = payment.get('created_at') or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
 
                 row_data = [
                     str(payment.get('payment_id', '')),
@@ -287,7 +373,8 @@ class PaymentsSheetsManager:
 
             # Пакетная вставка всех строк за один раз (только если есть новые)
             if rows_data:
-                worksheet.append_rows(rows_data)
+                response = worksheet.append_rows(rows_data)
+                self._appended(sheet_name, [row[0] for row in rows_data], response)
                 logger.info(
                     f"Batch insertion: {len(rows_data)} payments added to sheet '{sheet_name}'"
                     f"{f', {skipped_count} duplicates skipped' if skipped_count else ''}"
@@ -299,13 +386,19 @@ class PaymentsSheetsManager:
             return True
 
         except Exception as e:
+            if sheet_name:
+                self._forget_sheet(sheet_name)
             logger.error(f"Error in batch payment insertion: {e}", exc_info=True)
             return False
 
-    def get_payments_from_sheet(self, role: str) -> List[Dict]:
+    def get_payments_from_sheet(self, role: str, spreadsheet=None) -> List[Dict]:
         """
         Загружает все платежи из листа указанной роли
 
+        Args:
+            role: Роль (определяет лист)
+            spreadsheet: уже открытая таблица платежей (None - открыть)
+
         Returns:
             Список словарей с данными платежей
         """
@@ -319,35 +412,16 @@ class PaymentsSheetsManager:
                 logger.error(f"Sheet not found for role: {role}")
                 return []
 
-            spreadsheet = self.sheets_manager.open_sheet_by_id(self.spreadsheet_id)
+            if spreadsheet is None:
+                spreadsheet = self.sheets_manager.open_sheet_by_id(self.spreadsheet_id)
             if not spreadsheet:
                 logger.error(f"Failed to open table: {self.spreadsheet_id}")
                 return []
 
-            worksheet = spreadsheet.worksheet(sheet_name)
-
-            # Получаем все записи (кроме заголовка)
-            records = worksheet.get_all_records()
-
-            # Преобразуем в нужный формат
-            payments = []
-            for record in records:
-                # Пропускаем пустые записи
-                if not record.get('ID'):
-                    continue
-
-                payment = {
-                    'id': int(record['ID']),
-                    'user_display_name': record.get('Անուն', ''),
-                    'amount': float(record.get('Գումար', 0)),
-                    'date_from': record.get('Սկզբնական ամսաթիվ', ''),
-                    'date_to': record.get('Վերջնական ամսաթիվ', ''),
-                    'comment': record.get('Մեկնաբանություն', ''),
-                    'created_at': record.get('Ստեղծման ամսաթիվ', ''),
-                    'spreadsheet_id': record.get('Աղյուսակի ID', ''),
-                    'sheet_name': record.get('Թերթիկի անուն', '')
-                }
-                payments.append(payment)
+            # Лист читается неформатированными значениями по колонкам
+            data = self.sheets_manager.read_sheets(spreadsheet, [sheet_name])[sheet_name]
+            payments = self._payments_from_columns(data)
+            self.row_cache.store(self.spreadsheet_id, sheet_name, ['ID'] + data.column('ID'))
 
             logger.info(f"Loaded {len(payments)} payments from sheet '{sheet_name}'")
             return payments
@@ -356,17 +430,78 @@ class PaymentsSheetsManager:
             logger.error(f"Error loading payments from table: {e}", exc_info=True)
             return []
 
+    def _payments_from_columns(self, data: SheetColumns, first_row: int = 2) -> List[Dict]:
+        """
+        Платежи листа из его колонок (очистка ID, сумм и дат - по колонкам целиком);
+        first_row - номер строки листа, с которой начинаются данные
+        """
+        if not data.row_count:
+            return []
+
+        def column(header: str) -> pd.Series:
+            return pd.Series(data.column(header), dtype=object)
+
+        # Пропускаем пустые записи
+        ids = pd.to_numeric(column('ID'), errors='coerce')
+        valid = np.flatnonzero((ids.fillna(0) != 0).to_numpy())
+
+        amounts = clean_amounts(column('Գումար')).fillna(0.0)
+        names = cell_text(column('Անուն'))
+        comments = cell_text(column('Մեկնաբանություն'))
+        date_from = cell_text(serial_dates_to_text(column('Սկզբնական ամսաթիվ'), '%Y-%m-%d'))
+        date_to = cell_text(serial_dates_to_text(column('Վերջնական ամսաթիվ'), '%Y-%m-%d'))
+        created_at = cell_text(serial_dates_to_text(column('Ստեղծման ամսաթիվ'), '%Y-%m-%d %H:%M:%S'))
+        spreadsheet_ids = cell_text(column('Աղյուսակի ID'))
+        sheet_names = cell_text(column('Թերթիկի անուն'))
+
+        return [
+            {
+                'id': int(ids.iat[index]),
+                'user_display_name': names.iat[index],
+                'amount': float(amounts.iat[index]),
+                'date_from': date_from.iat[index],
+                'date_to': date_to.iat[index],
+                'comment': comments.iat[index],
+                'created_at': created_at.iat[index],
+                'spreadsheet_id': spreadsheet_ids.iat[index],
+                'sheet_name': sheet_names.iat[index],
+                'row': first_row + int(index)
+            }
+            for index in valid
+        ]
+
     def get_all_payments_from_sheets(self) -> List[Dict]:
         """
-        Загружает все платежи из всех листов
+        Загружает все платежи из всех листов (одним запросом values.batchGet)
 
         Returns:
             Список всех платежей со всех листов
         """
+        if not self.spreadsheet_id:
+            logger.error("PAYMENTS_SPREADSHEET_ID not set")
+            return []
+
+        spreadsheet = self.sheets_manager.open_sheet_by_id(self.spreadsheet_id)
+        if not spreadsheet:
+            logger.error(f"Failed to open table: {self.spreadsheet_id}")
+            return []
+
+        try:
+            sheets_data = self.sheets_manager.read_sheets(spreadsheet, list(self.SHEET_NAMES.values()))
+        except Exception as e:
+            # Например, лист одной из ролей отсутствует - читаем листы по отдельности
+            logger.warning(f"Batch read of payment sheets failed, loading sheets one by one: {e}")
+            sheets_data = None
+
         all_payments = []
 
-        for role in self.SHEET_NAMES.keys():
-            payments = self.get_payments_from_sheet(role)
+        for role, sheet_name in self.SHEET_NAMES.items():
+            if sheets_data is not None:
+                payments = self._payments_from_columns(sheets_data[sheet_name])
+                self.row_cache.store(self.spreadsheet_id, sheet_name, ['ID'] + sheets_data[sheet_name].column('ID'))
+                logger.info(f"Loaded {len(payments)} payments from sheet '{sheet_name}'")
+            else:
+                payments = self.get_payments_from_sheet(role, spreadsheet)
             # Добавляем информацию о роли
             for payment in payments:
                 payment['role'] = role
@@ -375,6 +510,52 @@ class PaymentsSheetsManager:
         logger.info(f"Loaded total {len(all_payments)} payments from all sheets")
         return all_payments
 
+    def get_payments_from_rows(self, first_rows: Dict[str, int]) -> Optional[Dict[str, List[Dict]]]:
+        """
+        Загружает платежи листов начиная с указанных строк одним запросом
+        values.batchGet (заголовки и строки от first_rows[лист] до конца)
+
+        Args:
+            first_rows: {имя листа: первая строка}
+
+        Returns:
+            {имя листа: платежи с номерами строк} или None при ошибке чтения
+        """
+        if not self.spreadsheet_id:
+            logger.error("PAYMENTS_SPREADSHEET_ID not set")
+            return None
+
+        try:
+            spreadsheet = self.sheets_manager.open_sheet_by_id(self.spreadsheet_id)
+            if not spreadsheet:
+                logger.error(f"Failed to open table: {self.spreadsheet_id}")
+                return None
+
+            sheet_names = list(first_rows)
+            last_column = rowcol_to_a1(1, len(self.HEADERS))[:-1]
+            ranges = []
+            for sheet_name in sheet_names:
+                ranges.append(absolute_range_name(sheet_name, '1:1'))
+                ranges.append(absolute_range_name(sheet_name, f"A{first_rows[sheet_name]}:{last_column}"))
+            value_ranges = spreadsheet.values_batch_get(ranges, params=dict(BATCH_GET_PARAMS)).get('valueRanges', [])
+
+            result = {}
+            for i, sheet_name in enumerate(sheet_names):
+                header_columns = value_ranges[2 * i].get('values') or []
+                rows_columns = value_ranges[2 * i + 1].get('values') or []
+                # Заголовки ставятся над прочитанными строками - колонки разбираются как целый лист
+                columns = [
+                    header[:1] + (rows_columns[column] if column < len(rows_columns) else [])
+                    for column, header in enumerate(header_columns)
+                ]
+                data = SheetColumns.from_value_range(sheet_name, {'values': columns})
+                result[sheet_name] = self._payments_from_columns(data, first_rows[sheet_name])
+            return result
+
+        except Exception as e:
+            logger.error(f"Error loading payment sheet rows: {e}", exc_info=True)
+            return None
+
     def update_payment_in_sheet(
         self,
         payment_id: int,
@@ -403,18 +584,13 @@ class PaymentsSheetsManager:
                 logger.error(f"Sheet not found for role: {role}")
                 return False
 
-            spreadsheet = self.sheets_manager.open_sheet_by_id(self.spreadsheet_id)
-            if not spreadsheet:
+            worksheet = self._worksheet(sheet_name)
+            if worksheet is None:
                 return False
 
-            worksheet = spreadsheet.worksheet(sheet_name)
-
             # Находим строку с нужным ID
-            id_column = worksheet.col_values(1)  # Первая колонка - ID
-
-            try:
-                row_index = id_column.index(str(payment_id)) + 1  # +1 т.к. индексация с 1
-            except ValueError:
+            row_index = self._find_payment_row(worksheet, sheet_name, payment_id)
+            if row_index is None:
                 logger.warning(f"Payment #{payment_id} not found in sheet '{sheet_name}'")
                 return False
 
@@ -460,6 +636,8 @@ class PaymentsSheetsManager:
             return True
 
         except Exception as e:
+            if sheet_name:
+                self._forget_sheet(sheet_name)
             logger.error(f"Error updating payment in table: {e}", exc_info=True)
             return False
 
@@ -484,24 +662,23 @@ class PaymentsSheetsManager:
                 logger.error(f"Sheet not found for role: {role}")
                 return False
 
-            spreadsheet = self.sheets_manager.open_sheet_by_id(self.spreadsheet_id)
-            if not spreadsheet:
+            worksheet = self._worksheet(sheet_name)
+            if worksheet is None:
                 return False
 
-            worksheet = spreadsheet.worksheet(sheet_name)
-
             # Находим строку с нужным ID
-            id_column = worksheet.col_values(1)
-
-            try:
-                row_index = id_column.index(str(payment_id)) + 1
-                worksheet.delete_rows(row_index)
-                logger.info(f"Payment #{payment_id} deleted from sheet '{sheet_name}'")
-                return True
-            except ValueError:
+            row_index = self._find_payment_row(worksheet, sheet_name, payment_id)
+            if row_index is None:
                 logger.warning(f"Payment #{payment_id} not found in sheet '{sheet_name}'")
                 return False
 
+            worksheet.delete_rows(row_index)
+            self.row_cache.deleted(self.spreadsheet_id, sheet_name, payment_id, row_index)
+            logger.info(f"Payment #{payment_id} deleted from sheet '{sheet_name}'")
+            return True
+
         except Exception as e:
+            if sheet_name:
+                self._forget_sheet(sheet_name)
             logger.error(f"Error deleting payment from table: {e}", exc_info=True)
             return False
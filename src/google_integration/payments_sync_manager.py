@@ -1,12 +1,38 @@
 """
 Менеджер синхронизации платежей между БД и Google Sheets
+
+Обычная синхронизация (sync_payments) инкрементальная: по водяным знакам
+(payments_sync_state) читаются только хвосты листов ролей и платежи БД с
+ID больше синхронизированного, поэтому ее стоимость пропорциональна числу
+новых платежей. Полная сверка всех ID (full_sync_payments) выполняется,
+когда водяных знаков нет или хвост листа сдвинулся, и по команде администратора.
+
+Синхронизации выполняются по одной на процесс (_sync_lock): синхронизация
+при запуске и команда /sync_payments иначе прочитали бы одно и то же
+состояние и обе дописали бы в листы одни и те же платежи.
 """
-from typing import List, Dict, Set
+import functools
+import threading
+from typing import List, Dict, Optional, Set
 from .payments_sheets_manager import PaymentsSheetsManager
+from .sheets_metrics import metrics
 from ..database.database_manager import DatabaseManager
-from ..utils.config_utils import get_user_role
-from ..config.settings import UserRole, logger
+from ..database.payments_sync_state import PaymentsSyncState, PaymentsWatermark, SheetWatermark
+from ..utils.config_utils import get_display_name_roles, get_user_role
+from ..config.settings import PAYMENTS_SYNC_TAIL_ROWS, UserRole, logger
+
+# Общая для всех экземпляров блокировка синхронизации (реентерабельная:
+# sync_payments вызывает full_sync_payments, а та - синхронизации по направлениям)
+_sync_lock = threading.RLock()
+
 
+def _serialized(method):
+    """Выполняет метод синхронизации под _sync_lock"""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with _sync_lock:
+            return method(*args, **kwargs)
+    return wrapper
 
 
 class PaymentsSyncManager:
@@ -15,11 +41,21 @@ class PaymentsSyncManager:
     def __init__(self):
         self.payments_sheets = PaymentsSheetsManager()
         self.db = DatabaseManager()
+        self.tail_rows = PAYMENTS_SYNC_TAIL_ROWS
 
-    def sync_payments_from_sheets_to_db(self) -> Dict[str, int]:
+    @property
+    def sync_state(self) -> PaymentsSyncState:
+        # Состояние хранится в той же БД, что и платежи (db может быть подменен)
+        return PaymentsSyncState(self.db.db_path)
+
+    @_serialized
+    def sync_payments_from_sheets_to_db(self, sheets_payments: Optional[List[Dict]] = None) -> Dict[str, int]:
         """
         Синхронизирует платежи из Google Sheets в БД
-        Загружает платежи, которые есть в Sheets, но нет в БД
+        Загружает платежи, которые есть в Sheets, но нет в БД (с тем же ID)
+
+        Args:
+            sheets_payments: уже прочитанные платежи листов (None - прочитать)
 
         Returns:
             Словарь со статистикой: {'added': count, 'skipped': count, 'errors': count}
@@ -36,43 +72,20 @@ class PaymentsSyncManager:
             logger.info(f"Found {len(db_payment_ids)} payments in DB")
 
             # Загружаем платежи из всех листов Google Sheets
-            sheets_payments = self.payments_sheets.get_all_payments_from_sheets()
+            if sheets_payments is None:
+                sheets_payments = self.payments_sheets.get_all_payments_from_sheets()
 
             logger.info(f"Found {len(sheets_payments)} payments in Google Sheets")
 
-            # Синхронизируем платежи: собираем новые платежи и выполняем batch-вставку в БД
+            # Если платеж уже есть в БД, пропускаем
             new_payments = []
             for sheet_payment in sheets_payments:
-                payment_id = sheet_payment.get('id')
-
-                if not payment_id:
-                    logger.warning("Skipping payment without ID")
+                if sheet_payment.get('id') in db_payment_ids:
                     stats['skipped'] += 1
                     continue
+                new_payments.append(sheet_payment)
 
-                # Если платеж уже есть в БД, пропускаем
-                if payment_id in db_payment_ids:
-                    stats['skipped'] += 1
-                    continue
-
-                new_payments.append({
-                    'user_display_name': sheet_payment.get('user_display_name'),
-                    'spreadsheet_id': sheet_payment.get('spreadsheet_id') or None,
-                    'sheet_name': sheet_payment.get('sheet_name') or None,
-                    'amount': sheet_payment.get('amount') or 0,
-                    'date_from': sheet_payment.get('date_from') or None,
-                    'date_to': sheet_payment.get('date_to') or None,
-                    'comment': sheet_payment.get('comment') or None
-                })
-
-            if new_payments:
-                try:
-                    inserted = self.db.add_payments_batch(new_payments)
-                    stats['added'] += inserted
-                    logger.info(f"Batch payment insertion completed: {inserted} added")
-                except Exception as e:
-                    logger.error(f"Error in batch payment insertion to DB: {e}", exc_info=True)
-                    stats['errors'] += len(new_payments)
+            self._import_to_db(new_payments, stats)
 
             logger.info(
                 f"Synchronization completed. "
@@ -86,6 +99,39 @@ class PaymentsSyncManager:
             stats['errors'] += 1
             return stats
 
+    def _import_to_db(self, sheets_payments: List[Dict], stats: Dict[str, int]):
+        """Пакетная вставка платежей листов в БД с их ID (уже существующие ID пропускаются)"""
+        new_payments = []
+        for sheet_payment in sheets_payments:
+            payment_id = sheet_payment.get('id')
+
+            if not payment_id:
+                logger.warning("Skipping payment without ID")
+                stats['skipped'] += 1
+                continue
+
+            new_payments.append({
+                'id': payment_id,
+                'user_display_name': sheet_payment.get('user_display_name'),
+                'spreadsheet_id': sheet_payment.get('spreadsheet_id') or None,
+                'sheet_name': sheet_payment.get('sheet_name') or None,
+                'amount': sheet_payment.get('amount') or 0,
+                'date_from': sheet_payment.get('date_from') or None,
+                'date_to': sheet_payment.get('date_to') or None,
+                'comment': sheet_payment.get('comment') or None,
+                'created_at': sheet_payment.get('created_at') or None
+            })
+
+        if new_payments:
+            # ID из листа сохраняется: при следующей синхронизации платеж уже есть с обеих сторон
+            inserted = self.db.add_missing_payments(new_payments)
+            if inserted is None:
+                stats['errors'] += len(new_payments)
+            else:
+                stats['added'] += inserted
+                stats['skipped'] += len(new_payments) - inserted
+                logger.info(f"Batch payment insertion completed: {inserted} added")
+
     def sync_payment_to_sheets(
         self,
         payment_id: int,
@@ -131,11 +177,15 @@ class PaymentsSyncManager:
             logger.error(f"Error synchronizing payment #{payment_id} to Sheets: {e}")
             return False
 
-    def sync_payments_from_db_to_sheets(self) -> Dict[str, int]:
+    @_serialized
+    def sync_payments_from_db_to_sheets(self, sheets_payments: Optional[List[Dict]] = None) -> Dict[str, int]:
         """
         Синхронизирует платежи из БД в Google Sheets (с пакетными вставками)
         Загружает платежи, которые есть в БД, но нет в Sheets
 
+        Args:
+            sheets_payments: уже прочитанные платежи листов (None - прочитать)
+
         Returns:
             Словарь со статистикой: {'added': count, 'skipped': count, 'errors': count}
         """
@@ -149,64 +199,21 @@ class PaymentsSyncManager:
             logger.info(f"Found {len(db_payments)} payments in DB")
 
             # Получаем все платежи из Google Sheets
-            sheets_payments = self.payments_sheets.get_all_payments_from_sheets()
+            if sheets_payments is None:
+                sheets_payments = self.payments_sheets.get_all_payments_from_sheets()
             sheets_payment_ids = {payment['id'] for payment in sheets_payments}
 
             logger.info(f"Found {len(sheets_payment_ids)} payments in Google Sheets")
 
-            # Группируем новые платежи по ролям для пакетной вставки
-            from ..config.settings import UserRole
-            payments_by_role = {
-                UserRole.ADMIN: [],
-                UserRole.WORKER: [],
-                UserRole.SECONDARY: [],
-                UserRole.CLIENT: []
-            }
-
+            # Если платеж уже есть в Sheets, пропускаем
+            new_payments = []
             for db_payment in db_payments:
-                payment_id = db_payment.get('id')
-
-                if not payment_id:
-                    logger.warning("Skipping payment without ID")
-                    stats['skipped'] += 1
-                    continue
-
-                # Если платеж уже есть в Sheets, пропускаем
-                if payment_id in sheets_payment_ids:
+                if db_payment.get('id') in sheets_payment_ids:
                     stats['skipped'] += 1
                     continue
+                new_payments.append(db_payment)
 
-                # Определяем роль получателя платежа
-                # TODO: улучшить определение роли по user_display_name
-                role = UserRole.WORKER  # По умолчанию
-
-                # Добавляем платеж в группу для пакетной вставки
-                payments_by_role[role].append({
-                    'payment_id': payment_id,
-                    'user_display_name': db_payment['user_display_name'],
-                    'amount': db_payment['amount'],
-                    'date_from': db_payment.get('date_from'),
-                    'date_to': db_payment.get('date_to'),
-                    'comment': db_payment.get('comment'),
-                    'target_spreadsheet_id': db_payment.get('spreadsheet_id'),
-                    'target_sheet_name': db_payment.get('sheet_name')
-                })
-
-            # Выполняем пакетные вставки для каждой роли
-            for role, payments in payments_by_role.items():
-                if payments:
-                    try:
-                        logger.info(f"Batch inserting {len(payments)} payments for role {role}")
-                        success = self.payments_sheets.add_payments_batch(payments, role)
-                        if success:
-                            stats['added'] += len(payments)
-                            logger.info(f"Batch added {len(payments)} payments for role {role}")
-                        else:
-                            stats['errors'] += len(payments)
-                            logger.error(f"Error in batch insertion for role {role}")
-                    except Exception as e:
-                        logger.error(f"Error during batch insertion for role {role}: {e}", exc_info=True)
-                        stats['errors'] += len(payments)
+            self._export_to_sheets(new_payments, stats)
 
             logger.info(
                 f"DB → Sheets synchronization completed. "
@@ -220,6 +227,56 @@ class PaymentsSyncManager:
             stats['errors'] += 1
             return stats
 
+    def _export_to_sheets(self, db_payments: List[Dict], stats: Dict[str, int]):
+        """Пакетная запись платежей БД в листы ролей (одна вставка на роль)"""
+        # Группируем новые платежи по ролям для пакетной вставки
+        payments_by_role = {role: [] for role in PaymentsSheetsManager.SHEET_NAMES}
+        # Роли получателей - из одной карты {display_name: роль} на весь проход
+        roles = get_display_name_roles()
+
+        for db_payment in db_payments:
+            payment_id = db_payment.get('id')
+
+            if not payment_id:
+                logger.warning("Skipping payment without ID")
+                stats['skipped'] += 1
+                continue
+
+            # Определяем роль получателя платежа (без своего листа - лист работников)
+            role = roles.get(db_payment['user_display_name'], UserRole.WORKER)
+            if role not in payments_by_role:
+                role = UserRole.WORKER
+
+            # Добавляем платеж в группу для пакетной вставки
+            payments_by_role[role].append({
+                'payment_id': payment_id,
+                'user_display_name': db_payment['user_display_name'],
+                'amount': db_payment['amount'],
+                'date_from': db_payment.get('date_from'),
+                'date_to': db_payment.get('date_to'),
+                'comment': db_payment.get('comment'),
+                'created_at': db_payment.get('created_at'),
+                'target_spreadsheet_id': db_payment.get('spreadsheet_id'),
+                'target_sheet_name': db_payment.get('sheet_name')
+            })
+
+        # Выполняем пакетные вставки для каждой роли
+        for role, payments in payments_by_role.items():
+            if payments:
+                try:
+                    logger.info(f"Batch inserting {len(payments)} payments for role {role}")
+                    success = self.payments_sheets.add_payments_batch(payments, role)
+                    if success:
+                        stats['added'] += len(payments)
+                        logger.info(f"Batch added {len(payments)} payments for role {role}")
+                    else:
+                        stats['errors'] += len(payments)
+                        logger.error(f"Error in batch insertion for role {role}")
+                except Exception as e:
+                    logger.error(f"Error during batch insertion for role {role}: {e}", exc_info=True)
+                    stats['errors'] += len(payments)
+
+    @_serialized
     def full_sync_payments(self) -> Dict[str, int]:
         """
         Полная двусторонняя синхронизация платежей:
@@ -231,14 +288,23 @@ class PaymentsSyncManager:
             Общая статистика синхронизации
         """
         logger.info("Starting full bidirectional payments synchronization")
+        metrics.inc('payments_sync_total', mode='full')
+
+        # Платежи БД, созданные после этой точки, следующая инкрементальная синхронизация
+        # найдет по водяному знаку (или в хвосте листа, если их уже записал воркер)
+        db_max_payment_id = self.db.get_max_payment_id()
+
+        # Листы всех ролей читаются один раз (один values.batchGet): первое
+        # направление листы не меняет, второе использует тот же снимок
+        sheets_payments = self.payments_sheets.get_all_payments_from_sheets()
 
         # 1. Синхронизируем из Sheets в БД
         logger.info("Sheets → DB...")
-        stats_sheets_to_db = self.sync_payments_from_sheets_to_db()
+        stats_sheets_to_db = self.sync_payments_from_sheets_to_db(sheets_payments)
 
         # 2. Синхронизируем из БД в Sheets
         logger.info("DB → Sheets...")
-        stats_db_to_sheets = self.sync_payments_from_db_to_sheets()
+        stats_db_to_sheets = self.sync_payments_from_db_to_sheets(sheets_payments)
 
         # Объединяем статистику
         total_stats = {
@@ -257,15 +323,123 @@ class PaymentsSyncManager:
             f"  Total added: {total_stats['total_added']}, errors: {total_stats['total_errors']}"
         )
 
+        if db_max_payment_id is not None:
+            self._save_watermark(sheets_payments, db_max_payment_id, {}, total_stats['total_errors'])
+
+        return total_stats
+
+    @_serialized
+    def sync_payments(self) -> Dict[str, int]:
+        """
+        Инкрементальная двусторонняя синхронизация платежей по водяным знакам:
+        1. Читает листы ролей начиная с хвоста, проверенного при прошлой
+           синхронизации (один values.batchGet), и добавляет в БД платежи ниже хвоста
+        2. Записывает в листы платежи БД с ID больше водяного знака, которых нет
+           среди прочитанных строк
+        Без водяных знаков или если хвост листа сдвинулся (строки удалены,
+        вставлены или отсортированы вручную), выполняется полная синхронизация.
+
+        Returns:
+            Общая статистика синхронизации (как у full_sync_payments)
+        """
+        spreadsheet_id = self.payments_sheets.spreadsheet_id
+        watermark = self.sync_state.get(spreadsheet_id) if spreadsheet_id else None
+        sheet_names = PaymentsSheetsManager.SHEET_NAMES
+        if watermark is None or set(watermark.sheets) != set(sheet_names.values()):
+            logger.info("No payments sync watermark, running full synchronization")
+            return self.full_sync_payments()
+
+        logger.info("Starting incremental payments synchronization")
+        db_payments = self.db.get_payments(after_id=watermark.db_max_payment_id)
+        first_rows = {
+            sheet_name: watermark.sheets[sheet_name].first_tail_row(self.tail_rows)
+            for sheet_name in sheet_names.values()
+        }
+        sheets_rows = self.payments_sheets.get_payments_from_rows(first_rows)
+        if sheets_rows is None:
+            logger.warning("Failed to read payment sheet tails, running full synchronization")
+            return self.full_sync_payments()
+
+        sheets_payments, new_sheets_payments = [], []
+        for role, sheet_name in sheet_names.items():
+            sheet = watermark.sheets[sheet_name]
+            payments = sheets_rows.get(sheet_name, [])
+            tail = [(payment['row'], payment['id']) for payment in payments if payment['row'] <= sheet.last_row]
+            if tail != [pair for pair in sheet.tail if pair[0] >= first_rows[sheet_name]]:
+                logger.warning(f"Payment sheet '{sheet_name}' changed above the sync watermark, "
+                               f"running full synchronization")
+                metrics.inc('payments_sync_fallbacks_total')
+                return self.full_sync_payments()
+            for payment in payments:
+                payment['role'] = role
+                if payment['row'] > sheet.last_row:
+                    new_sheets_payments.append(payment)
+            sheets_payments.extend(payments)
+
+        metrics.inc('payments_sync_total', mode='incremental')
+        logger.info(f"Found {len(new_sheets_payments)} new payments in Google Sheets, "
+                    f"{len(db_payments)} new payments in DB")
+
+        # 1. Из Sheets в БД: уже существующие ID пропускает сама вставка
+        stats_sheets_to_db = {'added': 0, 'skipped': 0, 'errors': 0}
+        self._import_to_db(new_sheets_payments, stats_sheets_to_db)
+
+        # 2. Из БД в Sheets: прочитанные строки (хвост и новые) уже содержат записанные воркером платежи
+        stats_db_to_sheets = {'added': 0, 'skipped': 0, 'errors': 0}
+        sheets_payment_ids = {payment['id'] for payment in sheets_payments}
+        stats_db_to_sheets['skipped'] = sum(1 for payment in db_payments if payment['id'] in sheets_payment_ids)
+        self._export_to_sheets([payment for payment in db_payments if payment['id'] not in sheets_payment_ids],
+                               stats_db_to_sheets)
+
+        total_stats = {
+            'sheets_to_db': stats_sheets_to_db,
+            'db_to_sheets': stats_db_to_sheets,
+            'total_added': stats_sheets_to_db['added'] + stats_db_to_sheets['added'],
+            'total_errors': stats_sheets_to_db['errors'] + stats_db_to_sheets['errors']
+        }
+        logger.info(
+            f"Incremental synchronization completed. "
+            f"Sheets → DB: added {stats_sheets_to_db['added']}, "
+            f"DB → Sheets: added {stats_db_to_sheets['added']}, errors: {total_stats['total_errors']}"
+        )
+
+        db_max_payment_id = max([watermark.db_max_payment_id] + [payment['id'] for payment in db_payments])
+        self._save_watermark(sheets_payments, db_max_payment_id, watermark.sheets, total_stats['total_errors'])
         return total_stats
 
-    def get_sync_status(self) -> Dict:
+    def _save_watermark(self, sheets_payments: List[Dict], db_max_payment_id: int,
+                        previous: Dict[str, SheetWatermark], errors: int):
+        """
+        Сохраняет водяные знаки по прочитанным строкам листов. После ошибок
+        сохраненные знаки не меняются: следующая синхронизация повторит ту же работу.
+        """
+        if errors or not self.payments_sheets.spreadsheet_id:
+            return
+        rows_by_sheet = {sheet_name: [] for sheet_name in PaymentsSheetsManager.SHEET_NAMES.values()}
+        for payment in sheets_payments:
+            sheet_name = PaymentsSheetsManager.SHEET_NAMES.get(payment.get('role'))
+            if sheet_name in rows_by_sheet and payment.get('row'):
+                rows_by_sheet[sheet_name].append((payment['row'], payment['id']))
+        # Платежи листов, добавленные в БД с их ID, уже есть в обоих местах
+        db_max_payment_id = max([db_max_payment_id] + [payment['id'] for payment in sheets_payments])
+        self.sync_state.save(self.payments_sheets.spreadsheet_id, PaymentsWatermark(
+            db_max_payment_id,
+            {
+                sheet_name: SheetWatermark.from_rows(rows, self.tail_rows, previous.get(sheet_name))
+                for sheet_name, rows in rows_by_sheet.items()
+            }
+        ))
+
+    def get_sync_status(self, sheets_payments: Optional[List[Dict]] = None) -> Dict:
         """
         Возвращает статус синхронизации:
         - Количество платежей в БД
         - Количество платежей в Google Sheets
         - Несинхронизированные платежи
 
+        Args:
+            sheets_payments: уже прочитанные платежи листов (None - прочитать)
+
         Returns:
             Словарь со статусом синхронизации
         """
@@ -276,7 +450,8 @@ class PaymentsSyncManager:
             db_ids = {p['id'] for p in db_payments}
 
             # Платежи в Sheets
-            sheets_payments = self.payments_sheets.get_all_payments_from_sheets()
+            if sheets_payments is None:
+                sheets_payments = self.payments_sheets.get_all_payments_from_sheets()
             sheets_count = len(sheets_payments)
             sheets_ids = {p['id'] for p in sheets_payments}
 
@@ -313,14 +488,17 @@ class PaymentsSyncManager:
                 'synced': 0
             }
 
-    def validate_sync(self) -> bool:
+    def validate_sync(self, sheets_payments: Optional[List[Dict]] = None) -> bool:
         """
         Проверяет, синхронизированы ли платежи между БД и Sheets
 
+        Args:
+            sheets_payments: уже прочитанные платежи листов (None - прочитать)
+
         Returns:
             True если все синхронизировано, False если есть расхождения
         """
-        status = self.get_sync_status()
+        status = self.get_sync_status(sheets_payments)
 
         if status.get('error'):
             logger.error("Error during synchronization check")
@@ -0,0 +1,277 @@
+"""
+Ограничитель частоты запросов к Google Sheets API с учетом квот
+
+Google ограничивает количество запросов на чтение и на запись в минуту,
+поэтому для каждого типа запросов ведется отдельный token bucket.
+Ограничитель не блокирует потоки: он только считает токены и сообщает,
+через сколько секунд можно выполнять следующий запрос.
+
+Воркер допускает задачу, только зарезервировав токены на ее оценочную
+стоимость (reserve): задачи, допущенные одновременно, не могут вместе
+превысить квоту. Запросы задачи списываются из резерва (он передается
+через contextvars и виден в to_thread), неиспользованный остаток
+возвращается в bucket по окончании задачи.
+"""
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from email.utils import parsedate_to_datetime
+from enum import Enum
+from typing import Dict, Iterator, Optional, Tuple
+
+from ..config.settings import (
+    GOOGLE_READ_REQUESTS_PER_MINUTE, GOOGLE_WRITE_REQUESTS_PER_MINUTE, logger
+)
+
+READ = 'read'
+WRITE = 'write'
+
+
+class ErrorKind(Enum):
+    RATE_LIMITED = "rate_limited"  # 429
+    SERVER = "server"              # 5xx
+    CLIENT = "client"              # 4xx (кроме 429) - повтор бессмысленен
+    NETWORK = "network"            # Таймауты и обрывы соединения
+    UNKNOWN = "unknown"
+
+
+@dataclass
+class ApiErrorInfo:
+    """Результат классификации ошибки Google API"""
+    kind: ErrorKind
+    status: Optional[int] = None
+    retry_after: Optional[float] = None
+
+    @property
+    def retryable(self) -> bool:
+        return self.kind != ErrorKind.CLIENT
+
+
+def _parse_retry_after(value) -> Optional[float]:
+    """Разбирает заголовок Retry-After (секунды или HTTP-дата)"""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def classify_error(error: BaseException) -> ApiErrorInfo:
+    """Классифицирует исключение gspread / googleapiclient / сети"""
+    response = getattr(error, 'response', None)  # gspread.exceptions.APIError
+    status = getattr(response, 'status_code', None)
+    headers = getattr(response, 'headers', None) or {}
+
+    if status is None and getattr(error, 'resp', None) is not None:  # googleapiclient HttpError
+        status = getattr(error.resp, 'status', None)
+        headers = error.resp
+
+    if status is not None:
+        try:
+            status = int(status)
+        except (TypeError, ValueError):
+            status = None
+
+    if status is None:
+        if isinstance(error, (ConnectionError, TimeoutError, OSError)):
+            return ApiErrorInfo(ErrorKind.NETWORK)
+        return ApiErrorInfo(ErrorKind.UNKNOWN)
+
+    retry_after = _parse_retry_after(headers.get('Retry-After') or headers.get('retry-after'))
+    if status == 429:
+        return ApiErrorInfo(ErrorKind.RATE_LIMITED, status, retry_after)
+    if status >= 500:
+        return ApiErrorInfo(ErrorKind.SERVER, status, retry_after)
+    if status >= 400:
+        return ApiErrorInfo(ErrorKind.CLIENT, status, retry_after)
+    return ApiErrorInfo(ErrorKind.UNKNOWN, status, retry_after)
+
+
+@dataclass
+class Reservation:
+    """Токены, зарезервированные при допуске задачи: {READ/WRITE: остаток}"""
+    remaining: Dict[str, float] = field(default_factory=dict)
+
+
+# Резерв задачи, выполняемой в текущем контексте (поток воркера или задача asyncio)
+_current_reservation: contextvars.ContextVar[Optional[Reservation]] = contextvars.ContextVar(
+    'sheets_quota_reservation', default=None
+)
+
+
+class TokenBucket:
+    """
+    Token bucket с возможностью "долга": списание никогда не блокирует,
+    а отрицательный баланс откладывает следующие запросы.
+    """
+
+    def __init__(self, per_minute: float):
+        self.max_rate = per_minute / 60.0
+        self.rate = self.max_rate
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.paused_until = 0.0
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self._updated = now
+
+    def consume(self, amount: float, now: float):
+        self._refill(now)
+        self.tokens -= amount
+
+    def refund(self, amount: float, now: float):
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+    def time_until_available(self, amount: float, now: float) -> float:
+        self._refill(now)
+        wait = max(0.0, self.paused_until - now)
+        missing = min(amount, self.capacity) - self.tokens
+        if missing > 0:
+            wait = max(wait, missing / self.rate)
+        return wait
+
+
+class QuotaRateLimiter:
+    """
+    Общий ограничитель для всех потоков, работающих с Google Sheets.
+
+    На 429 скорость bucket'а уменьшается вдвое (и выдерживается Retry-After),
+    после успешных запросов постепенно восстанавливается до квоты.
+    """
+
+    MIN_RATE_FACTOR = 0.1
+    RECOVERY_STEP = 0.05
+    MAX_BACKOFF = 64.0
+
+    def __init__(self, read_per_minute: float = GOOGLE_READ_REQUESTS_PER_MINUTE,
+                 write_per_minute: float = GOOGLE_WRITE_REQUESTS_PER_MINUTE):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, TokenBucket] = {
+            READ: TokenBucket(read_per_minute),
+            WRITE: TokenBucket(write_per_minute),
+        }
+        self._local = threading.local()
+        self.throttled_count = 0
+
+    def acquire(self, kind: str, amount: float = 1.0):
+        """Списывает токены за выполненный запрос (сначала из резерва задачи; не блокирует)"""
+        reservation = _current_reservation.get()
+        with self._lock:
+            if reservation is not None:
+                reserved = min(amount, reservation.remaining.get(kind, 0.0))
+                reservation.remaining[kind] = reservation.remaining.get(kind, 0.0) - reserved
+                amount -= reserved
+            if amount > 0:
+                self._buckets[kind].consume(amount, time.monotonic())
+
+    def _delay_locked(self, reads: float, writes: float, now: float) -> float:
+        delay = 0.0
+        if reads:
+            delay = max(delay, self._buckets[READ].time_until_available(reads, now))
+        if writes:
+            delay = max(delay, self._buckets[WRITE].time_until_available(writes, now))
+        return delay
+
+    def delay_for(self, reads: float = 0, writes: float = 0) -> float:
+        """Сколько секунд нужно подождать, чтобы хватило токенов на операцию (без резервирования)"""
+        with self._lock:
+            return self._delay_locked(reads, writes, time.monotonic())
+
+    def reserve(self, reads: float = 0, writes: float = 0) -> Tuple[float, Optional[Reservation]]:
+        """
+        Проверяет квоту и сразу резервирует токены на операцию
+
+        Returns:
+            (0, резерв) - операция допущена; (задержка, None) - токенов не хватает
+        """
+        now = time.monotonic()
+        with self._lock:
+            delay = self._delay_locked(reads, writes, now)
+            if delay > 0:
+                return delay, None
+            remaining = {}
+            for kind, amount in ((READ, reads), (WRITE, writes)):
+                if amount:
+                    self._buckets[kind].consume(amount, now)
+                    remaining[kind] = float(amount)
+            return 0.0, Reservation(remaining)
+
+    def release(self, reservation: Reservation):
+        """Возвращает в bucket'ы неиспользованный остаток резерва"""
+        now = time.monotonic()
+        with self._lock:
+            for kind, amount in reservation.remaining.items():
+                if amount > 0:
+                    self._buckets[kind].refund(amount, now)
+            reservation.remaining.clear()
+
+    @contextmanager
+    def reserved(self, reservation: Optional[Reservation]) -> Iterator[None]:
+        """Запросы внутри блока списываются из резерва; остаток возвращается на выходе"""
+        if reservation is None:
+            yield
+            return
+        token = _current_reservation.set(reservation)
+        try:
+            yield
+        finally:
+            _current_reservation.reset(token)
+            self.release(reservation)
+
+    def report_success(self, kind: str):
+        """Аддитивно восстанавливает скорость после успешного запроса"""
+        with self._lock:
+            bucket = self._buckets[kind]
+            if bucket.rate < bucket.max_rate:
+                bucket.rate = min(bucket.max_rate, bucket.rate + bucket.max_rate * self.RECOVERY_STEP)
+
+    def report_error(self, error: BaseException, kind: Optional[str] = None) -> ApiErrorInfo:
+        """Классифицирует ошибку, запоминает ее для текущего потока и корректирует скорость"""
+        info = classify_error(error)
+        self._local.last_error = info
+
+        if info.kind == ErrorKind.RATE_LIMITED:
+            now = time.monotonic()
+            pause = info.retry_after if info.retry_after is not None else 60.0 / self._buckets[kind or WRITE].capacity
+            with self._lock:
+                self.throttled_count += 1
+                buckets = [self._buckets[kind]] if kind else list(self._buckets.values())
+                for bucket in buckets:
+                    bucket.rate = max(bucket.max_rate * self.MIN_RATE_FACTOR, bucket.rate / 2)
+                    bucket.paused_until = max(bucket.paused_until, now + pause)
+            logger.warning(f"Google API quota exceeded ({kind or 'all'}), pausing for {pause:.1f}s")
+        return info
+
+    def clear_last_error(self):
+        self._local.last_error = None
+
+    def last_error(self) -> Optional[ApiErrorInfo]:
+        """Последняя ошибка API в текущем потоке (менеджеры сами перехватывают исключения)"""
+        return getattr(self._local, 'last_error', None)
+
+    def retry_delay(self, attempt: int, info: Optional[ApiErrorInfo]) -> float:
+        """Задержка перед повтором: Retry-After, иначе экспоненциальная с джиттером"""
+        if info is not None and info.retry_after is not None:
+            return info.retry_after
+        if info is not None and info.kind == ErrorKind.RATE_LIMITED:
+            base = min(2 ** attempt, self.MAX_BACKOFF)
+        else:
+            base = min(2 ** attempt, 10)
+        return base * (0.5 + random.random() / 2)
+
+
+# Глобальный ограничитель, общий для воркеров и менеджеров
+rate_limiter = QuotaRateLimiter()
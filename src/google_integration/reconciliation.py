@@ -0,0 +1,216 @@
+"""
+Сверка записей БД с листами Google Sheets (DB -> Sheets)
+
+Записи группируются по листам назначения. Для каждой таблицы одним
+запросом values.batchGet читается только колонка ID всех нужных листов,
+недостающие записи находятся разностью множеств, и строки каждого листа
+дописываются одним values.append. Результат - структурированный отчет
+о расхождениях по каждому листу.
+"""
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import pandas as pd
+from gspread.utils import absolute_range_name
+
+from ..config.settings import logger
+from .header_cache import is_layout_error
+from .sheet_columns import BATCH_GET_PARAMS, cell_text
+from .sheets_manager import RECORD_HEADERS, GoogleSheetsManager, build_record_row
+from .sheets_metrics import metrics
+
+SheetKey = Tuple[str, str]
+
+# Колонка ID листа записей (первая колонка RECORD_HEADERS)
+ID_COLUMN_RANGE = 'A:A'
+
+
+@dataclass
+class SheetDiff:
+    """Расхождения одного листа"""
+    spreadsheet_id: str
+    sheet_name: str
+    db_records: int = 0
+    sheet_records: int = 0
+    missing_ids: List[str] = field(default_factory=list)
+    extra_ids: List[str] = field(default_factory=list)
+    appended: int = 0
+    error: Optional[str] = None
+
+    @property
+    def in_sync(self) -> bool:
+        return not self.error and len(self.missing_ids) == self.appended
+
+
+@dataclass
+class ReconciliationReport:
+    """Отчет сверки БД с листами"""
+    sheets: List[SheetDiff] = field(default_factory=list)
+    skipped_records: int = 0
+    dry_run: bool = False
+    duration: float = 0.0
+
+    @property
+    def db_records(self) -> int:
+        return sum(diff.db_records for diff in self.sheets)
+
+    @property
+    def missing(self) -> int:
+        return sum(len(diff.missing_ids) for diff in self.sheets)
+
+    @property
+    def extra(self) -> int:
+        return sum(len(diff.extra_ids) for diff in self.sheets)
+
+    @property
+    def appended(self) -> int:
+        return sum(diff.appended for diff in self.sheets)
+
+    @property
+    def errors(self) -> int:
+        return sum(1 for diff in self.sheets if diff.error)
+
+    def stats(self) -> Dict[str, int]:
+        """Сводка в формате статистики SyncManager.sync_db_to_sheets"""
+        return {
+            'processed_records': self.db_records + self.skipped_records,
+            'synced_records': self.appended,
+            'missing_records': self.missing,
+            'extra_records': self.extra,
+            'sheets': len(self.sheets),
+            'errors': self.errors,
+        }
+
+    def to_dict(self) -> Dict:
+        return {
+            **self.stats(),
+            'dry_run': self.dry_run,
+            'duration': round(self.duration, 3),
+            'details': [asdict(diff) for diff in self.sheets if diff.missing_ids or diff.extra_ids or diff.error],
+        }
+
+
+def group_records_by_sheet(records: Iterable[Dict]) -> Tuple[Dict[SheetKey, Dict[str, Dict]], int]:
+    """
+    Группирует записи БД по (spreadsheet_id, sheet_name).
+    Возвращает {лист: {id записи: запись}} и число записей без листа назначения.
+    """
+    grouped: Dict[SheetKey, Dict[str, Dict]] = {}
+    skipped = 0
+    for record in records:
+        spreadsheet_id, sheet_name = record.get('spreadsheet_id'), record.get('sheet_name')
+        record_id = str(record.get('id') or '').strip()
+        if not (spreadsheet_id and sheet_name and record_id):
+            skipped += 1
+            continue
+        grouped.setdefault((spreadsheet_id, sheet_name), {})[record_id] = record
+    return grouped, skipped
+
+
+def id_column_values(value_range: Dict) -> Tuple[Optional[str], Set[str]]:
+    """Заголовок и непустые ID из ответа batchGet колонки A (majorDimension=COLUMNS)"""
+    columns = value_range.get('values') or [[]]
+    column = columns[0] if columns else []
+    if not column:
+        return None, set()
+    values = cell_text(pd.Series(column[1:], dtype=object))
+    return str(column[0]).strip(), set(values[values != ''])
+
+
+class SheetsReconciler:
+    """Сверка записей БД с листами: одно чтение колонки ID на таблицу, одна дозапись на лист"""
+
+    def __init__(self, sheets_manager: GoogleSheetsManager):
+        self.sheets = sheets_manager
+
+    def reconcile(self, records: Iterable[Dict], dry_run: bool = False) -> ReconciliationReport:
+        """
+        Сверяет записи БД с листами и дописывает недостающие строки
+        (dry_run=True - только отчет, без записи)
+        """
+        started = time.monotonic()
+        grouped, skipped = group_records_by_sheet(records)
+        report = ReconciliationReport(skipped_records=skipped, dry_run=dry_run)
+
+        by_spreadsheet: Dict[str, List[str]] = {}
+        for spreadsheet_id, sheet_name in grouped:
+            by_spreadsheet.setdefault(spreadsheet_id, []).append(sheet_name)
+
+        for spreadsheet_id, sheet_names in by_spreadsheet.items():
+            diffs = [
+                SheetDiff(spreadsheet_id, sheet_name, db_records=len(grouped[(spreadsheet_id, sheet_name)]))
+                for sheet_name in sheet_names
+            ]
+            report.sheets.extend(diffs)
+            try:
+                self._reconcile_spreadsheet(spreadsheet_id, diffs, grouped, dry_run)
+            except Exception as e:
+                logger.error(f"Error reconciling spreadsheet {spreadsheet_id}: {e}")
+                for diff in diffs:
+                    diff.error = diff.error or str(e)
+
+        report.duration = time.monotonic() - started
+        metrics.inc('sheets_reconcile_missing_total', report.missing)
+        metrics.inc('sheets_reconcile_appended_total', report.appended)
+        logger.info(f"DB to Sheets reconciliation: {report.stats()} in {report.duration:.2f}s")
+        return report
+
+    def _reconcile_spreadsheet(self, spreadsheet_id: str, diffs: List[SheetDiff],
+                               grouped: Dict[SheetKey, Dict[str, Dict]], dry_run: bool):
+        spreadsheet = self.sheets.open_sheet_by_id(spreadsheet_id)
+        if not spreadsheet:
+            raise RuntimeError('spreadsheet is not available')
+
+        existing = {worksheet.title for worksheet in spreadsheet.worksheets()}
+        targets = []
+        for diff in diffs:
+            if diff.sheet_name in existing:
+                targets.append(diff)
+            else:
+                diff.error = 'sheet not found'
+        if not targets:
+            return
+
+        # Колонки ID всех листов таблицы - одним запросом
+        response = spreadsheet.values_batch_get(
+            [absolute_range_name(diff.sheet_name, ID_COLUMN_RANGE) for diff in targets],
+            params=dict(BATCH_GET_PARAMS)
+        )
+
+        for diff, value_range in zip(targets, response.get('valueRanges', [])):
+            header, sheet_ids = id_column_values(value_range)
+            if header is not None and header != RECORD_HEADERS[0]:
+                # Строки строятся в порядке RECORD_HEADERS - в лист с другой раскладкой не пишем
+                diff.error = f"unexpected header in column A: {header!r}"
+                continue
+
+            db_records = grouped[(diff.spreadsheet_id, diff.sheet_name)]
+            diff.sheet_records = len(sheet_ids)
+            missing = [db_records[record_id] for record_id in db_records.keys() - sheet_ids]
+            missing.sort(key=lambda record: (record.get('date') or '', str(record.get('id'))))
+            diff.missing_ids = [str(record['id']) for record in missing]
+            diff.extra_ids = sorted(sheet_ids - db_records.keys())
+
+            if missing and not dry_run:
+                self._append_rows(spreadsheet, diff, missing, with_headers=header is None)
+
+    def _append_rows(self, spreadsheet, diff: SheetDiff, missing: List[Dict], with_headers: bool):
+        """Дописывает недостающие строки листа одним values.append"""
+        rows = [build_record_row(record) for record in missing]
+        if with_headers:
+            # Пустой лист - сначала строка заголовков
+            rows.insert(0, list(RECORD_HEADERS))
+        try:
+            spreadsheet.values_append(
+                absolute_range_name(diff.sheet_name, 'A1'),
+                params={'valueInputOption': 'RAW', 'insertDataOption': 'INSERT_ROWS'},
+                body={'majorDimension': 'ROWS', 'values': rows}
+            )
+            diff.appended = len(missing)
+            logger.info(f"Appended {len(missing)} records to {diff.spreadsheet_id}/{diff.sheet_name}")
+        except Exception as e:
+            if is_layout_error(e):
+                self.sheets.header_cache.invalidate(diff.spreadsheet_id, diff.sheet_name)
+            logger.error(f"Error appending records to {diff.spreadsheet_id}/{diff.sheet_name}: {e}")
+            diff.error = str(e)
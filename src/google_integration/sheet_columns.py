@@ -0,0 +1,167 @@
+"""
+Колоночное представление листов Google Sheets для пакетного чтения
+
+Листы читаются одним запросом values.batchGet с majorDimension=COLUMNS,
+valueRenderOption=UNFORMATTED_VALUE и dateTimeRenderOption=SERIAL_NUMBER:
+числа приходят числами (без локального форматирования вида "1 200,50"),
+даты - порядковыми номерами дней, а данные - сразу по колонкам, без
+построения словаря заголовков для каждой строки. Колонки без изменений
+передаются в pandas/NumPy для векторной очистки сумм и дат.
+"""
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from ..config.settings import logger
+from ..utils.date_utils import normalize_date
+
+# Параметры values.batchGet для пакетного чтения
+BATCH_GET_PARAMS = {
+    'majorDimension': 'COLUMNS',
+    'valueRenderOption': 'UNFORMATTED_VALUE',
+    'dateTimeRenderOption': 'SERIAL_NUMBER',
+}
+
+# Нулевой день порядковых дат Google Sheets (как в Excel)
+SERIAL_EPOCH = pd.Timestamp('1899-12-30')
+
+
+@dataclass
+class SheetColumns:
+    """Значения листа по колонкам (первая строка листа - заголовки)"""
+    title: str
+    headers: List[str] = field(default_factory=list)
+    columns: Dict[str, List] = field(default_factory=dict)
+    row_count: int = 0
+
+    @classmethod
+    def from_value_range(cls, title: str, value_range: Dict) -> 'SheetColumns':
+        """Строит колонки из ответа values.batchGet (majorDimension=COLUMNS)"""
+        raw_columns = value_range.get('values') or []
+        row_count = max((len(column) - 1 for column in raw_columns), default=0)
+        headers, columns = [], {}
+        for column in raw_columns:
+            header = str(column[0]).strip() if column else ''
+            if not header or header in columns:
+                # Колонки без заголовка (и повторы) get_all_records тоже не различает
+                continue
+            values = column[1:]
+            headers.append(header)
+            columns[header] = values + [''] * (row_count - len(values))
+        return cls(title, headers, columns, row_count)
+
+    def column(self, header: str) -> List:
+        return self.columns.get(header, [''] * self.row_count)
+
+    def to_frame(self) -> pd.DataFrame:
+        """DataFrame листа (значения - как вернул API, без строковых преобразований)"""
+        return pd.DataFrame(self.columns, columns=self.headers)
+
+    def records(self) -> List[Dict]:
+        """Строки в виде словарей - для кода, ожидающего get_all_records()"""
+        return self.to_frame().to_dict('records')
+
+    def content_hash(self) -> str:
+        """Хеш значений листа (заголовки и колонки в том виде, как их вернул API)"""
+        payload = json.dumps([self.headers, [self.columns[header] for header in self.headers]],
+                             ensure_ascii=False, default=str, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def blank_mask(values: pd.Series) -> np.ndarray:
+    """Пустые ячейки (None, '' и строки из пробелов)"""
+    return values.isna().to_numpy() | (values.astype(str).str.strip() == '').to_numpy()
+
+
+def clean_amounts(values: pd.Series) -> pd.Series:
+    """
+    Суммы как float: числа остаются числами, текстовые суммы очищаются
+    от пробелов (в т.ч. неразрывных) и десятичной запятой; нераспознанные -> NaN
+    """
+    numeric = pd.to_numeric(values, errors='coerce')
+    text = values[numeric.isna() & values.map(lambda value: isinstance(value, str))]
+    if not text.empty:
+        cleaned = (text.str.replace('\xa0', '', regex=False)
+                       .str.replace('\u202f', '', regex=False)
+                       .str.replace(' ', '', regex=False)
+                       .str.replace(',', '.', regex=False)
+                       .str.strip())
+        numeric.loc[cleaned.index] = pd.to_numeric(cleaned, errors='coerce')
+    return numeric.astype(float)
+
+
+def serial_dates_to_text(values: pd.Series, fmt: str = '%d.%m.%y') -> pd.Series:
+    """
+    Порядковые даты (SERIAL_NUMBER) переводятся в строки формата fmt,
+    текстовые даты возвращаются без изменений (с обрезкой пробелов)
+    """
+    result = values.map(lambda value: value.strip() if isinstance(value, str) else value)
+    serial = pd.to_numeric(values.where(values.map(lambda value: not isinstance(value, (str, bool)))),
+                           errors='coerce')
+    mask = serial.notna()
+    if mask.any():
+        dates = SERIAL_EPOCH + pd.to_timedelta(serial[mask], unit='D')
+        result = result.astype(object)
+        result.loc[mask] = dates.dt.round('s').dt.strftime(fmt)
+    return result.where(~values.isna(), '')
+
+
+def cell_text(values: pd.Series) -> pd.Series:
+    """Ячейки как обрезанные строки (числа - без хвоста '.0')"""
+    def to_text(value) -> str:
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            return ''
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value).strip()
+    return values.map(to_text)
+
+
+def record_rows(data: SheetColumns, spreadsheet_id: str) -> List[Tuple[int, Dict]]:
+    """
+    Записи БД из колонок листа записей вместе с номерами строк листа.
+    Валидная запись - с ID, поставщиком и суммой; суммы и даты
+    очищаются по колонкам целиком.
+    """
+    if not data.row_count:
+        return []
+
+    raw_amounts = pd.Series(data.column('Արժեք'), dtype=object)
+    suppliers = pd.Series(data.column('մատակարար'), dtype=object)
+    ids = cell_text(pd.Series(data.column('ID'), dtype=object))
+    valid = (ids != '') & suppliers.map(bool) & raw_amounts.map(bool)
+
+    amounts = clean_amounts(raw_amounts).fillna(0.0)
+    dates = serial_dates_to_text(pd.Series(data.column('ամսաթիվ'), dtype=object))
+    directions = cell_text(pd.Series(data.column('ուղղություն'), dtype=object))
+    descriptions = cell_text(pd.Series(data.column('ծախսի բնութագիր'), dtype=object))
+    suppliers = cell_text(suppliers)
+
+    rows = []
+    for index in np.flatnonzero(valid.to_numpy()):
+        try:
+            # Нормализуем дату
+            date_str = str(dates.iat[index])
+            normalized_date = normalize_date(date_str) if date_str else ''
+        except Exception as e:
+            logger.error(f"Error converting row: {e}")
+            continue
+
+        # Строка 1 - заголовки, данные начинаются со 2-й строки
+        rows.append((int(index) + 2, {
+            'id': ids.iat[index],
+            'date': normalized_date,
+            'supplier': suppliers.iat[index],
+            'direction': directions.iat[index],
+            'description': descriptions.iat[index],
+            'amount': float(amounts.iat[index]),
+            'spreadsheet_id': spreadsheet_id,
+            'sheet_name': data.title,
+            'user_id': None  # Будет определен позже
+        }))
+
+    return rows
@@ -1,37 +1,290 @@
 """
 Модуль для интеграции с Google Sheets
 """
+import json
+import re
+import threading
+import time
+from dataclasses import dataclass
+
 import gspread
-from oauth2client.service_account import ServiceAccountCredentials
+from gspread.utils import absolute_range_name, rowcol_to_a1
 
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
 import datetime
 from datetime import datetime
 from typing import List, Dict, Optional, Tuple
-from ..config.settings import GOOGLE_CREDS_FILE, GOOGLE_SCOPE, GOOGLE_SCOPES, logger
+from ..config.settings import GOOGLE_CREDS_FILE, DRIVE_PAGE_SIZE, logger
 from ..utils.date_utils import safe_parse_date_or_none
+from .rate_limiter import rate_limiter, READ, WRITE
+from .sheets_metrics import metrics
+from .client_pool import GoogleClientPool, client_pool as default_client_pool
+from .header_cache import HeaderLayout, header_cache, is_layout_error, worksheet_version
+from .sheet_columns import BATCH_GET_PARAMS, SheetColumns
+
+# spreadsheets/<id><остаток> и files в путях Sheets/Drive API
+_SPREADSHEET_ENDPOINT = re.compile(r'/spreadsheets/([^/:?]+)([^?]*)')
+_VALUES_VERB = re.compile(r':(append|clear|batch\w+)$')
+_DRIVE_ENDPOINT = re.compile(r'/drive/v\d+/(files|permissions)(/[^/?]+)?')
+
+
+def describe_endpoint(method: str, endpoint: str) -> Tuple[str, str]:
+    """Возвращает (операция, spreadsheet_id) для метрик по URL запроса gspread"""
+    method = method.upper()
+    match = _SPREADSHEET_ENDPOINT.search(endpoint or '')
+    if match:
+        spreadsheet_id, rest = match.group(1), match.group(2)
+        if rest.startswith('/values'):
+            verb = _VALUES_VERB.search(rest)
+            if verb:
+                return f"values.{verb.group(1)}", spreadsheet_id
+            return ('values.get' if method == 'GET' else 'values.update'), spreadsheet_id
+        if rest.startswith(':'):
+            return rest[1:], spreadsheet_id
+        return ('metadata' if method == 'GET' else f"spreadsheet.{method.lower()}"), spreadsheet_id
+
+    match = _DRIVE_ENDPOINT.search(endpoint or '')
+    if match:
+        if method == 'GET' and not match.group(2):
+            return f"drive.{match.group(1)}.list", '-'
+        return f"drive.{match.group(1)}.{method.lower()}", '-'
+    return f"other.{method.lower()}", '-'
+
+
+def _payload_size(args, kwargs) -> int:
+    """Размер тела запроса gspread (params, data, json, ...)"""
+    data = kwargs.get('data', args[1] if len(args) > 1 else None)
+    body = kwargs.get('json', args[2] if len(args) > 2 else None)
+    size = 0
+    if data:
+        size += len(data) if isinstance(data, (bytes, str)) else len(json.dumps(data, default=str))
+    if body:
+        size += len(json.dumps(body, default=str))
+    return size
+
+
+def record_api_call(method: str, endpoint: str, started: float, status,
+                    sent: int = 0, received: int = 0):
+    """Учитывает вызов API в метриках (операция, таблица, тип задачи воркера, байты)"""
+    try:
+        operation, spreadsheet_id = describe_endpoint(method, endpoint)
+        metrics.inc('google_api_calls_total', operation=operation, status=status)
+        metrics.inc('google_api_calls_by_spreadsheet_total', spreadsheet=spreadsheet_id)
+        metrics.observe('google_api_latency_seconds', time.monotonic() - started, operation=operation)
+
+        task_type = metrics.context().get('task_type')
+        if task_type:
+            metrics.inc('google_api_calls_by_task_total', task_type=task_type)
+
+        metrics.inc('google_api_bytes_total', sent, operation=operation,
+                    spreadsheet=spreadsheet_id, direction='sent')
+        metrics.inc('google_api_bytes_total', received, operation=operation,
+                    spreadsheet=spreadsheet_id, direction='received')
+    except Exception as e:
+        logger.debug(f"Error recording Google API metrics: {e}")
+
+
+DRIVE_FILES_URL = 'https://www.googleapis.com/drive/v3/files'
+
+# Заголовки листа записей и соответствие полей записи колонкам
+RECORD_HEADERS = ['ID', 'ամսաթիվ', 'մատակարար', 'ուղղություն', 'ծախսի բնութագիր', 'Արժեք']
+RECORD_FIELD_MAPPING = {
+    'date': 'ամսաթիվ',
+    'supplier': 'մատակարար',
+    'direction': 'ուղղություն',
+    'description': 'ծախսի բնութագիր',
+    'amount': 'Արժեք'
+}
+
+
+def record_sort_key(record: Dict) -> datetime:
+    """Безопасный ключ сортировки строки листа по дате"""
+    date_str = record.get('ամսաթիվ', '')
+    if not date_str:
+        return datetime.min
+    try:
+        parsed_date = safe_parse_date_or_none(date_str)
+        return datetime.combine(parsed_date, datetime.min.time()) if parsed_date else datetime.min
+    except Exception:
+        return datetime.min
+
+
+def build_record_row(record: Dict) -> List:
+    """Строка листа для записи БД (дата YYYY-MM-DD конвертируется в dd.mm.yy)"""
+    formatted_date = record.get('date', '')
+    if formatted_date:
+        try:
+            # Парсим дату в формате YYYY-MM-DD
+            date_obj = datetime.strptime(formatted_date, '%Y-%m-%d')
+            formatted_date = date_obj.strftime('%d.%m.%y')
+        except ValueError:
+            logger.warning(f"Invalid date format: {formatted_date}")
+            formatted_date = record.get('date', '')
+
+    return [
+        record.get('id', ''),
+        formatted_date,
+        record.get('supplier', ''),
+        record.get('direction', ''),
+        record.get('description', ''),
+        record.get('amount', 0)
+    ]
+
+
+def find_insert_row(all_records: List[Dict], formatted_date: str) -> int:
+    """Номер строки, куда вставить запись с датой formatted_date, сохраняя сортировку"""
+    all_records.sort(key=record_sort_key)
+
+    insert_row = len(all_records) + 2  # Если не найдем место, добавим в конец
+
+    if formatted_date:
+        try:
+            new_date = safe_parse_date_or_none(formatted_date)
+            if new_date:
+                for i, existing_record in enumerate(all_records):
+                    existing_date_str = existing_record.get('ամսաթիվ', '')
+                    if existing_date_str:
+                        existing_date = safe_parse_date_or_none(existing_date_str)
+                        if existing_date and new_date < existing_date:
+                            insert_row = i + 2  # +2 потому что записи начинаются с 2-й строки
+                            break
+        except Exception as e:
+            logger.warning(f"Error finding insert position: {e}")
+    return insert_row
+
+
+def format_sheet_value(field: str, new_value):
+    """Значение поля записи в формате листа (даты - dd.mm.yy)"""
+    if field == 'date' and new_value:
+        try:
+            # Безопасное парсинг даты
+            parsed_date = safe_parse_date_or_none(new_value)
+            if parsed_date:
+                # Конвертируем в формат dd.mm.yy для записи в таблицу
+                formatted_value = parsed_date.strftime('%d.%m.%y')
+                logger.info(f"Converted date '{new_value}' to '{formatted_value}'")
+                return formatted_value
+            logger.warning(f"Failed to convert date: {new_value}")
+            return str(new_value)
+        except Exception as e:
+            logger.error(f"Error converting date {new_value}: {e}")
+            return str(new_value)
+    return new_value
+
+
+def is_sorted_by_date(records: List[Dict]) -> bool:
+    """Проверяет, что строки листа идут по возрастанию даты"""
+    prev_date = None
+    for record in records:
+        date_str = record.get('ամսաթիվ', '')
+        if date_str:
+            current_date = safe_parse_date_or_none(date_str)
+            if current_date and prev_date and current_date < prev_date:
+                logger.info(f"Date order violation detected: {current_date} < {prev_date}")
+                return False
+            prev_date = current_date
+    return True
+
+
+def sorted_record_rows(records: List[Dict]) -> List[List]:
+    """Строки листа, отсортированные по дате (для перезаписи диапазона A2:F)"""
+    return [
+        [
+            record.get('ID', ''),
+            record.get('ամսաթիվ', ''),
+            record.get('մատակարար', ''),
+            record.get('ուղղություն', ''),
+            record.get('ծախսի բնութագիր', ''),
+            record.get('Արժեք', 0)
+        ]
+        for record in sorted(records, key=record_sort_key)
+    ]
+
+
+@dataclass
+class RowChange:
+    """
+    Изменение строк листа, выполненное менеджером (для позиций записей в БД):
+    locate - запись найдена в строке row; insert/delete - строка row вставлена
+    или удалена; sort - лист пересортирован, rows - {ID записи: строка}
+    """
+    kind: str
+    row: Optional[int] = None
+    rows: Optional[Dict[str, int]] = None
+
+
+class RateLimitedClient(gspread.Client):
+    """Клиент gspread, учитывающий каждый запрос в общем ограничителе квот"""
+
+    def request(self, method, endpoint, *args, **kwargs):
+        kind = READ if method.upper() == 'GET' else WRITE
+        rate_limiter.acquire(kind)
+        started = time.monotonic()
+        try:
+            response = super().request(method, endpoint, *args, **kwargs)
+        except Exception as e:
+            info = rate_limiter.report_error(e, kind)
+            record_api_call(method, endpoint, started, info.status or info.kind.value,
+                            _payload_size(args, kwargs))
+            raise
+        rate_limiter.report_success(kind)
+        record_api_call(method, endpoint, started, 'ok', _payload_size(args, kwargs),
+                        len(getattr(response, 'content', None) or b''))
+        return response
 
 
 class GoogleSheetsManager:
     """Класс для управления Google Sheets"""
     
-    def __init__(self, creds_file: str = GOOGLE_CREDS_FILE):
+    def __init__(self, creds_file: str = GOOGLE_CREDS_FILE,
+                 client_pool: Optional[GoogleClientPool] = None):
         self.creds_file = creds_file
-        self._client = None
+        if client_pool is None:
+            client_pool = (default_client_pool if creds_file == default_client_pool.creds_file
+                           else GoogleClientPool(creds_file, backend=default_client_pool.backend))
+        self.client_pool = client_pool
+        self.header_cache = header_cache
+        self._local = threading.local()
+
+    def last_row_changes(self) -> List[RowChange]:
+        """Изменения строк последней операции с записью в текущем потоке"""
+        return list(getattr(self._local, 'row_changes', []))
+
+    def _reset_row_changes(self):
+        self._local.row_changes = []
+
+    def _row_changed(self, kind: str, row: Optional[int] = None, rows: Optional[Dict[str, int]] = None):
+        if not hasattr(self._local, 'row_changes'):
+            self._local.row_changes = []
+        self._local.row_changes.append(RowChange(kind, row, rows))
+
+    def _locate_record(self, worksheet, record_id: str, sheet_row: Optional[int] = None) -> Optional[int]:
+        """
+        Строка записи в листе: известная позиция проверяется чтением одной
+        ячейки ID, при несовпадении запись ищется по колонке ID
+        """
+        if sheet_row and sheet_row >= 2:
+            if str(worksheet.acell(f"A{sheet_row}").value or '').strip() == record_id:
+                metrics.inc('sheets_row_hint_total', result='hit')
+                return sheet_row
+            metrics.inc('sheets_row_hint_total', result='stale')
+            logger.info(f"Stored row {sheet_row} of record {record_id} is stale, searching ID column")
+        else:
+            metrics.inc('sheets_row_hint_total', result='none')
+
+        ids = worksheet.col_values(1)
+        for i, value in enumerate(ids[1:], start=2):
+            if str(value or '').strip() == record_id:
+                return i
+        logger.debug(f"Record {record_id} not found among {max(len(ids) - 1, 0)} IDs")
+        return None
     
     def get_client(self):
-        """Получает авторизованного клиента Google Sheets"""
-        if self._client is None:
-            try:
-                creds = ServiceAccountCredentials.from_json_keyfile_name(
-                    self.creds_file, GOOGLE_SCOPE
-                )
-                self._client = gspread.authorize(creds)
-            except Exception as e:
-                logger.error(f"Google Sheets authorization error: {e}")
-                return None
-        return self._client
+        """Получает авторизованного клиента Google Sheets (свой для каждого потока)"""
+        try:
+            return self.client_pool.get_client()
+        except Exception as e:
+            logger.error(f"Google Sheets authorization error: {e}")
+            return None
 
     def list_spreadsheets(self):
         """Получает список всех доступных спредшитов"""
@@ -45,19 +298,25 @@ class GoogleSheetsManager:
             return []
 
     def get_all_spreadsheets(self):
-        """Получает все спредшиты с дополнительной информацией"""
+        """Получает все спредшиты с дополнительной информацией (все страницы Drive API)"""
         try:
-            creds = service_account.Credentials.from_service_account_file(
-                self.creds_file, scopes=GOOGLE_SCOPES
-            )
-            service = build('drive', 'v3', credentials=creds)
+            service = self.client_pool.get_drive_service()
+            files, page_token = [], None
             
-            results = service.files().list(
-                q="mimeType='application/vnd.google-apps.spreadsheet'",
-                fields="files(id, name, modifiedTime, size)"
-            ).execute()
-            
-            return results.get('files', [])
+            while True:
+                started = time.monotonic()
+                results = service.files().list(
+                    q="mimeType='application/vnd.google-apps.spreadsheet'",
+                    fields="nextPageToken, files(id, name, modifiedTime, size)",
+                    pageSize=DRIVE_PAGE_SIZE,
+                    pageToken=page_token
+                ).execute()
+                record_api_call('GET', DRIVE_FILES_URL, started, 'ok')
+                
+                files.extend(results.get('files', []))
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    return files
         except Exception as e:
             logger.error(f"Error getting list of spreadsheets via Drive API: {e}")
             return []
@@ -98,6 +357,30 @@ class GoogleSheetsManager:
             logger.error(f"Error getting worksheets information: {e}")
             return [], "Error"
 
+    def read_sheets(self, spreadsheet, sheet_names: Optional[List[str]] = None,
+                    dates_as_text: bool = False) -> Dict[str, SheetColumns]:
+        """
+        Читает листы таблицы (по умолчанию все) одним запросом values.batchGet:
+        по колонкам, неформатированные значения, даты - порядковыми номерами
+        (dates_as_text - даты строками в том виде, как они показаны в листе)
+        """
+        if sheet_names is None:
+            sheet_names = [worksheet.title for worksheet in spreadsheet.worksheets()]
+        if not sheet_names:
+            return {}
+
+        params = dict(BATCH_GET_PARAMS)
+        if dates_as_text:
+            params['dateTimeRenderOption'] = 'FORMATTED_STRING'
+        response = spreadsheet.values_batch_get(
+            [absolute_range_name(sheet_name) for sheet_name in sheet_names],
+            params=params
+        )
+        return {
+            sheet_name: SheetColumns.from_value_range(sheet_name, value_range)
+            for sheet_name, value_range in zip(sheet_names, response.get('valueRanges', []))
+        }
+
     def get_worksheet_by_name(self, spreadsheet_id: str, sheet_name: str):
         """Получает конкретный лист по имени"""
         try:
@@ -136,15 +419,105 @@ class GoogleSheetsManager:
             logger.error(f"Error getting spreadsheet information: {e}")
             return None
 
-    def ensure_headers(self, worksheet, headers: List[str]):
-        """Проверяет и устанавливает заголовки в первой строке листа"""
+    def ensure_headers(self, worksheet, headers: List[str]) -> Optional[HeaderLayout]:
+        """
+        Проверяет и устанавливает заголовки в первой строке листа.
+        Проверенная раскладка кешируется - первая строка читается только
+        при первом обращении к листу или после смены его метаданных.
+        """
+        spreadsheet_id, version = worksheet.spreadsheet.id, worksheet_version(worksheet)
+        layout = self.header_cache.get(spreadsheet_id, worksheet.title, version)
+        if layout and layout.headers == headers:
+            return layout
         try:
             current_headers = worksheet.row_values(1)
             if current_headers != headers:
                 logger.info("Updating headers on the sheet")
-                worksheet.update("A1:F1", [headers])
+                worksheet.update(f"A1:{rowcol_to_a1(1, len(headers))}", [headers])
+                current_headers = headers
+            return self.header_cache.store(spreadsheet_id, worksheet.title, current_headers, version)
         except Exception as e:
             logger.error(f"Error setting headers: {e}")
+            return None
+
+    def get_header_layout(self, worksheet, refresh: bool = False) -> HeaderLayout:
+        """Раскладка заголовков листа (из кеша или по первой строке)"""
+        spreadsheet_id, version = worksheet.spreadsheet.id, worksheet_version(worksheet)
+        layout = None if refresh else self.header_cache.get(spreadsheet_id, worksheet.title, version)
+        if layout is None:
+            layout = self.header_cache.observe(spreadsheet_id, worksheet.title,
+                                               worksheet.row_values(1), version)
+        return layout
+
+    def verify_headers(self, spreadsheet, headers: List[str] = RECORD_HEADERS,
+                       sheet_names: Optional[List[str]] = None, fix: bool = False) -> Dict[str, bool]:
+        """
+        Проверяет заголовки листов таблицы одним запросом values.batchGet
+        и запоминает фактические раскладки листов (переставленные или
+        переименованные колонки сбрасывают кеш). При fix=True неверные
+        заголовки исправляются одним values.batchUpdate.
+
+        Returns:
+            {название листа: заголовки верны (или исправлены)}
+        """
+        worksheets = [
+            worksheet for worksheet in spreadsheet.worksheets()
+            if sheet_names is None or worksheet.title in sheet_names
+        ]
+        if not worksheets:
+            return {}
+
+        response = spreadsheet.values_batch_get(
+            [absolute_range_name(worksheet.title, '1:1') for worksheet in worksheets]
+        )
+        header_range = f"A1:{rowcol_to_a1(1, len(headers))}"
+        results, fixes, fixed = {}, [], []
+
+        for worksheet, value_range in zip(worksheets, response.get('valueRanges', [])):
+            rows = value_range.get('values') or [[]]
+            current_headers = rows[0]
+            version = worksheet_version(worksheet)
+            self.header_cache.observe(spreadsheet.id, worksheet.title, current_headers, version)
+            if current_headers != headers and fix:
+                fixes.append({'range': absolute_range_name(worksheet.title, header_range), 'values': [headers]})
+                fixed.append((worksheet.title, version))
+                current_headers = headers
+            results[worksheet.title] = current_headers == headers
+
+        if fixes:
+            logger.info(f"Updating headers on {len(fixes)} sheets of {spreadsheet.id}")
+            spreadsheet.values_batch_update(body={'valueInputOption': 'RAW', 'data': fixes})
+            for sheet_name, version in fixed:
+                self.header_cache.observe(spreadsheet.id, sheet_name, headers, version)
+
+        return results
+
+    def verify_all_headers(self, spreadsheets: Optional[List[Dict]] = None,
+                           exclude: Tuple[str, ...] = ()) -> Dict[str, int]:
+        """
+        Проверка заголовков всех таблиц при старте: по одному values.batchGet
+        на таблицу, проверенные раскладки прогревают кеш (без исправлений)
+        """
+        stats = {'verified_sheets': 0, 'mismatched_sheets': 0, 'errors': 0}
+        if spreadsheets is None:
+            spreadsheets = self.get_all_spreadsheets()
+
+        for spreadsheet_info in spreadsheets:
+            if spreadsheet_info['id'] in exclude:
+                continue
+            try:
+                spreadsheet = self.open_sheet_by_id(spreadsheet_info['id'])
+                if not spreadsheet:
+                    stats['errors'] += 1
+                    continue
+                for matches in self.verify_headers(spreadsheet).values():
+                    stats['verified_sheets' if matches else 'mismatched_sheets'] += 1
+            except Exception as e:
+                logger.error(f"Error verifying headers in {spreadsheet_info['id']}: {e}")
+                stats['errors'] += 1
+
+        logger.info(f"Header verification: {stats}")
+        return stats
 
     def add_record_to_sheet(self, spreadsheet_id: str, sheet_name: str, record: Dict) -> bool:
         """Добавляет запись в Google Sheet с сортировкой по дате, используя пакетную вставку."""
@@ -155,162 +528,86 @@ class GoogleSheetsManager:
                 logger.error(f"Sheet {sheet_name} not found")
                 return False
 
-            headers = ['ID', 'ամսաթիվ', 'մատակարար', 'ուղղություն', 'ծախսի բնութագիր', 'Արժեք']
-            self.ensure_headers(worksheet, headers)
+            self._reset_row_changes()
+            self.ensure_headers(worksheet, RECORD_HEADERS)
 
-            # Конвертируем дату из YYYY-MM-DD в dd.mm.yy формат
-            formatted_date = record.get('date', '')
-            if formatted_date:
-                try:
-                    # Парсим дату в формате YYYY-MM-DD
-                    date_obj = datetime.strptime(formatted_date, '%Y-%m-%d')
-                    formatted_date = date_obj.strftime('%d.%m.%y')
-                except ValueError:
-                    logger.warning(f"Invalid date format: {formatted_date}")
-                    formatted_date = record.get('date', '')
-
-            new_row = [
-                record.get('id', ''),
-                formatted_date,
-                record.get('supplier', ''),
-                record.get('direction', ''),
-                record.get('description', ''),
-                record.get('amount', 0)
-            ]
-
-            # Получаем все записи и сортируем по дате
+            new_row = build_record_row(record)
+
+            # Получаем все записи и находим позицию для вставки по дате
             all_records = worksheet.get_all_records()
-            
-            def safe_sort_key(record):
-                """Безопасная функция для сортировки по дате"""
-                date_str = record.get('ամսաթիվ', '')
-                if not date_str:
-                    return datetime.min
-                try:
-                    parsed_date = safe_parse_date_or_none(date_str)
-                    return datetime.combine(parsed_date, datetime.min.time()) if parsed_date else datetime.min
-                except Exception:
-                    return datetime.min
-            
-            all_records.sort(key=safe_sort_key)
-
-            # Находим правильную позицию для вставки
-            insert_row = len(all_records) + 2  # Если не найдем место, добавим в конец
-
-            if formatted_date:
-                try:
-                    new_date = safe_parse_date_or_none(formatted_date)
-                    if new_date:
-                        for i, existing_record in enumerate(all_records):
-                            existing_date_str = existing_record.get('ամսաթիվ', '')
-                            if existing_date_str:
-                                existing_date = safe_parse_date_or_none(existing_date_str)
-                                if existing_date and new_date < existing_date:
-                                    insert_row = i + 2  # +2 потому что записи начинаются с 2-й строки
-                                    break
-                except Exception as e:
-                    logger.warning(f"Error finding insert position: {e}")
+            insert_row = find_insert_row(all_records, new_row[1])
 
             # Пакетная запись новой строки в таблицу
             worksheet.insert_row(new_row, insert_row)
+            self._row_changed('insert', insert_row)
             logger.info(f"Record {record.get('id')} inserted at position {insert_row} with date sorting")
 
             return True
 
         except Exception as e:
+            if is_layout_error(e):
+                self.header_cache.invalidate(spreadsheet_id, sheet_name)
             logger.error(f"Error adding record to Google Sheets: {e}")
             return False
 
 
     def update_record_in_sheet(self, spreadsheet_id: str, sheet_name: str, 
-                             record_id: str, field: str, new_value) -> bool:
+                             record_id: str, field: str, new_value,
+                             sheet_row: Optional[int] = None) -> bool:
         """Обновляет запись в Google Sheet с пересортировкой при изменении даты"""
+        return self.update_record_fields_in_sheet(spreadsheet_id, sheet_name, record_id,
+                                                  {field: new_value}, sheet_row)
+
+    def update_record_fields_in_sheet(self, spreadsheet_id: str, sheet_name: str,
+                                      record_id: str, fields: Dict,
+                                      sheet_row: Optional[int] = None) -> bool:
+        """
+        Обновляет несколько полей записи одним пакетным запросом
+        (с пересортировкой при изменении даты)
+
+        sheet_row - последняя известная строка записи (проверяется перед записью)
+        """
         try:
+            self._reset_row_changes()
             worksheet = self.get_worksheet_by_name(spreadsheet_id, sheet_name)
             if not worksheet:
                 logger.error(f"Sheet {sheet_name} not found")
                 return False
 
-            records = worksheet.get_all_records()
-            
-            field_mapping = {
-                'date': 'ամսաթիվ',
-                'supplier': 'մատակարար',
-                'direction': 'ուղղություն',
-                'description': 'ծախսի բնութագիր',
-                'amount': 'Արժեք'
-            }
-            
-            sheet_field = field_mapping.get(field, field)
-            
             # Находим запись для обновления
-            record_found = False
-            record_row = None
-            current_record = None
-            
-            logger.debug(f"Searching for record with ID: '{record_id}' in {len(records)} records")
-            
-            for i, row in enumerate(records, start=2):
-                row_id = str(row.get('ID', '')).strip()
-                logger.debug(f"Checking record {i}: ID='{row_id}'")
-                if row_id == record_id:
-                    record_found = True
-                    record_row = i
-                    current_record = row
-                    logger.info(f"Found record {record_id} in row {record_row}")
-                    break
-            
-            if not record_found:
-                logger.error(f"Record {record_id} not found for update. Available IDs: {[str(r.get('ID', '')).strip() for r in records[:5]]}")
-                return False
-            
-            # Подготавливаем новое значение в зависимости от поля
-            formatted_value = new_value
-            if field == 'date' and new_value:
-                try:
-                    # Безопасное парсинг даты
-                    parsed_date = safe_parse_date_or_none(new_value)
-                    if parsed_date:
-                        # Конвертируем в формат dd.mm.yy для записи в таблицу
-                        formatted_value = parsed_date.strftime('%d.%m.%y')
-                        logger.info(f"Converted date '{new_value}' to '{formatted_value}'")
-                    else:
-                        logger.warning(f"Failed to convert date: {new_value}")
-                        formatted_value = str(new_value)
-                except Exception as e:
-                    logger.error(f"Error converting date {new_value}: {e}")
-                    formatted_value = str(new_value)
-            
-            # Обновляем поле в записи
-            headers = worksheet.row_values(1)
-            if sheet_field not in headers:
-                logger.error(f"Field {sheet_field} not found in headers: {headers}")
+            record_row = self._locate_record(worksheet, record_id, sheet_row)
+            if record_row is None:
+                logger.error(f"Record {record_id} not found for update in sheet {sheet_name}")
                 return False
+            logger.info(f"Found record {record_id} in row {record_row}")
+            self._row_changed('locate', record_row)
             
-            col_index = headers.index(sheet_field) + 1
-            worksheet.update_cell(record_row, col_index, formatted_value)
-            logger.info(f"Record {record_id} updated: field '{sheet_field}' = '{formatted_value}'")
+            updates = self._field_updates(self.get_header_layout(worksheet), record_row, fields)
+            if updates is None:
+                # Кешированная раскладка могла устареть - перечитываем заголовки
+                updates = self._field_updates(self.get_header_layout(worksheet, refresh=True),
+                                              record_row, fields, log_missing=True)
+                if updates is None:
+                    return False
+
+            # Обновляем все поля записи одним запросом (как update_cell - USER_ENTERED)
+            try:
+                worksheet.batch_update(updates, value_input_option='USER_ENTERED')
+            except Exception as e:
+                if is_layout_error(e):
+                    self.header_cache.invalidate(spreadsheet_id, sheet_name)
+                raise
+            logger.info(f"Record {record_id} updated: fields {list(fields.keys())}")
             
             # Если обновили дату, проверяем нужна ли пересортировка
-            if field == 'date':
+            if 'date' in fields:
                 logger.info(f"Checking if resorting is needed after date update for record {record_id}")
                 
                 # Получаем обновленные записи для проверки порядка
                 updated_records = worksheet.get_all_records()
                 
                 # Проверяем, нарушен ли порядок сортировки по дате
-                need_resort = False
-                prev_date = None
-                
-                for record in updated_records:
-                    date_str = record.get('ամսաթիվ', '')
-                    if date_str:
-                        current_date = safe_parse_date_or_none(date_str)
-                        if current_date and prev_date and current_date < prev_date:
-                            need_resort = True
-                            logger.info(f"Date order violation detected: {current_date} < {prev_date}")
-                            break
-                        prev_date = current_date
+                need_resort = not is_sorted_by_date(updated_records)
                 
                 # Пересортировка только если действительно нужна
                 if need_resort:
@@ -325,22 +622,42 @@ class GoogleSheetsManager:
             logger.error(f"Error updating record {record_id} in Google Sheets: {e}", exc_info=True)
             return False
 
-    def delete_record_from_sheet(self, spreadsheet_id: str, sheet_name: str, record_id: str) -> bool:
-        """Удаляет запись из Google Sheet"""
+    def _field_updates(self, layout: HeaderLayout, record_row: int, fields: Dict,
+                       log_missing: bool = False) -> Optional[List[Dict]]:
+        """Диапазоны ячеек для обновления полей записи (None - колонка не найдена)"""
+        updates = []
+        for field, new_value in fields.items():
+            sheet_field = RECORD_FIELD_MAPPING.get(field, field)
+            col_index = layout.column(sheet_field)
+            if col_index is None:
+                if log_missing:
+                    logger.error(f"Field {sheet_field} not found in headers: {layout.headers}")
+                return None
+
+            # Подготавливаем новое значение в зависимости от поля
+            updates.append({
+                'range': rowcol_to_a1(record_row, col_index),
+                'values': [[format_sheet_value(field, new_value)]]
+            })
+        return updates
+
+    def delete_record_from_sheet(self, spreadsheet_id: str, sheet_name: str, record_id: str,
+                                 sheet_row: Optional[int] = None) -> bool:
+        """Удаляет запись из Google Sheet (sheet_row - последняя известная строка записи)"""
         try:
+            self._reset_row_changes()
             worksheet = self.get_worksheet_by_name(spreadsheet_id, sheet_name)
             if not worksheet:
                 return False
 
-            records = worksheet.get_all_records()
-            
-            for i, row in enumerate(records, start=2):
-                if str(row.get('ID', '')).strip() == record_id:
-                    worksheet.delete_rows(i)
-                    logger.info(f"Record {record_id} deleted from Google Sheets")
-                    return True
-            
-            return False
+            record_row = self._locate_record(worksheet, record_id, sheet_row)
+            if record_row is None:
+                return False
+
+            worksheet.delete_rows(record_row)
+            self._row_changed('delete', record_row)
+            logger.info(f"Record {record_id} deleted from Google Sheets")
+            return True
 
         except Exception as e:
             logger.error(f"Error deleting record from Google Sheets: {e}")
@@ -360,29 +677,8 @@ class GoogleSheetsManager:
                 logger.info("No records to sort")
                 return True
 
-            # Сортируем записи по дате
-            def get_sort_key(record):
-                date_str = record.get('ամսաթիվ', '')
-                if date_str:
-                    parsed_date = safe_parse_date_or_none(date_str)
-                    if parsed_date:
-                        return datetime.combine(parsed_date, datetime.min.time())
-                return datetime.min
-
-            sorted_records = sorted(all_records, key=get_sort_key)
-
-            # Подготавливаем данные для пакетного обновления
-            sorted_data = []
-            for record in sorted_records:
-                row = [
-                    record.get('ID', ''),
-                    record.get('ամսաթիվ', ''),
-                    record.get('մատակարար', ''),
-                    record.get('ուղղություն', ''),
-                    record.get('ծախսի բնութագիր', ''),
-                    record.get('Արժեք', 0)
-                ]
-                sorted_data.append(row)
+            # Сортируем записи по дате и готовим данные для пакетного обновления
+            sorted_data = sorted_record_rows(all_records)
 
             # Пакетное обновление всех записей начиная со строки 2
             if sorted_data:
@@ -396,8 +692,11 @@ class GoogleSheetsManager:
                 
                 logger.info(f"Updating range {range_name} with {len(sorted_data)} records")
                 worksheet.update(range_name, sorted_data, value_input_option='USER_ENTERED')
+                self._row_changed('sort', rows={
+                    str(row[0]).strip(): i for i, row in enumerate(sorted_data, start=start_row)
+                })
                 
-                logger.info(f"Sheet {sheet_name} sorted by date with batch update ({len(sorted_records)} records)")
+                logger.info(f"Sheet {sheet_name} sorted by date with batch update ({len(sorted_data)} records)")
             else:
                 logger.warning("No data to update after sorting")
 
@@ -416,10 +715,8 @@ class GoogleSheetsManager:
             if not worksheet:
                 return False
 
-            # Define the headers
-            headers = ['ID', 'ամսաթիվ', 'մատակարար', 'ուղղություն', 'ծախսի բնութագիր', 'Արժեք']
             # Ensure the headers are in the worksheet
-            self.ensure_headers(worksheet, headers)
+            self.ensure_headers(worksheet, RECORD_HEADERS)
             
             # Return True if successful
             return True
@@ -459,15 +756,20 @@ def add_record_to_sheet(spreadsheet_id: str, sheet_name: str, record: Dict) -> b
     return sheets_manager.add_record_to_sheet(spreadsheet_id, sheet_name, record)
 
 def update_record_in_sheet(spreadsheet_id: str, sheet_name: str, 
-                          record_id: str, field: str, new_value) -> bool:
+                          record_id: str, field: str, new_value,
+                          sheet_row: Optional[int] = None) -> bool:
     return sheets_manager.update_record_in_sheet(spreadsheet_id, sheet_name, 
-                                               record_id, field, new_value)
+                                               record_id, field, new_value, sheet_row)
 
-def delete_record_from_sheet(spreadsheet_id: str, sheet_name: str, record_id: str) -> bool:
-    return sheets_manager.delete_record_from_sheet(spreadsheet_id, sheet_name, record_id)
+def delete_record_from_sheet(spreadsheet_id: str, sheet_name: str, record_id: str,
+                             sheet_row: Optional[int] = None) -> bool:
+    return sheets_manager.delete_record_from_sheet(spreadsheet_id, sheet_name, record_id, sheet_row)
 
 def initialize_sheet_headers(spreadsheet_id: str, sheet_name: str) -> bool:
     return sheets_manager.initialize_sheet_headers(spreadsheet_id, sheet_name)
 
 def sort_sheet_by_date(spreadsheet_id: str, sheet_name: str) -> bool:
     return sheets_manager.sort_sheet_by_date(spreadsheet_id, sheet_name)
+
+def verify_all_headers(spreadsheets: Optional[List[Dict]] = None, exclude: Tuple[str, ...] = ()) -> Dict[str, int]:
+    return sheets_manager.verify_all_headers(spreadsheets, exclude)
@@ -0,0 +1,237 @@
+"""
+Метрики воркера Google Sheets и вызовов Google API
+
+Простой потокобезопасный реестр счетчиков, гистограмм и вычисляемых
+показателей (gauges). Снимок доступен админу через /sheets_metrics
+и в машиночитаемом виде (JSON).
+"""
+import json
+import threading
+from contextvars import ContextVar
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Tuple
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Границы корзин гистограмм задержек (секунды)
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def percentile(self, pct: float) -> float:
+        """Оценка перцентиля по верхней границе корзины"""
+        if not self.count:
+            return 0.0
+        target = self.count * pct / 100
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return min(self.buckets[index], self.max) if index < len(self.buckets) else self.max
+        return self.max
+
+    def to_dict(self) -> Dict:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 3),
+            'max': round(self.max, 3),
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'buckets': {
+                ('+Inf' if index == len(self.buckets) else str(self.buckets[index])): bucket_count
+                for index, bucket_count in enumerate(self.counts)
+            },
+        }
+
+
+class MetricsRegistry:
+    """Реестр метрик"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._gauges: Dict[str, Callable[[], object]] = {}
+        # Метки текущего потока или asyncio-задачи
+        self._context: ContextVar[Dict[str, str]] = ContextVar('sheets_metrics_context', default={})
+        self.started_at = time.time()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def register_gauge(self, name: str, provider: Callable[[], object]):
+        """Регистрирует показатель, вычисляемый в момент снятия снимка"""
+        self._gauges[name] = provider
+
+    def set_context(self, **labels):
+        """Метки текущего потока/задачи (например, тип выполняемой задачи воркера)"""
+        self._context.set(labels)
+
+    def clear_context(self):
+        self._context.set({})
+
+    def context(self) -> Dict[str, str]:
+        return self._context.get()
+
+    def counter_value(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0)
+
+    def counter_total(self, name: str) -> float:
+        with self._lock:
+            return sum(self._counters.get(name, {}).values())
+
+    def snapshot(self) -> Dict:
+        """Машиночитаемый снимок всех метрик"""
+        with self._lock:
+            counters = {
+                name: [{'labels': dict(key), 'value': value} for key, value in sorted(series.items())]
+                for name, series in self._counters.items()
+            }
+            histograms = {
+                name: [{'labels': dict(key), **histogram.to_dict()} for key, histogram in sorted(series.items(), key=lambda item: item[0])]
+                for name, series in self._histograms.items()
+            }
+        gauges = {}
+        for name, provider in list(self._gauges.items()):
+            try:
+                gauges[name] = provider()
+            except Exception as e:
+                gauges[name] = f"error: {e}"
+        return {
+            'timestamp': time.time(),
+            'uptime_seconds': round(time.time() - self.started_at, 1),
+            'gauges': gauges,
+            'counters': counters,
+            'histograms': histograms,
+        }
+
+    def dump_json(self) -> str:
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2, default=str)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+def _top_series(series: List[Dict], limit: int = 10) -> List[Dict]:
+    return sorted(series, key=lambda item: item['value'], reverse=True)[:limit]
+
+
+def format_metrics_report(snapshot: Dict) -> str:
+    """Краткий текстовый отчет для админа"""
+    gauges = snapshot.get('gauges', {})
+    counters = snapshot.get('counters', {})
+    histograms = snapshot.get('histograms', {})
+
+    lines = ["📈 Google Sheets metrics", ""]
+    lag = gauges.get('sheets_replication_lag_seconds')
+    lines.append(f"⏱ Replication lag: {lag if lag is not None else 0:.1f}s")
+    lines.append(f"📥 Queue size: {gauges.get('sheets_queue_size', 0)}")
+
+    lane_depths = gauges.get('sheets_lane_depth') or {}
+    for lane, depth in sorted(lane_depths.items(), key=lambda item: -item[1])[:10]:
+        lines.append(f"   • {lane}: {depth}")
+
+    lines.append("")
+    lines.append("✅ Tasks:")
+    for item in _top_series(counters.get('sheets_tasks_total', []), 20):
+        labels = item['labels']
+        lines.append(f"   • {labels.get('task_type')} {labels.get('outcome')}: {int(item['value'])}")
+
+    retries = counters.get('sheets_task_retries_total', [])
+    if retries:
+        lines.append("🔁 Retries:")
+        for item in _top_series(retries):
+            labels = item['labels']
+            lines.append(f"   • {labels.get('task_type')} ({labels.get('reason')}): {int(item['value'])}")
+
+    latency = histograms.get('sheets_task_commit_latency_seconds', [])
+    if latency:
+        lines.append("⌛ Enqueue → commit (p50 / p95 / max):")
+        for item in latency:
+            lines.append(f"   • {item['labels'].get('task_type')}: "
+                         f"{item['p50']}s / {item['p95']}s / {item['max']}s (n={item['count']})")
+
+    skipped = counters.get('sheets_sync_skipped_total', [])
+    if skipped:
+        lines.append("⏭ Sync skipped as unchanged:")
+        for item in skipped:
+            labels = item['labels']
+            lines.append(f"   • {labels.get('operation')} {labels.get('level')}: {int(item['value'])}")
+
+    cache_requests = counters.get('sheets_cache_requests_total', [])
+    if cache_requests:
+        lines.append("🗂 Sheet metadata cache, user requests (hit / stale / miss):")
+        per_kind: Dict[str, Dict[str, float]] = {}
+        for item in cache_requests:
+            labels = item['labels']
+            per_kind.setdefault(labels.get('kind'), {})[labels.get('result')] = item['value']
+        for kind, results in sorted(per_kind.items()):
+            total = sum(results.values())
+            misses = results.get('miss', 0)
+            lines.append(f"   • {kind}: {int(results.get('hit', 0))} / {int(results.get('stale', 0))} / "
+                         f"{int(misses)} ({misses / total:.0%} misses)")
+
+    lines.append("")
+    executions = {item['labels'].get('task_type'): item['value']
+                  for item in counters.get('sheets_task_executions_total', [])}
+    lines.append("🌐 API calls per task type (total / per execution):")
+    for item in _top_series(counters.get('google_api_calls_by_task_total', [])):
+        task_type = item['labels'].get('task_type')
+        per_execution = item['value'] / executions[task_type] if executions.get(task_type) else 0
+        lines.append(f"   • {task_type}: {int(item['value'])} / {per_execution:.1f}")
+
+    lines.append("🌐 API calls per operation:")
+    for item in _top_series(counters.get('google_api_calls_total', [])):
+        labels = item['labels']
+        lines.append(f"   • {labels.get('operation')} [{labels.get('status')}]: {int(item['value'])}")
+
+    traffic = counters.get('google_api_bytes_total', [])
+    if traffic:
+        lines.append("📦 API traffic per spreadsheet (bytes):")
+        per_spreadsheet: Dict[str, float] = {}
+        for item in traffic:
+            spreadsheet = item['labels'].get('spreadsheet', '-')
+            per_spreadsheet[spreadsheet] = per_spreadsheet.get(spreadsheet, 0) + item['value']
+        for spreadsheet, value in sorted(per_spreadsheet.items(), key=lambda kv: -kv[1])[:10]:
+            lines.append(f"   • {spreadsheet}: {int(value)}")
+
+    return "\n".join(lines)
+
+
+# Глобальный реестр метрик
+metrics = MetricsRegistry()
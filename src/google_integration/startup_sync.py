@@ -0,0 +1,129 @@
+"""
+Фоновая синхронизация с Google Sheets при запуске бота
+
+Инициализация таблицы платежей, синхронизация платежей (инкрементальная,
+по водяным знакам) и затем проверка заголовков листов выполняются в
+отдельном потоке, пока бот уже принимает обновления. Событие готовности
+платежей устанавливается сразу после синхронизации платежей, не дожидаясь
+проверки заголовков. Обработчики, которым нужны синхронизированные
+платежи, ждут его (не дольше STARTUP_SYNC_WAIT_TIMEOUT секунд), остальные
+работают сразу.
+"""
+import asyncio
+import threading
+import time
+from typing import Optional
+
+from .sheets_metrics import metrics
+from ..config.settings import PAYMENTS_SPREADSHEET_ID, STARTUP_SYNC_WAIT_TIMEOUT, logger
+
+# Период опроса события готовности платежей ожидающими обработчиками (секунды)
+WAIT_POLL_INTERVAL = 0.1
+
+
+class StartupSync:
+    """Синхронизация при запуске в фоновом потоке с событием готовности платежей"""
+
+    def __init__(self):
+        self.payments_ready = threading.Event()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> threading.Thread:
+        """Запускает синхронизацию (повторный вызов возвращает уже запущенный поток)"""
+        if self._thread is None:
+            self.started_at = time.monotonic()
+            self._thread = threading.Thread(target=self.run, name='startup-sync', daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def run(self):
+        try:
+            try:
+                self._sync_payments()
+            finally:
+                self.payments_ready.set()
+                ready_in = time.monotonic() - (self.started_at or time.monotonic())
+                metrics.observe('startup_payments_ready_seconds', ready_in)
+                logger.info(f"Startup payments sync finished in {ready_in:.1f}s")
+            self._verify_headers()
+        finally:
+            self.finished_at = time.monotonic()
+            duration = self.finished_at - (self.started_at or self.finished_at)
+            metrics.observe('startup_sync_seconds', duration)
+            logger.info(f"Startup sync finished in {duration:.1f}s")
+
+    def _verify_headers(self):
+        """Проверка заголовков всех листов (один пакетный запрос на таблицу)"""
+        try:
+            from .sheets_manager import get_all_spreadsheets, verify_all_headers
+            from ..utils.sheets_cache import store_cached_spreadsheets
+
+            logger.info("🔍 Verifying sheet headers...")
+            spreadsheets = get_all_spreadsheets()
+            if spreadsheets:
+                store_cached_spreadsheets(spreadsheets)
+            verify_all_headers(spreadsheets, exclude=(PAYMENTS_SPREADSHEET_ID,))
+        except Exception as e:
+            logger.error(f"❌ Error verifying sheet headers: {e}", exc_info=True)
+
+    def _sync_payments(self):
+        """Инициализация таблицы платежей и синхронизация платежей"""
+        try:
+            from .payments_sheets_manager import PaymentsSheetsManager
+            from .payments_sync_manager import PaymentsSyncManager
+
+            if not PAYMENTS_SPREADSHEET_ID:
+                logger.warning("⚠️ PAYMENTS_SPREADSHEET_ID not set. Payment synchronization disabled.")
+                return
+
+            logger.info("📊 Initializing payments table...")
+            if not PaymentsSheetsManager().initialize_payment_sheets():
+                logger.warning("⚠️ Failed to initialize payments table")
+                return
+            logger.info("✅ Payments table initialized")
+
+            logger.info("🔄 Syncing payments...")
+            stats = PaymentsSyncManager().sync_payments()
+            logger.info(
+                f"✅ Payment synchronization completed. "
+                f"Total added: {stats['total_added']}, "
+                f"Errors: {stats['total_errors']}"
+            )
+        except Exception as e:
+            logger.error(f"❌ Error during payment initialization: {e}", exc_info=True)
+
+    async def wait_payments(self, timeout: float = STARTUP_SYNC_WAIT_TIMEOUT) -> bool:
+        """
+        Ждет окончания синхронизации платежей, не блокируя цикл событий.
+        Если синхронизация не запускалась, ждать нечего.
+
+        Returns:
+            False - истек таймаут (данные БД используются как есть)
+        """
+        if self._thread is None or self.payments_ready.is_set():
+            return True
+        # Событие опрашивается в цикле событий: ожидание в потоке пула занимало бы
+        # поток исполнителя по умолчанию, нужный воркеру Google Sheets (to_thread)
+        started = time.monotonic()
+        deadline = started + timeout
+        while not self.payments_ready.is_set() and time.monotonic() < deadline:
+            await asyncio.sleep(min(WAIT_POLL_INTERVAL, max(0.0, deadline - time.monotonic())))
+        ready = self.payments_ready.is_set()
+        metrics.observe('startup_sync_wait_seconds', time.monotonic() - started)
+        if not ready:
+            logger.warning(f"Startup payments sync is still running after {timeout:.0f}s, using DB data as is")
+        return ready
+
+
+# Глобальный экземпляр
+startup_sync = StartupSync()
+
+
+def start_startup_sync() -> threading.Thread:
+    return startup_sync.start()
+
+
+async def wait_for_payments_sync(timeout: float = STARTUP_SYNC_WAIT_TIMEOUT) -> bool:
+    return await startup_sync.wait_payments(timeout)
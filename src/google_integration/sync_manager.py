@@ -1,210 +1,329 @@
 """
 Расширенный менеджер для Google Sheets с полной синхронизацией
 """
-from typing import Dict, Optional
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from gspread.utils import absolute_range_name
+
 from .sheets_manager import GoogleSheetsManager
-from ..database.database_manager import DatabaseManager, get_all_records
-from ..utils.date_utils import normalize_date
-from ..config.settings import logger
+from .drift import DriftRepair, DriftReport, SheetDrift
+from .reconciliation import (
+    ID_COLUMN_RANGE, ReconciliationReport, SheetDiff, SheetsReconciler, id_column_values
+)
+from .sheet_columns import BATCH_GET_PARAMS, SheetColumns, record_rows
+from .rate_limiter import rate_limiter
+from .sheets_metrics import metrics
+from ..database.database_manager import DatabaseManager
+from ..database.sheets_sync_state import SheetsSyncState
+from ..utils.sheets_cache import store_cached_spreadsheets
+from ..config.settings import FULL_SYNC_CONCURRENCY, logger
+
+# Запросов на чтение при синхронизации одной таблицы: метаданные, список листов, values.batchGet
+SPREADSHEET_SYNC_READS = 3
+
+# Операции, для которых хранится modifiedTime обработанных таблиц
+FULL_SYNC_SCOPE = 'full_sync'
+INIT_HEADERS_SCOPE = 'init_headers'
 
 class SyncManager:
     """Менеджер синхронизации между Google Sheets и локальной БД"""
     
-    def __init__(self, sheets_manager: GoogleSheetsManager, db_manager: DatabaseManager):
+    def __init__(self, sheets_manager: GoogleSheetsManager, db_manager: DatabaseManager,
+                 sync_state: Optional[SheetsSyncState] = None):
         self.sheets = sheets_manager
         self.db = db_manager
+        self.sync_state = sync_state or SheetsSyncState()
+        self._db_lock = threading.Lock()
+        self.reconciler = SheetsReconciler(sheets_manager)
+        self.drift = DriftRepair(sheets_manager, db_manager, self.sync_state)
+    
+    def _is_unchanged(self, spreadsheet: Dict, synced_times: Dict[str, str], operation: str) -> bool:
+        """Таблица не менялась с последней успешной обработки (по Drive modifiedTime)"""
+        modified_time = spreadsheet.get('modifiedTime')
+        if modified_time and synced_times.get(spreadsheet['id']) == modified_time:
+            metrics.inc('sheets_sync_skipped_total', operation=operation, level='spreadsheet')
+            return True
+        return False
     
-    async def full_sync(self) -> Dict[str, int]:
+    async def full_sync(self, force: bool = False,
+                        progress: Optional[Callable[[int, int, Dict[str, int]], Awaitable]] = None,
+                        cancel_event: Optional[threading.Event] = None,
+                        concurrency: int = FULL_SYNC_CONCURRENCY) -> Dict[str, int]:
         """
         Полная синхронизация всех таблиц и листов
         Возвращает статистику синхронизации
+        
+        Таблицы, не изменившиеся с прошлой синхронизации (Drive modifiedTime),
+        и листы с тем же хешем содержимого пропускаются; force=True
+        обрабатывает все таблицы и листы.
+        
+        Таблицы синхронизируются параллельно (не более concurrency одновременно)
+        в потоках, не блокируя event loop. После каждой таблицы вызывается
+        progress(done, total, stats); установленный cancel_event останавливает
+        синхронизацию после текущих листов.
         """
         stats = {
             'processed_sheets': 0,
             'synced_records': 0,
             'new_records': 0,
-            'errors': 0
+            'skipped_spreadsheets': 0,
+            'skipped_sheets': 0,
+            'errors': 0,
+            'cancelled': 0
         }
+        cancel_event = cancel_event or threading.Event()
+        jobs = []
         
         try:
             # Получаем все доступные таблицы
-            spreadsheets = self.sheets.get_all_spreadsheets()
+            spreadsheets = await asyncio.to_thread(self.sheets.get_all_spreadsheets)
+            if spreadsheets:
+                store_cached_spreadsheets(spreadsheets)
             
+            synced_times = {} if force else await asyncio.to_thread(
+                self.sync_state.get_modified_times, FULL_SYNC_SCOPE
+            )
+            pending = []
             for spreadsheet in spreadsheets:
-                spreadsheet_id = spreadsheet['id']
-                
-                try:
-                    # Получаем информацию о листах
-                    sheets_info, title = self.sheets.get_worksheets_info(spreadsheet_id)
-                    
-                    for sheet_info in sheets_info:
-                        if isinstance(sheet_info, dict):
-                            sheet_name = sheet_info.get('title') or sheet_info.get('name')
-                            await self.sync_sheet(spreadsheet_id, sheet_name, stats)
-                            stats['processed_sheets'] += 1
-                        
-                except Exception as e:
-                    logger.error(f"Error synchronizing spreadsheet {spreadsheet_id}: {e}")
-                    stats['errors'] += 1
+                if self._is_unchanged(spreadsheet, synced_times, FULL_SYNC_SCOPE):
+                    stats['skipped_spreadsheets'] += 1
+                else:
+                    pending.append(spreadsheet)
+            
+            total, done = len(spreadsheets), stats['skipped_spreadsheets']
+            await self._report_progress(progress, done, total, stats)
+            
+            semaphore = asyncio.Semaphore(max(1, concurrency))
+            
+            async def run_job(spreadsheet: Dict) -> Optional[Dict[str, int]]:
+                async with semaphore:
+                    if cancel_event.is_set():
+                        return None
+                    # Таблица стоит несколько запросов на чтение - ждем и резервируем квоту,
+                    # чтобы синхронизация не вытесняла воркер записи
+                    delay, reservation = rate_limiter.reserve(reads=SPREADSHEET_SYNC_READS)
+                    while reservation is None:
+                        await asyncio.sleep(delay)
+                        delay, reservation = rate_limiter.reserve(reads=SPREADSHEET_SYNC_READS)
+                    with rate_limiter.reserved(reservation):
+                        return await asyncio.to_thread(self._sync_spreadsheet, spreadsheet, force, cancel_event)
+            
+            jobs = [asyncio.ensure_future(run_job(spreadsheet)) for spreadsheet in pending]
+            for job in asyncio.as_completed(jobs):
+                job_stats = await job
+                for key, value in (job_stats or {}).items():
+                    stats[key] += value
+                done += 1
+                await self._report_progress(progress, done, total, stats)
 
+        except asyncio.CancelledError:
+            cancel_event.set()
+            for job in jobs:
+                job.cancel()
+            raise
         except Exception as e:
             logger.error(f"Error during full synchronization: {e}")
             stats['errors'] += 1
         
+        stats['cancelled'] = int(cancel_event.is_set())
+        if stats['cancelled']:
+            logger.info(f"Full synchronization cancelled: {stats}")
+        return stats
+    
+    async def _report_progress(self, progress, done: int, total: int, stats: Dict[str, int]):
+        if progress is None:
+            return
+        try:
+            await progress(done, total, stats)
+        except Exception as e:
+            logger.warning(f"Error reporting sync progress: {e}")
+    
+    def _sync_spreadsheet(self, spreadsheet: Dict, force: bool,
+                          cancel_event: threading.Event) -> Dict[str, int]:
+        """Синхронизирует одну таблицу (выполняется в потоке, возвращает свою статистику)"""
+        stats = {'processed_sheets': 0, 'synced_records': 0, 'new_records': 0,
+                 'skipped_sheets': 0, 'errors': 0}
+        spreadsheet_id = spreadsheet['id']
+        
+        try:
+            spreadsheet_obj = self.sheets.open_sheet_by_id(spreadsheet_id)
+            if not spreadsheet_obj:
+                stats['errors'] += 1
+                return stats
+            
+            sheet_hashes = {} if force else self.sync_state.get_sheet_hashes(spreadsheet_id)
+            
+            # Все листы таблицы читаются одним запросом values.batchGet
+            for sheet_name, data in self.sheets.read_sheets(spreadsheet_obj).items():
+                if cancel_event.is_set():
+                    return stats
+                
+                digest = data.content_hash()
+                if sheet_hashes.get(sheet_name) == digest:
+                    stats['skipped_sheets'] += 1
+                    metrics.inc('sheets_sync_skipped_total', operation=FULL_SYNC_SCOPE, level='sheet')
+                    continue
+                
+                sheet_errors = stats['errors']
+                self.sync_sheet_data(spreadsheet_id, data, stats)
+                stats['processed_sheets'] += 1
+                metrics.inc('sheets_sync_processed_total', operation=FULL_SYNC_SCOPE, level='sheet')
+                if stats['errors'] == sheet_errors:
+                    self.sync_state.set_sheet_hash(spreadsheet_id, sheet_name, digest)
+            
+            # Таблица запоминается, только если все ее листы обработаны без ошибок
+            if not stats['errors']:
+                self.sync_state.set_modified_time(FULL_SYNC_SCOPE, spreadsheet_id,
+                                                  spreadsheet.get('modifiedTime'))
+                
+        except Exception as e:
+            logger.error(f"Error synchronizing spreadsheet {spreadsheet_id}: {e}")
+            stats['errors'] += 1
+        
         return stats
     
     async def sync_sheet(self, spreadsheet_id: str, sheet_name: str, stats: Dict[str, int]):
         """Синхронизирует конкретный лист"""
         try:
-            worksheet = self.sheets.get_worksheet_by_name(spreadsheet_id, sheet_name)
-            if not worksheet:
-                logger.warning(f"Sheet {sheet_name} not found")
+            spreadsheet_obj = self.sheets.open_sheet_by_id(spreadsheet_id)
+            if not spreadsheet_obj:
+                logger.warning(f"Spreadsheet {spreadsheet_id} not found")
                 return
             
-            # Получаем все записи с листа
-            rows = worksheet.get_all_records()
-            
-            for row in rows:
-                if self.is_valid_record(row):
-                    record_id = str(row.get('ID', '')).strip()
-                    
-                    # Проверяем, есть ли запись в БД
-                    if not self.db.get_record(record_id):
-                        # Создаем новую запись
-                        record = self.sheet_row_to_record(row, spreadsheet_id, sheet_name)
-                        if record and self.db.add_record(record):
-                            stats['new_records'] += 1
-                            logger.info(f"Added new record: {record_id}")
-
-                    stats['synced_records'] += 1
+            data = self.sheets.read_sheets(spreadsheet_obj, [sheet_name]).get(sheet_name)
+            if data is not None:
+                self.sync_sheet_data(spreadsheet_id, data, stats)
 
         except Exception as e:
             logger.error(f"Error synchronizing sheet {sheet_name}: {e}")
             stats['errors'] += 1
     
-    def is_valid_record(self, row: Dict) -> bool:
-        """Проверяет, является ли строка валидной записью"""
-        return (
-            row.get('ID') and 
-            row.get('մատակարար') and 
-            row.get('Արժեք')
-        )
-    
-    def sheet_row_to_record(self, row: Dict, spreadsheet_id: str, sheet_name: str) -> Optional[Dict]:
-        """Преобразует строку из Google Sheets в формат записи БД"""
+    def sync_sheet_data(self, spreadsheet_id: str, data: SheetColumns, stats: Dict[str, int]):
+        """Добавляет в БД записи прочитанного листа, которых там еще нет"""
         try:
-            # Парсим сумму
-            amount_str = str(row.get('Արժեք', '0')).replace(',', '.').replace(' ', '')
-            try:
-                amount = float(amount_str)
-            except ValueError:
-                amount = 0.0
-            
-            # Нормализуем дату
-            date_str = str(row.get('ամսաթիվ', '')).strip()
-            normalized_date = normalize_date(date_str) if date_str else ''
+            records = self.sheet_columns_to_records(data, spreadsheet_id)
             
-            record = {
-                'id': str(row.get('ID', '')).strip(),
-                'date': normalized_date,
-                'supplier': str(row.get('մատակարար', '')).strip(),
-                'direction': str(row.get('ուղղություն', '')).strip(),
-                'description': str(row.get('ծախսի բնութագիր', '')).strip(),
-                'amount': amount,
-                'spreadsheet_id': spreadsheet_id,
-                'sheet_name': sheet_name,
-                'user_id': None  # Будет определен позже
-            }
-            
-            return record
+            # Одна транзакция на лист; листы синхронизируются в нескольких потоках,
+            # поэтому запись в SQLite выполняется по очереди
+            with self._db_lock:
+                added = self.db.add_missing_records(records)
             
+            if added is None:
+                stats['errors'] += 1
+                return
+            if added:
+                logger.info(f"Added {added} new records from sheet {data.title}")
+            stats['new_records'] += added
+            stats['synced_records'] += len(records)
+
         except Exception as e:
-            logger.error(f"Error converting row: {e}")
-            return None
+            logger.error(f"Error synchronizing sheet {data.title}: {e}")
+            stats['errors'] += 1
+    
+    def sheet_columns_to_records(self, data: SheetColumns, spreadsheet_id: str) -> List[Dict]:
+        """
+        Преобразует колонки листа в записи БД. Валидная запись - с ID,
+        поставщиком и суммой; суммы и даты очищаются по колонкам целиком.
+        """
+        return [record for _, record in record_rows(data, spreadsheet_id)]
     
-    async def sync_db_to_sheets(self) -> Dict[str, int]:
+    async def sync_db_to_sheets(self, dry_run: bool = False) -> Dict[str, int]:
         """
         Синхронизирует записи из БД в Google Sheets
         (для записей, которых нет в таблицах)
-        """
-        stats = {
-            'processed_records': 0,
-            'synced_records': 0,
-            'errors': 0
-        }
         
+        Недостающие записи находятся сверкой множеств ID (одно чтение колонки ID
+        на таблицу) и дописываются одним запросом на лист; подробности - в
+        reconcile_db_to_sheets.
+        """
+        report = await self.reconcile_db_to_sheets(dry_run)
+        return report.stats()
+    
+    async def reconcile_db_to_sheets(self, dry_run: bool = False) -> ReconciliationReport:
+        """Сверяет записи БД с листами и возвращает отчет о расхождениях по каждому листу"""
         try:
-            # Получаем все записи из БД
-            db_records = get_all_records()
-            
-            for record in db_records:
-                try:
-                    spreadsheet_id = record.get('spreadsheet_id')
-                    sheet_name = record.get('sheet_name')
-                    
-                    if spreadsheet_id and sheet_name:
-                        # Проверяем, есть ли запись в Google Sheets
-                        if not await self.record_exists_in_sheet(spreadsheet_id, sheet_name, record['id']):
-                            # Добавляем запись в Google Sheets
-                            if self.sheets.add_record_to_sheet(spreadsheet_id, sheet_name, record):
-                                stats['synced_records'] += 1
-                                logger.info(f"Record {record['id']} synchronized to Google Sheets")
-
-                    stats['processed_records'] += 1
-
-                except Exception as e:
-                    logger.error(f"Error synchronizing record {record.get('id')}: {e}")
-                    stats['errors'] += 1
-
+            records = await asyncio.to_thread(self.db.get_all_records)
+            return await asyncio.to_thread(self.reconciler.reconcile, records, dry_run)
         except Exception as e:
             logger.error(f"Error synchronizing DB to Sheets: {e}")
-            stats['errors'] += 1
-        
-        return stats
+            report = ReconciliationReport(dry_run=dry_run)
+            report.sheets.append(SheetDiff('', '', error=str(e)))
+            return report
+    
+    async def repair_drift(self, policy: Optional[str] = None, dry_run: bool = False,
+                           force: bool = False) -> DriftReport:
+        """
+        Трехсторонняя сверка полей БД и листов: изменения переносятся в ту сторону,
+        где их нет, конфликты решаются политикой (db, sheet или report)
+        """
+        try:
+            return await asyncio.to_thread(self.drift.repair, policy, dry_run, force)
+        except Exception as e:
+            logger.error(f"Error repairing drift between DB and Sheets: {e}")
+            report = DriftReport(policy or self.drift.policy, dry_run)
+            report.sheets.append(SheetDrift('', '', error=str(e)))
+            return report
     
     async def record_exists_in_sheet(self, spreadsheet_id: str, sheet_name: str, record_id: str) -> bool:
-        """Проверяет, существует ли запись в Google Sheets"""
+        """Проверяет, существует ли запись в Google Sheets (читается только колонка ID)"""
         try:
-            worksheet = self.sheets.get_worksheet_by_name(spreadsheet_id, sheet_name)
-            if not worksheet:
+            spreadsheet = self.sheets.open_sheet_by_id(spreadsheet_id)
+            if not spreadsheet:
                 return False
             
-            records = worksheet.get_all_records()
-            for row in records:
-                if str(row.get('ID', '')).strip() == record_id:
-                    return True
-            
-            return False
+            response = spreadsheet.values_batch_get(
+                [absolute_range_name(sheet_name, ID_COLUMN_RANGE)], params=dict(BATCH_GET_PARAMS)
+            )
+            _, sheet_ids = id_column_values((response.get('valueRanges') or [{}])[0])
+            return record_id in sheet_ids
             
         except Exception as e:
             logger.error(f"Error checking record existence: {e}")
             return False
     
-    async def initialize_all_sheets(self) -> Dict[str, int]:
-        """Инициализирует заголовки во всех листах"""
+    async def initialize_all_sheets(self, force: bool = False) -> Dict[str, int]:
+        """
+        Инициализирует заголовки во всех листах (одно чтение и одна запись на таблицу).
+        Таблицы, не изменившиеся с прошлой инициализации, пропускаются (кроме force=True).
+        """
         stats = {
             'processed_sheets': 0,
             'initialized_sheets': 0,
+            'skipped_spreadsheets': 0,
             'errors': 0
         }
         
         try:
             spreadsheets = self.sheets.get_all_spreadsheets()
+            if spreadsheets:
+                store_cached_spreadsheets(spreadsheets)
+            
+            synced_times = {} if force else self.sync_state.get_modified_times(INIT_HEADERS_SCOPE)
             
             for spreadsheet in spreadsheets:
                 spreadsheet_id = spreadsheet['id']
                 
+                if self._is_unchanged(spreadsheet, synced_times, INIT_HEADERS_SCOPE):
+                    stats['skipped_spreadsheets'] += 1
+                    continue
+                
                 try:
-                    sheets_info, title = self.sheets.get_worksheets_info(spreadsheet_id)
+                    spreadsheet_obj = self.sheets.open_sheet_by_id(spreadsheet_id)
+                    if not spreadsheet_obj:
+                        stats['errors'] += 1
+                        continue
                     
-                    for sheet_info in sheets_info:
-                        if isinstance(sheet_info, dict):
-                            sheet_name = sheet_info.get('title') or sheet_info.get('name')
-                            
-                            if self.sheets.initialize_sheet_headers(spreadsheet_id, sheet_name):
-                                stats['initialized_sheets'] += 1
-                            
-                            stats['processed_sheets'] += 1
+                    results = self.sheets.verify_headers(spreadsheet_obj, fix=True)
+                    for initialized in results.values():
+                        if initialized:
+                            stats['initialized_sheets'] += 1
+                        stats['processed_sheets'] += 1
+                    
+                    if all(results.values()):
+                        self.sync_state.set_modified_time(INIT_HEADERS_SCOPE, spreadsheet_id,
+                                                          spreadsheet.get('modifiedTime'))
                             
                 except Exception as e:
                     logger.error(f"Error initializing spreadsheet {spreadsheet_id}: {e}")
@@ -223,11 +342,14 @@ from ..database.database_manager import db_manager
 sync_manager = SyncManager(sheets_manager, db_manager)
 
 # Экспортируем функции для обратной совместимости
-async def full_sync():
-    return await sync_manager.full_sync()
+async def full_sync(force: bool = False, progress=None, cancel_event: Optional[threading.Event] = None):
+    return await sync_manager.full_sync(force, progress, cancel_event)
+
+async def sync_db_to_sheets(dry_run: bool = False):
+    return await sync_manager.sync_db_to_sheets(dry_run)
 
-async def sync_db_to_sheets():
-    return await sync_manager.sync_db_to_sheets()
+async def repair_drift(policy: Optional[str] = None, dry_run: bool = False, force: bool = False):
+    return await sync_manager.repair_drift(policy, dry_run, force)
 
-async def initialize_all_sheets():
-    return await sync_manager.initialize_all_sheets()
+async def initialize_all_sheets(force: bool = False):
+    return await sync_manager.initialize_all_sheets(force)
@@ -42,17 +42,20 @@ from src.bot.handlers.admin_handlers import (
     set_log_command, set_report_command, allow_user_command,
     disallow_user_command, allowed_users_command, set_user_name_command,
     export_command, sync_sheets_command, initialize_sheets_command, set_sheet_command,
-    send_data_files_command, add_backup_chat_command, scheduled_backup_job
+    send_data_files_command, add_backup_chat_command, scheduled_backup_job,
+    sheets_metrics_command, sheets_drift_command, sync_payments_command
 )
 from src.bot.handlers.admin_commands import clean_duplicates_command
 from src.bot.handlers.search_commands import (
     search_command, recent_command, info_command, my_report_command
 )
 from src.bot.handlers.button_handlers import button_handler
+from src.bot.handlers.cache_handlers import sheets_cache_warmup_job, sheets_cache_refresh_job
 from src.bot.handlers.error_handler import error_handler
 from src.config.settings import TOKEN, logger
 from src.database.database_manager import init_db
-from src.google_integration.async_sheets_worker import start_worker, stop_worker
+from src.google_integration.async_sheets_worker import start_worker, start_worker_in_loop, stop_worker
+from src.google_integration.startup_sync import start_startup_sync
 
 
 def main():
@@ -75,39 +78,13 @@ def main():
         start_worker()
         logger.info("🔄 Google Sheets async worker started")
 
-        # Инициализация таблицы платежей и синхронизация
-        try:
-            from src.google_integration.payments_sheets_manager import PaymentsSheetsManager
-            from src.google_integration.payments_sync_manager import PaymentsSyncManager
-            from src.config.settings import PAYMENTS_SPREADSHEET_ID
-
-            if PAYMENTS_SPREADSHEET_ID:
-                logger.info("📊 Initializing payments table...")
-                payments_sheets = PaymentsSheetsManager()
-
-                if payments_sheets.initialize_payment_sheets():
-                    logger.info("✅ Payments table initialized")
-
-                    # Sync payments
-                    logger.info("🔄 Syncing payments...")
-                    sync_manager = PaymentsSyncManager()
-                    stats = sync_manager.full_sync_payments()
-
-                    logger.info(
-                        f"✅ Payment synchronization completed. "
-                        f"Total added: {stats['total_added']}, "
-                        f"Errors: {stats['total_errors']}"
-                    )
-                else:
-                    logger.warning("⚠️ Failed to initialize payments table")
-            else:
-                logger.warning("⚠️ PAYMENTS_SPREADSHEET_ID not set. Payment synchronization disabled.")
-
-        except Exception as e:
-            logger.error(f"❌ Error during payment initialization: {e}", exc_info=True)
+        # Проверка заголовков и синхронизация платежей - в фоне, бот отвечает сразу
+        start_startup_sync()
+        logger.info("🔄 Startup sync started in background")
 
         # Создание приложения
-        application = Application.builder().token(TOKEN).build()
+        # В режиме SHEETS_WORKER_MODE=asyncio воркер запускается в цикле событий бота
+        application = Application.builder().token(TOKEN).post_init(start_worker_in_loop).build()
         
         # Создание ConversationHandler'ов
         add_record_conv = create_add_record_conversation()
@@ -181,9 +158,12 @@ def main():
         application.add_handler(CommandHandler("set_user_name", set_user_name_command))
         application.add_handler(CommandHandler("export", export_command))
         application.add_handler(CommandHandler("sync_sheets", sync_sheets_command))
+        application.add_handler(CommandHandler("sync_payments", sync_payments_command))
         application.add_handler(CommandHandler("initialize_sheets", initialize_sheets_command))
         application.add_handler(CommandHandler("send_data_files", send_data_files_command))
         application.add_handler(CommandHandler("add_backup_chat", add_backup_chat_command))
+        application.add_handler(CommandHandler("sheets_metrics", sheets_metrics_command))
+        application.add_handler(CommandHandler("sheets_drift", sheets_drift_command))
 
         # Настройка автоматического бэкапа
         from src.config.settings import BACKUP_CHAT_ID, BACKUP_INTERVAL_HOURS
@@ -200,6 +180,18 @@ def main():
         else:
             logger.info("BACKUP_CHAT_ID not set, automatic backup disabled")
 
+        # Прогрев кеша листов после запуска и его обновление до истечения срока
+        from src.config.settings import SHEETS_CACHE_REFRESH_MINUTES
+        application.job_queue.run_once(sheets_cache_warmup_job, when=5, name="sheets_cache_warmup")
+        if SHEETS_CACHE_REFRESH_MINUTES > 0:
+            logger.info(f"Setting up sheets cache refresh every {SHEETS_CACHE_REFRESH_MINUTES} minutes")
+            application.job_queue.run_repeating(
+                sheets_cache_refresh_job,
+                interval=SHEETS_CACHE_REFRESH_MINUTES * 60,
+                first=SHEETS_CACHE_REFRESH_MINUTES * 60,
+                name="sheets_cache_refresh"
+            )
+
         # Отдельные обработчики для специфичных callback'ов (должны быть ДО общего button_handler)
         from src.bot.handlers.edit_handlers import confirm_delete, cancel_edit
         logger.info("Registering handlers for confirm_delete_ and cancel_edit_")
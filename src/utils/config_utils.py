@@ -2,6 +2,7 @@
 Утилиты для работы с конфигурацией и пользователями
 """
 import json
+import os
 from ..config.settings import USERS_FILE, ALLOWED_USERS_FILE, BOT_CONFIG_FILE, logger
 
 
@@ -72,8 +73,34 @@ def load_users():
 
 def save_users(users_data):
     """Сохраняет данные пользователей"""
+    _display_name_roles['key'] = None
     return save_json_file(USERS_FILE, users_data)
 
+# Кеш {display_name: роль}; ключ - (mtime, размер) файла пользователей на момент построения
+_display_name_roles = {'key': None, 'roles': {}}
+
+def get_display_name_roles() -> dict:
+    """
+    Возвращает {display_name: роль} всех пользователей (без роли - worker).
+    Файл пользователей перечитывается, только если он изменился.
+    """
+    from ..config.settings import UserRole
+
+    try:
+        stat = os.stat(USERS_FILE)
+        key = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        key = None
+    if key is None or key != _display_name_roles['key']:
+        roles = {}
+        for user_data in load_users().values():
+            display_name = user_data.get('display_name')
+            if display_name:
+                # Как и при поиске по списку, побеждает первый пользователь с этим именем
+                roles.setdefault(display_name, user_data.get('role', UserRole.WORKER))
+        _display_name_roles.update(key=key, roles=roles)
+    return _display_name_roles['roles']
+
 def get_user_settings(user_id: int):
     """Получает настройки пользователя"""
     users = load_users()
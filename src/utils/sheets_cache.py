@@ -1,12 +1,32 @@
 """
 Кеширование данных о листах Google Sheets для быстрого доступа
+
+Блокировка кеша защищает только словари и никогда не удерживается во
+время запросов к API. Загрузка каждого ключа (список таблиц, листы
+таблицы) выполняется одной задачей пула: одновременные промахи ждут одну
+и ту же загрузку. Устаревшая запись отдается сразу, а ее обновление
+запускается в фоне (stale-while-revalidate); ждут загрузку только
+промахи и принудительное обновление.
+
+Прогрев (warm_up) при старте и обновление по расписанию (refresh_expiring)
+загружают записи в фоне заранее, чтобы пользователь не попадал на промах
+после перезапуска или истечения срока. Запросы пользователей считаются в
+метрике sheets_cache_requests_total (hit / stale / miss).
 """
 
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from functools import partial
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
 import threading
-from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from ..config.settings import logger
+from ..google_integration.sheets_metrics import metrics
+
+# Сколько секунд промах ждет загрузку, прежде чем вернуть устаревшие или пустые данные
+LOAD_TIMEOUT = 10
+
+# Ключ списка таблиц среди загрузок (листы таблицы - ключ по spreadsheet_id)
+SPREADSHEETS_KEY = ('spreadsheets',)
 
 
 class SheetsCache:
@@ -22,8 +42,22 @@ class SheetsCache:
         # Кеш для списка таблиц (spreadsheets, timestamp)
         self._spreadsheets_cache: Optional[Tuple[List[Dict], datetime]] = None
         
+        # Текущие загрузки по ключу (key -> (поколение, future)) и поколения:
+        # общее (clear_cache) и по ключу (invalidate_*). Загрузка, начатая до
+        # инвалидации ключа, не записывает свой результат и не используется
+        # новыми промахами - для них запускается новая загрузка
+        self._loads: Dict[Hashable, Tuple[Tuple[int, int], Future]] = {}
+        self._generation = 0
+        self._key_generations: Dict[Hashable, int] = {}
+        self._counters = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'shared_loads': 0, 'loads': 0, 'refreshes': 0}
+        
+        # Когда пользователи последний раз запрашивали листы таблицы и таблицы,
+        # прогретые при старте: их записи обновляются по расписанию
+        self._last_used: Dict[str, datetime] = {}
+        self._pinned: Set[str] = set()
+        
         # Пул потоков для асинхронной загрузки
-        self._executor = ThreadPoolExecutor(max_workers=2)
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='sheets-cache')
         
         logger.info(f"Sheets cache initialized with refresh period of {cache_duration_minutes} minutes")
     
@@ -57,6 +91,81 @@ class SheetsCache:
             logger.error(f"Error loading list of spreadsheets: {e}")
             return []
     
+    def _key_generation(self, key: Hashable) -> Tuple[int, int]:
+        return self._generation, self._key_generations.get(key, 0)
+    
+    def _invalidate_key(self, key: Hashable):
+        self._key_generations[key] = self._key_generations.get(key, 0) + 1
+    
+    def _current_load(self, key: Hashable) -> Optional[Future]:
+        """Загрузка ключа текущего поколения (начатая до инвалидации не в счет)"""
+        load = self._loads.get(key)
+        if load is not None and load[0] == self._key_generation(key):
+            return load[1]
+        return None
+    
+    def _start_load(self, key: Hashable, load: Callable, store: Callable) -> Future:
+        """
+        Запускает загрузку ключа или возвращает уже идущую (вызывается под self.lock)
+        
+        Args:
+            key: ключ загрузки
+            load: функция загрузки (выполняется в пуле, без блокировки)
+            store: сохраняет результат в кеш (вызывается под self.lock)
+        """
+        future = self._current_load(key)
+        if future is not None:
+            self._counters['shared_loads'] += 1
+            return future
+        
+        self._counters['loads'] += 1
+        generation = self._key_generation(key)
+        future = self._executor.submit(self._run_load, key, load, store, generation)
+        self._loads[key] = (generation, future)
+        return future
+    
+    def _start_refresh(self, key: Hashable, load: Callable, store: Callable, reason: str) -> bool:
+        """Фоновая загрузка без запроса пользователя (вызывается под self.lock); False - уже идет"""
+        if self._current_load(key) is not None:
+            return False
+        self._start_load(key, load, store)
+        self._counters['refreshes'] += 1
+        metrics.inc('sheets_cache_refreshes_total', reason=reason)
+        return True
+    
+    def _store_sheets_info(self, spreadsheet_id: str, value: Tuple[List[Dict], str]):
+        sheets_info, spreadsheet_title = value
+        if not sheets_info:
+            # Пустой результат - ошибка загрузки: прежняя запись остается в кеше
+            return
+        self._sheets_cache[spreadsheet_id] = (sheets_info, spreadsheet_title, datetime.now())
+        logger.info(f"Sheets data cached for {spreadsheet_id}: {len(sheets_info)} sheets")
+    
+    def _store_spreadsheets(self, spreadsheets: List[Dict]):
+        if not spreadsheets:
+            return
+        self._spreadsheets_cache = (spreadsheets, datetime.now())
+        logger.info(f"Spreadsheets list cached: {len(spreadsheets)} spreadsheets")
+    
+    def _run_load(self, key: Hashable, load: Callable, store: Callable, generation: Tuple[int, int]):
+        try:
+            value = load()
+        except BaseException:
+            with self.lock:
+                self._finish_load(key, generation)
+            raise
+        
+        with self.lock:
+            if generation == self._key_generation(key):
+                store(value)
+            self._finish_load(key, generation)
+        return value
+    
+    def _finish_load(self, key: Hashable, generation: Tuple[int, int]):
+        # Загрузку нового поколения, запущенную после инвалидации, не трогаем
+        if key in self._loads and self._loads[key][0] == generation:
+            del self._loads[key]
+    
     def get_sheets_info(self, spreadsheet_id: str, force_refresh: bool = False) -> Tuple[List[Dict], str]:
         """
         Получает информацию о листах из кеша или API
@@ -68,52 +177,44 @@ class SheetsCache:
         Returns:
             Tuple[List[Dict], str]: (sheets_info, spreadsheet_title)
         """
+        load = partial(self._load_sheets_info_sync, spreadsheet_id)
+        store = partial(self._store_sheets_info, spreadsheet_id)
+        
         with self.lock:
-            # Проверяем кеш
-            if not force_refresh and spreadsheet_id in self._sheets_cache:
-                sheets_info, spreadsheet_title, timestamp = self._sheets_cache[spreadsheet_id]
-                
-                if not self._is_cache_expired(timestamp):
-                    logger.debug(f"Returning sheets data from cache for {spreadsheet_id}")
-                    return sheets_info, spreadsheet_title
+            self._last_used[spreadsheet_id] = datetime.now()
+            cached = self._sheets_cache.get(spreadsheet_id)
+            if cached and not force_refresh:
+                sheets_info, spreadsheet_title, timestamp = cached
+                if self._is_cache_expired(timestamp):
+                    logger.debug(f"Cache expired for {spreadsheet_id}, refreshing in background")
+                    self._counters['stale_hits'] += 1
+                    metrics.inc('sheets_cache_requests_total', kind='sheets', result='stale')
+                    self._start_load(spreadsheet_id, load, store)
                 else:
-                    logger.debug(f"Cache expired for {spreadsheet_id}, refreshing...")
-            
-            # Получаем данные из API с тайм-аутом
-            try:
-                # Используем пул потоков с тайм-аутом 10 секунд
-                future = self._executor.submit(self._load_sheets_info_sync, spreadsheet_id)
-                sheets_info, spreadsheet_title = future.result(timeout=10)
-                
-                # Сохраняем в кеш
-                self._sheets_cache[spreadsheet_id] = (sheets_info, spreadsheet_title, datetime.now())
-                
-                logger.info(f"Sheets data cached for {spreadsheet_id}: {len(sheets_info)} sheets")
+                    logger.debug(f"Returning sheets data from cache for {spreadsheet_id}")
+                    self._counters['hits'] += 1
+                    metrics.inc('sheets_cache_requests_total', kind='sheets', result='hit')
                 return sheets_info, spreadsheet_title
-                
-            except FutureTimeoutError:
-                logger.warning(f"Timeout while loading sheets data for {spreadsheet_id}")
-                
-                # Если есть устаревший кеш, возвращаем его
-                if spreadsheet_id in self._sheets_cache:
-                    sheets_info, spreadsheet_title, _ = self._sheets_cache[spreadsheet_id]
-                    logger.warning(f"Returning expired cache for {spreadsheet_id}")
-                    return sheets_info, spreadsheet_title
-                
-                # Если кеша нет, возвращаем пустые данные
-                return [], "Таблица недоступна"
-                
-            except Exception as e:
-                logger.error(f"Error loading sheets data for {spreadsheet_id}: {e}")
-                
-                # Если есть устаревший кеш, возвращаем его
-                if spreadsheet_id in self._sheets_cache:
-                    sheets_info, spreadsheet_title, _ = self._sheets_cache[spreadsheet_id]
-                    logger.warning(f"Returning expired cache for {spreadsheet_id}")
-                    return sheets_info, spreadsheet_title
-                
-                # Если кеша нет, возвращаем пустые данные
-                return [], "Неизвестная таблица"
+            
+            self._counters['misses'] += 1
+            metrics.inc('sheets_cache_requests_total', kind='sheets', result='miss')
+            future = self._start_load(spreadsheet_id, load, store)
+        
+        # Загрузку ждем без блокировки кеша
+        try:
+            return future.result(timeout=LOAD_TIMEOUT)
+        except FutureTimeoutError:
+            logger.warning(f"Timeout while loading sheets data for {spreadsheet_id}")
+            fallback = "Таблица недоступна"
+        except Exception as e:
+            logger.error(f"Error loading sheets data for {spreadsheet_id}: {e}")
+            fallback = "Неизвестная таблица"
+        
+        # Если есть устаревший кеш, возвращаем его
+        if cached:
+            logger.warning(f"Returning expired cache for {spreadsheet_id}")
+            return cached[0], cached[1]
+        return [], fallback
     
     def get_spreadsheets(self, force_refresh: bool = False) -> List[Dict]:
         """
@@ -126,55 +227,99 @@ class SheetsCache:
             List[Dict]: список таблиц
         """
         with self.lock:
-            # Проверяем кеш
-            if not force_refresh and self._spreadsheets_cache:
-                spreadsheets, timestamp = self._spreadsheets_cache
-                
-                if not self._is_cache_expired(timestamp):
-                    logger.debug("Returning list of spreadsheets from cache")
-                    return spreadsheets
+            cached = self._spreadsheets_cache
+            if cached and not force_refresh:
+                spreadsheets, timestamp = cached
+                if self._is_cache_expired(timestamp):
+                    logger.debug("Spreadsheets cache expired, refreshing in background")
+                    self._counters['stale_hits'] += 1
+                    metrics.inc('sheets_cache_requests_total', kind='spreadsheets', result='stale')
+                    self._start_load(SPREADSHEETS_KEY, self._load_spreadsheets_sync, self._store_spreadsheets)
                 else:
-                    logger.debug("Spreadsheets cache expired, refreshing...")
-            
-            # Получаем данные из API с тайм-аутом
-            try:
-                # Используем пул потоков с тайм-аутом 10 секунд
-                future = self._executor.submit(self._load_spreadsheets_sync)
-                spreadsheets = future.result(timeout=10)
-                
-                # Сохраняем в кеш
-                self._spreadsheets_cache = (spreadsheets, datetime.now())
-                
-                logger.info(f"Spreadsheets list cached: {len(spreadsheets)} spreadsheets")
+                    logger.debug("Returning list of spreadsheets from cache")
+                    self._counters['hits'] += 1
+                    metrics.inc('sheets_cache_requests_total', kind='spreadsheets', result='hit')
                 return spreadsheets
-                
-            except FutureTimeoutError:
-                logger.warning("Timeout while loading list of spreadsheets")
-                
-                # Если есть устаревший кеш, возвращаем его
-                if self._spreadsheets_cache:
-                    spreadsheets, _ = self._spreadsheets_cache
-                    logger.warning("Returning expired spreadsheets cache")
-                    return spreadsheets
-                
-                # Если кеша нет, возвращаем пустой список
-                return []
-                
-            except Exception as e:
-                logger.error(f"Error loading list of spreadsheets: {e}")
-                
-                # Если есть устаревший кеш, возвращаем его
-                if self._spreadsheets_cache:
-                    spreadsheets, _ = self._spreadsheets_cache
-                    logger.warning("Returning expired spreadsheets cache")
-                    return spreadsheets
-                
-                # Если кеша нет, возвращаем пустой список
-                return []
+            
+            self._counters['misses'] += 1
+            metrics.inc('sheets_cache_requests_total', kind='spreadsheets', result='miss')
+            future = self._start_load(SPREADSHEETS_KEY, self._load_spreadsheets_sync, self._store_spreadsheets)
+        
+        # Загрузку ждем без блокировки кеша
+        try:
+            return future.result(timeout=LOAD_TIMEOUT)
+        except FutureTimeoutError:
+            logger.warning("Timeout while loading list of spreadsheets")
+        except Exception as e:
+            logger.error(f"Error loading list of spreadsheets: {e}")
+        
+        # Если есть устаревший кеш, возвращаем его
+        if cached:
+            logger.warning("Returning expired spreadsheets cache")
+            return cached[0]
+        return []
+    
+    def warm_up(self, spreadsheet_ids: Iterable[str]) -> int:
+        """
+        Прогрев кеша: в фоне загружает список таблиц и листы указанных таблиц,
+        которых еще нет в кеше (не ждет загрузок). Эти таблицы затем обновляются
+        по расписанию, даже если их никто не открывал.
+        
+        Returns:
+            int: число запущенных загрузок
+        """
+        started = 0
+        with self.lock:
+            if self._spreadsheets_cache is None:
+                started += self._start_refresh(SPREADSHEETS_KEY, self._load_spreadsheets_sync,
+                                               self._store_spreadsheets, 'warmup')
+            for spreadsheet_id in dict.fromkeys(filter(None, spreadsheet_ids)):
+                self._pinned.add(spreadsheet_id)
+                if spreadsheet_id not in self._sheets_cache:
+                    started += self._start_refresh(spreadsheet_id,
+                                                   partial(self._load_sheets_info_sync, spreadsheet_id),
+                                                   partial(self._store_sheets_info, spreadsheet_id), 'warmup')
+        logger.info(f"Sheets cache warm-up started {started} loads")
+        return started
+    
+    def refresh_expiring(self, within: timedelta) -> int:
+        """
+        Обновление по расписанию: в фоне перезагружает записи, срок которых
+        истечет в ближайшие within (до следующего запуска). Листы таблицы
+        обновляются, только если таблица прогрета при старте или ее открывали
+        после последней загрузки - неиспользуемые записи просто устаревают.
+        
+        Returns:
+            int: число запущенных загрузок
+        """
+        deadline = datetime.now() + within - self.cache_duration
+        started = 0
+        with self.lock:
+            if self._spreadsheets_cache and self._spreadsheets_cache[1] <= deadline:
+                started += self._start_refresh(SPREADSHEETS_KEY, self._load_spreadsheets_sync,
+                                               self._store_spreadsheets, 'scheduled')
+            for spreadsheet_id, (_, _, timestamp) in list(self._sheets_cache.items()):
+                if timestamp > deadline:
+                    continue
+                last_used = self._last_used.get(spreadsheet_id)
+                if spreadsheet_id in self._pinned or (last_used and last_used > timestamp):
+                    started += self._start_refresh(spreadsheet_id,
+                                                   partial(self._load_sheets_info_sync, spreadsheet_id),
+                                                   partial(self._store_sheets_info, spreadsheet_id), 'scheduled')
+        if started:
+            logger.info(f"Sheets cache scheduled refresh started {started} loads")
+        return started
+    
+    def store_spreadsheets(self, spreadsheets: List[Dict]):
+        """Сохраняет список таблиц, уже полученный из Drive API (например, при синхронизации)"""
+        with self.lock:
+            self._spreadsheets_cache = (spreadsheets, datetime.now())
+        logger.debug(f"Stored {len(spreadsheets)} spreadsheets in cache")
     
     def invalidate_sheets_cache(self, spreadsheet_id: str):
         """Инвалидирует кеш для конкретной таблицы"""
         with self.lock:
+            self._invalidate_key(spreadsheet_id)
             if spreadsheet_id in self._sheets_cache:
                 del self._sheets_cache[spreadsheet_id]
                 logger.info(f"Cache invalidated for {spreadsheet_id}")
@@ -182,12 +327,14 @@ class SheetsCache:
     def invalidate_spreadsheets_cache(self):
         """Инвалидирует кеш списка таблиц"""
         with self.lock:
+            self._invalidate_key(SPREADSHEETS_KEY)
             self._spreadsheets_cache = None
             logger.info("Spreadsheets cache invalidated")
     
     def clear_cache(self):
         """Очищает весь кеш"""
         with self.lock:
+            self._generation += 1
             self._sheets_cache.clear()
             self._spreadsheets_cache = None
             logger.info("Entire cache cleared")
@@ -204,7 +351,10 @@ class SheetsCache:
             stats = {
                 "sheets_cached": len(self._sheets_cache),
                 "spreadsheets_cached": 1 if self._spreadsheets_cache else 0,
-                "cache_duration_minutes": self.cache_duration.total_seconds() / 60
+                "cache_duration_minutes": self.cache_duration.total_seconds() / 60,
+                "loads_in_progress": len(self._loads),
+                "warm_spreadsheets": len(self._pinned),
+                **self._counters
             }
             
             # Добавляем информацию о времени последнего обновления
@@ -243,6 +393,18 @@ def get_cached_spreadsheets(force_refresh: bool = False) -> List[Dict]:
     """Получает список таблиц из кеша"""
     return _get_cache_instance().get_spreadsheets(force_refresh)
 
+def warm_up_sheets_cache(spreadsheet_ids: Iterable[str]) -> int:
+    """Прогревает кеш в фоне: список таблиц и листы указанных таблиц"""
+    return _get_cache_instance().warm_up(spreadsheet_ids)
+
+def refresh_expiring_sheets_cache(within: timedelta) -> int:
+    """Обновляет в фоне записи, срок которых истечет в ближайшие within"""
+    return _get_cache_instance().refresh_expiring(within)
+
+def store_cached_spreadsheets(spreadsheets: List[Dict]):
+    """Сохраняет свежий список таблиц в кеш"""
+    _get_cache_instance().store_spreadsheets(spreadsheets)
+
 def invalidate_sheets_cache(spreadsheet_id: str):
     """Инвалидирует кеш для конкретной таблицы"""
     _get_cache_instance().invalidate_sheets_cache(spreadsheet_id)
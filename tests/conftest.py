@@ -0,0 +1,39 @@
+"""
+Общие настройки тестов: фейковый бэкенд Google вместо API, лог и БД во
+временной директории (переменные окружения задаются до импорта src)
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['LOG_FILE'] = os.path.join(tempfile.gettempdir(), 'coordinatbot-tests.log')
+os.environ['GOOGLE_BACKEND'] = 'fake'
+os.environ.setdefault('PAYMENTS_SPREADSHEET_ID', 'payments-tests')
+
+from src.database.database_manager import DatabaseManager  # noqa: E402
+from src.google_integration import sheets_manager as sheets_module  # noqa: E402
+from src.google_integration.client_pool import client_pool  # noqa: E402
+from src.google_integration.rate_limiter import QuotaRateLimiter  # noqa: E402
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    """Фейковый бэкенд без задержек и без ограничения квоты"""
+    monkeypatch.setattr(sheets_module, 'rate_limiter', QuotaRateLimiter(1e9, 1e9))
+    fake = client_pool.backend
+    with fake._lock:
+        fake.spreadsheets.clear()
+    fake.latency = 0
+    fake.reset_counters()
+    yield fake
+    fake.latency = 0
+
+
+@pytest.fixture
+def db(tmp_path) -> DatabaseManager:
+    manager = DatabaseManager(str(tmp_path / 'expenses.db'))
+    assert manager.init_db()
+    return manager
@@ -0,0 +1,117 @@
+"""AsyncSheetsManager: кеш заголовков, известные строки записей и сдвиги строк"""
+import asyncio
+import threading
+
+import pytest
+
+from src.database.sheet_rows import SheetRowIndex
+from src.database.sheets_outbox import SheetsOutbox
+from src.google_integration import async_sheets_client as client_module
+from src.google_integration import async_sheets_worker as worker_module
+from src.google_integration.async_sheets_client import AsyncSheetsClient, AsyncSheetsManager
+from src.google_integration.client_pool import GoogleClientPool
+from src.google_integration.header_cache import HeaderLayoutCache
+from src.google_integration.rate_limiter import QuotaRateLimiter
+from src.google_integration.sheets_manager import RECORD_HEADERS, RowChange
+
+SPREADSHEET_ID = 'async-tests'
+SHEET = 'Sheet 1'
+
+
+def record(record_id: str, date: str = '2025-01-15', amount: float = 100) -> dict:
+    return {'id': record_id, 'date': date, 'supplier': 'Supplier', 'direction': 'Direction',
+            'description': '', 'amount': amount, 'spreadsheet_id': SPREADSHEET_ID, 'sheet_name': SHEET}
+
+
+@pytest.fixture
+def pool(backend, monkeypatch) -> GoogleClientPool:
+    limiter = QuotaRateLimiter(1e9, 1e9)
+    monkeypatch.setattr(client_module, 'rate_limiter', limiter)
+    monkeypatch.setattr(worker_module, 'rate_limiter', limiter)
+    backend.create_spreadsheet(SPREADSHEET_ID, SPREADSHEET_ID, {SHEET: [list(RECORD_HEADERS)] + [
+        [f"r{i}", f"{2 * i - 1:02d}.01.25", 'Supplier', 'Direction', '', 10 * i] for i in range(1, 4)
+    ]})
+    return GoogleClientPool(backend=backend)
+
+
+def run(manager: AsyncSheetsManager, method: str, *args):
+    """Вызывает метод менеджера; возвращает (результат, изменения строк)"""
+    async def scenario():
+        try:
+            result = await getattr(manager, method)(*args)
+            return result, manager.last_row_changes()
+        finally:
+            await manager.client.aclose()
+    return asyncio.run(scenario())
+
+
+def test_update_reads_one_cell_with_cached_headers(backend, pool):
+    manager = AsyncSheetsManager(AsyncSheetsClient(client_pool=pool), HeaderLayoutCache())
+    assert run(manager, 'update_record_fields', SPREADSHEET_ID, SHEET, 'r1', {'amount': 11}, 2)[0]
+
+    backend.reset_counters()
+    result, changes = run(manager, 'update_record_fields', SPREADSHEET_ID, SHEET, 'r2', {'amount': 22}, 3)
+
+    assert result and changes == [RowChange('locate', 3)]
+    assert backend.stats()['calls'] == {'spreadsheets.values.get': 1, 'spreadsheets.values.batchUpdate': 1}
+    assert [row[5] for row in backend.rows(SPREADSHEET_ID, SHEET)[1:]] == [11, 22, 30]
+
+
+def test_stale_row_hint_falls_back_to_id_column(backend, pool):
+    manager = AsyncSheetsManager(AsyncSheetsClient(client_pool=pool), HeaderLayoutCache())
+
+    result, changes = run(manager, 'delete_record', SPREADSHEET_ID, SHEET, 'r3', 2)
+
+    assert result and changes == [RowChange('delete', 4)]
+    assert [row[0] for row in backend.rows(SPREADSHEET_ID, SHEET)] == ['ID', 'r1', 'r2']
+
+
+def test_add_reports_inserted_row(backend, pool):
+    manager = AsyncSheetsManager(AsyncSheetsClient(client_pool=pool), HeaderLayoutCache())
+
+    result, changes = run(manager, 'add_record', SPREADSHEET_ID, SHEET, record('new', '2025-01-02'))
+
+    assert result and changes == [RowChange('insert', 3)]
+    assert backend.rows(SPREADSHEET_ID, SHEET)[2][0] == 'new'
+
+
+def test_layout_error_drops_cached_sheet_ids(backend, pool):
+    client = AsyncSheetsClient(client_pool=pool)
+    manager = AsyncSheetsManager(client, HeaderLayoutCache())
+
+    async def scenario():
+        assert await client.get_sheet_id(SPREADSHEET_ID, SHEET) is not None
+        # Лист удален и создан заново с тем же названием - у него новый sheetId
+        rows = backend.rows(SPREADSHEET_ID, SHEET)
+        with backend._lock:
+            del backend.spreadsheets[SPREADSHEET_ID].sheets[SHEET]
+        backend.add_sheet(SPREADSHEET_ID, SHEET, rows)
+        with pytest.raises(client_module.AsyncSheetsApiError):
+            await manager.delete_record(SPREADSHEET_ID, SHEET, 'r1')
+        assert await manager.delete_record(SPREADSHEET_ID, SHEET, 'r1')
+        await client.aclose()
+
+    asyncio.run(scenario())
+    assert [row[0] for row in backend.rows(SPREADSHEET_ID, SHEET)] == ['ID', 'r2', 'r3']
+
+
+def test_asyncio_worker_stores_record_rows(backend, pool, db):
+    for i in range(1, 4):
+        assert db.add_record(record(f"r{i}", f"2025-01-{2 * i - 1:02d}", 10 * i))
+    assert db.add_record(record('new', '2025-01-02'))
+    done = threading.Event()
+
+    async def scenario():
+        worker = worker_module.AsyncioSheetsWorker(2, outbox=SheetsOutbox(db.db_path),
+                                                   client=AsyncSheetsClient(client_pool=pool))
+        worker.start()
+        worker.add_task(worker_module.make_add_record_task(
+            SPREADSHEET_ID, SHEET, record('new', '2025-01-02'), lambda success, error: done.set()
+        ))
+        while not done.is_set():
+            await asyncio.sleep(0.01)
+        worker.stop()
+
+    asyncio.run(scenario())
+    rows = SheetRowIndex(db.db_path)
+    assert rows.lookup('new', SPREADSHEET_ID, SHEET) == 3
@@ -0,0 +1,50 @@
+"""Список таблиц из Drive API: все страницы files.list и сервис Drive пула"""
+import asyncio
+
+import pytest
+
+from src.google_integration.async_sheets_client import AsyncSheetsClient
+from src.google_integration.client_pool import GoogleClientPool
+from src.google_integration.sheets_manager import GoogleSheetsManager
+
+FILES = 2500  # Больше двух страниц по 1000
+
+
+@pytest.fixture
+def pool(backend) -> GoogleClientPool:
+    for i in range(FILES):
+        backend.create_spreadsheet(f"sheet-{i}", f"Spreadsheet {i}", {})
+    backend.reset_counters()
+    return GoogleClientPool(backend=backend)
+
+
+def test_listing_follows_all_pages(backend, pool):
+    manager = GoogleSheetsManager(client_pool=pool)
+
+    files = manager.get_all_spreadsheets()
+
+    assert sorted(f['id'] for f in files) == sorted(f"sheet-{i}" for i in range(FILES))
+    assert backend.stats()['calls'] == {'drive.files.list': 3}
+    assert {'id', 'name', 'modifiedTime'} <= set(files[0])
+
+
+def test_drive_service_is_built_once_per_thread(backend, pool):
+    manager = GoogleSheetsManager(client_pool=pool)
+    service = pool.get_drive_service()
+
+    assert len(manager.get_all_spreadsheets()) == len(manager.get_all_spreadsheets()) == FILES
+    assert pool.get_drive_service() is service
+
+
+def test_async_listing_follows_all_pages(backend, pool):
+    async def scenario():
+        client = AsyncSheetsClient(client_pool=pool)
+        try:
+            return await client.list_spreadsheets()
+        finally:
+            await client.aclose()
+
+    files = asyncio.run(scenario())
+
+    assert len({f['id'] for f in files}) == FILES
+    assert backend.stats()['calls'] == {'drive.files.list': 3}
@@ -0,0 +1,65 @@
+"""Кеш заголовков: перестановка и переименование колонок при той же версии метаданных листа"""
+import pytest
+
+from src.google_integration.client_pool import GoogleClientPool
+from src.google_integration.header_cache import HeaderLayoutCache
+from src.google_integration.sheets_manager import RECORD_HEADERS, GoogleSheetsManager
+from src.google_integration.sheets_metrics import metrics
+
+SPREADSHEET_ID = 'header-tests'
+SHEET = 'Sheet 1'
+
+
+def swap_columns(rows: list, first: int, second: int) -> list:
+    for row in rows:
+        row[first], row[second] = row[second], row[first]
+    return rows
+
+
+def invalidations() -> int:
+    return int(sum(item['value'] for item in
+                   metrics.snapshot()['counters'].get('sheets_header_cache_invalidations_total', [])))
+
+
+@pytest.fixture
+def manager(backend) -> GoogleSheetsManager:
+    backend.create_spreadsheet(SPREADSHEET_ID, SPREADSHEET_ID, {SHEET: [
+        list(RECORD_HEADERS),
+        ['r1', '01.01.25', 'Supplier', 'Direction', '', 10],
+    ]})
+    manager = GoogleSheetsManager(client_pool=GoogleClientPool(backend=backend))
+    manager.header_cache = HeaderLayoutCache()
+    assert manager.verify_headers(manager.open_sheet_by_id(SPREADSHEET_ID)) == {SHEET: True}
+    return manager
+
+
+def test_reordered_columns_replace_cached_layout(backend, manager):
+    # Колонки поставщика и направления переставлены вручную - версия листа та же
+    backend.set_rows(SPREADSHEET_ID, SHEET, swap_columns(backend.rows(SPREADSHEET_ID, SHEET), 2, 3))
+    metrics.reset()
+
+    assert manager.verify_headers(manager.open_sheet_by_id(SPREADSHEET_ID)) == {SHEET: False}
+    assert invalidations() == 1
+
+    assert manager.update_record_in_sheet(SPREADSHEET_ID, SHEET, 'r1', 'supplier', 'New supplier')
+    header, row = backend.rows(SPREADSHEET_ID, SHEET)
+    assert row[header.index(RECORD_HEADERS[2])] == 'New supplier'
+    assert row[header.index(RECORD_HEADERS[3])] == 'Direction'
+
+
+def test_renamed_column_is_not_kept_in_cache(backend, manager):
+    rows = backend.rows(SPREADSHEET_ID, SHEET)
+    rows[0][5] = 'Amount'
+    backend.set_rows(SPREADSHEET_ID, SHEET, rows)
+
+    assert manager.verify_headers(manager.open_sheet_by_id(SPREADSHEET_ID)) == {SHEET: False}
+    layout = manager.header_cache.get(SPREADSHEET_ID, SHEET)
+    assert layout.column('Amount') == 6 and layout.column(RECORD_HEADERS[5]) is None
+
+
+def test_fixed_sheet_caches_expected_headers(backend, manager):
+    backend.set_rows(SPREADSHEET_ID, SHEET, swap_columns(backend.rows(SPREADSHEET_ID, SHEET), 2, 3))
+
+    assert manager.verify_headers(manager.open_sheet_by_id(SPREADSHEET_ID), fix=True) == {SHEET: True}
+    assert backend.rows(SPREADSHEET_ID, SHEET)[0] == list(RECORD_HEADERS)
+    assert manager.header_cache.get(SPREADSHEET_ID, SHEET).headers == list(RECORD_HEADERS)
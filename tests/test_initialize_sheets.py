@@ -0,0 +1,44 @@
+"""/initialize_sheets: ID новым строкам, записи в БД, лист перезаписывается без смены формата дат"""
+import pytest
+
+from src.bot.handlers import admin_handlers
+from src.database import database_manager
+
+HEADERS = ['ID', 'ամսաթիվ', 'մատակարար', 'ուղղություն', 'ծախսի բնութագիր', 'Արժեք']
+
+
+def sheet_rows(backend) -> list:
+    # clear() очищает ячейки, но не удаляет строки - пустые строки пропускаем
+    return [row for row in backend.rows('expenses', 'Sheet 1') if any(cell != '' for cell in row)]
+
+
+@pytest.fixture
+def module_db(monkeypatch, db):
+    monkeypatch.setattr(database_manager.db_manager, 'db_path', db.db_path)
+    return db
+
+
+def test_initialize_keeps_date_text_and_adds_records_once(backend, module_db):
+    backend.create_spreadsheet('expenses', 'Expenses', {'Sheet 1': [
+        HEADERS,
+        ['cb-1', '2025-01-05', 'Supplier', 'Road', 'Sand', 1200.5],
+        ['', '', 'Supplier', 'Road', 'Stone', '1 000,25'],
+        ['', '', '', '', '', ''],
+        ['cb-3', '07.01.25', 'Other', '', '', 10],
+    ]})
+
+    admin_handlers.initialize_and_sync_sheets()
+    rows = sheet_rows(backend)
+    assert rows[0] == HEADERS
+    assert [row[1] for row in rows[1:]] == ['2025-01-05', '2025-01-05', '07.01.25']
+    assert rows[1][0] == 'cb-1' and rows[2][0].startswith('cb-') and rows[3][0] == 'cb-3'
+    assert [float(row[5]) for row in rows[1:]] == [1200.5, 1000.25, 10.0]
+
+    records = {record['id']: record for record in module_db.get_all_records()}
+    assert set(records) == {row[0] for row in rows[1:]}
+    assert records['cb-1']['date'] == '2025-01-05' and records['cb-3']['date'] == '07.01.25'
+
+    # Повторный запуск ничего не меняет и не дублирует записи
+    admin_handlers.initialize_and_sync_sheets()
+    assert sheet_rows(backend) == rows
+    assert len(module_db.get_all_records()) == 3
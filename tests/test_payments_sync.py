@@ -0,0 +1,89 @@
+"""Синхронизация платежей БД и листов ролей на фейковом бэкенде"""
+import os
+import threading
+
+import pytest
+
+from src.config.settings import UserRole
+from src.google_integration.payments_sheets_manager import PaymentsSheetsManager
+from src.google_integration.payments_sync_manager import PaymentsSyncManager
+
+SPREADSHEET_ID = os.environ['PAYMENTS_SPREADSHEET_ID']
+ROLES = [UserRole.ADMIN, UserRole.WORKER, UserRole.SECONDARY, UserRole.CLIENT]
+
+
+def sheet_row(payment_id: int) -> list:
+    return [str(payment_id), f"User {payment_id % 10}", 100 + payment_id, '2025-01-01', '2025-01-31',
+            f"sheet {payment_id}", '2025-01-02 10:00:00', '', '']
+
+
+def sheet_ids(backend) -> list:
+    ids = []
+    for role in ROLES:
+        ids += [int(row[0]) for row in backend.rows(SPREADSHEET_ID, PaymentsSheetsManager.SHEET_NAMES[role])[1:]]
+    return ids
+
+
+def create_payments_spreadsheet(backend, payment_ids=()):
+    backend.create_spreadsheet(SPREADSHEET_ID, 'Payments', {
+        PaymentsSheetsManager.SHEET_NAMES[role]: [list(PaymentsSheetsManager.HEADERS)] + [
+            sheet_row(payment_id) for payment_id in payment_ids if payment_id % len(ROLES) == r
+        ]
+        for r, role in enumerate(ROLES)
+    })
+
+
+def sync_manager(db) -> PaymentsSyncManager:
+    sync = PaymentsSyncManager()
+    sync.db = db
+    return sync
+
+
+@pytest.mark.parametrize('method', ['sync_payments', 'full_sync_payments'])
+def test_concurrent_syncs_do_not_duplicate_rows(backend, db, method):
+    create_payments_spreadsheet(backend)
+    for i in range(20):
+        assert db.add_payment(f"User {i}", amount=10 + i)
+    backend.latency = 0.02
+
+    barrier = threading.Barrier(2)
+    results = []
+
+    def run():
+        barrier.wait()
+        results.append(getattr(sync_manager(db), method)())
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    ids = sheet_ids(backend)
+    assert sorted(ids) == sorted(payment['id'] for payment in db.get_payments())
+    assert len(ids) == len(set(ids)) == 20
+    assert sorted(stats['db_to_sheets']['added'] for stats in results) == [0, 20]
+
+
+def test_repeated_syncs_keep_sheet_ids(backend, db):
+    # Листы: ID 1..40; БД: ID 21..40 (общие) и платежи бота
+    create_payments_spreadsheet(backend, range(1, 41))
+    assert db.add_missing_payments([
+        {'id': payment_id, 'user_display_name': f"User {payment_id % 10}", 'amount': 100 + payment_id}
+        for payment_id in range(21, 41)
+    ]) == 20
+    bot_ids = [db.add_payment(f"Bot user {i}", amount=10 + i) for i in range(5)]
+    assert min(bot_ids) > 40
+
+    sync = sync_manager(db)
+    first = sync.full_sync_payments()
+    assert first['total_errors'] == 0
+    expected = list(range(1, 41)) + bot_ids
+    assert sorted(payment['id'] for payment in db.get_payments()) == expected
+    assert sorted(sheet_ids(backend)) == expected
+
+    for _ in range(3):
+        stats = sync.full_sync_payments()
+        assert stats['total_added'] == 0 and stats['total_errors'] == 0
+        assert sorted(payment['id'] for payment in db.get_payments()) == expected
+        assert sorted(sheet_ids(backend)) == expected
@@ -0,0 +1,73 @@
+"""QuotaRateLimiter: резервирование токенов при допуске задач"""
+import asyncio
+import threading
+
+from src.google_integration.rate_limiter import READ, WRITE, QuotaRateLimiter
+
+
+def test_concurrent_admissions_are_bounded_by_quota():
+    limiter = QuotaRateLimiter(read_per_minute=10, write_per_minute=60)
+    barrier = threading.Barrier(8)
+    admitted = []
+
+    def admit():
+        barrier.wait()
+        delay, reservation = limiter.reserve(reads=3, writes=1)
+        if reservation is not None:
+            admitted.append(reservation)
+        else:
+            assert delay > 0
+
+    threads = [threading.Thread(target=admit) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 10 токенов чтения на задачи по 3 чтения: допускаются 3, а не все 8
+    assert len(admitted) == 3
+
+
+def test_requests_are_charged_to_the_reservation_once():
+    limiter = QuotaRateLimiter(read_per_minute=10, write_per_minute=10)
+    _, reservation = limiter.reserve(reads=4, writes=2)
+    with limiter.reserved(reservation):
+        for _ in range(3):
+            limiter.acquire(READ)
+        limiter.acquire(WRITE)
+
+    # 3 чтения и 1 запись из резерва, неиспользованные 1 + 1 вернулись
+    assert round(limiter._buckets[READ].tokens) == 7
+    assert round(limiter._buckets[WRITE].tokens) == 9
+    assert reservation.remaining == {}
+
+
+def test_requests_beyond_reservation_use_the_bucket():
+    limiter = QuotaRateLimiter(read_per_minute=10, write_per_minute=10)
+    _, reservation = limiter.reserve(reads=1)
+    with limiter.reserved(reservation):
+        limiter.acquire(READ)
+        limiter.acquire(READ)
+    assert round(limiter._buckets[READ].tokens) == 8
+
+
+def test_reservation_is_visible_in_to_thread():
+    limiter = QuotaRateLimiter(read_per_minute=10, write_per_minute=10)
+
+    async def task():
+        _, reservation = limiter.reserve(reads=2)
+        with limiter.reserved(reservation):
+            await asyncio.to_thread(limiter.acquire, READ)
+            await asyncio.to_thread(limiter.acquire, READ)
+        return reservation
+
+    asyncio.run(task())
+    assert round(limiter._buckets[READ].tokens) == 8
+
+
+def test_postponed_admission_reserves_nothing():
+    limiter = QuotaRateLimiter(read_per_minute=2, write_per_minute=10)
+    assert limiter.reserve(reads=2)[1] is not None
+    delay, reservation = limiter.reserve(reads=2)
+    assert reservation is None and delay > 0
+    assert round(limiter._buckets[READ].tokens) == 0
@@ -0,0 +1,99 @@
+"""SheetsCache: общие загрузки (single-flight) и инвалидация во время загрузки"""
+import threading
+import time
+
+import pytest
+
+from src.utils.sheets_cache import SheetsCache
+
+
+class ControlledLoader:
+    """Загрузчик листов: отдает текущие данные таблицы, пока не закрыт gate"""
+
+    def __init__(self):
+        self.data = {}
+        self.calls = []
+        self.gate = threading.Event()
+        self.gate.set()
+        self.started = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self, spreadsheet_id):
+        with self._lock:
+            self.calls.append(spreadsheet_id)
+            value = ([dict(sheet) for sheet in self.data[spreadsheet_id]], spreadsheet_id)
+        self.started.set()
+        assert self.gate.wait(5)
+        return value
+
+
+@pytest.fixture
+def cache():
+    cache = SheetsCache()
+    cache._load_sheets_info_sync = ControlledLoader()
+    yield cache
+    cache._load_sheets_info_sync.gate.set()
+    cache.shutdown()
+
+
+def test_concurrent_misses_share_one_load(cache):
+    loader = cache._load_sheets_info_sync
+    loader.data['s'] = [{'title': 'Sheet 1'}]
+    loader.gate.clear()
+    barrier = threading.Barrier(20)
+    results = []
+
+    def open_menu():
+        barrier.wait()
+        results.append(cache.get_sheets_info('s'))
+
+    threads = [threading.Thread(target=open_menu) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while cache.get_cache_stats()['misses'] < 20 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    loader.gate.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert loader.calls == ['s']
+    assert results == [([{'title': 'Sheet 1'}], 's')] * 20
+    stats = cache.get_cache_stats()
+    assert stats['loads'] == 1 and stats['misses'] == 20 and stats['shared_loads'] == 19
+
+
+def test_force_refresh_after_invalidation_does_not_join_older_load(cache):
+    loader = cache._load_sheets_info_sync
+    loader.data['s'] = [{'title': 'Old'}]
+    loader.gate.clear()
+    old = threading.Thread(target=cache.get_sheets_info, args=('s',))
+    old.start()
+    assert loader.started.wait(5)
+
+    # Данные изменились, пока шла загрузка
+    loader.data['s'] = [{'title': 'New'}]
+    cache.invalidate_sheets_cache('s')
+    loader.gate.set()
+    assert cache.get_sheets_info('s', force_refresh=True) == ([{'title': 'New'}], 's')
+    old.join(5)
+
+    assert len(loader.calls) == 2
+    assert cache.get_sheets_info('s') == ([{'title': 'New'}], 's')
+
+
+def test_invalidating_one_spreadsheet_keeps_other_loads(cache):
+    loader = cache._load_sheets_info_sync
+    loader.data.update({'a': [{'title': 'A'}], 'b': [{'title': 'B'}]})
+    loader.gate.clear()
+    other = threading.Thread(target=cache.get_sheets_info, args=('b',))
+    other.start()
+    assert loader.started.wait(5)
+
+    cache.invalidate_sheets_cache('a')
+    loader.gate.set()
+    other.join(5)
+
+    # Загрузка 'b' записана в кеш, повторный запрос - попадание без загрузки
+    assert cache.get_sheets_info('b') == ([{'title': 'B'}], 'b')
+    assert loader.calls == ['b']
@@ -0,0 +1,108 @@
+"""Outbox задач Google Sheets: сохранение вместе с изменением в БД и аренды"""
+import sqlite3
+import time
+import uuid
+
+from src.database.sheets_outbox import SheetsOutbox
+from src.google_integration import async_sheets_worker as worker_module
+from src.google_integration.async_sheets_worker import AsyncSheetsWorker, make_update_record_task
+from src.google_integration.rate_limiter import QuotaRateLimiter
+
+
+def outbox_ids(db) -> list:
+    conn = sqlite3.connect(db.db_path)
+    ids = [row[0] for row in conn.execute('SELECT id FROM sheets_outbox ORDER BY id')]
+    conn.close()
+    return ids
+
+
+def add_record(db, sheet_name: str = 'Sheet 1') -> str:
+    record_id = uuid.uuid4().hex[:8]
+    assert db.add_record({'id': record_id, 'date': '01.01.25', 'supplier': 'Supplier',
+                          'direction': 'Direction', 'description': '', 'amount': 1,
+                          'spreadsheet_id': 'outbox-tests', 'sheet_name': sheet_name})
+    return record_id
+
+
+def test_update_of_missing_record_does_not_persist_task(db):
+    task = make_update_record_task('outbox-tests', 'Sheet 1', 'missing', 'amount', 5)
+
+    assert not db.update_record('missing', 'amount', 5, task)
+    assert task.outbox_id is None
+    assert outbox_ids(db) == []
+
+    record_id = add_record(db)
+    task = make_update_record_task('outbox-tests', 'Sheet 1', record_id, 'amount', 5)
+    assert db.update_record(record_id, 'amount', 5, task)
+    assert outbox_ids(db) == [task.outbox_id]
+
+
+def test_stop_releases_leases_of_waiting_tasks(db):
+    outbox = SheetsOutbox(db.db_path)
+    worker = AsyncSheetsWorker(outbox=outbox)
+    tasks = []
+    for sheet_name in ('Sheet 1', 'Sheet 2'):
+        record_id = add_record(db, sheet_name)
+        task = make_update_record_task('outbox-tests', sheet_name, record_id, 'amount', 5)
+        assert db.update_record(record_id, 'amount', 5, task)
+        worker._enqueue(task)
+        assert outbox.claim(task.outbox_id) is None
+        tasks.append(task)
+    waiting, executing = tasks
+    worker._lanes[executing.lane_key].current = executing
+
+    # Следующий процесс (другой владелец аренды)
+    restarted = SheetsOutbox(db.db_path)
+    restarted.owner = 'restarted'
+    assert restarted.claim(waiting.outbox_id) > 0
+
+    worker.stop()
+
+    assert restarted.claim(waiting.outbox_id) is None
+    # Выполняемая задача остается в аренде до своего завершения
+    assert restarted.claim(executing.outbox_id) > 0
+
+
+def test_claim_error_postpones_task(db, monkeypatch):
+    monkeypatch.setattr(worker_module, 'rate_limiter', QuotaRateLimiter(1e9, 1e9))
+    outbox = SheetsOutbox(db.db_path)
+    record_id = add_record(db)
+    task = make_update_record_task('outbox-tests', 'Sheet 1', record_id, 'amount', 5)
+    assert db.update_record(record_id, 'amount', 5, task)
+
+    def locked():
+        raise sqlite3.OperationalError('database is locked')
+    monkeypatch.setattr(outbox, '_connect', locked)
+    worker = AsyncSheetsWorker(1, outbox=outbox)
+    processed = []
+    monkeypatch.setattr(worker, '_process_task', processed.append)
+
+    worker.start()
+    worker.add_task(task)
+    time.sleep(0.3)
+    worker.stop()
+
+    assert processed == []
+    assert [delayed for _, _, delayed in worker._delayed] == [task]
+
+
+def test_replay_counts_interrupted_attempts(db):
+    outbox = SheetsOutbox(db.db_path)
+    tasks = []
+    for claims in (1, 4):
+        record_id = add_record(db)
+        task = make_update_record_task('outbox-tests', 'Sheet 1', record_id, 'amount', 5)
+        assert db.update_record(record_id, 'amount', 5, task)
+        for _ in range(claims):
+            assert outbox.claim(task.outbox_id) is None
+        tasks.append(task)
+    interrupted, exhausted = tasks
+
+    # Процесс упал во время выполнения: следующий запуск поднимает outbox
+    worker = AsyncSheetsWorker(outbox=SheetsOutbox(db.db_path))
+    worker.replay_outbox()
+
+    assert list(worker._outbox_tasks) == [interrupted.outbox_id]
+    assert worker._outbox_tasks[interrupted.outbox_id].retry_count == 1
+    assert outbox_ids(db) == [interrupted.outbox_id, exhausted.outbox_id]
+    assert outbox.count_pending() == 1
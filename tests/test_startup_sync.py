@@ -0,0 +1,54 @@
+"""Фоновая синхронизация при запуске: событие готовности платежей и его ожидание"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.google_integration.startup_sync import StartupSync
+
+
+def test_payments_ready_does_not_wait_for_header_check(monkeypatch):
+    headers_release = threading.Event()
+    sync = StartupSync()
+    monkeypatch.setattr(sync, '_sync_payments', lambda: None)
+    monkeypatch.setattr(sync, '_verify_headers', lambda: headers_release.wait(5))
+
+    thread = sync.start()
+    try:
+        assert sync.payments_ready.wait(1)
+        assert thread.is_alive() and sync.finished_at is None
+    finally:
+        headers_release.set()
+        thread.join(5)
+    assert sync.finished_at is not None
+
+
+def test_waiting_handlers_do_not_hold_executor_threads():
+    sync = StartupSync()
+    sync._thread = threading.current_thread()  # синхронизация "запущена"
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=2))
+        waiters = [asyncio.create_task(sync.wait_payments(timeout=5)) for _ in range(20)]
+        await asyncio.sleep(0.05)
+
+        # Вызовы воркера через to_thread не ждут, пока освободятся ожидающие обработчики
+        started = time.monotonic()
+        assert await asyncio.wait_for(asyncio.to_thread(lambda: 'done'), 1) == 'done'
+        to_thread_delay = time.monotonic() - started
+
+        sync.payments_ready.set()
+        return to_thread_delay, await asyncio.gather(*waiters)
+
+    to_thread_delay, results = asyncio.run(scenario())
+    assert to_thread_delay < 0.5
+    assert all(results)
+
+
+def test_wait_times_out_while_payments_sync_runs():
+    sync = StartupSync()
+    sync._thread = threading.current_thread()
+    started = time.monotonic()
+    assert asyncio.run(sync.wait_payments(timeout=0.2)) is False
+    assert 0.2 <= time.monotonic() - started < 1
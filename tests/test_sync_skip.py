@@ -0,0 +1,104 @@
+"""Полная синхронизация: пропуск неизменившихся таблиц (Drive modifiedTime) и листов (хеш содержимого)"""
+import asyncio
+
+import pytest
+
+from src.database.sheets_sync_state import SheetsSyncState
+from src.google_integration import sync_manager as sync_module
+from src.google_integration.client_pool import GoogleClientPool
+from src.google_integration.rate_limiter import QuotaRateLimiter
+from src.google_integration.sheets_manager import RECORD_HEADERS, GoogleSheetsManager
+from src.google_integration.sync_manager import FULL_SYNC_SCOPE, SyncManager
+
+SPREADSHEETS = 3
+SHEETS = 4
+
+
+def sheet_rows(spreadsheet: int, sheet: int) -> list:
+    return [list(RECORD_HEADERS)] + [
+        [f"cb-{spreadsheet}-{sheet}-{i}", f"{i + 1:02d}.01.25", 'Supplier', 'Direction', '', 10 * (i + 1)]
+        for i in range(5)
+    ]
+
+
+@pytest.fixture
+def sync(backend, db, monkeypatch) -> SyncManager:
+    monkeypatch.setattr(sync_module, 'rate_limiter', QuotaRateLimiter(1e9, 1e9))
+    for i in range(SPREADSHEETS):
+        backend.create_spreadsheet(f"spreadsheet-{i}", f"Spreadsheet {i}",
+                                   {f"Sheet {j}": sheet_rows(i, j) for j in range(SHEETS)})
+    manager = GoogleSheetsManager(client_pool=GoogleClientPool(backend=backend))
+    return SyncManager(manager, db, SheetsSyncState(db.db_path))
+
+
+def run(backend, sync: SyncManager, force: bool = False) -> dict:
+    backend.reset_counters()
+    return asyncio.run(sync.full_sync(force=force, concurrency=2))
+
+
+def test_first_sync_processes_every_sheet(backend, sync):
+    stats = run(backend, sync)
+
+    assert stats['processed_sheets'] == SPREADSHEETS * SHEETS
+    assert stats['skipped_spreadsheets'] == 0 and stats['errors'] == 0
+    assert stats['new_records'] == SPREADSHEETS * SHEETS * 5
+
+
+def test_unchanged_spreadsheets_are_skipped(backend, sync):
+    run(backend, sync)
+
+    stats = run(backend, sync)
+
+    assert stats['processed_sheets'] == 0
+    assert stats['skipped_spreadsheets'] == SPREADSHEETS
+    assert backend.stats()['sheets_requests'] == 0
+    assert backend.stats()['calls'] == {'drive.files.list': 1}
+
+
+def test_only_edited_sheet_is_processed(backend, sync):
+    run(backend, sync)
+    rows = backend.rows('spreadsheet-1', 'Sheet 0')
+    rows.append(['cb-new', '11.02.25', 'New supplier', 'Direction', 'New expense', 500])
+    backend.set_rows('spreadsheet-1', 'Sheet 0', rows)
+
+    stats = run(backend, sync)
+
+    assert stats['processed_sheets'] == 1
+    assert stats['skipped_sheets'] == SHEETS - 1
+    assert stats['skipped_spreadsheets'] == SPREADSHEETS - 1
+    assert stats['new_records'] == 1
+
+
+def test_force_processes_every_sheet(backend, sync):
+    run(backend, sync)
+
+    stats = run(backend, sync, force=True)
+
+    assert stats['processed_sheets'] == SPREADSHEETS * SHEETS
+    assert stats['skipped_spreadsheets'] == 0 and stats['skipped_sheets'] == 0
+    assert stats['new_records'] == 0
+
+
+def test_error_keeps_spreadsheet_for_next_sync(backend, sync, db, monkeypatch):
+    add_missing_records = db.add_missing_records
+
+    def failing(records):
+        if records and records[0]['spreadsheet_id'] == 'spreadsheet-2' and records[0]['sheet_name'] == 'Sheet 1':
+            return None
+        return add_missing_records(records)
+    monkeypatch.setattr(db, 'add_missing_records', failing)
+
+    stats = run(backend, sync)
+
+    assert stats['errors'] == 1
+    assert set(sync.sync_state.get_modified_times(FULL_SYNC_SCOPE)) == {'spreadsheet-0', 'spreadsheet-1'}
+
+    monkeypatch.setattr(db, 'add_missing_records', add_missing_records)
+    stats = run(backend, sync)
+
+    # Таблица читается снова, но обрабатывается только лист с ошибкой
+    assert stats['skipped_spreadsheets'] == SPREADSHEETS - 1
+    assert stats['processed_sheets'] == 1 and stats['skipped_sheets'] == SHEETS - 1
+    assert stats['errors'] == 0
+    synced = sync.sync_state.get_modified_times(FULL_SYNC_SCOPE)
+    assert set(synced) == {f"spreadsheet-{i}" for i in range(SPREADSHEETS)}